@@ -0,0 +1,91 @@
+"""
+Offline benchmark for NPPESDataCollector against the fake NPPES server.
+
+Compares sequential vs concurrent collection with injected latency and
+failures, and checks that a crashed run resumes from its checkpoint.
+
+Usage:
+    python benchmark_collector.py
+"""
+
+import shutil
+import tempfile
+import time
+
+from fake_nppes_server import FakeNPPESServer
+from fetch_mental_health_specialists import (
+    MENTAL_HEALTH_TAXONOMIES,
+    NPPESDataCollector,
+    NPPESFetchError,
+)
+
+PROVIDERS_PER_TAXONOMY = 1200
+LATENCY = 0.05
+
+
+def run(server: FakeNPPESServer, workers: int, rps: float, **kwargs):
+    output_dir = tempfile.mkdtemp(prefix="nppes_bench_")
+    try:
+        collector = NPPESDataCollector(output_dir=output_dir, base_url=server.url,
+                                       max_workers=workers, requests_per_second=rps,
+                                       backoff_base=0.05, **kwargs)
+        start = time.perf_counter()
+        df = collector.collect_all_mental_health_providers()
+        elapsed = time.perf_counter() - start
+        return len(df), elapsed, collector.stats
+    finally:
+        shutil.rmtree(output_dir)
+
+
+def bench_throughput():
+    print("=" * 60)
+    print(f"Throughput ({len(MENTAL_HEALTH_TAXONOMIES)} taxonomies x "
+          f"{PROVIDERS_PER_TAXONOMY} providers, {LATENCY * 1000:.0f} ms latency)")
+    print("=" * 60)
+    for failure_rate in (0.0, 0.1):
+        for workers, rps in ((1, 0), (4, 0), (9, 0), (9, 20)):
+            with FakeNPPESServer(providers_per_taxonomy=PROVIDERS_PER_TAXONOMY,
+                                 latency=LATENCY, failure_rate=failure_rate) as server:
+                n, elapsed, stats = run(server, workers, rps)
+            limit = f"{rps:g} req/s" if rps else "unlimited"
+            print(f"failures={failure_rate:.0%} workers={workers} rate={limit:>10}: "
+                  f"{n} providers in {elapsed:6.2f}s "
+                  f"({stats['requests'] / elapsed:6.1f} req/s, {stats['retries']} retries)")
+
+
+def bench_resume():
+    print("=" * 60)
+    print("Resume after failure")
+    print("=" * 60)
+    output_dir = tempfile.mkdtemp(prefix="nppes_resume_")
+    try:
+        # 30% of requests fail and nothing is retried: the run must raise,
+        # not return partial data
+        with FakeNPPESServer(providers_per_taxonomy=PROVIDERS_PER_TAXONOMY,
+                             failure_rate=0.3, seed=1) as server:
+            collector = NPPESDataCollector(output_dir=output_dir, base_url=server.url,
+                                           max_workers=4, requests_per_second=0,
+                                           max_retries=0)
+            try:
+                collector.collect_all_mental_health_providers()
+                print("First run completed without failures (unexpected with max_retries=0)")
+            except NPPESFetchError as e:
+                print(f"First run failed as expected: {e}")
+            first_requests = server.stats["requests"]
+
+        with FakeNPPESServer(providers_per_taxonomy=PROVIDERS_PER_TAXONOMY) as server:
+            collector = NPPESDataCollector(output_dir=output_dir, base_url=server.url,
+                                           max_workers=4, requests_per_second=0)
+            df = collector.collect_all_mental_health_providers()
+            resumed_requests = server.stats["requests"]
+
+        full_pages = len(MENTAL_HEALTH_TAXONOMIES) * (PROVIDERS_PER_TAXONOMY // 200)
+        print(f"First run: {first_requests} requests; resumed run: {resumed_requests} "
+              f"requests (a fresh run needs {full_pages}); {len(df)} providers")
+    finally:
+        shutil.rmtree(output_dir)
+
+
+if __name__ == "__main__":
+    bench_throughput()
+    bench_resume()
@@ -0,0 +1,213 @@
+"""
+Local stand-in for the NPPES API v2.1
+Serves deterministic synthetic providers so the collector can be
+benchmarked and failure-tested offline.
+
+Usage:
+    with FakeNPPESServer(providers_per_taxonomy=600, latency=0.05,
+                         failure_rate=0.1) as server:
+        collector = NPPESDataCollector(base_url=server.url, ...)
+
+    # Or standalone:
+    python fake_nppes_server.py --port 8765
+"""
+
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+FAKE_STATES = ["NY", "CA", "TX", "FL", "IL", "WA", "MA", "CO"]
+FAKE_CREDENTIALS = ["MD", "PhD", "PsyD", "LCSW", "LMHC", "LPC", ""]
+
+
+def fake_provider(taxonomy: str, i: int, overlap: float = 0.2) -> Dict[str, Any]:
+    """
+    Provider `i` of a taxonomy. The first `overlap` fraction of every
+    taxonomy shares NPIs with the other taxonomies, to exercise dedup.
+    """
+    shared = i < int(overlap * 1000)
+    seed = i if shared else zlib.crc32(f"{taxonomy}:{i}".encode()) % 10**8
+    npi = 1000000000 + seed
+    rng = random.Random(npi)
+    state = rng.choice(FAKE_STATES)
+    individual = rng.random() < 0.8
+    basic = {
+        "status": "A",
+        "last_updated": "2024-01-15",
+    }
+    if individual:
+        basic.update({
+            "first_name": f"FIRST{seed}",
+            "last_name": f"LAST{seed}",
+            "credential": rng.choice(FAKE_CREDENTIALS),
+        })
+    else:
+        basic["organization_name"] = f"\"{taxonomy.upper()} CLINIC {seed}\""
+    return {
+        "number": npi,
+        "enumeration_type": "NPI-1" if individual else "NPI-2",
+        "basic": basic,
+        "taxonomies": [{
+            "code": f"{zlib.crc32(taxonomy.encode()) % 1000:03d}X00000X",
+            "desc": taxonomy,
+            "state": state,
+            "license": f"L{seed}",
+            "primary": True,
+        }],
+        "addresses": [{
+            "address_1": f"{seed % 999} MAIN ST",
+            "address_2": "",
+            "city": f"CITY{seed % 50}",
+            "state": state,
+            "postal_code": f"{seed % 99999:05d}",
+            "country_code": "US",
+            "telephone_number": f"555-{seed % 10000:04d}",
+        }],
+        "identifiers": [],
+        "endpoints": [],
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_FakeHTTPServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        fake = self.server.fake
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        fake._record("requests")
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        roll = fake._roll()
+        if roll < fake.throttle_rate:
+            fake._record("throttled")
+            return self._send(429, {"message": "Too Many Requests"}, {"Retry-After": "0"})
+        if roll < fake.throttle_rate + fake.failure_rate:
+            fake._record("failures")
+            return self._send(503, {"message": "Service Unavailable"})
+
+        taxonomy = params.get("taxonomy_description")
+        if not taxonomy:
+            return self._send(200, {"Errors": [{"description": "No valid search criteria"}]})
+        limit = min(int(params.get("limit", 10)), 200)
+        skip = int(params.get("skip", 0))
+        end = min(skip + limit, fake.providers_per_taxonomy)
+        results = [fake_provider(taxonomy, i, fake.overlap) for i in range(skip, end)]
+        fake._record("pages")
+        self._send(200, {"result_count": len(results), "results": results})
+
+
+class _FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: "FakeNPPESServer"
+
+
+class FakeNPPESServer:
+    """
+    Threaded HTTP server that mimics NPPES paging (limit/skip) with
+    configurable latency, 503 failures and 429 throttling.
+
+    Args:
+        port: 0 picks a free port
+        providers_per_taxonomy: Records available per taxonomy
+        latency: Seconds added to every response
+        failure_rate: Fraction of requests answered with 503
+        throttle_rate: Fraction of requests answered with 429 + Retry-After
+        overlap: Fraction of each taxonomy shared with the others (same NPIs)
+        seed: Seed for the failure/throttle rolls
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 providers_per_taxonomy: int = 1200,
+                 latency: float = 0.0,
+                 failure_rate: float = 0.0,
+                 throttle_rate: float = 0.0,
+                 overlap: float = 0.2,
+                 seed: int = 0):
+        self.providers_per_taxonomy = providers_per_taxonomy
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.overlap = overlap
+        self.stats = {"requests": 0, "pages": 0, "failures": 0, "throttled": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = _FakeHTTPServer((host, port), _Handler)
+        self._httpd.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/"
+
+    def _record(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _roll(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def start(self) -> "FakeNPPESServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeNPPESServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Fake NPPES API server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--providers", type=int, default=1200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeNPPESServer(port=args.port, providers_per_taxonomy=args.providers,
+                             latency=args.latency, failure_rate=args.failure_rate,
+                             throttle_rate=args.throttle_rate)
+    print(f"Fake NPPES API listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,19 @@ Fetches provider data for content-based recommendation system
 import requests
 import pandas as pd
 import json
+import os
+import queue
+import random
+import re
+import threading
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterator, Optional
 from pathlib import Path
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+
+from provider_parquet import ProviderParquetWriter
 
 # Mental health related taxonomy descriptions to search
 MENTAL_HEALTH_TAXONOMIES = [
@@ -23,30 +33,286 @@ MENTAL_HEALTH_TAXONOMIES = [
     "Mental Health",
 ]
 
+# HTTP statuses worth retrying (throttling and transient server errors)
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class NPPESFetchError(Exception):
+    """A page could not be fetched after all retries (or was rejected by the API)"""
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: at most `rate` requests per second on average,
+    with bursts of up to `burst` requests.
+    """
+    
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        
+    def acquire(self):
+        """Block until a request may be sent"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """One token bucket per host, created on first use"""
+    
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+        
+    def acquire(self, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = RateLimiter(self.rate, self.burst)
+        bucket.acquire()
+
+
+class CollectionCheckpoint:
+    """
+    Resumable collection state.
+    
+    Every fetched page is spooled to `spool_dir/<taxonomy>/<skip>.json` before
+    the checkpoint file records the next skip offset, so a crashed run can
+    resume at the last offset without losing the pages it already had.
+    Both files are written to a temp file and renamed (atomic on POSIX).
+    """
+    
+    def __init__(self, path: Path, spool_dir: Path):
+        self.path = Path(path)
+        self.spool_dir = Path(spool_dir)
+        self._lock = threading.Lock()
+        self.state: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.state = json.load(f)
+                
+    @staticmethod
+    def _slug(taxonomy: str) -> str:
+        return re.sub(r"[^a-z0-9]+", "_", taxonomy.lower()).strip("_")
+    
+    @staticmethod
+    def _write_json(path: Path, data: Any):
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+        
+    def progress(self, taxonomy: str) -> Dict[str, Any]:
+        """{"next_skip": int, "done": bool} for a taxonomy"""
+        with self._lock:
+            return dict(self.state.get(taxonomy, {"next_skip": 0, "done": False}))
+    
+    def spooled_pages(self, taxonomy: str) -> Iterator[List[Dict[str, Any]]]:
+        """Pages already fetched for a taxonomy, one at a time in skip order"""
+        folder = self.spool_dir / self._slug(taxonomy)
+        if not folder.exists():
+            return
+        for page in sorted(folder.glob("*.json"), key=lambda p: int(p.stem)):
+            with open(page) as f:
+                yield json.load(f)
+    
+    def record_page(self, taxonomy: str, skip: int, results: List[Dict[str, Any]],
+                    next_skip: int, done: bool):
+        """Spool a page and advance the taxonomy's offset"""
+        folder = self.spool_dir / self._slug(taxonomy)
+        folder.mkdir(parents=True, exist_ok=True)
+        if results:
+            self._write_json(folder / f"{skip}.json", results)
+        self.mark(taxonomy, next_skip, done)
+        
+    def mark(self, taxonomy: str, next_skip: int, done: bool):
+        with self._lock:
+            self.state[taxonomy] = {"next_skip": next_skip, "done": done}
+            self._write_json(self.path, self.state)
+            
+    def clear(self):
+        """Remove checkpoint and spool after a successful run"""
+        with self._lock:
+            self.state = {}
+            if self.path.exists():
+                self.path.unlink()
+            if self.spool_dir.exists():
+                for page in self.spool_dir.glob("*/*.json"):
+                    page.unlink()
+                for folder in self.spool_dir.glob("*"):
+                    folder.rmdir()
+                self.spool_dir.rmdir()
+
+
+# Fields kept from nested NPPES objects (see provider_parquet schema)
+IDENTIFIER_FIELDS = ("code", "desc", "identifier", "issuer", "state")
+ENDPOINT_FIELDS = ("endpointType", "endpointTypeDescription", "endpoint",
+                   "affiliation", "use", "contentType")
+
+
+def _as_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _address(address: Dict[str, Any]) -> Dict[str, Any]:
+    """NPPES address -> location fields used downstream"""
+    return {
+        "address_1": address.get("address_1"),
+        "address_2": address.get("address_2"),
+        "city": address.get("city"),
+        "state": address.get("state"),
+        "postal_code": address.get("postal_code"),
+        "country_code": address.get("country_code"),
+        "telephone": address.get("telephone_number")
+    }
+
+
 class NPPESDataCollector:
     """Collector for mental health specialist data from NPPES API v2.1"""
     
     BASE_URL = "https://npiregistry.cms.hhs.gov/api/"
     
-    def __init__(self, output_dir: str = "data"):
+    def __init__(
+        self,
+        output_dir: str = "data",
+        base_url: Optional[str] = None,
+        max_workers: int = 4,
+        requests_per_second: float = 2.0,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: float = 30.0,
+        resume: bool = True
+    ):
+        """
+        Args:
+            output_dir: Directory for output files, checkpoint and page spool
+            base_url: API endpoint (default: public NPPES registry)
+            max_workers: Taxonomies fetched concurrently (pages within a
+                taxonomy stay sequential because skip offsets depend on order)
+            requests_per_second: Average request rate allowed per host
+            max_retries: Retries per page for timeouts, connection errors,
+                429 and 5xx responses
+            backoff_base: First retry delay in seconds (doubles each attempt,
+                with full jitter)
+            backoff_max: Upper bound for a single retry delay
+            timeout: Per-request timeout in seconds
+            resume: Continue from an existing checkpoint instead of starting over
+        """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        self.base_url = base_url or self.BASE_URL
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.rate_limiter = HostRateLimiter(requests_per_second, burst=self.max_workers)
+        
+        # Connection pool sized to the worker count; retries are handled here
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         
-    def fetch_providers_by_taxonomy(
-        self, 
-        taxonomy_desc: str, 
+        self.checkpoint = CollectionCheckpoint(
+            self.output_dir / "collection_checkpoint.json",
+            self.output_dir / "spool"
+        )
+        if not resume:
+            self.checkpoint.clear()
+            
+        self.stats = {"requests": 0, "retries": 0, "pages": 0}
+        self._stats_lock = threading.Lock()
+        
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+            
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Delay before retry `attempt` (0-based): Retry-After or exponential with jitter"""
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    def _get_page(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET one page with rate limiting and retries. Raises NPPESFetchError"""
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count("retries")
+            self.rate_limiter.acquire(self.base_url)
+            self._count("requests")
+            retry_after = None
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+                if response.status_code in RETRYABLE_STATUS:
+                    retry_after = response.headers.get("Retry-After")
+                    last_error = f"HTTP {response.status_code}"
+                else:
+                    response.raise_for_status()
+                    data = response.json()
+                    # The API reports invalid queries as 200 + "Errors"
+                    if data.get("Errors"):
+                        raise NPPESFetchError(f"API rejected query {params}: {data['Errors']}")
+                    return data
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = str(e)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # Other 4xx or an unparseable body: retrying will not help
+                raise NPPESFetchError(f"Request failed for {params}: {e}") from e
+                
+            if attempt < self.max_retries:
+                time.sleep(self._backoff(attempt, retry_after))
+                
+        raise NPPESFetchError(
+            f"Giving up after {self.max_retries + 1} attempts for {params}: {last_error}")
+        
+    def iter_taxonomy_pages(
+        self,
+        taxonomy_desc: str,
         limit: int = 200,
         max_records: int = 1200
-    ) -> List[Dict[str, Any]]:
+    ) -> Iterator[List[Dict[str, Any]]]:
         """
-        Fetch providers for a given taxonomy description.
+        Yield raw result pages for a taxonomy description: first the pages
+        spooled by a previous run, then new pages from the API.
         API limits: 200 results per request, max 1200 with skip parameter.
+        
+        Raises NPPESFetchError if a page fails after all retries; pages
+        fetched so far stay spooled for the next run.
         """
-        all_results = []
-        skip = 0
+        progress = self.checkpoint.progress(taxonomy_desc)
+        skip = progress["next_skip"]
         
-        print(f"Fetching providers for taxonomy: {taxonomy_desc}")
+        if progress["done"]:
+            print(f"Taxonomy already collected: {taxonomy_desc}")
+        elif skip:
+            print(f"Resuming taxonomy {taxonomy_desc} at skip={skip}")
+        else:
+            print(f"Fetching providers for taxonomy: {taxonomy_desc}")
+        yield from self.checkpoint.spooled_pages(taxonomy_desc)
+        if progress["done"]:
+            return
         
         while skip < max_records:
             params = {
@@ -57,58 +323,65 @@ class NPPESDataCollector:
                 "country_code": "US"
             }
             
-            try:
-                response = self.session.get(self.BASE_URL, params=params, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-                
-                results = data.get("results", [])
-                if not results:
-                    print(f"  No more results at skip={skip}")
-                    break
-                    
-                all_results.extend(results)
-                print(f"  Collected {len(results)} records (total: {len(all_results)})")
-                
-                # Check if we got fewer results than requested (last page)
-                if len(results) < limit:
-                    break
-                    
-                skip += limit
-                time.sleep(0.5)  # Be respectful to the API
-                
-            except requests.exceptions.RequestException as e:
-                print(f"  Error fetching data: {e}")
-                break
-                
+            data = self._get_page(params)
+            self._count("pages")
+            results = data.get("results", [])
+            
+            # Fewer results than requested means this was the last page
+            done = len(results) < limit or skip + limit >= max_records
+            self.checkpoint.record_page(taxonomy_desc, skip, results, skip + limit, done)
+            print(f"  [{taxonomy_desc}] Collected {len(results)} records at skip={skip}")
+            yield results
+            if done:
+                return
+            skip += limit
+        
+        self.checkpoint.mark(taxonomy_desc, skip, True)
+    
+    def fetch_providers_by_taxonomy(
+        self, 
+        taxonomy_desc: str, 
+        limit: int = 200,
+        max_records: int = 1200
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch all providers for a given taxonomy description (in memory).
+        Resumes from the checkpoint when a previous run stopped midway.
+        """
+        all_results = []
+        for results in self.iter_taxonomy_pages(taxonomy_desc, limit, max_records):
+            all_results.extend(results)
         return all_results
     
-    def extract_provider_info(self, provider: Dict[str, Any]) -> Dict[str, Any]:
-        """Extract relevant information from provider record for RAG system"""
+    def extract_provider_record(self, provider: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Extract relevant information from a provider record, keeping nested
+        values (taxonomies, addresses, identifiers, endpoints) as lists and
+        dicts matching provider_parquet.PROVIDER_SCHEMA
+        """
         
         # Basic info
         npi = provider.get("number")
         enum_type = provider.get("enumeration_type")
+        basic = provider.get("basic", {})
         
         # Individual vs Organization
         if enum_type == "NPI-1":
-            basic = provider.get("basic", {})
-            first_name = basic.get("first_name", "").strip()
-            last_name = basic.get("last_name", "").strip()
+            first_name = (basic.get("first_name") or "").strip()
+            last_name = (basic.get("last_name") or "").strip()
             name = f"{first_name} {last_name}".strip()
-            credential = basic.get("credential", "").strip()
+            credential = (basic.get("credential") or "").strip()
         else:
             # Clean organization name - remove quotes and extra characters
-            org_name = provider.get("basic", {}).get("organization_name", "")
+            org_name = basic.get("organization_name") or ""
             name = org_name.strip().strip("'\"").strip()
             credential = ""
             
         # Taxonomies - get primary and all specialties
-        taxonomies = provider.get("taxonomies", [])
         primary_taxonomy = None
         all_taxonomies = []
         
-        for tax in taxonomies:
+        for tax in provider.get("taxonomies", []):
             # Clean taxonomy description
             desc = tax.get("desc", "").strip() if tax.get("desc") else None
             code = tax.get("code", "").strip() if tax.get("code") else None
@@ -117,8 +390,8 @@ class NPPESDataCollector:
                 "code": code,
                 "desc": desc,
                 "state": tax.get("state"),
-                "license": tax.get("license"),
-                "primary": tax.get("primary", False)
+                "license": _as_str(tax.get("license")),
+                "primary": bool(tax.get("primary", False))
             }
             all_taxonomies.append(tax_info)
             if tax.get("primary") and desc:  # Only set if has description
@@ -131,66 +404,77 @@ class NPPESDataCollector:
                     primary_taxonomy = tax
                     break
                 
-        # Addresses - Primary Practice Location and Mailing
+        # Addresses - first is Primary Practice Location, second is Mailing
         addresses = provider.get("addresses", [])
-        practice_location = None
-        mailing_address = None
-        
-        if addresses:
-            # First address is Primary Practice Location
-            practice_location = addresses[0] if len(addresses) > 0 else None
-            # Second address is Mailing Address
-            mailing_address = addresses[1] if len(addresses) > 1 else None
-            
-        # Extract practice location details
-        if practice_location:
-            location_info = {
-                "address_1": practice_location.get("address_1"),
-                "address_2": practice_location.get("address_2"),
-                "city": practice_location.get("city"),
-                "state": practice_location.get("state"),
-                "postal_code": practice_location.get("postal_code"),
-                "country_code": practice_location.get("country_code"),
-                "telephone": practice_location.get("telephone_number")
-            }
-        else:
-            location_info = {}
-            
-        # Other identifiers
-        identifiers = provider.get("identifiers", [])
-        
-        # Endpoints
-        endpoints = provider.get("endpoints", [])
+        practice_location = _address(addresses[0]) if len(addresses) > 0 else None
+        mailing_address = _address(addresses[1]) if len(addresses) > 1 else None
         
-        # Construct structured record for RAG
-        record = {
-            "npi": str(npi).strip() if npi else None,
+        return {
+            "npi": int(npi) if npi else None,
             "provider_type": "Individual" if enum_type == "NPI-1" else "Organization",
             "name": name if name else None,
             "credential": credential if credential else None,
             "primary_taxonomy": primary_taxonomy.get("desc") if primary_taxonomy else None,
             "primary_taxonomy_code": primary_taxonomy.get("code") if primary_taxonomy else None,
-            "all_taxonomies": json.dumps(all_taxonomies),  # Store as JSON string for CSV
-            "practice_location": json.dumps(location_info),  # Store as JSON string for CSV
-            "mailing_address": json.dumps(mailing_address) if mailing_address else None,
-            "identifiers": json.dumps(identifiers),
-            "endpoints": json.dumps(endpoints),
-            "last_updated": provider.get("basic", {}).get("last_updated"),
-            "status": provider.get("basic", {}).get("status")
+            "all_taxonomies": all_taxonomies,
+            "practice_location": practice_location,
+            "mailing_address": mailing_address,
+            "identifiers": [{k: _as_str(ident.get(k)) for k in IDENTIFIER_FIELDS}
+                            for ident in provider.get("identifiers", [])],
+            "endpoints": [{k: _as_str(ep.get(k)) for k in ENDPOINT_FIELDS}
+                          for ep in provider.get("endpoints", [])],
+            "last_updated": basic.get("last_updated"),
+            "status": basic.get("status")
         }
-        
+    
+    def extract_provider_info(self, provider: Dict[str, Any]) -> Dict[str, Any]:
+        """Flat version of extract_provider_record for CSV: nested values as JSON strings"""
+        record = self.extract_provider_record(provider)
+        record["npi"] = str(record["npi"]) if record["npi"] else None
+        record["all_taxonomies"] = json.dumps(record["all_taxonomies"])
+        record["practice_location"] = json.dumps(record["practice_location"] or {})
+        record["mailing_address"] = (json.dumps(record["mailing_address"])
+                                     if record["mailing_address"] else None)
+        record["identifiers"] = json.dumps(record["identifiers"])
+        record["endpoints"] = json.dumps(record["endpoints"])
         return record
     
-    def collect_all_mental_health_providers(self) -> pd.DataFrame:
-        """Collect providers for all mental health taxonomies"""
+    def collect_all_mental_health_providers(
+        self,
+        taxonomies: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Collect providers for all mental health taxonomies, `max_workers`
+        taxonomies at a time.
+        
+        Every taxonomy is attempted even if another one fails; failures are
+        raised together at the end (progress stays in the checkpoint).
+        """
+        taxonomies = taxonomies or MENTAL_HEALTH_TAXONOMIES
+        by_taxonomy: Dict[str, List[Dict[str, Any]]] = {}
+        errors: Dict[str, Exception] = {}
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch_providers_by_taxonomy, t): t for t in taxonomies}
+            for future in as_completed(futures):
+                taxonomy = futures[future]
+                try:
+                    by_taxonomy[taxonomy] = future.result()
+                except NPPESFetchError as e:
+                    errors[taxonomy] = e
+                    print(f"  Error fetching {taxonomy}: {e}")
+        
+        if errors:
+            raise NPPESFetchError(
+                f"{len(errors)} taxonomies failed ({', '.join(errors)}); "
+                f"re-run to resume from {self.checkpoint.path}")
         
         all_providers = []
         seen_npis = set()
         
-        for taxonomy in MENTAL_HEALTH_TAXONOMIES:
-            providers = self.fetch_providers_by_taxonomy(taxonomy)
-            
-            for provider in providers:
+        # Merge in taxonomy order so deduplication does not depend on timing
+        for taxonomy in taxonomies:
+            for provider in by_taxonomy[taxonomy]:
                 npi = provider.get("number")
                 # Avoid duplicates
                 if npi not in seen_npis:
@@ -198,11 +482,103 @@ class NPPESDataCollector:
                     extracted = self.extract_provider_info(provider)
                     all_providers.append(extracted)
                     
-            print(f"Total unique providers so far: {len(all_providers)}\n")
+        print(f"Total unique providers: {len(all_providers)} "
+              f"({self.stats['requests']} requests, {self.stats['retries']} retries)\n")
             
         df = pd.DataFrame(all_providers)
         return df
     
+    def stream_to_parquet(
+        self,
+        path: Optional[str] = None,
+        taxonomies: Optional[List[str]] = None,
+        row_group_size: int = 10_000
+    ) -> Dict[str, Any]:
+        """
+        Collect providers straight into a Parquet file.
+        
+        Worker threads fetch pages and hand them to this thread through a
+        bounded queue; each page is extracted, deduplicated by NPI and
+        appended to the current row group, so memory stays bounded by
+        (queue size + one row group) regardless of the total collected.
+        
+        Returns:
+            Summary with path, rows written, duplicates and row groups
+        """
+        path = Path(path) if path else self.output_dir / "mental_health_specialists.parquet"
+        taxonomies = taxonomies or MENTAL_HEALTH_TAXONOMIES
+        pages: "queue.Queue" = queue.Queue(maxsize=self.max_workers * 2)
+        finished = object()
+        stop = threading.Event()
+        errors: Dict[str, Exception] = {}
+        
+        def put(item) -> bool:
+            # Gives up if the consumer stopped, so workers never block forever
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def produce(taxonomy: str):
+            try:
+                for results in self.iter_taxonomy_pages(taxonomy):
+                    if not put(results):
+                        return
+            except NPPESFetchError as e:
+                errors[taxonomy] = e
+                print(f"  Error fetching {taxonomy}: {e}")
+            finally:
+                put(finished)
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                ProviderParquetWriter(path, row_group_size=row_group_size) as writer:
+            for taxonomy in taxonomies:
+                executor.submit(produce, taxonomy)
+            
+            pending = len(taxonomies)
+            try:
+                while pending:
+                    results = pages.get()
+                    if results is finished:
+                        pending -= 1
+                        continue
+                    writer.write_many(self.extract_provider_record(p) for p in results)
+            finally:
+                stop.set()
+            
+            if errors:
+                # Leaves no partial Parquet file; the checkpoint keeps progress
+                raise NPPESFetchError(
+                    f"{len(errors)} taxonomies failed ({', '.join(errors)}); "
+                    f"re-run to resume from {self.checkpoint.path}")
+        
+        summary = {
+            "path": str(path),
+            "total_records": writer.rows_written,
+            "duplicates_skipped": writer.duplicates,
+            "row_groups": writer.row_groups,
+            "requests": self.stats["requests"],
+            "retries": self.stats["retries"]
+        }
+        print(f"Wrote {writer.rows_written} unique providers to {path} "
+              f"({writer.row_groups} row groups, {writer.duplicates} duplicates skipped)")
+        return summary
+    
+    def save_metadata(self, summary: Dict[str, Any]):
+        """Save collection metadata next to the Parquet output"""
+        metadata = {
+            **summary,
+            "collection_date": pd.Timestamp.now().isoformat(),
+            "taxonomies_searched": MENTAL_HEALTH_TAXONOMIES,
+        }
+        metadata_path = self.output_dir / "collection_metadata.json"
+        with open(metadata_path, "w") as f:
+            json.dump(metadata, f, indent=2)
+        print(f"Saved metadata to: {metadata_path}")
+    
     def save_data(self, df: pd.DataFrame):
         """Save collected data in multiple formats"""
         
@@ -242,19 +618,25 @@ def main():
     print("="*60)
     print()
     
-    collector = NPPESDataCollector(output_dir="data")
+    collector = NPPESDataCollector(
+        output_dir="data",
+        base_url=os.getenv("NPPES_BASE_URL"),
+        max_workers=int(os.getenv("NPPES_WORKERS", "4")),
+        requests_per_second=float(os.getenv("NPPES_RPS", "2.0"))
+    )
     
-    # Collect data
+    # Collect data straight to Parquet
     print("Starting data collection...")
-    df = collector.collect_all_mental_health_providers()
+    summary = collector.stream_to_parquet()
     
     print("\n" + "="*60)
-    print(f"Collection complete! Total providers: {len(df)}")
+    print(f"Collection complete! Total providers: {summary['total_records']}")
     print("="*60)
     print()
     
-    # Save data
-    collector.save_data(df)
+    # Save metadata and drop the page spool
+    collector.save_metadata(summary)
+    collector.checkpoint.clear()
     
     print("\nData collection finished successfully!")
     
@@ -0,0 +1,185 @@
+"""
+Columnar storage for NPPES provider records
+Streams extracted records into a Parquet file in row groups, with nested
+types for taxonomies, addresses, identifiers and endpoints, so consumers
+can read only the columns they need:
+
+    pq.read_table(path, columns=["npi", "primary_taxonomy", "practice_location"])
+"""
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+TAXONOMY_TYPE = pa.struct([
+    ("code", pa.string()),
+    ("desc", pa.string()),
+    ("state", pa.string()),
+    ("license", pa.string()),
+    ("primary", pa.bool_()),
+])
+
+ADDRESS_TYPE = pa.struct([
+    ("address_1", pa.string()),
+    ("address_2", pa.string()),
+    ("city", pa.string()),
+    ("state", pa.string()),
+    ("postal_code", pa.string()),
+    ("country_code", pa.string()),
+    ("telephone", pa.string()),
+])
+
+IDENTIFIER_TYPE = pa.struct([
+    ("code", pa.string()),
+    ("desc", pa.string()),
+    ("identifier", pa.string()),
+    ("issuer", pa.string()),
+    ("state", pa.string()),
+])
+
+ENDPOINT_TYPE = pa.struct([
+    ("endpointType", pa.string()),
+    ("endpointTypeDescription", pa.string()),
+    ("endpoint", pa.string()),
+    ("affiliation", pa.string()),
+    ("use", pa.string()),
+    ("contentType", pa.string()),
+])
+
+PROVIDER_SCHEMA = pa.schema([
+    ("npi", pa.int64()),
+    ("provider_type", pa.string()),
+    ("name", pa.string()),
+    ("credential", pa.string()),
+    ("primary_taxonomy", pa.string()),
+    ("primary_taxonomy_code", pa.string()),
+    ("all_taxonomies", pa.list_(TAXONOMY_TYPE)),
+    ("practice_location", ADDRESS_TYPE),
+    ("mailing_address", ADDRESS_TYPE),
+    ("identifiers", pa.list_(IDENTIFIER_TYPE)),
+    ("endpoints", pa.list_(ENDPOINT_TYPE)),
+    ("last_updated", pa.string()),
+    ("status", pa.string()),
+])
+
+
+class CompactIntSet:
+    """
+    Set of integers (NPIs) stored as a sorted int64 array: 8 bytes per
+    member instead of ~60 for a Python set. New members go to a small
+    pending set that is merged into the array when it fills up.
+    """
+
+    def __init__(self, merge_every: int = 50_000):
+        self._sorted = np.empty(0, dtype=np.int64)
+        self._pending = set()
+        self.merge_every = merge_every
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._pending)
+
+    def __contains__(self, value: int) -> bool:
+        if value in self._pending:
+            return True
+        i = np.searchsorted(self._sorted, value)
+        return bool(i < len(self._sorted) and self._sorted[i] == value)
+
+    def add(self, value: int) -> bool:
+        """Add a value; returns False if it was already present"""
+        if value in self:
+            return False
+        self._pending.add(value)
+        if len(self._pending) >= self.merge_every:
+            self._merge()
+        return True
+
+    def _merge(self):
+        nuevos = np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))
+        self._sorted = np.union1d(self._sorted, nuevos)
+        self._pending = set()
+
+    @property
+    def nbytes(self) -> int:
+        return self._sorted.nbytes
+
+
+class ProviderParquetWriter:
+    """
+    Appends provider records to a Parquet file, one row group every
+    `row_group_size` records, skipping NPIs already written.
+
+    Usage:
+        with ProviderParquetWriter("data/providers.parquet") as writer:
+            for record in records:
+                writer.write(record)
+    """
+
+    def __init__(self,
+                 path: Union[str, Path],
+                 row_group_size: int = 10_000,
+                 compression: str = "zstd"):
+        self.path = Path(path)
+        self.row_group_size = row_group_size
+        self.seen_npis = CompactIntSet()
+        self.rows_written = 0
+        self.duplicates = 0
+        self.row_groups = 0
+        self._buffer: List[Dict[str, Any]] = []
+        # Written to a temp file and renamed on close: a crashed run never
+        # leaves a truncated (footer-less) Parquet file at `path`
+        self._tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self._writer = pq.ParquetWriter(self._tmp_path, PROVIDER_SCHEMA, compression=compression)
+
+    def write(self, record: Dict[str, Any]) -> bool:
+        """Buffer a record; returns False if it was skipped (missing or duplicate NPI)"""
+        npi = record.get("npi")
+        if npi is None or not self.seen_npis.add(int(npi)):
+            self.duplicates += 1
+            return False
+        self._buffer.append(record)
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+        return True
+
+    def write_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        return sum(self.write(record) for record in records)
+
+    def flush(self):
+        """Write buffered records as one row group"""
+        if not self._buffer:
+            return
+        table = pa.Table.from_pylist(self._buffer, schema=PROVIDER_SCHEMA)
+        self._writer.write_table(table)
+        self.rows_written += len(self._buffer)
+        self.row_groups += 1
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        self._tmp_path.replace(self.path)
+
+    def abort(self):
+        """Discard the partial file"""
+        self._writer.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "ProviderParquetWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def iter_provider_batches(path: Union[str, Path],
+                          columns: Optional[List[str]] = None,
+                          batch_size: int = 10_000) -> Iterator[pa.RecordBatch]:
+    """Read a provider Parquet file batch by batch, optionally only some columns"""
+    parquet_file = pq.ParquetFile(path)
+    yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
@@ -0,0 +1,250 @@
+"""
+Control de admisión por prioridad y descarte de carga
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Bajo sobrecarga un request de crisis no debe esperar detrás de búsquedas de
+exploración. Cada request POST se clasifica (api_rest.clase_admision) en:
+
+- crisis: /emergency y búsquedas o preguntas con crisis léxica (CRITICO/ALTO)
+- normal: búsquedas y consultas de primera página
+- baja: facetas, seguimientos paginados (offset > 0, top_k > 1 en la guía)
+  y clientes batch (header X-Priority: batch)
+
+Como mucho ADMISSION_MAX_CONCURRENT requests se ejecutan a la vez por
+proceso; crisis puede usar además ADMISSION_CRISIS_RESERVE cupos propios.
+Los demás esperan en una cola por clase y al liberarse un cupo entra el
+primero de la clase más prioritaria. Crisis no se descarta nunca; normal y
+baja tienen una cola acotada y un presupuesto de espera, y al excederlo (o
+si la espera estimada ya lo excede al llegar) se responde 503 con
+Retry-After sin tocar la API de embeddings.
+
+Con gunicorn gthread la espera ocupa un hilo: conviene un
+ADMISSION_MAX_CONCURRENT menor que --threads para que queden hilos libres
+que reciban y clasifiquen los requests de crisis. En el modo ASGI
+(api_asgi.py) se espera en el event loop, antes de pedir embeddings.
+
+Sin ADMISSION_MAX_CONCURRENT (o en 0) no se encola ni se descarta nada.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from metrics import actualizar_admision, observar_espera_admision, registrar_rechazo
+
+CRISIS = 'crisis'
+NORMAL = 'normal'
+BAJA = 'baja'
+
+# Orden de prioridad
+CLASES = (CRISIS, NORMAL, BAJA)
+
+# Factor de suavizado del tiempo medio de servicio (para estimar esperas)
+ALFA_SERVICIO = 0.1
+
+
+class Saturado(Exception):
+    """Request descartado: responder 503 con Retry-After"""
+
+    def __init__(self, clase: str, motivo: str, retry_after: int):
+        super().__init__(f"Request {clase} descartado ({motivo})")
+        self.clase = clase
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+
+class _Espera:
+    __slots__ = ('clase', 'llegada', 'avisar', 'concedido')
+
+    def __init__(self, clase: str, avisar: Callable[[], None]):
+        self.clase = clase
+        self.llegada = time.perf_counter()
+        self.avisar = avisar
+        self.concedido = False
+
+
+class Turno:
+    """Cupo de ejecución concedido; liberar() al terminar de enviar la respuesta"""
+
+    __slots__ = ('clase', 'inicio', '_control', '_liberado')
+
+    def __init__(self, control: 'AdmissionController', clase: str):
+        self.clase = clase
+        self.inicio = time.perf_counter()
+        self._control = control
+        self._liberado = False
+
+    def liberar(self):
+        if not self._liberado:
+            self._liberado = True
+            self._control._liberar(self)
+
+
+class AdmissionController:
+    """
+    Cupos de ejecución y colas por clase de un proceso
+
+    Args:
+        max_concurrentes: Requests ejecutándose a la vez (0 deshabilita)
+        reserva_crisis: Cupos adicionales que solo usa la clase crisis
+        max_cola: Requests en espera por clase (None = sin límite)
+        espera_max: Segundos de espera tolerados por clase antes del 503
+            (None = sin límite)
+        retry_after_max: Tope del Retry-After sugerido, en segundos
+    """
+
+    def __init__(self,
+                 max_concurrentes: int = 0,
+                 reserva_crisis: int = 2,
+                 max_cola: Optional[Dict[str, Optional[int]]] = None,
+                 espera_max: Optional[Dict[str, Optional[float]]] = None,
+                 retry_after_max: int = 30):
+        self.max_concurrentes = max_concurrentes
+        self.reserva_crisis = reserva_crisis
+        self.max_cola = {CRISIS: None, NORMAL: 200, BAJA: 50, **(max_cola or {})}
+        self.espera_max = {CRISIS: None, NORMAL: 10.0, BAJA: 0.5, **(espera_max or {})}
+        self.retry_after_max = retry_after_max
+        self._lock = threading.Lock()
+        self._colas: Dict[str, Deque[_Espera]] = {clase: deque() for clase in CLASES}
+        self._en_curso = {clase: 0 for clase in CLASES}
+        self._servicio: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> 'AdmissionController':
+        return cls(max_concurrentes=int(os.getenv('ADMISSION_MAX_CONCURRENT', '0')),
+                   reserva_crisis=int(os.getenv('ADMISSION_CRISIS_RESERVE', '2')),
+                   max_cola={NORMAL: int(os.getenv('ADMISSION_NORMAL_QUEUE', '200')),
+                             BAJA: int(os.getenv('ADMISSION_LOW_QUEUE', '50'))},
+                   espera_max={NORMAL: float(os.getenv('ADMISSION_NORMAL_WAIT_MS', '10000')) / 1000,
+                               BAJA: float(os.getenv('ADMISSION_LOW_WAIT_MS', '500')) / 1000})
+
+    @property
+    def activo(self) -> bool:
+        return self.max_concurrentes > 0
+
+    def admitir(self, clase: str) -> Turno:
+        """Espera un cupo bloqueando el hilo; lanza Saturado si se descarta"""
+        evento = threading.Event()
+        espera = self._entrar(clase, evento.set)
+        if isinstance(espera, Turno):
+            return espera
+        evento.wait(self.espera_max[clase])
+        return self._resolver(espera)
+
+    async def admitir_async(self, clase: str) -> Turno:
+        """Como admitir() pero esperando en el event loop"""
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+
+        def avisar():
+            # Se libera desde los hilos del executor
+            loop.call_soon_threadsafe(lambda: futuro.done() or futuro.set_result(None))
+
+        espera = self._entrar(clase, avisar)
+        if isinstance(espera, Turno):
+            return espera
+        try:
+            await asyncio.wait_for(futuro, self.espera_max[clase])
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Cliente desconectado: si el cupo llegó a concederse se devuelve
+            try:
+                self._resolver(espera).liberar()
+            except Saturado:
+                pass
+            raise
+        return self._resolver(espera)
+
+    def _cupo(self, clase: str) -> bool:
+        limite = self.max_concurrentes + (self.reserva_crisis if clase == CRISIS else 0)
+        return sum(self._en_curso.values()) < limite
+
+    def _delante(self, clase: str) -> int:
+        """Requests en cola que entrarían antes que uno nuevo de esta clase"""
+        return sum(len(self._colas[c]) for c in CLASES[:CLASES.index(clase) + 1])
+
+    def _estimar_espera(self, en_cola: int) -> Optional[float]:
+        if self._servicio is None:
+            return None
+        return en_cola * self._servicio / self.max_concurrentes
+
+    def _retry_after(self) -> int:
+        estimada = self._estimar_espera(sum(len(cola) for cola in self._colas.values())) or 0.0
+        return max(1, min(self.retry_after_max, math.ceil(estimada)))
+
+    def _entrar(self, clase: str, avisar: Callable[[], None]):
+        """Turno si hay cupo; si no, la _Espera encolada"""
+        motivo = None
+        with self._lock:
+            delante = self._delante(clase)
+            if delante == 0 and self._cupo(clase):
+                self._en_curso[clase] += 1
+                actualizar_admision(clase, len(self._colas[clase]), self._en_curso[clase])
+                espera = Turno(self, clase)
+            else:
+                limite = self.max_cola[clase]
+                presupuesto = self.espera_max[clase]
+                estimada = self._estimar_espera(delante + 1)
+                if limite is not None and len(self._colas[clase]) >= limite:
+                    motivo = 'cola_llena'
+                elif presupuesto is not None and estimada is not None and estimada > presupuesto:
+                    # Se descarta ya en vez de hacer esperar el presupuesto completo
+                    motivo = 'espera_estimada'
+                else:
+                    espera = _Espera(clase, avisar)
+                    self._colas[clase].append(espera)
+                    actualizar_admision(clase, len(self._colas[clase]), self._en_curso[clase])
+            if motivo is not None:
+                retry_after = self._retry_after()
+        if motivo is not None:
+            registrar_rechazo(clase, motivo)
+            raise Saturado(clase, motivo, retry_after)
+        if isinstance(espera, Turno):
+            observar_espera_admision(clase, 0.0)
+        return espera
+
+    def _resolver(self, espera: _Espera) -> Turno:
+        """Después de esperar: Turno si se concedió el cupo, Saturado si no"""
+        with self._lock:
+            concedido = espera.concedido
+            if not concedido:
+                self._colas[espera.clase].remove(espera)
+                actualizar_admision(espera.clase, len(self._colas[espera.clase]),
+                                    self._en_curso[espera.clase])
+                retry_after = self._retry_after()
+        if not concedido:
+            registrar_rechazo(espera.clase, 'espera')
+            raise Saturado(espera.clase, 'espera', retry_after)
+        observar_espera_admision(espera.clase, time.perf_counter() - espera.llegada)
+        return Turno(self, espera.clase)
+
+    def _liberar(self, turno: Turno):
+        duracion = time.perf_counter() - turno.inicio
+        avisos = []
+        with self._lock:
+            self._en_curso[turno.clase] -= 1
+            self._servicio = duracion if self._servicio is None else \
+                (1 - ALFA_SERVICIO) * self._servicio + ALFA_SERVICIO * duracion
+            # El cupo liberado pasa al primero de la clase más prioritaria
+            for clase in CLASES:
+                cola = self._colas[clase]
+                while cola and self._cupo(clase):
+                    espera = cola.popleft()
+                    espera.concedido = True
+                    self._en_curso[clase] += 1
+                    avisos.append(espera.avisar)
+            for clase in CLASES:
+                actualizar_admision(clase, len(self._colas[clase]), self._en_curso[clase])
+        for avisar in avisos:
+            avisar()
+
+    def estado(self) -> Dict[str, Dict[str, int]]:
+        """Requests en cola y en curso por clase"""
+        with self._lock:
+            return {clase: {'en_cola': len(self._colas[clase]), 'en_curso': self._en_curso[clase]}
+                    for clase in CLASES}
@@ -0,0 +1,324 @@
+"""
+Modo de servicio ASGI/asyncio de la API
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Con Flask bajo Gunicorn cada hilo queda bloqueado esperando a OpenAI la
+mayor parte del request, así que la concurrencia es workers × threads. Aquí
+el request se atiende en el event loop:
+
+1. Se lee el body y se deciden los textos que el endpoint va a embeber
+   (la query de búsqueda, la del protocolo de crisis o la pregunta de la
+   guía cuando el router no la resuelve)
+2. Se piden con AsyncOpenAI sin ocupar un hilo (AsyncEmbedder, con a lo
+   sumo EMBEDDING_MAX_CONCURRENT llamadas en vuelo)
+3. El endpoint de api_rest se ejecuta tal cual en un pool acotado de
+   ASGI_EXECUTOR_THREADS hilos, que solo hace trabajo de CPU (detección de
+   crisis, FAISS, scoring, formateo): embed_query toma el vector ya
+   calculado (async_embeddings.embeddings_precalculados)
+
+Con ADMISSION_MAX_CONCURRENT el control de admisión (admission_control.py)
+se resuelve antes del paso 1: la espera por cupo es en el event loop y un
+request descartado recibe el 503 sin llegar al executor.
+
+Las respuestas son las mismas que las de api_rest (mismo código de los
+endpoints, incluido el streaming NDJSON/SSE, métricas, perfilado y captura).
+Si la llamada asíncrona falla, el endpoint la reintenta de forma síncrona y
+responde como siempre.
+
+Uso:
+    uvicorn api_asgi:app --host 0.0.0.0 --port 8000
+    gunicorn api_asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+"""
+
+import asyncio
+import contextvars
+import io
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from werkzeug.exceptions import HTTPException
+
+import api_rest
+from admission_control import Saturado
+from api_rest import (HEADER_PRIORIDAD, admision, clase_admision, crisis_detector, cuerpo_saturado,
+                      parametros_busqueda, query_crisis)
+from async_embeddings import AsyncEmbedder, embeddings_precalculados
+from metrics import endpoint_actual, registrar_degradada
+
+logger = logging.getLogger(__name__)
+
+flask_app = api_rest.app
+
+# Trabajo de CPU de los endpoints; el event loop nunca ejecuta código de Flask
+EXECUTOR_THREADS = int(os.getenv('ASGI_EXECUTOR_THREADS', str(os.cpu_count() or 4)))
+executor = ThreadPoolExecutor(max_workers=EXECUTOR_THREADS, thread_name_prefix='asgi-cpu')
+embedder = AsyncEmbedder(max_concurrentes=int(os.getenv('EMBEDDING_MAX_CONCURRENT', '64')))
+
+RUTAS_BUSQUEDA = {'/search', '/emergency', '/facets'}
+RUTAS_ESPECIALISTA = {'/buscar_especialista', '/buscar_especialista/stream'}
+RUTAS_GUIA = {'/consultar_guia_medica', '/consultar_guia_medica/stream'}
+
+
+def modelo_recursos() -> str:
+    if api_rest.region_manager is not None:
+        return api_rest.region_manager.openai_model
+    return api_rest.get_retrieval_system().openai_model
+
+
+def leer_json(cuerpo: bytes) -> Any:
+    """Body parseado, o None si no es JSON (el endpoint responde el error)"""
+    try:
+        return json.loads(cuerpo) if cuerpo else None
+    except ValueError:
+        return None
+
+
+def pedidos_embedding(path: str, data: Any) -> List[Tuple[str, str]]:
+    """
+    (modelo, texto) que el endpoint va a embeber. Se replica solo la parte
+    de cada endpoint que elige el texto; un error aquí no es del request (el
+    endpoint valida y responde), así que se ignora y no se precalcula nada.
+    """
+    try:
+        if not isinstance(data, dict):
+            return []
+        ruta = path.rstrip('/')
+        if ruta in RUTAS_BUSQUEDA:
+            query = data.get('query')
+            return [(modelo_recursos(), query)] if isinstance(query, str) and query else []
+        if ruta in RUTAS_ESPECIALISTA and 'sintoma' in data:
+            params = parametros_busqueda(data)
+            # Con crisis léxica CRITICO no se evalúa la query: se busca con la del protocolo
+            if crisis_detector.detect(params['sintoma']).nivel == 'CRITICO':
+                return [(modelo_recursos(), query_crisis(params))]
+            # La query para buscar y el síntoma para el clasificador de crisis
+            return [(modelo_recursos(), params['query']), (modelo_recursos(), params['sintoma'])]
+        if ruta in RUTAS_GUIA:
+            pregunta = data.get('pregunta')
+            knowledge_system = api_rest.get_knowledge_system()
+            if isinstance(pregunta, str) and knowledge_system.requiere_embedding(pregunta):
+                return [(knowledge_system.openai_model, pregunta)]
+    except Exception as e:
+        logger.debug(f"Sin precálculo de embeddings para {path}: {e}")
+    return []
+
+
+def nombre_endpoint(path: str, metodo: str) -> str:
+    """Endpoint de Flask para etiquetar las métricas del precálculo"""
+    try:
+        return flask_app.url_map.bind('localhost').match(path, method=metodo)[0]
+    except HTTPException:
+        return 'desconocido'
+
+
+def environ_wsgi(scope: Dict[str, Any], cuerpo: bytes) -> Dict[str, Any]:
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(servidor[0]),
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': cliente[0] if cliente else '',
+        'CONTENT_LENGTH': str(len(cuerpo)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope.get('headers', []):
+        nombre, valor = nombre.decode('latin-1'), valor.decode('latin-1')
+        if nombre == 'content-type':
+            environ['CONTENT_TYPE'] = valor
+        elif nombre != 'content-length':
+            clave = 'HTTP_' + nombre.upper().replace('-', '_')
+            environ[clave] = f"{environ[clave]},{valor}" if clave in environ else valor
+    return environ
+
+
+class RespuestaWSGI:
+    """Ejecuta la app de Flask y guarda status y headers de start_response"""
+
+    def __init__(self, environ: Dict[str, Any]):
+        self.environ = environ
+        self.status = 500
+        self.headers: List[Tuple[bytes, bytes]] = []
+        self.iterable = None
+        self._iterador = None
+
+    def _start_response(self, status: str, headers: List[Tuple[str, str]], exc_info=None):
+        self.status = int(status.split(' ', 1)[0])
+        self.headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    def ejecutar(self) -> Optional[bytes]:
+        """
+        Llama a la app. Las respuestas con Content-Length se leen completas
+        aquí (un solo paso por el executor); las de streaming se dejan
+        abiertas y retorna None
+        """
+        self.iterable = flask_app(self.environ, self._start_response)
+        if any(k == b'content-length' for k, _ in self.headers):
+            try:
+                return b''.join(self.iterable)
+            finally:
+                self.cerrar()
+        self._iterador = iter(self.iterable)
+        return None
+
+    def siguiente(self) -> Optional[bytes]:
+        return next(self._iterador, None)
+
+    def cerrar(self):
+        # Dispara call_on_close (perfilado, captura de tráfico)
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
+
+
+async def leer_cuerpo(receive: Callable) -> bytes:
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            break
+        partes.append(mensaje.get('body', b''))
+        if not mensaje.get('more_body', False):
+            break
+    return b''.join(partes)
+
+
+def header(scope: Dict[str, Any], nombre: str) -> Optional[str]:
+    buscado = nombre.lower().encode('latin-1')
+    for clave, valor in scope.get('headers', []):
+        if clave == buscado:
+            return valor.decode('latin-1')
+    return None
+
+
+async def responder_saturado(send: Callable, error: Saturado):
+    cuerpo = json.dumps(cuerpo_saturado(), ensure_ascii=False).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': 503,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(cuerpo)).encode('latin-1')),
+                            (b'retry-after', str(error.retry_after).encode('latin-1'))]})
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+
+async def atender(scope: Dict[str, Any], receive: Callable, send: Callable):
+    cuerpo = await leer_cuerpo(receive)
+    data = leer_json(cuerpo) if scope['method'] == 'POST' else None
+
+    turno = None
+    if admision.activo:
+        # Clasificar es parseo y detección léxica: se hace en el loop, antes de esperar cupo
+        clase = clase_admision(scope['method'], scope['path'], data, header(scope, HEADER_PRIORIDAD))
+        if clase is not None:
+            try:
+                turno = await admision.admitir_async(clase)
+            except Saturado as e:
+                logger.warning(f"⛔ {e}, Retry-After {e.retry_after}s")
+                await responder_saturado(send, e)
+                return
+    try:
+        await ejecutar(scope, cuerpo, data, send)
+    finally:
+        if turno is not None:
+            turno.liberar()
+
+
+async def ejecutar(scope: Dict[str, Any], cuerpo: bytes, data: Any, send: Callable):
+    loop = asyncio.get_running_loop()
+
+    if scope['method'] == 'POST':
+        endpoint_actual.set(nombre_endpoint(scope['path'], scope['method']))
+        if api_rest.sistemas_listos():
+            # Parseo y detección léxica: microsegundos, no vale un salto al executor
+            pedidos = pedidos_embedding(scope['path'], data)
+        else:
+            # Arranque en frío: get_*_system() cargaría los índices en el loop
+            pedidos = await loop.run_in_executor(executor, pedidos_embedding, scope['path'], data)
+        if pedidos:
+            try:
+                embeddings_precalculados.set(await embedder.precalcular(pedidos))
+            except Exception as e:
+                # El endpoint pedirá el embedding de forma síncrona y responderá como siempre
+                logger.warning(f"Embedding asíncrono falló, se usa el cliente síncrono: {e}")
+                registrar_degradada('embedding_asincrono')
+
+    # Todos los pasos del request en el executor comparten este contexto
+    # (endpoint, embeddings precalculados, etapas del perfil/captura)
+    contexto = contextvars.copy_context()
+
+    def en_executor(fn, *args):
+        return loop.run_in_executor(executor, contexto.run, fn, *args)
+
+    environ = environ_wsgi(scope, cuerpo)
+    if admision.activo:
+        environ['calma.admision'] = True
+    respuesta = RespuestaWSGI(environ)
+    completo = await en_executor(respuesta.ejecutar)
+    await send({'type': 'http.response.start', 'status': respuesta.status, 'headers': respuesta.headers})
+    if completo is not None:
+        await send({'type': 'http.response.body', 'body': completo})
+        return
+
+    # Streaming: cada evento se genera en el executor y se envía desde el loop
+    try:
+        while True:
+            parte = await en_executor(respuesta.siguiente)
+            if parte is None:
+                break
+            if parte:
+                await send({'type': 'http.response.body', 'body': parte, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        await en_executor(respuesta.cerrar)
+
+
+async def lifespan(receive: Callable, send: Callable):
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            try:
+                # Carga índices antes del primer request (fuera del event loop)
+                await asyncio.get_running_loop().run_in_executor(executor, api_rest.init_systems)
+            except Exception as e:
+                logger.exception(e)
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            logger.info(f"✓ Modo ASGI listo ({EXECUTOR_THREADS} hilos de CPU, "
+                        f"{embedder.max_concurrentes} embeddings en vuelo)")
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            await embedder.cerrar()
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope: Dict[str, Any], receive: Callable, send: Callable):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http':
+        await atender(scope, receive, send)
+    elif scope['type'] == 'websocket':
+        # Sin endpoints websocket: cerrar antes de aceptar rechaza el handshake (403)
+        await receive()
+        await send({'type': 'websocket.close', 'code': 1000})
+    else:
+        logger.warning(f"Tipo de conexión no soportado, se ignora: {scope['type']}")
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', 8000)))
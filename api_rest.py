@@ -4,18 +4,42 @@ Diseñado para integración con aplicación móvil
 
 Uso:
     python api_rest.py
+    gunicorn -c gunicorn.conf.py api_rest:app   # producción: carga en el master
+    uvicorn api_asgi:app   # modo ASGI con embeddings asíncronos (api_asgi.py)
 
 Endpoints:
     POST /search - Buscar especialistas
-    GET /health - Health check
+    POST /facets - Conteos por faceta para la búsqueda actual
+    POST /especialistas_similares - Recursos parecidos a uno dado
+    POST /buscar_especialista/stream, /consultar_guia_medica/stream - Versiones
+        en streaming (NDJSON, o SSE con Accept: text/event-stream)
+    GET /health - Liveness (el proceso responde)
+    GET /ready - Readiness (índices cargados) y tiempos del arranque
+    GET /metrics - Métricas Prometheus (latencia por etapa, caches, tokens)
+    GET /admin/profiles/<id> - Perfil de un request perfilado (X-Profile)
+
+Con ADMISSION_MAX_CONCURRENT los requests se admiten por prioridad (crisis
+primero) y los de baja prioridad se descartan con 503 bajo sobrecarga
+(admission_control.py).
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from retrieval_system import MentalHealthRetrieval, QueryFilters
 from knowledge_rag import MentalHealthKnowledgeRAG
+from region_shards import RegionShardManager
+from crisis_detection import CrisisDetector, NIVELES_EMERGENCIA, nivel_mas_grave
+from metrics import (cronometrado, endpoint_actual, etapa, etapas_request, exposicion, fase_arranque,
+                     observar_request, registrar_degradada, tiempos_arranque)
+from profiler import HEADER_PERFIL, RequestProfiler
+from traffic_capture import TrafficCapture
+from admission_control import AdmissionController, Saturado, CRISIS, NORMAL, BAJA
+from embedding_client import stats_compartido
+import json
 import logging
-from typing import Dict, Any
+import threading
+import time
+from typing import Dict, Any, List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -33,26 +57,130 @@ CORS(app, resources={r"/*": {"origins": "*"}})  # Permitir CORS para llamadas de
 # Variables globales para sistemas (se cargan al iniciar para respuestas rápidas)
 retrieval_system = None
 knowledge_system = None
+region_manager = None  # Solo con REGIONS_CONFIG: shards de recursos por región
+
+# Serializa la carga: con la carga perezosa dos requests simultáneos no la repiten
+_init_lock = threading.Lock()
 
 # Pre-cargar sistemas al iniciar (evita lazy loading en primera request)
 def init_systems():
-    """Inicializa los sistemas al arrancar Gunicorn (solo una vez)"""
-    global retrieval_system, knowledge_system
-    if retrieval_system is None:
-        logger.info("Pre-cargando sistema de retrieval...")
-        retrieval_system = MentalHealthRetrieval('recursos_salud_mental_cdmx.json')
-        logger.info("✓ Sistema RecSys listo")
-    if knowledge_system is None:
-        logger.info("Pre-cargando sistema de conocimiento...")
-        knowledge_system = MentalHealthKnowledgeRAG('base_conocimiento_rag_pasos_inmediatos.json')
-        logger.info("✓ Sistema RAG listo")
+    """
+    Carga los sistemas una vez por proceso. Con gunicorn.conf.py corre en el
+    master antes del fork; los workers heredan los índices ya cargados
+    """
+    global retrieval_system, knowledge_system, region_manager
+    with _init_lock:
+        if retrieval_system is not None and knowledge_system is not None:
+            return
+        inicio = time.perf_counter()
+        if retrieval_system is None:
+            logger.info("Pre-cargando sistema de retrieval...")
+            with fase_arranque('recursos'):
+                if os.getenv('REGIONS_CONFIG'):
+                    # Un índice por región; se pre-carga solo la región por defecto.
+                    # El global es el manager (embeddings y crisis): fijar aquí el
+                    # shard lo dejaría en memoria aunque el LRU lo descargue
+                    region_manager = RegionShardManager.from_config(os.getenv('REGIONS_CONFIG'))
+                    region_manager.get(region_manager.default or next(iter(region_manager.regiones)))
+                    retrieval_system = region_manager
+                elif os.getenv('RECURSOS_INDEX_PATH') and os.getenv('RECURSOS_METADATA_PATH'):
+                    # Índice construido fuera de línea (por ejemplo nppes_ingestion.py)
+                    retrieval_system = MentalHealthRetrieval.from_index(
+                        os.getenv('RECURSOS_INDEX_PATH'), os.getenv('RECURSOS_METADATA_PATH'))
+                else:
+                    retrieval_system = MentalHealthRetrieval('recursos_salud_mental_cdmx.json')
+            logger.info("✓ Sistema RecSys listo")
+        if knowledge_system is None:
+            logger.info("Pre-cargando sistema de conocimiento...")
+            with fase_arranque('conocimiento'):
+                knowledge_system = MentalHealthKnowledgeRAG('base_conocimiento_rag_pasos_inmediatos.json')
+            logger.info("✓ Sistema RAG listo")
+        tiempos_arranque['total'] = time.perf_counter() - inicio
+        logger.info("⏱️ Arranque: " + ", ".join(f"{fase} {segundos * 1000:.0f} ms"
+                                               for fase, segundos in tiempos_arranque.items()))
+
+def sistemas_listos() -> bool:
+    return retrieval_system is not None and knowledge_system is not None
+
+# Probes y métricas: nunca disparan la carga perezosa
+RUTAS_SIN_CARGA = {'/health', '/ready', '/metrics'}
+
+# Perfilado bajo demanda (header X-Profile con ADMIN_TOKEN, o PROFILE_SAMPLE_RATE)
+perfilador = RequestProfiler.from_env()
+
+# Captura de tráfico para replay (CAPTURE_DIR, ver traffic_capture.py)
+captura = TrafficCapture.from_env()
+
+# Control de admisión por prioridad (ADMISSION_MAX_CONCURRENT, ver admission_control.py)
+admision = AdmissionController.from_env()
+
+# Clientes batch (cargas masivas, replays) piden baja prioridad con X-Priority: batch
+HEADER_PRIORIDAD = 'X-Priority'
+
+RUTAS_PAGINADAS = {'/buscar_especialista', '/buscar_especialista/stream'}
+RUTAS_GUIA = {'/consultar_guia_medica', '/consultar_guia_medica/stream'}
+
+def clase_admision(metodo: str, path: str, data: Any, prioridad: Optional[str] = None) -> Optional[str]:
+    """
+    Clase de prioridad del request (None: no pasa por el control de admisión)
+    
+    La crisis se decide con la detección léxica (sin embeddings): la semántica
+    necesita el embedding de la query, que es justo el trabajo a priorizar.
+    """
+    ruta = path.rstrip('/')
+    if metodo != 'POST' or ruta.startswith('/admin'):
+        return None
+    if ruta == '/emergency':
+        return CRISIS
+    data = data if isinstance(data, dict) else {}
+    
+    texto = data.get('sintoma') or data.get('query') or data.get('pregunta')
+    if ruta != '/facets' and isinstance(texto, str) and crisis_detector.detect(texto).nivel in NIVELES_EMERGENCIA:
+        return CRISIS
+    
+    offset, top_k = data.get('offset'), data.get('top_k')
+    seguimiento = ((ruta in RUTAS_PAGINADAS and isinstance(offset, int) and offset > 0)
+                   or (ruta in RUTAS_GUIA and isinstance(top_k, int) and top_k > 1))
+    if ruta == '/facets' or seguimiento or (prioridad or '').lower() == 'batch':
+        return BAJA
+    return NORMAL
+
+def cuerpo_saturado() -> Dict[str, Any]:
+    return {
+        'success': False,
+        'error': 'Servicio saturado, intenta de nuevo en unos segundos',
+        'respuesta_voz': 'En este momento estoy atendiendo muchas consultas. Intenta de nuevo en unos segundos, por favor.'
+    }
 
 # Cargar en el primer request usando before_first_request
 @app.before_request
 def ensure_systems_loaded():
     """Asegura que los sistemas estén cargados antes de cualquier request"""
+    g.inicio = time.perf_counter()
+    endpoint_actual.set(request.endpoint or 'desconocido')
+    if perfilador.activo:
+        perfil = perfilador.iniciar(request.headers.get(HEADER_PERFIL))
+        if perfil is not None:
+            g.perfil = perfil
+    if captura.muestrear(request.method, request.path):
+        g.captura_ts = time.time()
+        if etapas_request.get() is None:
+            etapas_request.set([])
+        g.captura_etapas = etapas_request.get()
     logger.info(f"Incoming request: {request.method} {request.path}")
-    if retrieval_system is None or knowledge_system is None:
+    # En el modo ASGI la admisión ya se resolvió en el event loop
+    if admision.activo and 'calma.admision' not in request.environ:
+        clase = clase_admision(request.method, request.path, request.get_json(silent=True),
+                               request.headers.get(HEADER_PRIORIDAD))
+        if clase is not None:
+            try:
+                g.turno = admision.admitir(clase)
+            except Saturado as e:
+                logger.warning(f"⛔ {e}, Retry-After {e.retry_after}s")
+                g.saturado = True
+                return jsonify(cuerpo_saturado()), 503, {'Retry-After': str(e.retry_after)}
+    if not sistemas_listos() and request.path not in RUTAS_SIN_CARGA:
+        # Sin gunicorn.conf.py (o api_rest.py directo) la carga cae en el primer request
         logger.warning(" Sistemas no cargados, inicializando...")
         init_systems()
 
@@ -60,23 +188,41 @@ def ensure_systems_loaded():
 def log_response(response):
     """Log de todas las respuestas"""
     logger.info(f"📤 Outgoing response: {request.method} {request.path} - Status: {response.status_code}")
+    if 'inicio' in g:
+        observar_request(endpoint_actual.get(), response.status_code, time.perf_counter() - g.inicio)
+    # Los descartes por saturación se cuentan en calma_admision_rechazos_total
+    if response.status_code >= 500 and not g.get('saturado'):
+        registrar_degradada('error')
+    turno = g.pop('turno', None)
+    if turno is not None:
+        # El cupo se ocupa hasta terminar de enviar el cuerpo (incluye streaming)
+        response.call_on_close(turno.liberar)
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        # El perfil se cierra al terminar de enviar el cuerpo (incluye streaming)
+        response.headers['X-Profile-Id'] = perfil.id
+        response.headers['Server-Timing'] = perfil.server_timing()
+        info = {'endpoint': endpoint_actual.get(), 'metodo': request.method,
+                'path': request.path, 'status': response.status_code}
+        response.call_on_close(lambda: perfilador.terminar(perfil, info))
+        logger.info(f"🔬 Request perfilado: {perfil.id}")
+    if 'captura_ts' in g:
+        registro = {'ts': g.pop('captura_ts'), 'endpoint': endpoint_actual.get(), 'path': request.path,
+                    'body': request.get_json(silent=True), 'status': response.status_code}
+        etapas, inicio = g.pop('captura_etapas'), g.inicio
+        
+        def cerrar_captura():
+            etapas_request.set(None)
+            captura.registrar(duracion=time.perf_counter() - inicio, etapas=etapas, **registro)
+        
+        # Como el perfil, se escribe al terminar de enviar el cuerpo (incluye streaming)
+        response.call_on_close(cerrar_captura)
     return response
 
-# Palabras clave de crisis y alto riesgo
-CRISIS_KEYWORDS = [
-    'suicid', 'suicidio', 'suicidarme', 'matarme', 'quitarme la vida',
-    'morir', 'muerte', 'acabar con todo', 'no quiero vivir',
-    'mejor muerto', 'quiero desaparecer', 'hacerme daño',
-    'cortarme', 'autolesion', 'pastillas para morir',
-    'plan para suicidarme', 'quiero que acabe', 'ya no puedo más'
-]
-
-HIGH_RISK_KEYWORDS = [
-    'pánico', 'panico', 'crisis', 'desesperado', 'desesperada',
-    'muy mal', 'horrible', 'insoportable', 'no aguanto',
-    'colapso', 'emergencia', 'urgente', 'ayuda inmediata'
-]
+# Detector de crisis compilado (palabras clave recargables vía CRISIS_KEYWORDS_PATH)
+crisis_detector = CrisisDetector(keywords_path=os.getenv('CRISIS_KEYWORDS_PATH'))
 
+@cronometrado('deteccion_crisis')
 def detectar_nivel_crisis(texto: str) -> tuple[str, bool]:
     """
     Detecta nivel de crisis en el texto del usuario
@@ -86,22 +232,35 @@ def detectar_nivel_crisis(texto: str) -> tuple[str, bool]:
         - nivel: 'CRITICO', 'ALTO', 'MODERADO', 'NORMAL'
         - requiere_emergencia: bool
     """
-    texto_lower = texto.lower()
+    resultado = crisis_detector.detect(texto)
     
-    # Detectar crisis crítica (suicidio/autolesión)
-    for keyword in CRISIS_KEYWORDS:
-        if keyword in texto_lower:
-            logger.critical(f"CRISIS DETECTADA: palabra clave '{keyword}' en texto")
-            return 'CRITICO', True
+    if resultado.nivel == 'CRITICO':
+        terminos = [c.termino for c in resultado.coincidencias if c.nivel == 'CRITICO']
+        logger.critical(f"CRISIS DETECTADA: palabras clave {terminos} en texto")
+    elif resultado.nivel == 'ALTO':
+        terminos = [c.termino for c in resultado.coincidencias if c.nivel == 'ALTO']
+        logger.warning(f"ALTO RIESGO: palabras clave {terminos} en texto")
     
-    # Detectar alto riesgo
-    for keyword in HIGH_RISK_KEYWORDS:
-        if keyword in texto_lower:
-            logger.warning(f"ALTO RIESGO: palabra clave '{keyword}' en texto")
-            return 'ALTO', True
-    
-    return 'NORMAL', False
+    return resultado.nivel, resultado.requiere_emergencia
+
+def apertura_respuesta(sintoma: str, nivel_crisis: str) -> str:
+    """
+    Primera frase de la respuesta de voz, que no depende de los resultados
+    (las respuestas en streaming la envían antes de buscar). Toda respuesta
+    de generar_respuesta_empatica empieza con ella, haya o no resultados.
+    """
+    if nivel_crisis == 'CRITICO':
+        return (
+            "Escucho que estás pasando por un momento muy difícil. "
+            "Tu seguridad es lo más importante. "
+            "Por favor, llama INMEDIATAMENTE a la Línea de la Vida: 800-911-2000, "
+            "o al 911 si necesitas ayuda urgente. Están disponibles 24/7 y es completamente gratuito. "
+        )
+    if nivel_crisis == 'ALTO':
+        return f"Entiendo que estás pasando por un momento muy difícil con {sintoma}. "
+    return "Gracias por confiar en mí. "
 
+@cronometrado('respuesta_voz')
 def generar_respuesta_empatica(sintoma: str, nivel_crisis: str, num_resultados: int, 
                                tiene_resultados: bool, genero: str = '', 
                                ubicacion: str = '', primer_resultado: dict = None) -> str:
@@ -121,17 +280,13 @@ def generar_respuesta_empatica(sintoma: str, nivel_crisis: str, num_resultados:
         str: Respuesta de voz empática y apropiada
     """
     if nivel_crisis == 'CRITICO':
-        return (
-            f"Escucho que estás pasando por un momento muy difícil. "
-            f"Tu seguridad es lo más importante. "
-            f"Por favor, llama INMEDIATAMENTE a la Línea de la Vida: 800-911-2000, "
-            f"o al 911 si necesitas ayuda urgente. Están disponibles 24/7 y es completamente gratuito. "
+        return apertura_respuesta(sintoma, nivel_crisis) + (
             f"También encontré {num_resultados} especialista{'s' if num_resultados > 1 else ''} que puede{'n' if num_resultados > 1 else ''} apoyarte, "
             f"pero por favor, contacta primero a los servicios de emergencia."
         )
     
     if nivel_crisis == 'ALTO':
-        respuesta = f"Entiendo que estás pasando por un momento muy difícil con {sintoma}. "
+        respuesta = apertura_respuesta(sintoma, nivel_crisis)
         if not tiene_resultados:
             respuesta += "Aunque no encontré especialistas con los criterios exactos, "
             respuesta += "es importante que busques ayuda. ¿Quieres que busque con otros criterios? "
@@ -161,7 +316,8 @@ def generar_respuesta_empatica(sintoma: str, nivel_crisis: str, num_resultados:
     
     # NORMAL - respuesta empática pero menos intensa
     if not tiene_resultados:
-        respuesta = f"Entiendo que estás buscando ayuda con {sintoma}. "
+        # También empieza con la apertura: el streaming ya la envió antes de buscar
+        respuesta = apertura_respuesta(sintoma, nivel_crisis) + f"Entiendo que estás buscando ayuda con {sintoma}. "
         respuesta += "Lamentablemente no encontré especialistas"
         if genero:
             respuesta += f" {genero}es"
@@ -169,7 +325,7 @@ def generar_respuesta_empatica(sintoma: str, nivel_crisis: str, num_resultados:
             respuesta += f" en {ubicacion}"
         respuesta += ". ¿Te gustaría que busque con otros criterios o en otra zona?"
     else:
-        respuesta = f"Gracias por confiar en mí. Encontré {num_resultados} especialista{'s' if num_resultados > 1 else ''} "
+        respuesta = apertura_respuesta(sintoma, nivel_crisis) + f"Encontré {num_resultados} especialista{'s' if num_resultados > 1 else ''} "
         if genero:
             respuesta += f"{genero}{'es' if num_resultados > 1 else ''} "
         respuesta += f"que puede{'n' if num_resultados > 1 else ''} ayudarte con {sintoma}. "
@@ -197,6 +353,32 @@ def get_retrieval_system():
         init_systems()
     return retrieval_system
 
+def buscar_recursos(query: str, filters: QueryFilters = None, top_k: int = 5,
+                    query_embedding=None, ubicacion: str = None, region: str = None,
+                    cuotas: Dict[str, int] = None) -> list:
+    """
+    Busca recursos en el índice único o, con REGIONS_CONFIG, en los shards
+    que el router elige según la ubicación/región del request.
+    Con `cuotas` ({partición: máximo}) solo se recorren esas particiones.
+    """
+    if region_manager is not None:
+        results = region_manager.search(query, filters=filters, top_k=top_k,
+                                        query_embedding=query_embedding,
+                                        ubicacion=ubicacion, region=region, cuotas=cuotas)
+    elif cuotas:
+        results = get_retrieval_system().search_mixto(query, cuotas, filters=filters,
+                                                      query_embedding=query_embedding)
+    else:
+        results = get_retrieval_system().search(query, filters=filters, top_k=top_k,
+                                                query_embedding=query_embedding)
+    return results[:top_k]
+
+def particiones_disponibles(ubicacion: str = None, region: str = None) -> List[str]:
+    """Particiones que acepta `cuotas` (las de los shards que el router elegiría)"""
+    if region_manager is not None:
+        return region_manager.particiones(ubicacion, region)
+    return get_retrieval_system().particiones.nombres
+
 def get_knowledge_system():
     """Retorna el sistema de conocimiento (ya pre-cargado)"""
     global knowledge_system
@@ -241,6 +423,7 @@ def parse_filters(request_data: Dict[str, Any]) -> QueryFilters:
     return filters
 
 
+@cronometrado('format_for_mobile')
 def format_for_mobile(results: list) -> list:
     """
     Formatea resultados para consumo desde app móvil
@@ -273,6 +456,14 @@ def format_for_mobile(results: list) -> list:
             },
             'disponibilidad': result.get('disponibilidad'),
             'metodos_pago': result.get('metodos_pago', []),
+            'region': result.get('region'),
+            # Otras entradas del mismo servicio colapsadas al construir el índice
+            'variantes': [{
+                'id': v.get('id'),
+                'nombre': v.get('nombre'),
+                'modalidad': v.get('modalidad'),
+                'telefono': (v.get('contacto') or {}).get('telefono'),
+            } for v in result.get('variantes', [])],
             'scores': {
                 'relevance': round(result.get('relevance_score', 0), 3),
                 'similarity': round(result.get('semantic_similarity', 0), 3)
@@ -295,10 +486,37 @@ def health_check():
         'systems': {
             'retrieval_loaded': retrieval_system is not None,
             'knowledge_loaded': knowledge_system is not None
-        }
+        },
+        'admision': admision.estado() if admision.activo else None,
+        'embeddings': stats_compartido()
     })
 
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness: 200 solo con los índices cargados (/health solo dice que el
+    proceso responde). Incluye los tiempos de cada fase del arranque
+    """
+    listo = sistemas_listos()
+    return jsonify({
+        'ready': listo,
+        'systems': {
+            'retrieval_loaded': retrieval_system is not None,
+            'knowledge_loaded': knowledge_system is not None
+        },
+        'arranque_ms': {fase: round(segundos * 1000, 1) for fase, segundos in tiempos_arranque.items()},
+        'pid': os.getpid()
+    }), 200 if listo else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas en formato de exposición de Prometheus"""
+    cuerpo, content_type = exposicion()
+    return app.response_class(cuerpo, content_type=content_type)
+
+
 @app.route('/debug', methods=['GET'])
 def debug_info():
     """
@@ -310,17 +528,24 @@ def debug_info():
         'systems': {
             'retrieval_loaded': retrieval_system is not None,
             'knowledge_loaded': knowledge_system is not None,
-            'retrieval_specialists_count': len(retrieval_system.especialistas) if retrieval_system else 0,
+            'retrieval_specialists_count': (sum(region_manager.tamanos().values()) if region_manager
+                                            else len(retrieval_system.especialistas) if retrieval_system else 0),
+            'regiones_activas': region_manager.activas if region_manager else None,
             'knowledge_articles_count': len(knowledge_system.articles) if knowledge_system else 0
         },
         'python_version': sys.version,
         'endpoints': [
             '/health',
+            '/metrics',
             '/debug',
             '/search',
+            '/facets',
+            '/especialistas_similares',
             '/emergency',
             '/buscar_especialista',
-            '/consultar_guia_medica'
+            '/buscar_especialista/stream',
+            '/consultar_guia_medica',
+            '/consultar_guia_medica/stream'
         ]
     })
 
@@ -334,6 +559,9 @@ def search_specialists():
     {
         "query": "Necesito ayuda con ansiedad",
         "top_k": 5,
+        "region": "cdmx",          // opcional, solo con REGIONS_CONFIG
+        "ubicacion": "Coyoacán",   // opcional, para elegir la región
+        "cuotas": {"especialista": 3, "servicio": 2},  // opcional, máximo por partición
         "filters": {
             "max_cost": 800,
             "min_rating": 4.5,
@@ -370,6 +598,24 @@ def search_specialists():
                 'error': 'top_k debe ser un entero entre 1 y 20'
             }), 400
         
+        cuotas = data.get('cuotas')
+        if cuotas is not None and (not isinstance(cuotas, dict) or
+                                   not all(isinstance(k, int) and k >= 0 for k in cuotas.values())):
+            return jsonify({
+                'success': False,
+                'error': 'cuotas debe ser un objeto {particion: entero}'
+            }), 400
+        
+        if cuotas:
+            disponibles = particiones_disponibles(data.get('ubicacion'), data.get('region'))
+            desconocidas = sorted(set(cuotas) - set(disponibles))
+            if desconocidas:
+                return jsonify({
+                    'success': False,
+                    'error': f"Particiones desconocidas en cuotas: {', '.join(desconocidas)} "
+                             f"(disponibles: {', '.join(disponibles)})"
+                }), 400
+        
         # Parsear filtros
         filters = None
         if 'filters' in data:
@@ -378,7 +624,9 @@ def search_specialists():
         logger.info(f"Búsqueda: '{query}' | Top K: {top_k} | Filtros: {filters}")
         
         # Realizar búsqueda
-        results = get_retrieval_system().search(query, filters=filters, top_k=top_k)
+        results = buscar_recursos(query, filters=filters, top_k=top_k,
+                                  ubicacion=data.get('ubicacion'), region=data.get('region'),
+                                  cuotas=cuotas)
         
         # Formatear para móvil
         mobile_results = format_for_mobile(results)
@@ -403,6 +651,143 @@ def search_specialists():
         }), 500
 
 
+@app.route('/facets', methods=['POST'])
+def search_facets():
+    """
+    Conteos por faceta (delegación, modalidad, tipo profesional y banda de precio)
+    sobre los candidatos filtrados y semánticamente relevantes
+    
+    Body (JSON):
+    {
+        "query": "Necesito ayuda con ansiedad",  // opcional
+        "candidate_k": 200,                       // opcional
+        "filters": {
+            "max_cost": 800,
+            "modalidad": ["Online"]
+        }
+    }
+    
+    Response:
+    {
+        "success": true,
+        "total": 12,
+        "facets": {
+            "delegacion": {"Coyoacán": 4, ...},
+            "modalidad": {"Presencial": 9, "Online": 5},
+            "tipo_profesional": {...},
+            "banda_precio": {"gratuito": 3, "bajo": 4, "medio": 3, "alto": 2}
+        }
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        query = data.get('query')
+        candidate_k = data.get('candidate_k', 200)
+        
+        if not isinstance(candidate_k, int) or candidate_k < 1 or candidate_k > 5000:
+            return jsonify({
+                'success': False,
+                'error': 'candidate_k debe ser un entero entre 1 y 5000'
+            }), 400
+        
+        filters = None
+        if 'filters' in data:
+            filters = parse_filters(data['filters'])
+        
+        if region_manager is not None:
+            result = region_manager.facets(query, filters=filters, candidate_k=candidate_k,
+                                           ubicacion=data.get('ubicacion'), region=data.get('region'))
+        else:
+            result = get_retrieval_system().facets(query, filters=filters, candidate_k=candidate_k)
+        
+        return jsonify({
+            'success': True,
+            'query': query,
+            'total': result['total'],
+            'facets': result['facets']
+        })
+    
+    except Exception as e:
+        logger.error(f"Error en facetas: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/especialistas_similares', methods=['POST'])
+def especialistas_similares():
+    """
+    Recursos más parecidos a uno dado ("más como este especialista"),
+    servidos desde el grafo de vecinos precalculado
+    
+    Body (JSON):
+    {
+        "id": "esp_001",
+        "top_k": 5,                  // opcional
+        "region": "cdmx",            // opcional, solo con REGIONS_CONFIG
+        "filters": {"max_cost": 800} // opcional
+    }
+    
+    Response:
+    {
+        "success": true,
+        "id": "esp_001",
+        "total_results": 5,
+        "results": [...]
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        resource_id = data.get('id')
+        top_k = data.get('top_k', 5)
+        
+        if not resource_id:
+            return jsonify({
+                'success': False,
+                'error': 'El campo "id" es requerido'
+            }), 400
+        if not isinstance(top_k, int) or top_k < 1 or top_k > 20:
+            return jsonify({
+                'success': False,
+                'error': 'top_k debe ser un entero entre 1 y 20'
+            }), 400
+        
+        filters = None
+        if 'filters' in data:
+            filters = parse_filters(data['filters'])
+        
+        try:
+            if region_manager is not None:
+                results = region_manager.similares(resource_id, top_k=top_k, filters=filters,
+                                                   region=data.get('region'))
+            else:
+                results = get_retrieval_system().similares(resource_id, top_k=top_k, filters=filters)
+        except KeyError:
+            return jsonify({
+                'success': False,
+                'error': f'Recurso no encontrado: {resource_id}'
+            }), 404
+        
+        mobile_results = format_for_mobile(results)
+        
+        return jsonify({
+            'success': True,
+            'id': resource_id,
+            'total_results': len(mobile_results),
+            'results': mobile_results
+        })
+    
+    except Exception as e:
+        logger.error(f"Error en similares: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.route('/emergency', methods=['POST'])
 def emergency_search():
     """
@@ -436,7 +821,8 @@ def emergency_search():
         logger.warning(f"🚨 BÚSQUEDA DE EMERGENCIA: '{query}'")
         
         # Buscar solo top 3 más relevantes en emergencia
-        results = get_retrieval_system().search(query, filters=filters, top_k=3)
+        results = buscar_recursos(query, filters=filters, top_k=3,
+                                  ubicacion=data.get('ubicacion'), region=data.get('region'))
         mobile_results = format_for_mobile(results)
         
         response = {
@@ -458,6 +844,212 @@ def emergency_search():
         }), 500
 
 
+# Palabras que indican búsqueda de servicio digital/app (meditación, relajación, etc.)
+PALABRAS_BUSQUEDA_DIGITAL = [
+    'meditación', 'meditacion', 'mindfulness', 'app', 'aplicación',
+    'aplicacion', 'herramienta', 'relajación', 'relajacion', 'yoga',
+    'respiración', 'respiracion', 'ejercicio', 'autoayuda'
+]
+
+NUMEROS_EMERGENCIA_CRISIS = {
+    'mexico': '800-911-2000 (Línea de la Vida - 24/7 GRATUITO)',
+    'emergencia_general': '911',
+    'mensaje': 'Por favor contacta inmediatamente si estás en peligro'
+}
+
+NUMEROS_EMERGENCIA_RIESGO = {
+    'mexico': '800-911-2000 (Línea de la Vida - 24/7)',
+    'emergencia_general': '911',
+    'mensaje': 'Recursos de crisis disponibles 24/7'
+}
+
+RESULTADOS_POR_PAGINA = 3
+
+
+def parametros_busqueda(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Parámetros de buscar_especialista y la query natural para el RecSys"""
+    sintoma = data['sintoma']
+    genero = data.get('genero', '').lower()  # hombre, mujer, etc.
+    ubicacion = data.get('ubicacion', '')
+    
+    # Construir query natural para el RecSys
+    query_parts = [f"Necesito ayuda con {sintoma}"]
+    
+    # Detectar si es una búsqueda de servicio digital/app (meditación, relajación, etc.)
+    es_busqueda_digital = any(word in sintoma.lower() for word in PALABRAS_BUSQUEDA_DIGITAL)
+    
+    if ubicacion and not es_busqueda_digital:
+        query_parts.append(f"cerca de {ubicacion}")
+    if genero:
+        query_parts.append(f"especialista {genero}")
+    
+    return {
+        'sintoma': sintoma,
+        'genero': genero,
+        'presupuesto': data.get('presupuesto', ''),
+        'ubicacion': ubicacion,
+        'region': data.get('region'),
+        'es_busqueda_digital': es_busqueda_digital,
+        'query': " ".join(query_parts),
+        'offset': data.get('offset', 0),  # Parámetro de paginación
+        'top_k': data.get('top_k', 10),   # Aumentado a 10 por defecto
+    }
+
+
+def evaluar_crisis(sintoma: str, query: str) -> tuple:
+    """
+    Nivel de crisis léxico y semántico
+    
+    Returns:
+        tuple: (nivel, requiere_emergencia, query_embedding)
+        - query_embedding: embedding de la query, reutilizado en la búsqueda
+          normal (None si la detección léxica ya dio CRITICO). El protocolo de
+          emergencia embebe su propia query (query_crisis)
+    """
+    # 🚨 DETECCIÓN DE CRISIS (léxica)
+    nivel_crisis, requiere_emergencia = detectar_nivel_crisis(sintoma)
+    
+    # Detección semántica sobre el texto del usuario: la query compuesta
+    # ("Necesito ayuda con ... cerca de ...") diluye la señal. Ambos
+    # embeddings salen de una sola llamada a la API
+    query_embedding = None
+    if nivel_crisis != 'CRITICO':
+        embeddings = get_retrieval_system().embed_queries([query, sintoma])
+        query_embedding = embeddings[:1]
+        semantica = get_retrieval_system().classify_crisis(embeddings[1:])
+        nivel_combinado = nivel_mas_grave({nivel_crisis, semantica.nivel})
+        if nivel_combinado != nivel_crisis:
+            logger.warning(f"RIESGO SEMÁNTICO: nivel {semantica.nivel} (similitud {semantica.similitud:.3f} con '{semantica.prototipo}')")
+            nivel_crisis = nivel_combinado
+            requiere_emergencia = nivel_crisis in NIVELES_EMERGENCIA
+    
+    return nivel_crisis, requiere_emergencia, query_embedding
+
+
+def query_crisis(params: Dict[str, Any]) -> str:
+    """Query del protocolo de emergencia (siempre se embebe ella misma)"""
+    return f"crisis psicológica {params['sintoma']}"
+
+
+def buscar_en_crisis(params: Dict[str, Any]) -> list:
+    """Protocolo de emergencia: recursos de crisis sin restricciones de perfil"""
+    filters_emergencia = QueryFilters(
+        es_emergencia=True,
+        max_cost=2000  # Menos restrictivo en crisis
+    )
+    return buscar_recursos(
+        query_crisis(params), 
+        filters=filters_emergencia, 
+        top_k=3,
+        ubicacion=params['ubicacion'],
+        region=params['region']
+    )
+
+
+def filtros_busqueda(params: Dict[str, Any]) -> QueryFilters:
+    """Filtros del RecSys a partir de presupuesto, ubicación y género"""
+    filters = QueryFilters()
+    presupuesto = params['presupuesto']
+    ubicacion = params['ubicacion']
+    genero = params['genero']
+    
+    # Filtro de presupuesto
+    if presupuesto:
+        presupuesto_lower = presupuesto.lower()
+        if any(word in presupuesto_lower for word in ['barato', 'económico', 'gratuito', 'gratis', 'sin dinero', 'estudiante', 'barata']):
+            filters.max_cost = 600
+            filters.es_gratuito = True
+        elif any(word in presupuesto_lower for word in ['medio', 'moderado', 'accesible', 'razonable']):
+            filters.max_cost = 1200
+        elif any(word in presupuesto_lower for word in ['caro', 'premium', 'privado']):
+            filters.max_cost = 3000
+        # Si no especifica límite, dejamos sin restricción
+    
+    # Filtro de ubicación (NO aplicar para búsquedas digitales)
+    if ubicacion and not params['es_busqueda_digital']:
+        filters.delegacion = ubicacion
+    
+    # Filtro de género (usar el campo correcto del sistema)
+    if genero:
+        # Mapear los valores comunes a los esperados por el sistema
+        genero_map = {
+            'hombre': 'Masculino',
+            'masculino': 'Masculino',
+            'mujer': 'Femenino',
+            'femenino': 'Femenino',
+            'femenina': 'Femenino',
+            'cualquiera': 'Mixto',
+            'indistinto': 'Mixto'
+        }
+        genero_normalizado = genero_map.get(genero, genero.capitalize())
+        filters.genero_especialista = genero_normalizado
+    
+    return filters
+
+
+def buscar_pagina(params: Dict[str, Any], filters: QueryFilters, query_embedding) -> tuple:
+    """
+    Busca especialistas y recorta la página pedida
+    
+    Returns:
+        tuple: (resultados de la página, total disponibles)
+    """
+    # Sin cuotas por partición: solo /search las aplica, cuando el cliente las envía
+    results = buscar_recursos(params['query'], filters=filters, top_k=params['top_k'],
+                              query_embedding=query_embedding,
+                              ubicacion=params['ubicacion'], region=params['region'])
+    
+    logger.info(f"✓ Encontrados {len(results)} resultados totales")
+    
+    # Aplicar offset para paginación
+    offset = params['offset']
+    results_paginados = results[offset:offset + RESULTADOS_POR_PAGINA]
+    
+    logger.info(f"   Mostrando resultados {offset+1} a {offset+len(results_paginados)} de {len(results)}")
+    return results_paginados, len(results)
+
+
+def respuesta_voz_busqueda(params: Dict[str, Any], nivel_crisis: str, mobile_results: list,
+                           total_disponibles: int) -> str:
+    """Respuesta empática más el aviso de resultados adicionales"""
+    respuesta_voz = generar_respuesta_empatica(
+        sintoma=params['sintoma'],
+        nivel_crisis=nivel_crisis,
+        num_resultados=len(mobile_results),
+        tiene_resultados=len(mobile_results) > 0,
+        genero=params['genero'],
+        ubicacion=params['ubicacion'],
+        primer_resultado=mobile_results[0] if mobile_results else None
+    )
+    
+    # Agregar información sobre resultados adicionales
+    if params['offset'] + RESULTADOS_POR_PAGINA < total_disponibles:
+        resultados_restantes = total_disponibles - (params['offset'] + len(mobile_results))
+        respuesta_voz += f" Tengo {resultados_restantes} opcione{'s' if resultados_restantes > 1 else ''} más disponible{'s' if resultados_restantes > 1 else ''}. ¿Te gustaría conocerlas?"
+    return respuesta_voz
+
+
+def parametros_respuesta(params: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        'sintoma': params['sintoma'],
+        'genero': params['genero'] or 'no especificado',
+        'presupuesto': params['presupuesto'] or 'no especificado',
+        'ubicacion': params['ubicacion'] or 'no especificado'
+    }
+
+
+def paginacion_busqueda(params: Dict[str, Any], mostrando: int, total_disponibles: int) -> Dict[str, Any]:
+    offset = params['offset']
+    hay_mas = (offset + RESULTADOS_POR_PAGINA) < total_disponibles
+    return {
+        'offset_actual': offset,
+        'mostrando': mostrando,
+        'total_disponibles': total_disponibles,
+        'hay_mas': hay_mas,
+        'siguiente_offset': offset + RESULTADOS_POR_PAGINA if hay_mas else None
+    }
+
+
 @app.route('/buscar_especialista', methods=['POST'])
 def buscar_especialista():
     """
@@ -480,193 +1072,87 @@ def buscar_especialista():
     }
     """
     try:
-        data = request.get_json()
+        with etapa('parseo'):
+            data = request.get_json()
+            params = parametros_busqueda(data) if data and 'sintoma' in data else None
         
         # Validar parámetro requerido
-        if not data or 'sintoma' not in data:
+        if params is None:
             return jsonify({
                 'success': False,
                 'error': 'El parámetro "sintoma" es requerido',
                 'respuesta_voz': 'Lo siento, necesito que me digas qué síntoma o problema tienes.'
             }), 400
         
-        # Extraer parámetros
-        sintoma = data['sintoma']
-        genero = data.get('genero', '').lower()  # hombre, mujer, etc.
-        presupuesto = data.get('presupuesto', '')
-        ubicacion = data.get('ubicacion', '')
+        sintoma = params['sintoma']
         
-        # 🚨 DETECCIÓN DE CRISIS
-        nivel_crisis, requiere_emergencia = detectar_nivel_crisis(sintoma)
+        nivel_crisis, requiere_emergencia, query_embedding = evaluar_crisis(sintoma, params['query'])
         
         if requiere_emergencia:
             logger.critical(f"🚨🚨🚨 CRISIS DETECTADA - Usuario: '{sintoma}' - Nivel: {nivel_crisis}")
             # Activar endpoint de emergencia automáticamente
             if nivel_crisis == 'CRITICO':
                 # Redirigir a protocolo de emergencia
-                filters_emergencia = QueryFilters(
-                    es_emergencia=True,
-                    max_cost=2000  # Menos restrictivo en crisis
-                )
-                results = get_retrieval_system().search(
-                    f"crisis psicológica {sintoma}", 
-                    filters=filters_emergencia, 
-                    top_k=3
-                )
-                mobile_results = format_for_mobile(results)
+                mobile_results = format_for_mobile(buscar_en_crisis(params))
                 
                 respuesta_voz = generar_respuesta_empatica(
                     sintoma=sintoma,
                     nivel_crisis=nivel_crisis,
                     num_resultados=len(mobile_results),
                     tiene_resultados=len(mobile_results) > 0,
-                    genero=genero,
-                    ubicacion=ubicacion,
+                    genero=params['genero'],
+                    ubicacion=params['ubicacion'],
                     primer_resultado=mobile_results[0] if mobile_results else None
                 )
                 
-                return jsonify({
-                    'success': True,
-                    'alerta_crisis': True,
-                    'nivel_urgencia': nivel_crisis,
-                    'respuesta_voz': respuesta_voz,
-                    'numeros_emergencia': {
-                        'mexico': '800-911-2000 (Línea de la Vida - 24/7 GRATUITO)',
-                        'emergencia_general': '911',
-                        'mensaje': 'Por favor contacta inmediatamente si estás en peligro'
-                    },
-                    'parametros': {
-                        'sintoma': sintoma,
-                        'genero': genero or 'no especificado',
-                        'presupuesto': presupuesto or 'no especificado',
-                        'ubicacion': ubicacion or 'no especificado'
-                    },
-                    'total_resultados': len(mobile_results),
-                    'resultados': mobile_results
-                }), 200
-        
-        # Construir query natural para el RecSys
-        query_parts = [f"Necesito ayuda con {sintoma}"]
-        
-        # Detectar si es una búsqueda de servicio digital/app (meditación, relajación, etc.)
-        es_busqueda_digital = any(word in sintoma.lower() for word in [
-            'meditación', 'meditacion', 'mindfulness', 'app', 'aplicación', 
-            'aplicacion', 'herramienta', 'relajación', 'relajacion', 'yoga', 
-            'respiración', 'respiracion', 'ejercicio', 'autoayuda'
-        ])
-        
-        if ubicacion and not es_busqueda_digital:
-            query_parts.append(f"cerca de {ubicacion}")
-        if genero:
-            query_parts.append(f"especialista {genero}")
-        query = " ".join(query_parts)
+                with etapa('serializacion'):
+                    return jsonify({
+                        'success': True,
+                        'alerta_crisis': True,
+                        'nivel_urgencia': nivel_crisis,
+                        'respuesta_voz': respuesta_voz,
+                        'numeros_emergencia': NUMEROS_EMERGENCIA_CRISIS,
+                        'parametros': parametros_respuesta(params),
+                        'total_resultados': len(mobile_results),
+                        'resultados': mobile_results
+                    }), 200
         
         # Configurar filtros según parámetros
-        filters = QueryFilters()
-        
-        # Filtro de presupuesto
-        if presupuesto:
-            presupuesto_lower = presupuesto.lower()
-            if any(word in presupuesto_lower for word in ['barato', 'económico', 'gratuito', 'gratis', 'sin dinero', 'estudiante', 'barata']):
-                filters.max_cost = 600
-                filters.es_gratuito = True
-            elif any(word in presupuesto_lower for word in ['medio', 'moderado', 'accesible', 'razonable']):
-                filters.max_cost = 1200
-            elif any(word in presupuesto_lower for word in ['caro', 'premium', 'privado']):
-                filters.max_cost = 3000
-            # Si no especifica límite, dejamos sin restricción
-        
-        # Filtro de ubicación (NO aplicar para búsquedas digitales)
-        if ubicacion and not es_busqueda_digital:
-            filters.delegacion = ubicacion
-        
-        # Filtro de género (usar el campo correcto del sistema)
-        if genero:
-            # Mapear los valores comunes a los esperados por el sistema
-            genero_map = {
-                'hombre': 'Masculino',
-                'masculino': 'Masculino',
-                'mujer': 'Femenino',
-                'femenino': 'Femenino',
-                'femenina': 'Femenino',
-                'cualquiera': 'Mixto',
-                'indistinto': 'Mixto'
-            }
-            genero_normalizado = genero_map.get(genero, genero.capitalize())
-            filters.genero_especialista = genero_normalizado
+        filters = filtros_busqueda(params)
         
         # Log de búsqueda
-        logger.info(f"🔍 Búsqueda especialista: sintoma='{sintoma}', genero='{genero}', presupuesto='{presupuesto}', ubicacion='{ubicacion}'")
-        logger.info(f"   Query construida: '{query}'")
-        logger.info(f"   Es búsqueda digital: {es_busqueda_digital}")
+        logger.info(f"🔍 Búsqueda especialista: sintoma='{sintoma}', genero='{params['genero']}', presupuesto='{params['presupuesto']}', ubicacion='{params['ubicacion']}'")
+        logger.info(f"   Query construida: '{params['query']}'")
+        logger.info(f"   Es búsqueda digital: {params['es_busqueda_digital']}")
         logger.info(f"   Filtros aplicados: max_cost={filters.max_cost}, delegacion={filters.delegacion}, genero={filters.genero_especialista}")
         
         # Buscar especialistas (top 10 para tener más opciones disponibles)
-        offset = data.get('offset', 0)  # Parámetro de paginación
-        top_k = data.get('top_k', 10)   # Aumentado a 10 por defecto
-        
-        results = get_retrieval_system().search(query, filters=filters, top_k=top_k)
-        
-        logger.info(f"✓ Encontrados {len(results)} resultados totales")
-        
-        # Aplicar offset para paginación
-        results_paginados = results[offset:offset+3]  # Mostrar 3 por página
-        total_disponibles = len(results)
-        hay_mas = (offset + 3) < total_disponibles
-        
-        logger.info(f"   Mostrando resultados {offset+1} a {offset+len(results_paginados)} de {total_disponibles}")
+        results_paginados, total_disponibles = buscar_pagina(params, filters, query_embedding)
         
         # Formatear para móvil
         mobile_results = format_for_mobile(results_paginados)
         
         # Generar respuesta empática usando la función
-        respuesta_voz = generar_respuesta_empatica(
-            sintoma=sintoma,
-            nivel_crisis=nivel_crisis,
-            num_resultados=len(mobile_results),
-            tiene_resultados=len(mobile_results) > 0,
-            genero=genero,
-            ubicacion=ubicacion,
-            primer_resultado=mobile_results[0] if mobile_results else None
-        )
-        
-        # Agregar información sobre resultados adicionales
-        if hay_mas:
-            resultados_restantes = total_disponibles - (offset + len(results_paginados))
-            respuesta_voz += f" Tengo {resultados_restantes} opcione{'s' if resultados_restantes > 1 else ''} más disponible{'s' if resultados_restantes > 1 else ''}. ¿Te gustaría conocerlas?"
+        respuesta_voz = respuesta_voz_busqueda(params, nivel_crisis, mobile_results, total_disponibles)
         
         response = {
             'success': True,
             'alerta_crisis': requiere_emergencia,
             'nivel_urgencia': nivel_crisis,
             'respuesta_voz': respuesta_voz,
-            'parametros': {
-                'sintoma': sintoma,
-                'genero': genero or 'no especificado',
-                'presupuesto': presupuesto or 'no especificado',
-                'ubicacion': ubicacion or 'no especificado'
-            },
-            'paginacion': {
-                'offset_actual': offset,
-                'mostrando': len(mobile_results),
-                'total_disponibles': total_disponibles,
-                'hay_mas': hay_mas,
-                'siguiente_offset': offset + 3 if hay_mas else None
-            },
+            'parametros': parametros_respuesta(params),
+            'paginacion': paginacion_busqueda(params, len(mobile_results), total_disponibles),
             'total_resultados': len(mobile_results),
             'resultados': mobile_results
         }
         
         # Agregar números de emergencia si es alto riesgo
         if nivel_crisis in ['CRITICO', 'ALTO']:
-            response['numeros_emergencia'] = {
-                'mexico': '800-911-2000 (Línea de la Vida - 24/7)',
-                'emergencia_general': '911',
-                'mensaje': 'Recursos de crisis disponibles 24/7'
-            }
+            response['numeros_emergencia'] = NUMEROS_EMERGENCIA_RIESGO
         
         logger.info(f"✓ Retornando {len(mobile_results)} resultados para buscar_especialista")
-        return jsonify(response)
+        with etapa('serializacion'):
+            return jsonify(response)
     
     except Exception as e:
         logger.error(f"Error en buscar_especialista: {str(e)}")
@@ -678,6 +1164,24 @@ def buscar_especialista():
         }), 500
 
 
+def paginacion_guia(total_disponibles: int, top_k: int) -> Dict[str, Any]:
+    hay_mas = total_disponibles > top_k
+    return {
+        'mostrando': min(top_k, total_disponibles),
+        'total_disponibles': total_disponibles,
+        'hay_mas': hay_mas,
+        'siguiente_top_k': top_k + 1 if hay_mas else None
+    }
+
+
+def voz_mas_tecnicas(total_disponibles: int, top_k: int) -> str:
+    """Aviso de voz si hay más técnicas/recursos disponibles"""
+    restantes = total_disponibles - top_k
+    if restantes <= 0:
+        return ''
+    return f"También tengo {restantes} técnica{'s' if restantes > 1 else ''} más relacionada{'s' if restantes > 1 else ''} que te pueden ayudar. ¿Quieres conocerlas?"
+
+
 @app.route('/consultar_guia_medica', methods=['POST'])
 def consultar_guia_medica():
     """
@@ -702,7 +1206,8 @@ def consultar_guia_medica():
     }
     """
     try:
-        data = request.get_json()
+        with etapa('parseo'):
+            data = request.get_json()
         
         if not data or 'pregunta' not in data:
             return jsonify({
@@ -718,7 +1223,7 @@ def consultar_guia_medica():
         
         # Buscar en base de conocimiento - buscar más para saber si hay otros disponibles
         logger.info(f"❗️ Llamando a knowledge_system.ask()...")
-        resultados = get_knowledge_system().ask(pregunta, top_k=5, include_context=True)
+        resultados = get_knowledge_system().ask(pregunta, top_k=5, include_context=True, top_passages=3)
         logger.info(f"❗️ Resultados obtenidos: {len(resultados) if resultados else 0}")
         
         if not resultados:
@@ -732,82 +1237,30 @@ def consultar_guia_medica():
         # Tomar solo los primeros top_k resultados para retornar
         resultados_a_mostrar = resultados[:top_k]
         total_disponibles = len(resultados)
-        hay_mas = total_disponibles > top_k
         
         articulo = resultados_a_mostrar[0]
-        tema = articulo.get('tema', 'Información')
-        categoria = articulo.get('categoria', 'General')
-        nivel_urgencia = articulo.get('nivel_urgencia', 'N/A')
-        
-        # Generar respuesta para voz (concisa y natural)
-        respuesta_voz_parts = []
-        
-        # Intro
-        if nivel_urgencia == 'CRÍTICO':
-            respuesta_voz_parts.append(f"⚠️ ATENCIÓN: Esta es una situación crítica. ")
-            # Agregar números de emergencia si existen
-            if 'NUMEROS_EMERGENCIA' in articulo:
-                numeros = articulo['NUMEROS_EMERGENCIA']
-                if 'México' in numeros:
-                    respuesta_voz_parts.append(f"Por favor llama inmediatamente al {numeros['México']}. ")
-        
-        respuesta_voz_parts.append(f"Sobre {tema}: ")
-        
-        # Descripción breve
-        if 'descripcion_clinica' in articulo:
-            desc = articulo['descripcion_clinica']
-            # Limitar longitud para voz
-            if len(desc) > 150:
-                desc = desc[:147] + "..."
-            respuesta_voz_parts.append(f"{desc} ")
-        
-        # Pasos inmediatos (máximo 3)
-        pasos_key = 'PASOS_INMEDIATOS_CRÍTICOS' if 'PASOS_INMEDIATOS_CRÍTICOS' in articulo else 'pasos_inmediatos'
-        if pasos_key in articulo:
-            pasos = articulo[pasos_key][:3]  # Solo primeros 3
-            respuesta_voz_parts.append("Aquí están los pasos que puedes seguir: ")
-            for i, paso in enumerate(pasos, 1):
-                if isinstance(paso, dict):
-                    nombre = paso.get('nombre', paso.get('accion', ''))
-                    respuesta_voz_parts.append(f"{i}. {nombre}. ")
-        
-        # Informar si hay más técnicas/recursos disponibles
-        if hay_mas:
-            respuesta_voz_parts.append(f"También tengo {total_disponibles - top_k} técnica{'s' if (total_disponibles - top_k) > 1 else ''} más relacionada{'s' if (total_disponibles - top_k) > 1 else ''} que te pueden ayudar. ¿Quieres conocerlas?")
-        
-        respuesta_voz = "".join(respuesta_voz_parts)
-        
-        # Formatear artículo completo para contexto (opcional)
-        articulo_formateado = {
-            'tema': tema,
-            'categoria': categoria,
-            'nivel_urgencia': nivel_urgencia,
-            'descripcion': articulo.get('descripcion_clinica', ''),
-            'sintomas': articulo.get('sintomas_clave', []),
-            'pasos': articulo.get(pasos_key, []),
-            'relevancia': articulo.get('relevancia', 'N/A'),
-            'similarity_score': articulo.get('similarity_score', 0)
-        }
-        
-        # Agregar números de emergencia si es crítico
-        if nivel_urgencia == 'CRÍTICO' and 'NUMEROS_EMERGENCIA' in articulo:
-            articulo_formateado['numeros_emergencia'] = articulo['NUMEROS_EMERGENCIA']
-        
-        response = {
-            'success': True,
-            'respuesta_voz': respuesta_voz,
-            'pregunta': pregunta,
-            'articulo': articulo_formateado,
-            'paginacion': {
-                'mostrando': len(resultados_a_mostrar),
-                'total_disponibles': total_disponibles,
-                'hay_mas': hay_mas,
-                'siguiente_top_k': top_k + 1 if hay_mas else None
-            }
-        }
+        knowledge_system = get_knowledge_system()
+        
+        # Respuesta para voz: intro y pasos precalculados por artículo,
+        # más el aviso si hay otras técnicas/recursos disponibles
+        with etapa('respuesta_voz'):
+            respuesta_voz = knowledge_system.voice_response(articulo) + voz_mas_tecnicas(total_disponibles, top_k)
+        
+        paginacion = paginacion_guia(total_disponibles, top_k)
+        
+        # El artículo formateado ya viene serializado (fragmento estático
+        # precalculado + pasos + relevancia); solo se arma el sobre
+        with etapa('serializacion'):
+            body = (
+                '{"success": true, '
+                f'"respuesta_voz": {json.dumps(respuesta_voz, ensure_ascii=False)}, '
+                f'"pregunta": {json.dumps(pregunta, ensure_ascii=False)}, '
+                f'"articulo": {knowledge_system.article_projection_json(articulo)}, '
+                f'"paginacion": {json.dumps(paginacion)}}}'
+            )
         
         logger.info(f"✓ Retornando respuesta para consulta guía médica (mostrando {len(resultados_a_mostrar)} de {total_disponibles})")
-        return jsonify(response)
+        return app.response_class(body, mimetype='application/json')
     
     except Exception as e:
         logger.error(f"❌ Error en consultar_guia_medica: {str(e)}")
@@ -819,6 +1272,242 @@ def consultar_guia_medica():
         }), 500
 
 
+# ============================================================================
+# Respuestas en streaming (NDJSON o SSE) para las herramientas de voz
+# ============================================================================
+# Cada línea/evento es un objeto JSON con 'evento' y 't_ms' (milisegundos
+# desde que llegó el request), en este orden:
+#   crisis     -> veredicto de crisis (y números de emergencia si aplica)
+#   voz        -> primera frase de la respuesta de voz
+#   resultado  -> cada especialista (o 'articulo' en la guía médica)
+#   voz        -> resto de la respuesta de voz
+#   fin        -> respuesta_voz completa, paginación y totales
+# Con 'Accept: text/event-stream' se envía como SSE; si no, como NDJSON.
+
+class JSONCrudo(str):
+    """Valor ya serializado como JSON que se inserta tal cual en un evento"""
+
+
+@cronometrado('serializacion')
+def serializar_evento(evento: Dict[str, Any]) -> str:
+    return '{' + ', '.join(
+        f'{json.dumps(k)}: {v if isinstance(v, JSONCrudo) else json.dumps(v, ensure_ascii=False)}'
+        for k, v in evento.items()) + '}'
+
+
+def stream_eventos(generar, nombre: str):
+    """
+    Respuesta HTTP en streaming a partir de un generador de eventos.
+    Un error a mitad del stream se envía como evento 'error'.
+    """
+    inicio = time.perf_counter()
+    sse = 'text/event-stream' in request.headers.get('Accept', '')
+    endpoint = endpoint_actual.get()
+    
+    def cuerpo():
+        # El cuerpo se genera después de after_request: las etapas se
+        # etiquetan con el endpoint del request que lo creó
+        endpoint_actual.set(endpoint)
+        primer_evento_ms = None
+        try:
+            for evento in generar():
+                t_ms = round((time.perf_counter() - inicio) * 1000, 1)
+                evento['t_ms'] = t_ms
+                if primer_evento_ms is None:
+                    primer_evento_ms = t_ms
+                linea = serializar_evento(evento)
+                yield f"event: {evento['evento']}\ndata: {linea}\n\n" if sse else linea + '\n'
+        except Exception as e:
+            logger.error(f"❌ Error en {nombre} (stream): {str(e)}")
+            logger.exception(e)
+            registrar_degradada('error')
+            error = serializar_evento({
+                'evento': 'error',
+                'success': False,
+                'error': str(e),
+                'respuesta_voz': 'Lo siento, tuve un problema técnico. ¿Puedes intentarlo de nuevo?',
+                't_ms': round((time.perf_counter() - inicio) * 1000, 1)
+            })
+            yield f"event: error\ndata: {error}\n\n" if sse else error + '\n'
+        logger.info(f"⏱️  {nombre} (stream): primer evento {primer_evento_ms} ms, "
+                    f"total {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    
+    mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+    response = app.response_class(cuerpo(), mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Sin buffer en proxies (nginx/Render)
+    return response
+
+
+def evento_crisis(nivel_crisis: str, requiere_emergencia: bool) -> Dict[str, Any]:
+    evento = {'evento': 'crisis', 'alerta_crisis': requiere_emergencia, 'nivel_urgencia': nivel_crisis}
+    if nivel_crisis == 'CRITICO':
+        evento['numeros_emergencia'] = NUMEROS_EMERGENCIA_CRISIS
+    elif nivel_crisis == 'ALTO':
+        evento['numeros_emergencia'] = NUMEROS_EMERGENCIA_RIESGO
+    return evento
+
+
+def resto_voz(completa: str, apertura: str) -> str:
+    """Parte de la respuesta de voz que falta después de la apertura ya enviada"""
+    return completa[len(apertura):] if completa.startswith(apertura) else completa
+
+
+@app.route('/buscar_especialista/stream', methods=['POST'])
+def buscar_especialista_stream():
+    """
+    Igual que /buscar_especialista pero en streaming: el veredicto de crisis
+    y la primera frase de voz salen antes de buscar, y cada resultado se
+    envía en cuanto está formateado.
+    
+    Body (JSON): mismo que /buscar_especialista
+    
+    Response (NDJSON, una línea por evento):
+    {"evento": "crisis", "alerta_crisis": false, "nivel_urgencia": "NORMAL", "t_ms": 210.4}
+    {"evento": "voz", "texto": "Gracias por confiar en mí. ", "t_ms": 210.6}
+    {"evento": "resultado", "indice": 0, "resultado": {...}, "t_ms": 214.0}
+    {"evento": "voz", "texto": "Encontré 3 especialistas...", "t_ms": 215.1}
+    {"evento": "fin", "success": true, "respuesta_voz": "...", "paginacion": {...}, "t_ms": 215.2}
+    """
+    with etapa('parseo'):
+        data = request.get_json(silent=True)
+        params = parametros_busqueda(data) if data and 'sintoma' in data else None
+    if params is None:
+        return jsonify({
+            'success': False,
+            'error': 'El parámetro "sintoma" es requerido',
+            'respuesta_voz': 'Lo siento, necesito que me digas qué síntoma o problema tienes.'
+        }), 400
+    
+    def eventos():
+        sintoma = params['sintoma']
+        nivel_crisis, requiere_emergencia, query_embedding = evaluar_crisis(sintoma, params['query'])
+        critico = requiere_emergencia and nivel_crisis == 'CRITICO'
+        if requiere_emergencia:
+            logger.critical(f"🚨🚨🚨 CRISIS DETECTADA - Usuario: '{sintoma}' - Nivel: {nivel_crisis}")
+        yield evento_crisis(nivel_crisis, requiere_emergencia)
+        
+        apertura = apertura_respuesta(sintoma, nivel_crisis)
+        yield {'evento': 'voz', 'texto': apertura}
+        
+        if critico:
+            resultados = buscar_en_crisis(params)
+            total_disponibles = len(resultados)
+        else:
+            resultados, total_disponibles = buscar_pagina(params, filtros_busqueda(params), query_embedding)
+        
+        mobile_results = []
+        for indice, resultado in enumerate(resultados):
+            mobile_result = format_for_mobile([resultado])[0]
+            mobile_results.append(mobile_result)
+            yield {'evento': 'resultado', 'indice': indice, 'resultado': mobile_result}
+        
+        if critico:
+            respuesta_voz = generar_respuesta_empatica(
+                sintoma=sintoma,
+                nivel_crisis=nivel_crisis,
+                num_resultados=len(mobile_results),
+                tiene_resultados=len(mobile_results) > 0,
+                genero=params['genero'],
+                ubicacion=params['ubicacion'],
+                primer_resultado=mobile_results[0] if mobile_results else None
+            )
+        else:
+            respuesta_voz = respuesta_voz_busqueda(params, nivel_crisis, mobile_results, total_disponibles)
+        yield {'evento': 'voz', 'texto': resto_voz(respuesta_voz, apertura)}
+        
+        fin = {
+            'evento': 'fin',
+            'success': True,
+            'respuesta_voz': respuesta_voz,
+            'parametros': parametros_respuesta(params),
+            'total_resultados': len(mobile_results)
+        }
+        if not critico:
+            fin['paginacion'] = paginacion_busqueda(params, len(mobile_results), total_disponibles)
+        yield fin
+    
+    return stream_eventos(eventos, 'buscar_especialista')
+
+
+@app.route('/consultar_guia_medica/stream', methods=['POST'])
+def consultar_guia_medica_stream():
+    """
+    Igual que /consultar_guia_medica pero en streaming: veredicto de crisis
+    (léxico, sin esperar al RAG), intro de voz, artículo y pasos.
+    
+    Body (JSON): mismo que /consultar_guia_medica
+    
+    Response (NDJSON): eventos crisis, voz (intro), articulo, voz (pasos), fin
+    """
+    data = request.get_json(silent=True)
+    if not data or 'pregunta' not in data:
+        return jsonify({
+            'success': False,
+            'error': 'El parámetro "pregunta" es requerido',
+            'respuesta_voz': 'Lo siento, necesito que me digas qué quieres saber.'
+        }), 400
+    
+    pregunta = data['pregunta']
+    top_k = data.get('top_k', 1)
+    
+    def eventos():
+        nivel_crisis, requiere_emergencia = detectar_nivel_crisis(pregunta)
+        yield evento_crisis(nivel_crisis, requiere_emergencia)
+        
+        knowledge_system = get_knowledge_system()
+        resultados = knowledge_system.ask(pregunta, top_k=5, include_context=True, top_passages=3)
+        if not resultados:
+            respuesta_voz = 'Lo siento, no encontré información sobre eso. ¿Puedes reformular tu pregunta?'
+            yield {'evento': 'voz', 'texto': respuesta_voz}
+            yield {'evento': 'fin', 'success': False, 'respuesta_voz': respuesta_voz, 'pregunta': pregunta}
+            return
+        
+        articulo = resultados[0]
+        intro, pasos = knowledge_system.voice_parts(articulo)
+        yield {'evento': 'voz', 'texto': intro}
+        yield {'evento': 'articulo', 'articulo': JSONCrudo(knowledge_system.article_projection_json(articulo))}
+        
+        paginacion = paginacion_guia(len(resultados), top_k)
+        pasos += voz_mas_tecnicas(len(resultados), top_k)
+        yield {'evento': 'voz', 'texto': pasos}
+        yield {
+            'evento': 'fin',
+            'success': True,
+            'respuesta_voz': intro + pasos,
+            'pregunta': pregunta,
+            'paginacion': paginacion
+        }
+    
+    return stream_eventos(eventos, 'consultar_guia_medica')
+
+
+@app.route('/admin/profiles/<perfil_id>', methods=['GET'])
+def admin_profile(perfil_id: str):
+    """
+    Descarga un perfil guardado (requiere header X-Admin-Token con ADMIN_TOKEN)
+    
+    Query params:
+        formato: 'folded' (pilas colapsadas para flamegraph.pl/speedscope, default)
+                 o 'json' (tiempos por etapa y metadatos)
+    """
+    if not perfilador.autorizado(request.headers.get('X-Admin-Token')):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    formato = request.args.get('formato', 'folded')
+    if formato not in ('folded', 'json'):
+        return jsonify({'success': False, 'error': 'formato debe ser "folded" o "json"'}), 400
+    
+    ruta = perfilador.ruta(perfil_id, f".{formato}")
+    if ruta is None:
+        return jsonify({'success': False, 'error': f'Perfil no encontrado: {perfil_id}'}), 404
+    
+    with open(ruta, 'r', encoding='utf-8') as f:
+        contenido = f.read()
+    mimetype = 'application/json' if formato == 'json' else 'text/plain'
+    return app.response_class(contenido, mimetype=mimetype)
+
+
 @app.route('/admin/rebuild_faiss', methods=['POST'])
 def admin_rebuild_faiss():
     """
@@ -826,37 +1515,37 @@ def admin_rebuild_faiss():
     Llamar desde navegador: POST https://tu-api.onrender.com/admin/rebuild_faiss
     """
     try:
-        import shutil
-        
         logger.warning("🔄 ADMIN: Iniciando regeneración de índice FAISS...")
         
-        # Eliminar cache viejo
-        cache_dir = 'faiss_recursos'
-        if os.path.exists(cache_dir):
-            logger.info(f"🗑️  Eliminando cache: {cache_dir}")
-            shutil.rmtree(cache_dir)
-        
-        # Regenerar sistema con force_rebuild
+        # Regenerar sistema con force_rebuild. Sin borrar faiss_recursos/: el
+        # snapshot se reemplaza de forma atómica y si la regeneración falla
+        # quedan el índice, el manifiesto, el grafo y los prototipos anteriores
         global retrieval_system
         logger.info("⏳ Regenerando embeddings con OpenAI...")
-        retrieval_system = MentalHealthRetrieval(
+        sistema = MentalHealthRetrieval(
             'recursos_salud_mental_cdmx.json',
             force_rebuild=True
         )
+        if region_manager is not None:
+            # Los shards en memoria se recargan desde los archivos nuevos
+            for region in region_manager.activas:
+                region_manager.unload(region)
+        else:
+            retrieval_system = sistema
         
         # Contar tipos
-        psicologos = len([e for e in retrieval_system.especialistas 
+        psicologos = len([e for e in sistema.especialistas 
                          if 'psicólog' in e.get('tipo_profesional', '').lower()])
-        psiquiatras = len([e for e in retrieval_system.especialistas 
+        psiquiatras = len([e for e in sistema.especialistas 
                           if 'psiquiatra' in e.get('tipo_profesional', '').lower()])
         
-        logger.info(f"✅ Índice regenerado: {len(retrieval_system.especialistas)} recursos")
+        logger.info(f"✅ Índice regenerado: {len(sistema.especialistas)} recursos")
         logger.info(f"   Psicólogos: {psicologos}, Psiquiatras: {psiquiatras}")
         
         return jsonify({
             'success': True,
             'message': '✅ Índice FAISS regenerado exitosamente',
-            'total_recursos': len(retrieval_system.especialistas),
+            'total_recursos': len(sistema.especialistas),
             'psicologos': psicologos,
             'psiquiatras': psiquiatras,
             'timestamp': str(time.time())
@@ -871,6 +1560,47 @@ def admin_rebuild_faiss():
         }), 500
 
 
+@app.route('/admin/reload_crisis_keywords', methods=['POST'])
+def admin_reload_crisis_keywords():
+    """
+    Recarga las palabras clave de crisis desde CRISIS_KEYWORDS_PATH
+    (el detector también las recarga solo al detectar cambios en el archivo).
+    Requiere header X-Admin-Token con ADMIN_TOKEN.
+    """
+    if not perfilador.autorizado(request.headers.get('X-Admin-Token')):
+        return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    
+    try:
+        if not crisis_detector.keywords_path:
+            return jsonify({
+                'success': False,
+                'error': 'CRISIS_KEYWORDS_PATH no está configurado'
+            }), 400
+        
+        crisis_detector.reload()
+        logger.warning(f"🔄 ADMIN: Palabras clave de crisis recargadas desde {crisis_detector.keywords_path}")
+        
+        return jsonify({
+            'success': True,
+            'niveles': {nivel: len(palabras) for nivel, palabras in crisis_detector.keywords.items()}
+        })
+    
+    except ValueError as e:
+        # JSON o esquema inválido: siguen activas las palabras anteriores
+        logger.error(f"❌ Archivo de palabras clave de crisis inválido: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    except Exception as e:
+        logger.error(f"❌ Error recargando palabras clave de crisis: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -0,0 +1,87 @@
+"""
+Embeddings asíncronos para el modo ASGI (api_asgi.py)
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+En el modo ASGI los embeddings de un request se piden con AsyncOpenAI antes
+de ejecutar el endpoint, sin ocupar un hilo mientras se espera a la API. Por
+defecto se usa el AsyncOpenAI del cliente compartido
+(EmbeddingClient.crear_async): mismos timeouts, y sus reintentos salen del
+mismo presupuesto que los del cliente síncrono.
+Los vectores se dejan en la variable de contexto embeddings_precalculados y
+embed_query / _embed_texts (retrieval_system, region_shards, knowledge_rag)
+los toman de ahí en vez de llamar al cliente síncrono. Si un texto no fue
+precalculado se llama a la API como siempre, así el resultado no cambia.
+
+Fuera del modo ASGI la variable queda en None y no se consulta nada.
+"""
+
+import asyncio
+import contextvars
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from embedding_client import cliente_compartido
+from metrics import etapa, registrar_cache, registrar_tokens
+
+# {(modelo, texto): embedding} del request en curso (solo en api_asgi)
+embeddings_precalculados: contextvars.ContextVar[Optional[Dict[Tuple[str, str], List[float]]]] = \
+    contextvars.ContextVar('embeddings_precalculados', default=None)
+
+
+def precalculado(modelo: str, texto: str) -> Optional[List[float]]:
+    """Embedding ya pedido para este request, o None si hay que llamar a la API"""
+    precalculados = embeddings_precalculados.get()
+    if precalculados is None:
+        return None
+    vector = precalculados.get((modelo, texto))
+    registrar_cache('embedding_precalculado', vector is not None)
+    return vector
+
+
+class AsyncEmbedder:
+    """
+    Pide embeddings con un cliente asíncrono compartido por el proceso
+
+    Args:
+        client: Cliente compatible con openai.AsyncOpenAI (None usa
+            cliente_compartido().crear_async)
+        max_concurrentes: Llamadas a la API en vuelo a la vez (también acota
+            las conexiones abiertas por el cliente asíncrono)
+    """
+
+    def __init__(self, client: Optional[Any] = None, max_concurrentes: int = 64):
+        self.client = client
+        self.max_concurrentes = max_concurrentes
+        self._semaforo = asyncio.Semaphore(max_concurrentes)
+        self._usa_compartido = False
+
+    async def _crear(self, modelo: str, textos: List[str]) -> Any:
+        if self.client is not None:
+            return await self.client.embeddings.create(model=modelo, input=textos)
+        self._usa_compartido = True
+        return await cliente_compartido().crear_async(modelo, textos)
+
+    async def precalcular(self, pedidos: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], List[float]]:
+        """Embeddings de los (modelo, texto) pedidos, una llamada por modelo"""
+        por_modelo: Dict[str, List[str]] = {}
+        for modelo, texto in pedidos:
+            textos = por_modelo.setdefault(modelo, [])
+            if texto not in textos:
+                textos.append(texto)
+
+        resultado: Dict[Tuple[str, str], List[float]] = {}
+        for modelo, textos in por_modelo.items():
+            async with self._semaforo:
+                # Incluye los reintentos que conceda el presupuesto
+                with etapa('embedding'):
+                    resp = await self._crear(modelo, textos)
+            registrar_tokens(modelo, resp)
+            for texto, dato in zip(textos, resp.data):
+                resultado[(modelo, texto)] = dato.embedding
+        return resultado
+
+    async def cerrar(self):
+        if self.client is not None:
+            if hasattr(self.client, 'close'):
+                await self.client.close()
+        elif self._usa_compartido:
+            await cliente_compartido().cerrar_async()
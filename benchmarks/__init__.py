@@ -0,0 +1 @@
+"""Benchmarks de rendimiento (ejecutar desde la raíz: python -m benchmarks.<modulo>)"""
@@ -0,0 +1,92 @@
+"""
+Benchmark del detector de crisis
+Compara el recorrido original (un `in` por palabra clave) contra el
+CrisisDetector compilado, con transcripciones largas y miles de patrones.
+
+Uso:
+    python -m benchmarks.bench_crisis_detection
+    python -m benchmarks.bench_crisis_detection --patrones 5000 --caracteres 200000
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, Dict, List
+
+from crisis_detection import CRISIS_KEYWORDS, HIGH_RISK_KEYWORDS, CrisisDetector
+
+VOCABULARIO = [
+    'hoy', 'me', 'siento', 'muy', 'cansada', 'no', 'duermo', 'bien', 'trabajo',
+    'familia', 'ansiedad', 'tristeza', 'pienso', 'mucho', 'en', 'todo', 'que',
+    'pasa', 'la', 'semana', 'terapia', 'escuela', 'amigos', 'dolor', 'cabeza',
+]
+
+
+def detector_legacy(keywords: Dict[str, List[str]]) -> Callable[[str], list]:
+    """Recorrido original: una búsqueda de subcadena por palabra clave"""
+    def detect(texto: str) -> list:
+        texto_lower = texto.lower()
+        return [(k, nivel) for nivel, palabras in keywords.items()
+                for k in palabras if k in texto_lower]
+    return detect
+
+
+def generar_patrones(n: int, rnd: random.Random) -> Dict[str, List[str]]:
+    """Palabras clave reales más n patrones sintéticos de 2-3 palabras"""
+    sinteticos = {' '.join(rnd.choice(VOCABULARIO) + rnd.choice('aeiou') for _ in range(rnd.randint(2, 3)))
+                  for _ in range(n)}
+    return {
+        'CRITICO': CRISIS_KEYWORDS + sorted(sinteticos)[: n // 2],
+        'ALTO': HIGH_RISK_KEYWORDS + sorted(sinteticos)[n // 2:],
+    }
+
+
+def generar_transcripcion(caracteres: int, rnd: random.Random) -> str:
+    palabras = []
+    total = 0
+    while total < caracteres:
+        palabra = rnd.choice(VOCABULARIO)
+        if rnd.random() < 0.001:
+            palabra = rnd.choice(CRISIS_KEYWORDS + HIGH_RISK_KEYWORDS)
+        palabras.append(palabra)
+        total += len(palabra) + 1
+    return ' '.join(palabras)
+
+
+def medir(fn: Callable[[str], list], texto: str, repeticiones: int) -> float:
+    """Milisegundos por llamada (mejor de las repeticiones)"""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn(texto)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del detector de crisis')
+    parser.add_argument('--patrones', type=int, nargs='+', default=[0, 1000, 5000])
+    parser.add_argument('--caracteres', type=int, nargs='+', default=[200, 10000, 100000])
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    print(f"{'patrones':>9} {'caracteres':>11} {'legacy ms':>10} {'compilado ms':>13} {'speedup':>8}")
+    for n_patrones in args.patrones:
+        keywords = generar_patrones(n_patrones, rnd)
+        legacy = detector_legacy(keywords)
+        inicio = time.perf_counter()
+        detector = CrisisDetector(keywords=keywords)
+        compilacion_ms = (time.perf_counter() - inicio) * 1000
+        for n_caracteres in args.caracteres:
+            texto = generar_transcripcion(n_caracteres, rnd)
+            t_legacy = medir(legacy, texto, args.repeticiones)
+            t_nuevo = medir(detector.detect, texto, args.repeticiones)
+            print(f"{n_patrones:>9} {n_caracteres:>11} {t_legacy:>10.3f} {t_nuevo:>13.3f} "
+                  f"{t_legacy / t_nuevo:>7.1f}x")
+        print(f"          (compilación de {len(keywords['CRITICO']) + len(keywords['ALTO'])} "
+              f"patrones: {compilacion_ms:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark del colapso de casi-duplicados
+Embebe el catálogo una vez y compara el índice sin colapsar contra el
+colapsado (near_duplicates.py): tamaño del índice y número de resultados
+únicos (grupos distintos) en el top-k de un conjunto de consultas.
+
+Con --duplicar N se agregan N copias sintéticas de servicios (otra
+modalidad, mismo teléfono), como las que aparecen al integrar fuentes.
+
+Uso:
+    python -m benchmarks.bench_dedup
+    python -m benchmarks.bench_dedup --duplicar 20 --k 5 10 --umbral 0.9
+"""
+
+import argparse
+import json
+import os
+import random
+from typing import Dict, List
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from near_duplicates import UMBRAL_DUPLICADO, colapsar_duplicados, grupos_duplicados
+from retrieval_system import generate_embeddings, texto_recurso
+
+load_dotenv()
+
+CONSULTAS = [
+    'línea de crisis gratuita 24 horas',
+    'pensamientos suicidas necesito ayuda ya',
+    'psicólogo para ansiedad en Coyoacán',
+    'terapia gratuita para adolescentes',
+    'centro comunitario de salud mental',
+    'apoyo psicológico por teléfono',
+    'adicciones centro de integración juvenil',
+    'terapia familiar',
+]
+
+
+def duplicar_servicios(recursos: List[Dict], n: int, rnd: random.Random) -> List[Dict]:
+    """Copias de servicios con otra modalidad e id, como llegan de otra fuente"""
+    servicios = [r for r in recursos if r.get('tipo_recurso') == 'servicio'] or recursos
+    copias = []
+    for i in range(n):
+        copia = json.loads(json.dumps(rnd.choice(servicios)))
+        copia['id'] = f"dup_{i:03d}"
+        copia['modalidad'] = rnd.choice(['Online', 'Teléfono', 'Presencial / Online'])
+        copias.append(copia)
+    return recursos + copias
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tamaño del índice y resultados únicos con/sin colapso')
+    parser.add_argument('--catalogo', default='recursos_salud_mental_cdmx.json')
+    parser.add_argument('--duplicar', type=int, default=0)
+    parser.add_argument('--umbral', type=float, default=UMBRAL_DUPLICADO)
+    parser.add_argument('--k', type=int, nargs='+', default=[5, 10])
+    parser.add_argument('--model', default='text-embedding-3-small')
+    args = parser.parse_args()
+
+    with open(args.catalogo, 'r', encoding='utf-8') as f:
+        recursos = json.load(f)
+    if args.duplicar:
+        recursos = duplicar_servicios(recursos, args.duplicar, random.Random(0))
+
+    client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    vectores = generate_embeddings(client, args.model, [texto_recurso(r) for r in recursos], verbose=False)
+    faiss.normalize_L2(vectores)
+    consultas = generate_embeddings(client, args.model, CONSULTAS, verbose=False)
+    faiss.normalize_L2(consultas)
+
+    # Grupo de cada fila del catálogo original: define qué resultados son "el mismo"
+    grupo_de = np.empty(len(recursos), dtype=np.int64)
+    for g, miembros in enumerate(grupos_duplicados(vectores, recursos, args.umbral)):
+        grupo_de[miembros] = g
+
+    colapsados_vec, _, estadisticas = colapsar_duplicados(vectores, recursos, args.umbral)
+    indices = {'sin colapsar': vectores, 'colapsado': colapsados_vec}
+    for nombre, matriz in indices.items():
+        index = faiss.IndexFlatIP(matriz.shape[1])
+        index.add(matriz)
+        indices[nombre] = index
+
+    print('\n' + '=' * 70)
+    print(f"{'indice':<14}{'vectores':>10}{'MB':>8}")
+    for nombre, index in indices.items():
+        print(f"{nombre:<14}{index.ntotal:>10}{index.ntotal * index.d * 4 / 1e6:>8.2f}")
+    print(f"{estadisticas['grupos']} grupos de casi-duplicados (umbral {args.umbral})")
+
+    print('-' * 70)
+    for k in args.k:
+        _, ids = indices['sin colapsar'].search(consultas, k)
+        unicos = {'sin colapsar': [len({grupo_de[i] for i in fila if i >= 0}) for fila in ids]}
+        # Cada fila del índice colapsado es un grupo distinto
+        _, ids = indices['colapsado'].search(consultas, k)
+        unicos['colapsado'] = [int((fila >= 0).sum()) for fila in ids]
+        print(f"resultados unicos en top-{k}: sin colapsar {np.mean(unicos['sin colapsar']):.2f}, "
+              f"colapsado {np.mean(unicos['colapsado']):.2f}")
+        for consulta, antes, despues in zip(CONSULTAS, unicos['sin colapsar'], unicos['colapsado']):
+            print(f"    {antes:>3} -> {despues:<3} {consulta}")
+
+
+if __name__ == '__main__':
+    main()
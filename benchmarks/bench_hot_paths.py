@@ -0,0 +1,268 @@
+"""
+Suite de microbenchmarks de los caminos calientes del retrieval y el RAG
+Sin red: embeddings con el cliente falso determinista (fake_openai.py) y
+catálogos sintéticos con el esquema real de 'recurso' (synthetic_catalog.py).
+
+Caminos medidos:
+- Por tamaño de catálogo: MentalHealthRetrieval.search (incluye el embedding
+  falso), search_mixto (cupo por partición, particiones en paralelo),
+  facets (solo filtros y con consulta sobre candidate_k candidatos),
+  _apply_filters, _calculate_score, _apply_hard_filters y
+  format_for_mobile sobre resultados de search
+- Una vez: MentalHealthKnowledgeRAG.ask (router y semántico) y
+  detectar_nivel_crisis
+
+Reporta throughput y p50/p99 por operación (mediana de --rondas rondas).
+Las funciones de microsegundos se miden en lotes de --lote llamadas y se
+reporta el tiempo por llamada.
+
+Con --guardar se escribe el baseline; sin él se compara contra el baseline
+y el proceso termina con código 1 si algún camino empeora más de
+--tolerancia en p50 (o el doble de la tolerancia en p99), si falta el
+baseline o si un camino medido no está en él (regenerarlo con --guardar al
+agregar caminos o tamaños). Los baselines dependen de la máquina: generarlos
+y compararlos en el mismo entorno.
+
+Uso:
+    python -m benchmarks.bench_hot_paths --guardar
+    python -m benchmarks.bench_hot_paths
+    python -m benchmarks.bench_hot_paths --tamanos 1000 10000 100000 1000000 --tolerancia 0.3
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.synthetic_catalog import generar_catalogo, sistema_sintetico
+from knowledge_rag import MentalHealthKnowledgeRAG
+from retrieval_system import QueryFilters
+
+BASELINE_DEFAULT = os.path.join(os.path.dirname(__file__), 'baselines', 'hot_paths.json')
+
+CONSULTAS = [
+    'Necesito ayuda con ansiedad',
+    'Necesito ayuda con depresión cerca de Coyoacán',
+    'psicóloga para adolescentes con TDAH',
+    'terapia gratuita en línea',
+    'crisis psicológica ideación suicida',
+    'psiquiatra trastorno bipolar Benito Juárez especialista mujer',
+]
+
+FILTROS = [
+    QueryFilters(),
+    QueryFilters(max_cost=600, es_gratuito=True),
+    QueryFilters(delegacion='Coyoacán', genero_especialista='Femenino'),
+    QueryFilters(modalidad=['Online'], min_rating=4.5, requiere_sabado=True),
+    QueryFilters(es_emergencia=True, max_cost=2000, metodo_pago_requerido='Tarjeta'),
+    QueryFilters(especializaciones=['Ansiedad'], grupo_etario=['Adolescentes'],
+                 costo_maximo_absoluto=1000),
+]
+
+# Filtros de la pantalla de facetas: subcadenas sobre especializaciones y delegación
+FILTROS_FACETAS = [
+    QueryFilters(especializaciones=['Ansiedad', 'Depresión'], delegacion='Coyoacán'),
+    QueryFilters(especializaciones=['crisis'], delegacion='Benito Juárez', modalidad=['Online']),
+    QueryFilters(especializaciones=['adicciones'], max_cost=600),
+]
+
+# Cupos de la lista mixta: dos particiones y las tres (la digital es minoritaria)
+CUOTAS = [
+    {'especialista': 7, 'servicio': 3},
+    {'especialista': 5, 'servicio': 3, 'digital': 2},
+]
+
+PREGUNTAS_ROUTER = ['¿Qué hago si tengo un ataque de pánico?', 'no puedo dormir, tengo insomnio',
+                    'creo que tengo tdah']
+PREGUNTAS_SEMANTICAS = ['me siento raro y no sé qué hacer', 'mi hermano escucha voces',
+                        'cómo me calmo rápido antes de un examen']
+
+TEXTOS_CRISIS = [
+    'ansiedad', 'me siento triste desde hace semanas',
+    'ya no quiero vivir', 'tengo ataques de pánico en el trabajo',
+    ' '.join(['hoy fue un día difícil en la escuela y no dormí bien'] * 40) + ' quiero desaparecer',
+]
+
+
+def _ronda(fn: Callable[[int], Any], max_segundos: float, min_muestras: int,
+           max_muestras: int, por_muestra: int) -> np.ndarray:
+    latencias = []
+    limite = time.perf_counter() + max_segundos
+    while len(latencias) < max_muestras and (len(latencias) < min_muestras or time.perf_counter() < limite):
+        inicio = time.perf_counter()
+        fn(len(latencias))
+        latencias.append((time.perf_counter() - inicio) / por_muestra)
+    return np.array(latencias) * 1e6
+
+
+def medir(fn: Callable[[int], Any], max_segundos: float, rondas: int = 3, min_muestras: int = 20,
+          max_muestras: int = 2000, por_muestra: int = 1) -> Dict[str, float]:
+    """
+    Llama fn(i) durante `rondas` rondas de max_segundos / rondas (entre min
+    y max muestras cada una) y retorna la mediana entre rondas de p50/p99
+    en µs por operación y de operaciones por segundo. El GC se apaga
+    mientras se mide para que una recolección no caiga en un solo camino.
+    """
+    for i in range(5):  # calentamiento
+        fn(i)
+    gc.collect()
+    gc.disable()
+    try:
+        medidas = [_ronda(fn, max_segundos / rondas, min_muestras, max_muestras, por_muestra)
+                   for _ in range(rondas)]
+    finally:
+        gc.enable()
+    return {'p50_us': float(np.median([np.percentile(m, 50) for m in medidas])),
+            'p99_us': float(np.median([np.percentile(m, 99) for m in medidas])),
+            'ops_s': float(np.median([1e6 / m.mean() for m in medidas])),
+            'muestras': int(sum(len(m) for m in medidas))}
+
+
+def caminos_catalogo(n: int, dim: int, lote: int, seed: int) -> Dict[str, Callable[[int], Any]]:
+    """Caminos que dependen del tamaño del catálogo"""
+    from api_rest import format_for_mobile
+
+    inicio = time.perf_counter()
+    recursos = generar_catalogo(n, seed)
+    sistema = sistema_sintetico(recursos, FakeOpenAI(dim))
+    print(f"  catálogo de {n} recursos listo en {time.perf_counter() - inicio:.1f}s")
+
+    rnd = random.Random(seed)
+    muestras = [recursos[rnd.randrange(n)] for _ in range(lote * 16)]
+    similitudes = [rnd.uniform(0.2, 0.9) for _ in range(len(muestras))]
+    resultados = [sistema.search(CONSULTAS[i % len(CONSULTAS)], FILTROS[i % len(FILTROS)], top_k=10)
+                  for i in range(len(CONSULTAS) * len(FILTROS))]
+
+    def por_lote(llamar: Callable[[Dict[str, Any], float, QueryFilters], Any]) -> Callable[[int], Any]:
+        def fn(i: int):
+            filtros = FILTROS[i % len(FILTROS)]
+            base = (i * lote) % len(muestras)
+            for j in range(base, min(base + lote, len(muestras))):
+                llamar(muestras[j], similitudes[j], filtros)
+        return fn
+
+    return {
+        'search': lambda i: sistema.search(CONSULTAS[i % len(CONSULTAS)], FILTROS[i % len(FILTROS)], top_k=10),
+        'search_mixto': lambda i: sistema.search_mixto(CONSULTAS[i % len(CONSULTAS)], CUOTAS[i % len(CUOTAS)],
+                                                       FILTROS[i % len(FILTROS)]),
+        'facets': lambda i: sistema.facets(None, FILTROS_FACETAS[i % len(FILTROS_FACETAS)]),
+        'facets (consulta)': lambda i: sistema.facets(CONSULTAS[i % len(CONSULTAS)],
+                                                      FILTROS_FACETAS[i % len(FILTROS_FACETAS)],
+                                                      candidate_k=5000),
+        '_apply_filters': por_lote(lambda r, s, f: sistema._apply_filters(r, f)),
+        '_calculate_score': por_lote(lambda r, s, f: sistema._calculate_score(r, s, f)),
+        '_apply_hard_filters': por_lote(lambda r, s, f: sistema._apply_hard_filters(r, f)),
+        'format_for_mobile': lambda i: format_for_mobile(resultados[i % len(resultados)]),
+    }
+
+
+def caminos_fijos(dim: int) -> Tuple[Dict[str, Callable[[int], Any]], tempfile.TemporaryDirectory]:
+    """Caminos que no dependen del catálogo de recursos"""
+    from api_rest import detectar_nivel_crisis
+
+    tmp = tempfile.TemporaryDirectory()
+    rag = MentalHealthKnowledgeRAG(
+        index_path=os.path.join(tmp.name, 'kb.bin'),
+        metadata_path=os.path.join(tmp.name, 'kb.pkl'),
+        passages_index_path=os.path.join(tmp.name, 'pasajes.bin'),
+        passages_metadata_path=os.path.join(tmp.name, 'pasajes.pkl'),
+        projections_path=os.path.join(tmp.name, 'proyecciones.pkl'),
+        force_rebuild=True,
+        client=FakeOpenAI(dim))
+    return {
+        'ask (router)': lambda i: rag.ask(PREGUNTAS_ROUTER[i % len(PREGUNTAS_ROUTER)],
+                                          top_k=5, top_passages=3),
+        'ask (semantico)': lambda i: rag.ask(PREGUNTAS_SEMANTICAS[i % len(PREGUNTAS_SEMANTICAS)],
+                                             top_k=5, top_passages=3, use_router=False),
+        'detectar_nivel_crisis': lambda i: detectar_nivel_crisis(TEXTOS_CRISIS[i % len(TEXTOS_CRISIS)]),
+    }, tmp
+
+
+def comparar(resultados: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+             tolerancia: float) -> List[str]:
+    """Caminos que empeoraron respecto al baseline o que no están en él"""
+    regresiones = []
+    for clave, actual in resultados.items():
+        base = baseline.get(clave)
+        if base is None:
+            regresiones.append(f"{clave}: sin baseline (regenerarlo con --guardar)")
+            continue
+        if actual['p50_us'] > base['p50_us'] * (1 + tolerancia):
+            regresiones.append(f"{clave}: p50 {base['p50_us']:.1f} -> {actual['p50_us']:.1f} µs")
+        if actual['p99_us'] > base['p99_us'] * (1 + 2 * tolerancia):
+            regresiones.append(f"{clave}: p99 {base['p99_us']:.1f} -> {actual['p99_us']:.1f} µs")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks de retrieval y RAG con baseline')
+    parser.add_argument('--tamanos', type=int, nargs='+', default=[1000, 10_000, 100_000])
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--lote', type=int, default=100, help='Llamadas por muestra en funciones de µs')
+    parser.add_argument('--max-segundos', type=float, default=3.0, help='Tiempo por camino')
+    parser.add_argument('--rondas', type=int, default=3, help='Rondas por camino (se toma la mediana)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_DEFAULT)
+    parser.add_argument('--guardar', action='store_true', help='Escribir el baseline en vez de comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.3, help='Empeoramiento aceptado en p50')
+    args = parser.parse_args()
+
+    # Los logs por request de api_rest (crisis detectadas) no son parte de lo medido
+    logging.getLogger('api_rest').disabled = True
+
+    por_lote = {'_apply_filters', '_calculate_score', '_apply_hard_filters'}
+    resultados: Dict[str, Dict[str, float]] = {}
+
+    def correr(prefijo: str, caminos: Dict[str, Callable[[int], Any]]):
+        for nombre, fn in caminos.items():
+            r = medir(fn, args.max_segundos, rondas=args.rondas,
+                      por_muestra=args.lote if nombre in por_lote else 1)
+            resultados[f"{prefijo}/{nombre}"] = r
+            print(f"  {nombre:<24} p50 {r['p50_us']:>10.2f} µs  p99 {r['p99_us']:>10.2f} µs  "
+                  f"{r['ops_s']:>12.0f} ops/s")
+
+    print('=' * 78)
+    print('knowledge base / crisis')
+    caminos, tmp = caminos_fijos(args.dim)
+    with tmp:
+        correr('fijo', caminos)
+    for n in args.tamanos:
+        print('-' * 78)
+        print(f"{n} recursos")
+        correr(str(n), caminos_catalogo(n, args.dim, args.lote, args.seed))
+
+    print('=' * 78)
+    if args.guardar:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'meta': {'python': platform.python_version(), 'maquina': platform.machine(),
+                                'dim': args.dim, 'fecha': time.strftime('%Y-%m-%d %H:%M:%S')},
+                       'resultados': resultados}, f, ensure_ascii=False, indent=2)
+        print(f"Baseline guardado en {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"Sin baseline en {args.baseline} (generarlo con --guardar)")
+        sys.exit(1)
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['resultados']
+    regresiones = comparar(resultados, baseline, args.tolerancia)
+    if regresiones:
+        print(f"REGRESIONES (tolerancia {args.tolerancia:.0%}):")
+        for r in regresiones:
+            print(f"  {r}")
+        sys.exit(1)
+    print(f"Sin regresiones respecto a {args.baseline} (tolerancia {args.tolerancia:.0%})")
+
+
+if __name__ == '__main__':
+    main()
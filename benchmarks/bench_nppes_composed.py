@@ -0,0 +1,173 @@
+"""
+Benchmark de embeddings compuestos para proveedores NPPES
+Construye el índice con las dos estrategias de nppes_ingestion ('completo':
+un embedding por proveedor; 'compuesto': componentes compartidos cacheados
++ features locales) y compara llamadas a la API, tiempo y recall@k del
+índice compuesto respecto al completo sobre un conjunto de consultas.
+
+Se reportan tres recalls:
+- por id: fracción del top-k completo que el compuesto también recupera.
+  Con miles de proveedores casi empatados (misma taxonomía y estado) el
+  orden entre ellos es arbitrario, así que es una cota inferior estricta.
+- por atributos: fracción del top-k compuesto cuyo (tipo_profesional,
+  estado) aparece en el top-k completo, es decir, si recupera el mismo
+  tipo de proveedor en la misma región.
+- en la ciudad: en las consultas que nombran una ciudad, fracción del
+  top-k de cada estrategia que está en esa ciudad.
+
+Con --sintetico no usa la API ni el Parquet real: genera n proveedores
+(synthetic_catalog.generar_parquet_nppes) y embebe con FakeOpenAI, así la
+comparación corre sin red (los valores absolutos dependen del cliente falso).
+
+Uso:
+    python -m benchmarks.bench_nppes_composed NPPES_content_based_recommendations/data/mental_health_specialists.parquet
+    python -m benchmarks.bench_nppes_composed archivo.parquet --limit 5000 --k 10 50
+    python -m benchmarks.bench_nppes_composed --sintetico 20000
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Tuple
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.synthetic_catalog import generar_parquet_nppes
+from nppes_ingestion import ingest_nppes
+from retrieval_system import generate_embeddings
+from snapshots import leer_metadatos
+
+load_dotenv()
+
+CONSULTAS = [
+    'psiquiatra en Texas',
+    'child and adolescent psychiatrist in California',
+    'psicólogo clínico',
+    'trabajador social clínico para depresión',
+    'mental health counselor New York',
+    'addiction psychiatry Florida',
+    'terapeuta familiar y de pareja',
+    'neuropsychologist Illinois',
+    'psychiatric nurse practitioner',
+    'behavioral health clinic',
+    'psicóloga PhD en Washington',
+    'centro comunitario de salud mental',
+    'psychiatrist in Austin',
+    'clinical psychologist Houston',
+    'child and adolescent psychiatry Los Angeles',
+    'clinical social worker Chicago',
+    'marriage and family therapist Miami',
+    'mental health center Denver',
+]
+
+# Ciudades que pueden nombrar las consultas (para el recall en la ciudad)
+CIUDADES = ['austin', 'houston', 'los angeles', 'chicago', 'miami', 'denver']
+
+
+def _atributos(recurso: Dict) -> tuple:
+    return recurso.get('tipo_profesional'), recurso.get('ubicacion', {}).get('estado')
+
+
+def _ciudad(recurso: Dict) -> str:
+    return (recurso.get('ubicacion', {}).get('ciudad') or '').lower()
+
+
+def en_la_ciudad(index: faiss.Index, recursos: List[Dict], consultas: np.ndarray,
+                 textos: List[str], k: int) -> List[float]:
+    """Fracción del top-k en la ciudad nombrada, por consulta que nombra una"""
+    _, ids = index.search(consultas, k)
+    fracciones = []
+    for texto, fila in zip(textos, ids):
+        ciudad = next((c for c in CIUDADES if c in texto.lower()), None)
+        if ciudad is not None:
+            fracciones.append(sum(_ciudad(recursos[i]) == ciudad for i in fila if i >= 0) / k)
+    return fracciones
+
+
+def recall_por_consulta(index_completo: faiss.Index,
+                        index_compuesto: faiss.Index,
+                        recursos: List[Dict],
+                        consultas: np.ndarray,
+                        k: int) -> List[Tuple[float, float]]:
+    """(recall por id, recall por atributos) de cada consulta"""
+    _, ids_completo = index_completo.search(consultas, k)
+    _, ids_compuesto = index_compuesto.search(consultas, k)
+    resultados = []
+    for a, b in zip(ids_completo, ids_compuesto):
+        por_id = len(set(a) & set(b)) / k
+        atributos_completo = {_atributos(recursos[i]) for i in a}
+        por_atributos = sum(_atributos(recursos[i]) in atributos_completo for i in b) / k
+        resultados.append((por_id, por_atributos))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recall y costo de embeddings compuestos NPPES')
+    parser.add_argument('parquet_path', nargs='?')
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--k', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--model', default='text-embedding-3-small')
+    parser.add_argument('--sintetico', type=int, default=None,
+                        help='Proveedores sintéticos con FakeOpenAI (sin red) en vez del Parquet')
+    parser.add_argument('--dim', type=int, default=1536, help='Dimensión de FakeOpenAI')
+    args = parser.parse_args()
+    if args.parquet_path is None and args.sintetico is None:
+        parser.error('indica parquet_path o --sintetico N')
+
+    tmp = tempfile.mkdtemp(prefix='bench_nppes_')
+    if args.sintetico is not None:
+        client = FakeOpenAI(args.dim)
+        args.parquet_path = generar_parquet_nppes(os.path.join(tmp, 'nppes.parquet'), args.sintetico)
+    else:
+        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    try:
+        estadisticas: Dict[str, dict] = {}
+        indices: Dict[str, faiss.Index] = {}
+        for estrategia in ('completo', 'compuesto'):
+            index_path = os.path.join(tmp, f'{estrategia}.bin')
+            estadisticas[estrategia] = ingest_nppes(
+                args.parquet_path, index_path, os.path.join(tmp, f'{estrategia}.pkl'),
+                client=client, openai_model=args.model, limit=args.limit,
+                estrategia=estrategia, cache_path=None, umbral_duplicados=None)
+            indices[estrategia] = faiss.read_index(index_path)
+
+        # Sin colapsar duplicados ambas estrategias indexan los mismos
+        # recursos en el mismo orden
+        recursos = leer_metadatos(os.path.join(tmp, 'completo.pkl'))['especialistas']
+        
+        consultas = generate_embeddings(client, args.model, CONSULTAS, verbose=False)
+        faiss.normalize_L2(consultas)
+
+        print('\n' + '=' * 70)
+        print(f"{'estrategia':<12}{'recursos':>10}{'llamadas API':>15}{'segundos':>10}")
+        for estrategia, est in estadisticas.items():
+            print(f"{estrategia:<12}{est['indexados']:>10}{est['llamadas_embeddings']:>15}"
+                  f"{est['segundos']:>10}")
+        completo, compuesto = estadisticas['completo'], estadisticas['compuesto']
+        if compuesto['llamadas_embeddings']:
+            print(f"Reduccion de llamadas: {completo['llamadas_embeddings'] / compuesto['llamadas_embeddings']:.0f}x "
+                  f"({compuesto['componentes_distintos']} componentes distintos)")
+
+        print('-' * 70)
+        for k in args.k:
+            recalls = np.array(recall_por_consulta(indices['completo'], indices['compuesto'],
+                                                   recursos, consultas, k))
+            print(f"recall@{k}: por id {recalls[:, 0].mean():.3f}, "
+                  f"por atributos {recalls[:, 1].mean():.3f} (min {recalls[:, 1].min():.3f})")
+            for consulta, (por_id, por_atributos) in zip(CONSULTAS, recalls):
+                print(f"    {por_id:.2f} / {por_atributos:.2f}  {consulta}")
+            ciudad = {estrategia: np.mean(en_la_ciudad(index, recursos, consultas, CONSULTAS, k))
+                      for estrategia, index in indices.items()}
+            print(f"  en la ciudad@{k}: completo {ciudad['completo']:.3f}, "
+                  f"compuesto {ciudad['compuesto']:.3f}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
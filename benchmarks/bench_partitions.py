@@ -0,0 +1,89 @@
+"""
+Benchmark de búsqueda particionada por tipo de recurso
+Catálogo sintético (sin API): especialistas mayoritarios y pocos servicios.
+Compara, para listas que deben incluir servicios:
+- índice completo: sobre-pedir candidatos y quedarse con los servicios
+- partición: buscar solo en el sub-índice de servicios (PartitionedIndex)
+- lista mixta: cuotas por partición buscadas en paralelo
+
+Uso:
+    python -m benchmarks.bench_partitions
+    python -m benchmarks.bench_partitions --recursos 200000 --servicios 0.05 --dim 512
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+import faiss
+import numpy as np
+
+from partitioned_index import PartitionedIndex
+
+
+def medir(fn: Callable[[np.ndarray], int], consultas: np.ndarray) -> Dict[str, float]:
+    latencias, encontrados = [], []
+    for q in consultas:
+        inicio = time.perf_counter()
+        encontrados.append(fn(q[None, :]))
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    return {'p50_ms': float(np.percentile(latencias, 50)), 'p99_ms': float(np.percentile(latencias, 99)),
+            'encontrados': float(np.mean(encontrados))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Índice completo vs sub-índices por tipo de recurso')
+    parser.add_argument('--recursos', type=int, default=100_000)
+    parser.add_argument('--servicios', type=float, default=0.05, help='Fracción de servicios')
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--consultas', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectores = rng.standard_normal((args.recursos, args.dim)).astype('float32')
+    faiss.normalize_L2(vectores)
+    recursos = [{'tipo_recurso': 'servicio' if rng.random() < args.servicios else 'especialista'}
+                for _ in range(args.recursos)]
+    es_servicio = np.array([r['tipo_recurso'] == 'servicio' for r in recursos])
+    consultas = rng.standard_normal((args.consultas, args.dim)).astype('float32')
+    faiss.normalize_L2(consultas)
+
+    completo = faiss.IndexFlatIP(args.dim)
+    completo.add(vectores)
+    inicio = time.perf_counter()
+    particiones = PartitionedIndex(vectores, recursos)
+    construccion = time.perf_counter() - inicio
+    k = args.k
+    executor = ThreadPoolExecutor(max_workers=2)
+
+    def completo_sobrepedido(q: np.ndarray) -> int:
+        # Lo que hace search(): top_k * 3 candidatos y luego filtrar por tipo
+        _, ids = completo.search(q, k * 3)
+        return int(es_servicio[ids[0][ids[0] >= 0]].sum())
+
+    def solo_particion(q: np.ndarray) -> int:
+        _, ids = particiones.search('servicio', q, k * 3)
+        return min(k, int((ids[0] >= 0).sum()))
+
+    def mixta(q: np.ndarray) -> int:
+        cuotas = {'especialista': k - k // 3, 'servicio': k // 3}
+        partes = executor.map(lambda nombre: particiones.search(nombre, q, cuotas[nombre] * 3), cuotas)
+        return sum(min(cuotas[nombre], int((ids[0] >= 0).sum()))
+                   for nombre, (_, ids) in zip(cuotas, partes))
+
+    print('=' * 70)
+    print(f"{args.recursos} recursos ({es_servicio.sum()} servicios), dim {args.dim}; "
+          f"particiones {particiones.tamanos()} construidas en {construccion:.2f}s")
+    print('-' * 70)
+    for nombre, fn, unidad in (('completo (servicios en top-3k)', completo_sobrepedido, 'servicios'),
+                               ('particion servicio', solo_particion, 'servicios'),
+                               ('mixta por cuotas', mixta, 'resultados')):
+        r = medir(fn, consultas)
+        print(f"{nombre:<32} p50 {r['p50_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms  "
+              f"{r['encontrados']:.1f} {unidad} de {k}")
+
+
+if __name__ == '__main__':
+    main()
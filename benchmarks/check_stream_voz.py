@@ -0,0 +1,88 @@
+"""
+Chequeo de la voz en streaming de /buscar_especialista/stream
+Sin red: recursos y base de conocimiento se embeben con FakeOpenAI.
+
+El streaming envía la apertura de voz antes de buscar y el resto al final;
+lo que el agente dice (los textos de los eventos 'voz' concatenados) tiene
+que ser exactamente el 'respuesta_voz' del evento 'fin' y el de
+/buscar_especialista para el mismo request. Se prueba en cada nivel de
+crisis, con y sin resultados (offset fuera de rango = página vacía).
+
+Termina con código 1 si algún caso no coincide.
+
+Uso:
+    python -m benchmarks.check_stream_voz
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+import api_rest
+from benchmarks.fake_openai import FakeOpenAI
+from knowledge_rag import MentalHealthKnowledgeRAG
+from retrieval_system import MentalHealthRetrieval
+
+# (descripción, body del request)
+CASOS: List[Tuple[str, Dict[str, Any]]] = [
+    ('normal con resultados', {'sintoma': 'ansiedad'}),
+    ('normal sin resultados', {'sintoma': 'ansiedad', 'offset': 500}),
+    ('normal con filtros sin resultados', {'sintoma': 'insomnio', 'genero': 'mujer',
+                                           'ubicacion': 'Coyoacán', 'offset': 500}),
+    ('alto con resultados', {'sintoma': 'ataque de pánico, no aguanto'}),
+    ('alto sin resultados', {'sintoma': 'ataque de pánico, no aguanto', 'offset': 500}),
+    ('critico', {'sintoma': 'quiero suicidarme'}),
+]
+
+
+def voz_stream(cliente, body: Dict[str, Any]) -> Tuple[str, str]:
+    """(textos de los eventos 'voz' concatenados, respuesta_voz del 'fin')"""
+    respuesta = cliente.post('/buscar_especialista/stream', json=body)
+    eventos = [json.loads(linea) for linea in respuesta.get_data(as_text=True).splitlines() if linea.strip()]
+    hablado = ''.join(e['texto'] for e in eventos if e.get('evento') == 'voz')
+    fin = next((e for e in eventos if e.get('evento') == 'fin'), {})
+    return hablado, fin.get('respuesta_voz', '')
+
+
+def main():
+    logging.getLogger('api_rest').disabled = True
+    with tempfile.TemporaryDirectory() as tmp:
+        cliente_fake = FakeOpenAI()
+        api_rest.retrieval_system = MentalHealthRetrieval(
+            'recursos_salud_mental_cdmx.json',
+            index_path=os.path.join(tmp, 'recursos.bin'),
+            metadata_path=os.path.join(tmp, 'recursos.pkl'),
+            prototypes_path=os.path.join(tmp, 'prototipos.pkl'),
+            force_rebuild=True,
+            client=cliente_fake)
+        api_rest.knowledge_system = MentalHealthKnowledgeRAG(
+            index_path=os.path.join(tmp, 'kb.bin'),
+            metadata_path=os.path.join(tmp, 'kb.pkl'),
+            passages_index_path=os.path.join(tmp, 'pasajes.bin'),
+            passages_metadata_path=os.path.join(tmp, 'pasajes.pkl'),
+            projections_path=os.path.join(tmp, 'proyecciones.pkl'),
+            force_rebuild=True,
+            client=cliente_fake)
+
+    cliente = api_rest.app.test_client()
+    errores = []
+    print('=' * 70)
+    for descripcion, body in CASOS:
+        hablado, fin = voz_stream(cliente, body)
+        completa = cliente.post('/buscar_especialista', json=body).get_json().get('respuesta_voz', '')
+        ok = hablado == fin == completa
+        print(f"  {'ok   ' if ok else 'FALLA'} {descripcion:<36}{hablado[:60]!r}")
+        if not ok:
+            errores.append(f"{descripcion}: voz {hablado!r} / fin {fin!r} / sin streaming {completa!r}")
+    print('=' * 70)
+    for error in errores:
+        print(f"  {error}")
+    if errores:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
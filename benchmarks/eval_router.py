@@ -0,0 +1,104 @@
+"""
+Evaluación del router de intención de MentalHealthKnowledgeRAG
+Sin red: el router no usa embeddings (la base se embebe con FakeOpenAI solo
+para construir el sistema).
+
+Cada pregunta lleva el artículo con que el router puede responderla, o None
+si debe caer a la búsqueda densa: paráfrasis en que la palabra clave aparece
+pero la pregunta trata de otra cosa (un tercero, otro síntoma, otro
+contexto). Se reporta, con el umbral del sistema (router_min_confidence):
+- ruteadas: preguntas con artículo esperado que el router resolvió
+- errores: preguntas ruteadas a otro artículo, o ruteadas cuando debían
+  caer a la búsqueda densa
+
+Termina con código 1 si hay errores.
+
+Uso:
+    python -m benchmarks.eval_router
+    python -m benchmarks.eval_router --min-confianza 0.5
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from typing import List, Optional, Tuple
+
+from benchmarks.fake_openai import FakeOpenAI
+from knowledge_rag import MentalHealthKnowledgeRAG
+
+# (pregunta, artículo esperado o None = debe usar la búsqueda densa)
+PREGUNTAS: List[Tuple[str, Optional[str]]] = [
+    ('¿Qué hago si tengo un ataque de pánico?', 'kb_001'),
+    ('tengo un ataque de pánico', 'kb_001'),
+    ('no puedo dormir', 'kb_002'),
+    ('no puedo dormir, tengo insomnio', 'kb_002'),
+    ('insomnio', 'kb_002'),
+    ('tengo ansiedad', 'kb_003'),
+    ('quiero suicidarme', 'kb_004'),
+    ('qué es el trastorno bipolar', 'kb_005'),
+    ('creo que tengo tdah', 'kb_006'),
+    ('tengo miedo a la gente', 'kb_007'),
+    ('escucho voces', 'kb_009'),
+    ('tengo sueño todo el dia y no tengo ganas de nada', None),
+    ('cómo ayudo a alguien con pensamientos suicidas', None),
+    ('me da ansiedad hablar en público', None),
+    ('mi mamá tiene alucinaciones y no sé cómo hablarle', None),
+    ('mi hijo no puede dormir por las pesadillas del colegio', None),
+    ('tengo pánico escénico antes de tocar en un concierto', None),
+    ('mi pareja es bipolar y discutimos todo el tiempo', None),
+    ('me cuesta concentrarme desde que murió mi papá', None),
+    ('cómo sé si mi amigo tiene toc o solo es muy ordenado', None),
+]
+
+
+def evaluar(rag: MentalHealthKnowledgeRAG) -> Tuple[int, int, List[str]]:
+    """(ruteadas, con artículo esperado, errores)"""
+    ruteadas = esperadas = 0
+    errores = []
+    for pregunta, esperado in PREGUNTAS:
+        ruta = rag.route(pregunta)
+        confianza = ruta.confidence if ruta is not None else 0.0
+        ruteada = confianza >= rag.router_min_confidence
+        articulo = rag.knowledge_base[ruta.ranking[0][0]].get('id') if ruta is not None else None
+        print(f"  {confianza:5.2f} {'router' if ruteada else 'denso ':<7}{articulo or '-':<8}{pregunta}")
+        if esperado is not None:
+            esperadas += 1
+            ruteadas += ruteada
+        if ruteada and articulo != esperado:
+            errores.append(f"{pregunta!r}: ruteada a {articulo} con confianza {confianza:.2f} "
+                           f"(esperado: {esperado or 'búsqueda densa'})")
+    return ruteadas, esperadas, errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Paráfrasis que el router debe resolver o dejar pasar')
+    parser.add_argument('--min-confianza', type=float, default=None,
+                        help='router_min_confidence (default: el del sistema)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rag = MentalHealthKnowledgeRAG(
+            index_path=os.path.join(tmp, 'kb.bin'),
+            metadata_path=os.path.join(tmp, 'kb.pkl'),
+            passages_index_path=os.path.join(tmp, 'pasajes.bin'),
+            passages_metadata_path=os.path.join(tmp, 'pasajes.pkl'),
+            projections_path=os.path.join(tmp, 'proyecciones.pkl'),
+            force_rebuild=True,
+            client=FakeOpenAI())
+    if args.min_confianza is not None:
+        rag.router_min_confidence = args.min_confianza
+
+    print('=' * 70)
+    ruteadas, esperadas, errores = evaluar(rag)
+    print('=' * 70)
+    print(f"Ruteadas: {ruteadas}/{esperadas} con artículo esperado "
+          f"(umbral {rag.router_min_confidence}), errores: {len(errores)}")
+    for error in errores:
+        print(f"  {error}")
+    if errores:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
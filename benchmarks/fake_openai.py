@@ -0,0 +1,86 @@
+"""
+Cliente de embeddings falso y determinista (sin red ni API key)
+
+Cada palabra tiene un vector pseudoaleatorio fijo (semilla = crc32 de la
+palabra) y el embedding de un texto es la suma de los vectores de sus
+palabras, normalizada. Textos que comparten palabras quedan cerca, así las
+búsquedas, el router y los filtros recorren los mismos caminos que con
+OpenAI, y dos corridas dan exactamente los mismos vectores.
+
+Implementa lo que usa el código: client.embeddings.create(model=, input=)
+con respuesta .data[i].embedding y .usage.total_tokens.
+"""
+
+import re
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+_PALABRA = re.compile(r'\w+')
+
+
+def palabras(texto: str) -> List[str]:
+    return _PALABRA.findall(texto.lower())
+
+
+class FakeEmbeddings:
+    """
+    Args:
+        dim: Dimensión de los embeddings
+        latencia_ms: Espera por llamada (simula la red; 0 = sin espera)
+    """
+
+    def __init__(self, dim: int = 256, latencia_ms: float = 0.0):
+        self.dim = dim
+        self.latencia = latencia_ms / 1000
+        self.llamadas = 0
+        self._vectores: Dict[str, np.ndarray] = {}
+
+    def vector_palabra(self, palabra: str) -> np.ndarray:
+        vector = self._vectores.get(palabra)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(palabra.encode()))
+            vector = self._vectores[palabra] = rng.standard_normal(self.dim).astype('float32')
+        return vector
+
+    def vectores(self, textos: Sequence[str], lote: int = 4096) -> np.ndarray:
+        """
+        (n, dim) normalizados L2, sin pasar por listas de Python. Por lote se
+        arma la matriz de conteos palabra x texto y se multiplica por los
+        vectores de las palabras (catálogos sintéticos de millones de textos).
+        """
+        salida = np.empty((len(textos), self.dim), dtype='float32')
+        for inicio in range(0, len(textos), lote):
+            vocabulario: Dict[str, int] = {}
+            filas, columnas = [], []
+            for i, texto in enumerate(textos[inicio:inicio + lote]):
+                for palabra in palabras(texto) or ['']:
+                    filas.append(i)
+                    columnas.append(vocabulario.setdefault(palabra, len(vocabulario)))
+            conteos = np.zeros((min(lote, len(textos) - inicio), len(vocabulario)), dtype='float32')
+            np.add.at(conteos, (filas, columnas), 1)
+            matriz = np.stack([self.vector_palabra(p) for p in vocabulario])
+            salida[inicio:inicio + len(conteos)] = conteos @ matriz
+        salida /= np.maximum(np.linalg.norm(salida, axis=1, keepdims=True), 1e-12)
+        return salida
+
+    def create(self, model: str, input: Sequence[str], **kwargs) -> SimpleNamespace:
+        self.llamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        textos = [input] if isinstance(input, str) else list(input)
+        tokens = sum(len(palabras(t)) for t in textos)
+        data = [SimpleNamespace(index=i, embedding=v.tolist(), object='embedding')
+                for i, v in enumerate(self.vectores(textos))]
+        return SimpleNamespace(data=data, model=model, object='list',
+                               usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+
+
+class FakeOpenAI:
+    """Sustituto de openai.OpenAI para el parámetro client= de los sistemas"""
+
+    def __init__(self, dim: int = 256, latencia_ms: float = 0.0):
+        self.embeddings = FakeEmbeddings(dim, latencia_ms)
@@ -0,0 +1,161 @@
+"""
+Servidor local que imita POST /v1/embeddings de OpenAI
+Los vectores salen de FakeEmbeddings (fake_openai.py): deterministas y sin
+red. Con OPENAI_BASE_URL=http://127.0.0.1:<puerto>/v1 el cliente de
+embeddings de la API (embedding_client.py) lo usa sin cambios de código,
+así las pruebas de carga recorren el cliente HTTP real (pool de
+conexiones, reintentos, base64).
+
+Inyección de fallas para ver cómo degrada la API:
+- --latencia-ms / --jitter-ms: espera por llamada (latencia + uniforme(0, jitter))
+- --tasa-error: fracción de llamadas que responden --status-error (500 o 429)
+
+GET /stats retorna llamadas, textos, errores inyectados y latencia servida.
+
+Uso:
+    python -m benchmarks.fake_openai_server --puerto 8900 --latencia-ms 80 --jitter-ms 40
+    python -m benchmarks.fake_openai_server --tasa-error 0.02 --status-error 429
+"""
+
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+from benchmarks.fake_openai import FakeEmbeddings, palabras
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    Args:
+        direccion: (host, puerto); puerto 0 elige uno libre
+        dim: Dimensión de los embeddings (1536 = text-embedding-3-small)
+        latencia_ms: Espera mínima por llamada
+        jitter_ms: Espera extra uniforme entre 0 y jitter_ms
+        tasa_error: Fracción de llamadas que fallan
+        status_error: Status HTTP de las llamadas que fallan
+        seed: Semilla de la latencia y los errores
+    """
+
+    daemon_threads = True
+
+    def __init__(self, direccion, dim: int = 1536, latencia_ms: float = 0.0, jitter_ms: float = 0.0,
+                 tasa_error: float = 0.0, status_error: int = 500, seed: int = 0):
+        super().__init__(direccion, FakeOpenAIHandler)
+        self.embeddings = FakeEmbeddings(dim)
+        self.latencia = latencia_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.tasa_error = tasa_error
+        self.status_error = status_error
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'llamadas': 0, 'textos': 0, 'tokens': 0, 'errores_inyectados': 0, 'espera_s': 0.0}
+
+    def sortear(self) -> tuple:
+        """(segundos de espera, falla?) de la próxima llamada"""
+        with self._lock:
+            espera = self.latencia + self._rnd.uniform(0, self.jitter)
+            falla = self._rnd.random() < self.tasa_error
+            self.stats['llamadas'] += 1
+            self.stats['espera_s'] += espera
+            if falla:
+                self.stats['errores_inyectados'] += 1
+        return espera, falla
+
+    def contar(self, textos: int, tokens: int):
+        with self._lock:
+            self.stats['textos'] += textos
+            self.stats['tokens'] += tokens
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como api.openai.com
+
+    def log_message(self, format, *args):
+        pass
+
+    def _responder(self, status: int, cuerpo: Dict[str, Any], headers: Dict[str, str] = None):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        for nombre, valor in (headers or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            with self.server._lock:
+                self._responder(200, dict(self.server.stats))
+        else:
+            self._responder(404, {'error': {'message': f'No existe {self.path}'}})
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path.rstrip('/') != '/v1/embeddings':
+            self._responder(404, {'error': {'message': f'No existe {self.path}'}})
+            return
+
+        espera, falla = self.server.sortear()
+        if espera:
+            time.sleep(espera)
+        if falla:
+            status = self.server.status_error
+            headers = {'Retry-After': '1'} if status == 429 else None
+            self._responder(status, {'error': {'message': 'Error inyectado por fake_openai_server',
+                                               'type': 'server_error' if status >= 500 else 'rate_limit'}},
+                            headers)
+            return
+
+        entrada = cuerpo.get('input', [])
+        textos = [entrada] if isinstance(entrada, str) else list(entrada)
+        if not textos or not all(isinstance(t, str) for t in textos):
+            self._responder(400, {'error': {'message': "'input' debe ser texto o lista de textos"}})
+            return
+        vectores = self.server.embeddings.vectores(textos)
+        # embedding_client.py y el SDK piden base64 (float32 little-endian)
+        if cuerpo.get('encoding_format') == 'base64':
+            embeddings = [base64.b64encode(v.astype('<f4').tobytes()).decode() for v in vectores]
+        else:
+            embeddings = [v.tolist() for v in vectores]
+        tokens = sum(len(palabras(t)) for t in textos)
+        self.server.contar(len(textos), tokens)
+        self._responder(200, {
+            'object': 'list',
+            'model': cuerpo.get('model', 'text-embedding-3-small'),
+            'data': [{'object': 'embedding', 'index': i, 'embedding': e} for i, e in enumerate(embeddings)],
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor falso de /v1/embeddings')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8900)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--latencia-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--tasa-error', type=float, default=0.0)
+    parser.add_argument('--status-error', type=int, default=500, choices=[429, 500, 502, 503])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    servidor = FakeOpenAIServer((args.host, args.puerto), dim=args.dim, latencia_ms=args.latencia_ms,
+                                jitter_ms=args.jitter_ms, tasa_error=args.tasa_error,
+                                status_error=args.status_error, seed=args.seed)
+    print(f"Fake OpenAI en http://{args.host}:{servidor.server_address[1]}/v1", flush=True)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
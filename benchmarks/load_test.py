@@ -0,0 +1,464 @@
+"""
+Prueba de carga de punta a punta de api_rest:app bajo gunicorn
+Para dimensionar workers y threads de render.yaml. Por cada configuración
+(--configs WxT: W workers con T threads cada uno):
+
+1. Levanta gunicorn con OPENAI_BASE_URL apuntando a fake_openai_server.py
+   (latencia y errores inyectables), en un directorio de trabajo temporal
+   con copia de los catálogos: los índices FAISS que se reconstruyan con
+   vectores falsos no pisan los del repo
+2. Calienta los workers (carga de sistemas) sin medir
+3. Manda una mezcla de /search, /buscar_especialista,
+   /consultar_guia_medica y /emergency a --qps fijo durante --duracion
+   segundos. La carga es de lazo abierto: cada request tiene su instante
+   programado y la latencia se mide desde ese instante, así la cola en el
+   cliente cuando el servidor no da abasto cuenta como latencia
+4. Reporta throughput, p50/p95/p99 por endpoint, tasa de errores, llamadas
+   al proveedor de embeddings y RSS por worker (pico muestreado de /proc)
+
+Solo Linux (RSS desde /proc), igual que Render.
+
+Uso:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --configs 1x1 1x4 2x4 4x2 --qps 40 --duracion 60
+    python -m benchmarks.load_test --latencia-ms 150 --jitter-ms 100 --tasa-error 0.02 --json carga.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Archivos que api_rest lee con rutas relativas al directorio de trabajo
+DATOS = ['recursos_salud_mental_cdmx.json', 'base_conocimiento_rag_pasos_inmediatos.json',
+         'faiss_recursos', 'faiss_pasos']
+
+MEZCLA_DEFAULT = 'search=4,buscar_especialista=3,consultar_guia_medica=2,emergency=1'
+
+CUERPOS: Dict[str, List[Dict[str, Any]]] = {
+    'search': [
+        {'query': 'Necesito ayuda con ansiedad', 'top_k': 5},
+        {'query': 'terapia para depresión en línea', 'top_k': 5, 'filters': {'modalidad': ['Online']}},
+        {'query': 'psicóloga para adolescentes', 'top_k': 10, 'filters': {'max_cost': 800}},
+        {'query': 'psiquiatra trastorno bipolar', 'top_k': 5, 'filters': {'min_rating': 4.5}},
+        {'query': 'atención gratuita duelo', 'top_k': 5, 'filters': {'max_cost': 0}},
+    ],
+    'buscar_especialista': [
+        {'sintoma': 'ansiedad', 'genero': 'femenino', 'presupuesto': 'bajo', 'ubicacion': 'Benito Juárez'},
+        {'sintoma': 'depresión', 'ubicacion': 'Coyoacán'},
+        {'sintoma': 'ataques de pánico', 'presupuesto': 'medio'},
+        {'sintoma': 'meditación para dormir'},
+        {'sintoma': 'TDAH en adolescentes', 'genero': 'masculino', 'ubicacion': 'Tlalpan'},
+    ],
+    'consultar_guia_medica': [
+        {'pregunta': '¿Qué hago si tengo un ataque de pánico?'},
+        {'pregunta': 'no puedo dormir, tengo insomnio'},
+        {'pregunta': 'me siento muy triste desde hace semanas'},
+        {'pregunta': 'cómo me calmo antes de un examen'},
+        {'pregunta': 'mi hermano escucha voces'},
+    ],
+    'emergency': [
+        {'query': 'Pensamientos suicidas'},
+        {'query': 'crisis de pánico ahora', 'max_cost': 500},
+        {'query': 'autolesiones adolescente'},
+    ],
+}
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def esperar_http(url: str, timeout: float, proceso: subprocess.Popen) -> None:
+    """Espera a que `url` responda; falla si el proceso murió o se acabó el tiempo"""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"{' '.join(proceso.args[:4])} terminó con código {proceso.returncode}")
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} no respondió en {timeout:.0f}s")
+
+
+def parsear_mezcla(texto: str) -> Dict[str, float]:
+    mezcla = {}
+    for parte in texto.split(','):
+        nombre, _, peso = parte.partition('=')
+        nombre = nombre.strip().lstrip('/')
+        if nombre not in CUERPOS:
+            raise argparse.ArgumentTypeError(f"Endpoint desconocido en la mezcla: {nombre}")
+        mezcla[nombre] = float(peso or 1)
+    return mezcla
+
+
+def parsear_config(texto: str) -> Tuple[int, int]:
+    workers, _, threads = texto.lower().partition('x')
+    try:
+        return int(workers), int(threads or 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Configuración inválida '{texto}' (formato WxT, p. ej. 2x4)")
+
+
+# ============================================================================
+# RSS por worker
+# ============================================================================
+
+def _rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for linea in f:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def hijos(pid: int) -> List[int]:
+    """Procesos cuyo padre es `pid` (los workers del master de gunicorn)"""
+    encontrados = []
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entrada}/stat') as f:
+                # El nombre va entre paréntesis y puede tener espacios: ppid es el 2º campo tras ')'
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            encontrados.append(int(entrada))
+    return encontrados
+
+
+class MuestreadorRSS:
+    """Hilo que registra el RSS pico de cada worker mientras dura la carga"""
+
+    def __init__(self, master_pid: int, intervalo: float = 0.5):
+        self.master_pid = master_pid
+        self.intervalo = intervalo
+        self.pico_kb: Dict[int, int] = {}
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, name='rss', daemon=True)
+
+    def __enter__(self) -> 'MuestreadorRSS':
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._detener.set()
+        self._hilo.join()
+
+    def _muestrear(self):
+        while True:
+            for pid in hijos(self.master_pid):
+                rss = _rss_kb(pid)
+                if rss is not None:
+                    self.pico_kb[pid] = max(rss, self.pico_kb.get(pid, 0))
+            if self._detener.wait(self.intervalo):
+                return
+
+    def resumen(self) -> Dict[str, Any]:
+        picos = sorted(self.pico_kb.values())
+        return {'workers_vistos': len(picos),
+                'rss_master_mb': round((_rss_kb(self.master_pid) or 0) / 1024, 1),
+                'rss_pico_worker_mb': [round(kb / 1024, 1) for kb in picos],
+                'rss_pico_total_mb': round(sum(picos) / 1024, 1)}
+
+
+# ============================================================================
+# Servidores
+# ============================================================================
+
+def preparar_directorio() -> str:
+    """Directorio de trabajo con copia de los datos que api_rest abre por ruta relativa"""
+    directorio = tempfile.mkdtemp(prefix='calma_carga_')
+    for nombre in DATOS:
+        origen = os.path.join(RAIZ, nombre)
+        if os.path.isdir(origen):
+            shutil.copytree(origen, os.path.join(directorio, nombre))
+        elif os.path.exists(origen):
+            shutil.copy2(origen, directorio)
+    return directorio
+
+
+def entorno_api(base_url: str) -> Dict[str, str]:
+    entorno = dict(os.environ)
+    entorno.update({
+        'OPENAI_BASE_URL': base_url,
+        'OPENAI_API_KEY': 'sk-fake-carga',
+        'PYTHONPATH': os.pathsep.join(filter(None, [RAIZ, entorno.get('PYTHONPATH')])),
+    })
+    # Perfilado y shards fuera: se mide la configuración por defecto de Render
+    for variable in ('ADMIN_TOKEN', 'PROFILE_SAMPLE_RATE', 'REGIONS_CONFIG', 'PROMETHEUS_MULTIPROC_DIR'):
+        entorno.pop(variable, None)
+    return entorno
+
+
+def construir_indices(directorio: str, entorno: Dict[str, str], log) -> float:
+    """
+    Carga los sistemas una vez fuera de gunicorn para que los índices que
+    falten o estén desactualizados queden escritos antes de levantar varios
+    workers (que si no los reconstruirían a la vez sobre los mismos archivos)
+    """
+    inicio = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import api_rest; api_rest.init_systems()'],
+                   cwd=directorio, env=entorno, stdout=log, stderr=subprocess.STDOUT, check=True)
+    return time.perf_counter() - inicio
+
+
+def iniciar_gunicorn(workers: int, threads: int, puerto: int, directorio: str,
+                     entorno: Dict[str, str], log, timeout: int) -> subprocess.Popen:
+    comando = [sys.executable, '-m', 'gunicorn', 'api_rest:app',
+               '--bind', f'127.0.0.1:{puerto}',
+               '--workers', str(workers), '--threads', str(threads),
+               '--timeout', str(timeout), '--chdir', directorio]
+    return subprocess.Popen(comando, cwd=directorio, env=entorno, stdout=log, stderr=subprocess.STDOUT)
+
+
+def detener(proceso: subprocess.Popen) -> None:
+    if proceso.poll() is None:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+            proceso.wait()
+
+
+# ============================================================================
+# Generador de carga
+# ============================================================================
+
+class GeneradorCarga:
+    """
+    Carga de lazo abierto a QPS fijo con un pool de hilos cliente
+
+    Args:
+        base_url: URL de la API
+        mezcla: {endpoint: peso}
+        qps: Requests por segundo programados
+        conexiones: Hilos cliente (requests simultáneos máximos)
+        timeout: Timeout por request en segundos
+        seed: Semilla de la secuencia de endpoints y cuerpos
+    """
+
+    def __init__(self, base_url: str, mezcla: Dict[str, float], qps: float,
+                 conexiones: int = 64, timeout: float = 30.0, seed: int = 0):
+        self.base_url = base_url
+        self.mezcla = mezcla
+        self.qps = qps
+        self.conexiones = conexiones
+        self.timeout = timeout
+        self.seed = seed
+        self._local = threading.local()
+
+    def _sesion(self) -> requests.Session:
+        sesion = getattr(self._local, 'sesion', None)
+        if sesion is None:
+            sesion = self._local.sesion = requests.Session()
+        return sesion
+
+    def _enviar(self, endpoint: str, cuerpo: Dict[str, Any], programado: float) -> Dict[str, Any]:
+        try:
+            respuesta = self._sesion().post(f"{self.base_url}/{endpoint}", json=cuerpo, timeout=self.timeout)
+            status = respuesta.status_code
+            error = None if status < 400 else f"HTTP {status}"
+        except requests.RequestException as e:
+            status, error = None, type(e).__name__
+        return {'endpoint': endpoint, 'status': status, 'error': error,
+                'latencia_ms': (time.perf_counter() - programado) * 1000, 'fin': time.perf_counter()}
+
+    def correr(self, duracion: float) -> Tuple[List[Dict[str, Any]], float]:
+        """Resultados de cada request y segundos transcurridos hasta el último"""
+        rnd = random.Random(self.seed)
+        endpoints, pesos = list(self.mezcla), list(self.mezcla.values())
+        total = int(duracion * self.qps)
+        futuros = []
+        with ThreadPoolExecutor(max_workers=self.conexiones, thread_name_prefix='cliente') as pool:
+            inicio = time.perf_counter()
+            for i in range(total):
+                programado = inicio + i / self.qps
+                espera = programado - time.perf_counter()
+                if espera > 0:
+                    time.sleep(espera)
+                endpoint = rnd.choices(endpoints, pesos)[0]
+                futuros.append(pool.submit(self._enviar, endpoint, rnd.choice(CUERPOS[endpoint]), programado))
+            resultados = [f.result() for f in futuros]
+        fin = max((r['fin'] for r in resultados), default=inicio)
+        return resultados, fin - inicio
+
+
+def resumir(resultados: List[Dict[str, Any]], segundos: float) -> Dict[str, Any]:
+    def stats(filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ok = [r['latencia_ms'] for r in filas if r['error'] is None]
+        errores: Dict[str, int] = {}
+        for r in filas:
+            if r['error'] is not None:
+                errores[r['error']] = errores.get(r['error'], 0) + 1
+        latencias = np.array(ok) if ok else np.array([np.nan])
+        return {'requests': len(filas), 'ok': len(ok),
+                'tasa_error': round(1 - len(ok) / len(filas), 4) if filas else 0.0,
+                'errores': errores,
+                'p50_ms': round(float(np.percentile(latencias, 50)), 1),
+                'p95_ms': round(float(np.percentile(latencias, 95)), 1),
+                'p99_ms': round(float(np.percentile(latencias, 99)), 1),
+                'max_ms': round(float(latencias.max()), 1)}
+
+    total = stats(resultados)
+    total['throughput_rps'] = round(total['ok'] / segundos, 2) if segundos > 0 else 0.0
+    total['por_endpoint'] = {e: stats([r for r in resultados if r['endpoint'] == e])
+                             for e in sorted({r['endpoint'] for r in resultados})}
+    return total
+
+
+def stats_fake(url: str) -> Dict[str, Any]:
+    return requests.get(f"{url}/stats", timeout=5).json()
+
+
+# ============================================================================
+# Main
+# ============================================================================
+
+def probar_config(workers: int, threads: int, args, fake_url: str, directorio: str,
+                  entorno: Dict[str, str], log) -> Dict[str, Any]:
+    puerto = puerto_libre()
+    api_url = f"http://127.0.0.1:{puerto}"
+    gunicorn = iniciar_gunicorn(workers, threads, puerto, directorio, entorno, log, args.timeout_worker)
+    try:
+        inicio = time.perf_counter()
+        esperar_http(f"{api_url}/health", 120, gunicorn)
+        # Cada worker carga los sistemas en su primer request (el master no
+        # elige a quién le toca): requests simultáneos hasta que todos respondan
+        with ThreadPoolExecutor(max_workers=workers * threads * 2) as pool:
+            list(pool.map(lambda _: requests.get(f"{api_url}/health", timeout=300),
+                          range(workers * threads * 4)))
+        arranque = time.perf_counter() - inicio
+
+        generador = GeneradorCarga(api_url, args.mezcla, args.qps, args.conexiones,
+                                   args.timeout, args.seed)
+        if args.calentamiento > 0:
+            generador.correr(args.calentamiento)
+
+        antes = stats_fake(fake_url)
+        with MuestreadorRSS(gunicorn.pid) as rss:
+            resultados, segundos = generador.correr(args.duracion)
+        memoria = rss.resumen()
+        despues = stats_fake(fake_url)
+    finally:
+        detener(gunicorn)
+
+    resumen = resumir(resultados, segundos)
+    resumen.update({
+        'config': f"{workers}x{threads}", 'workers': workers, 'threads': threads,
+        'qps_objetivo': args.qps, 'segundos': round(segundos, 2),
+        'arranque_s': round(arranque, 2),
+        'embeddings': {clave: despues[clave] - antes[clave]
+                       for clave in ('llamadas', 'textos', 'errores_inyectados')},
+        **memoria,
+    })
+    return resumen
+
+
+def imprimir(r: Dict[str, Any]) -> None:
+    print(f"  throughput {r['throughput_rps']:.1f} req/s (objetivo {r['qps_objetivo']:g}) · "
+          f"errores {r['tasa_error']:.2%} · arranque {r['arranque_s']:.1f}s")
+    print(f"  {'endpoint':<24}{'reqs':>7}{'err%':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for nombre, e in [*r['por_endpoint'].items(), ('TOTAL', r)]:
+        print(f"  {nombre:<24}{e['requests']:>7}{e['tasa_error']:>8.2%}{e['p50_ms']:>9.1f}"
+              f"{e['p95_ms']:>9.1f}{e['p99_ms']:>9.1f}{e['max_ms']:>9.1f}")
+    if r['errores']:
+        print(f"  errores: {r['errores']}")
+    emb = r['embeddings']
+    print(f"  embeddings: {emb['llamadas']} llamadas, {emb['textos']} textos, "
+          f"{emb['errores_inyectados']} errores inyectados")
+    print(f"  RSS master {r['rss_master_mb']} MB · pico por worker {r['rss_pico_worker_mb']} MB "
+          f"· total {r['rss_pico_total_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga de api_rest bajo gunicorn')
+    parser.add_argument('--configs', type=parsear_config, nargs='+', default=[(1, 1), (1, 4), (2, 4)],
+                        help='Configuraciones WxT (workers x threads)')
+    parser.add_argument('--qps', type=float, default=20.0)
+    parser.add_argument('--duracion', type=float, default=30.0, help='Segundos medidos por configuración')
+    parser.add_argument('--calentamiento', type=float, default=5.0, help='Segundos de carga sin medir')
+    parser.add_argument('--mezcla', type=parsear_mezcla, default=parsear_mezcla(MEZCLA_DEFAULT),
+                        help=f'Pesos por endpoint (default {MEZCLA_DEFAULT})')
+    parser.add_argument('--conexiones', type=int, default=64, help='Hilos cliente')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Timeout por request (s)')
+    parser.add_argument('--timeout-worker', type=int, default=120, help='--timeout de gunicorn')
+    parser.add_argument('--latencia-ms', type=float, default=80.0, help='Latencia del fake de embeddings')
+    parser.add_argument('--jitter-ms', type=float, default=40.0)
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='Fracción de embeddings que fallan')
+    parser.add_argument('--status-error', type=int, default=500, choices=[429, 500, 502, 503])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Escribir los resultados en este archivo')
+    args = parser.parse_args()
+
+    directorio = preparar_directorio()
+    log_path = os.path.join(directorio, 'carga.log')
+    fake = None
+    resultados = []
+    try:
+        with open(log_path, 'w') as log:
+            puerto_fake = puerto_libre()
+            fake_url = f"http://127.0.0.1:{puerto_fake}"
+            fake = subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks.fake_openai_server', '--puerto', str(puerto_fake),
+                 '--latencia-ms', str(args.latencia_ms), '--jitter-ms', str(args.jitter_ms),
+                 '--tasa-error', str(args.tasa_error), '--status-error', str(args.status_error),
+                 '--seed', str(args.seed)],
+                cwd=RAIZ, stdout=log, stderr=subprocess.STDOUT)
+            esperar_http(f"{fake_url}/stats", 30, fake)
+            entorno = entorno_api(f"{fake_url}/v1")
+            print(f"Directorio de trabajo: {directorio} (log en {log_path})")
+            print(f"Embeddings falsos: {args.latencia_ms:g}±{args.jitter_ms:g} ms, "
+                  f"errores {args.tasa_error:.1%} (HTTP {args.status_error})")
+            print(f"Índices listos en {construir_indices(directorio, entorno, log):.1f}s")
+
+            for workers, threads in args.configs:
+                print('=' * 78)
+                print(f"gunicorn --workers {workers} --threads {threads} · {args.qps:g} QPS durante "
+                      f"{args.duracion:g}s")
+                r = probar_config(workers, threads, args, fake_url, directorio, entorno, log)
+                imprimir(r)
+                resultados.append(r)
+    finally:
+        if fake is not None:
+            detener(fake)
+
+    print('=' * 78)
+    print(f"{'config':<8}{'req/s':>8}{'err%':>8}{'p50':>9}{'p99':>9}{'RSS total MB':>14}")
+    for r in resultados:
+        print(f"{r['config']:<8}{r['throughput_rps']:>8.1f}{r['tasa_error']:>8.2%}{r['p50_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['rss_pico_total_mb']:>14.1f}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'parametros': {k: v for k, v in vars(args).items() if k != 'json'},
+                       'resultados': resultados}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.json}")
+    shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
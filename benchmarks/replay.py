@@ -0,0 +1,281 @@
+"""
+Replay de capturas de tráfico (traffic_capture.py) y comparación entre builds
+
+Reenvía los requests capturados a un build, al ritmo original (--velocidad 1),
+acelerado (--velocidad 10 = diez veces más rápido) o sin pausas
+(--velocidad 0, limitado por --concurrencia). Como en load_test.py la carga
+es de lazo abierto y la latencia se mide desde el instante programado.
+
+De cada respuesta se guarda status, latencia e ids del top-k (resultados de
+especialistas o artículo de la guía, también en las versiones en streaming).
+Con dos --url se corre la misma captura contra ambos builds, uno después del
+otro, y se comparan; con --diff se comparan dos corridas guardadas.
+
+La comparación reporta p50/p95/p99 por endpoint (marcados con ! si p50
+empeora más de --tolerancia o p99 más del doble, en endpoints con al menos
+--min-muestras requests) y, en los requests que respondieron bien en ambos,
+qué fracción tiene el mismo top-k (mismo orden, mismo conjunto) y la
+superposición media (Jaccard). Termina con código 1 si hay
+regresiones de latencia; los cambios de top-k se reportan pero no fallan
+(pueden ser intencionales).
+
+Uso:
+    CAPTURE_DIR=capturas gunicorn api_rest:app        # en producción / staging
+    python -m benchmarks.replay capturas/ --url http://localhost:8000 --salida base.jsonl
+    python -m benchmarks.replay capturas/ --url http://localhost:8000 --url http://localhost:8001 --velocidad 5
+    python -m benchmarks.replay --diff base.jsonl nuevo.jsonl
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+from benchmarks.load_test import resumir
+from traffic_capture import leer_capturas
+
+
+def rutas_captura(entradas: List[str]) -> List[str]:
+    """Archivos de captura (un directorio incluye trafico-*.jsonl y sus rotados)"""
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            rutas.extend(sorted(glob.glob(os.path.join(entrada, 'trafico-*.jsonl*'))))
+        else:
+            rutas.append(entrada)
+    return rutas
+
+
+def _ids(items: Any) -> List[Any]:
+    return [item.get('id') for item in items if isinstance(item, dict)] if isinstance(items, list) else []
+
+
+def ids_respuesta(contenido: bytes, content_type: str) -> List[Any]:
+    """Ids del top-k en una respuesta JSON, NDJSON o SSE"""
+    if 'ndjson' in content_type or 'event-stream' in content_type:
+        ids = []
+        for linea in contenido.decode('utf-8', errors='replace').splitlines():
+            if 'event-stream' in content_type:
+                if not linea.startswith('data: '):
+                    continue
+                linea = linea[len('data: '):]
+            if not linea.strip():
+                continue
+            evento = json.loads(linea)
+            if evento.get('evento') == 'resultado':
+                ids.extend(_ids([evento.get('resultado')]))
+            elif evento.get('evento') == 'articulo':
+                ids.extend(_ids([evento.get('articulo')]))
+        return ids
+    try:
+        cuerpo = json.loads(contenido)
+    except ValueError:
+        return []
+    if not isinstance(cuerpo, dict):
+        return []
+    return (_ids(cuerpo.get('results')) or _ids(cuerpo.get('resultados'))
+            or _ids([cuerpo.get('articulo')]))
+
+
+class Replayer:
+    """
+    Args:
+        base_url: URL del build a probar
+        velocidad: Factor sobre el ritmo original (0 = sin pausas)
+        concurrencia: Requests simultáneos máximos
+        timeout: Timeout por request en segundos
+    """
+
+    def __init__(self, base_url: str, velocidad: float = 1.0, concurrencia: int = 32,
+                 timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.velocidad = velocidad
+        self.concurrencia = concurrencia
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _sesion(self) -> requests.Session:
+        sesion = getattr(self._local, 'sesion', None)
+        if sesion is None:
+            sesion = self._local.sesion = requests.Session()
+        return sesion
+
+    def _enviar(self, i: int, registro: Dict[str, Any], programado: Optional[float]) -> Dict[str, Any]:
+        # Sin pausas (programado None) la latencia cuenta desde que hay un hilo libre
+        programado = programado or time.perf_counter()
+        ids, error, status = [], None, None
+        try:
+            respuesta = self._sesion().post(self.base_url + registro['path'], json=registro['body'],
+                                            timeout=self.timeout)
+            status = respuesta.status_code
+            if status >= 400:
+                error = f"HTTP {status}"
+            else:
+                ids = ids_respuesta(respuesta.content, respuesta.headers.get('Content-Type', ''))
+        except requests.RequestException as e:
+            error = type(e).__name__
+        except ValueError:
+            error = 'respuesta_invalida'
+        return {'i': i, 'endpoint': registro['endpoint'], 'path': registro['path'],
+                'body': registro['body'], 'status': status, 'error': error,
+                'latencia_ms': round((time.perf_counter() - programado) * 1000, 3),
+                'original_ms': registro.get('duracion_ms'), 'ids': ids, 'fin': time.perf_counter()}
+
+    def correr(self, registros: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], float]:
+        """Resultados por request (en el orden de la captura) y segundos totales"""
+        if not registros:
+            return [], 0.0
+        ts0 = registros[0]['ts']
+        with ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix='replay') as pool:
+            inicio = time.perf_counter()
+            futuros = []
+            for i, registro in enumerate(registros):
+                programado = None
+                if self.velocidad > 0:
+                    programado = inicio + (registro['ts'] - ts0) / self.velocidad
+                    espera = programado - time.perf_counter()
+                    if espera > 0:
+                        time.sleep(espera)
+                futuros.append(pool.submit(self._enviar, i, registro, programado))
+            resultados = [f.result() for f in futuros]
+        return resultados, max(r['fin'] for r in resultados) - inicio
+
+
+# ============================================================================
+# Comparación entre corridas
+# ============================================================================
+
+def comparar_latencias(a: Dict[str, Any], b: Dict[str, Any], tolerancia: float,
+                       min_muestras: int) -> List[str]:
+    """
+    Imprime p50/p95/p99 por endpoint de ambas corridas; retorna las regresiones
+    (solo en endpoints con al menos min_muestras requests en ambas)
+    """
+    regresiones = []
+    print(f"  {'endpoint':<30}{'reqs':>6}  {'p50 A → B':>22}  {'p95 A → B':>22}  {'p99 A → B':>22}")
+    for nombre in sorted(set(a['por_endpoint']) | set(b['por_endpoint'])) + ['TOTAL']:
+        ea = a if nombre == 'TOTAL' else a['por_endpoint'].get(nombre)
+        eb = b if nombre == 'TOTAL' else b['por_endpoint'].get(nombre)
+        if ea is None or eb is None:
+            print(f"  {nombre:<30} solo en {'B' if ea is None else 'A'}")
+            continue
+        columnas = []
+        for p, limite in (('p50_ms', tolerancia), ('p95_ms', None), ('p99_ms', 2 * tolerancia)):
+            cambio = eb[p] / ea[p] - 1 if ea[p] > 0 else 0.0
+            marca = ''
+            suficientes = min(ea['requests'], eb['requests']) >= min_muestras
+            if limite is not None and suficientes and cambio > limite:
+                marca = '!'
+                regresiones.append(f"{nombre}: {p[:3]} {ea[p]:.1f} -> {eb[p]:.1f} ms ({cambio:+.0%})")
+            columnas.append(f"{ea[p]:>7.1f} → {eb[p]:>7.1f} {cambio:+5.0%}{marca:1}")
+        print(f"  {nombre:<30}{eb['requests']:>6}  " + '  '.join(columnas))
+    return regresiones
+
+
+def comparar_topk(a: List[Dict[str, Any]], b: List[Dict[str, Any]], mostrar: int) -> None:
+    por_i = {r['i']: r for r in b}
+    pares = [(ra, por_i[ra['i']]) for ra in a if ra['i'] in por_i]
+    status_distinto = sum(1 for ra, rb in pares if ra['status'] != rb['status'])
+    ambos_ok = [(ra, rb) for ra, rb in pares if ra['error'] is None and rb['error'] is None]
+    print(f"  {len(pares)} requests comparados, {status_distinto} con status distinto, "
+          f"{len(ambos_ok)} bien en ambos")
+    if not ambos_ok:
+        return
+
+    def jaccard(x: List[Any], y: List[Any]) -> float:
+        union = set(x) | set(y)
+        return len(set(x) & set(y)) / len(union) if union else 1.0
+
+    filas = [(jaccard(ra['ids'], rb['ids']), ra, rb) for ra, rb in ambos_ok]
+    mismo_orden = sum(1 for _, ra, rb in filas if ra['ids'] == rb['ids'])
+    mismo_conjunto = sum(1 for j, _, _ in filas if j == 1.0)
+    print(f"  top-k idéntico: {mismo_orden / len(filas):.1%} · mismo conjunto: "
+          f"{mismo_conjunto / len(filas):.1%} · Jaccard medio: {np.mean([j for j, _, _ in filas]):.3f}")
+    distintos = sorted((f for f in filas if f[1]['ids'] != f[2]['ids']), key=lambda f: f[0])
+    for j, ra, rb in distintos[:mostrar]:
+        print(f"    #{ra['i']} {ra['path']} {json.dumps(ra['body'], ensure_ascii=False)[:100]}")
+        print(f"      Jaccard {j:.2f}  A {ra['ids']}")
+        print(f"      {'':13}B {rb['ids']}")
+
+
+def comparar(a: List[Dict[str, Any]], b: List[Dict[str, Any]], tolerancia: float,
+             min_muestras: int, mostrar: int) -> List[str]:
+    print('Latencia (ms)')
+    regresiones = comparar_latencias(resumir(a, 1.0), resumir(b, 1.0), tolerancia, min_muestras)
+    print('Resultados')
+    comparar_topk(a, b, mostrar)
+    return regresiones
+
+
+def guardar(resultados: List[Dict[str, Any]], ruta: str) -> None:
+    with open(ruta, 'w', encoding='utf-8') as f:
+        for r in resultados:
+            f.write(json.dumps({k: v for k, v in r.items() if k != 'fin'}, ensure_ascii=False) + '\n')
+
+
+def cargar(ruta: str) -> List[Dict[str, Any]]:
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay de capturas de tráfico y diff entre builds')
+    parser.add_argument('capturas', nargs='*', help='Archivos o directorios de captura')
+    parser.add_argument('--url', action='append', default=[], help='Build a probar (una o dos veces)')
+    parser.add_argument('--velocidad', type=float, default=1.0,
+                        help='Factor sobre el ritmo original (0 = sin pausas)')
+    parser.add_argument('--concurrencia', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--limite', type=int, help='Solo los primeros N requests de la captura')
+    parser.add_argument('--salida', help='Guardar la corrida (con dos --url: prefijo, se agrega .a/.b)')
+    parser.add_argument('--diff', nargs=2, metavar=('A', 'B'), help='Comparar dos corridas guardadas')
+    parser.add_argument('--tolerancia', type=float, default=0.3, help='Empeoramiento aceptado en p50')
+    parser.add_argument('--min-muestras', type=int, default=20,
+                        help='Requests mínimos de un endpoint para marcar regresiones')
+    parser.add_argument('--mostrar', type=int, default=5, help='Requests con top-k distinto a listar')
+    args = parser.parse_args()
+
+    if args.diff:
+        corridas = [cargar(ruta) for ruta in args.diff]
+    else:
+        if not args.capturas or not 1 <= len(args.url) <= 2:
+            parser.error('indicar capturas y una o dos --url (o --diff A B)')
+        registros = leer_capturas(rutas_captura(args.capturas))[:args.limite]
+        if registros:
+            print(f"{len(registros)} requests capturados en "
+                  f"{registros[-1]['ts'] - registros[0]['ts']:.0f}s, replay a velocidad {args.velocidad:g}")
+        corridas = []
+        for n, url in enumerate(args.url):
+            resultados, segundos = Replayer(url, args.velocidad, args.concurrencia, args.timeout).correr(registros)
+            resumen = resumir(resultados, segundos)
+            print(f"{url}: {resumen['throughput_rps']:.1f} req/s, errores {resumen['tasa_error']:.2%}, "
+                  f"p50 {resumen['p50_ms']:.1f} ms, p99 {resumen['p99_ms']:.1f} ms")
+            if args.salida:
+                ruta = args.salida if len(args.url) == 1 else f"{args.salida}.{'ab'[n]}"
+                guardar(resultados, ruta)
+                print(f"  corrida guardada en {ruta}")
+            corridas.append(resultados)
+        if len(corridas) < 2:
+            return
+
+    print('=' * 78)
+    regresiones = comparar(corridas[0], corridas[1], args.tolerancia, args.min_muestras, args.mostrar)
+    print('=' * 78)
+    if regresiones:
+        print(f"REGRESIONES (tolerancia {args.tolerancia:.0%}):")
+        for r in regresiones:
+            print(f"  {r}")
+        sys.exit(1)
+    print(f"Sin regresiones de latencia (tolerancia {args.tolerancia:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Catálogos sintéticos de recursos con el esquema real de 'recurso'
+
+Cada recurso parte de una plantilla del catálogo real
+(recursos_salud_mental_cdmx.json) y recibe id, nombre, costo, rating,
+especializaciones, ubicación, género y disponibilidad al azar tomados de los
+valores que aparecen en el catálogo, así los filtros, el scoring y
+format_for_mobile recorren los mismos campos y ramas que en producción.
+Con la misma semilla el catálogo es idéntico.
+"""
+
+import copy
+import json
+import random
+import zlib
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from filter_index import FilterIndex
+from partitioned_index import PartitionedIndex
+from retrieval_system import MentalHealthRetrieval, texto_recurso
+
+CATALOGO_REAL = 'recursos_salud_mental_cdmx.json'
+
+NOMBRES = ['Ana', 'Carlos', 'María', 'Jorge', 'Lucía', 'Fernando', 'Sofía', 'Miguel',
+           'Valeria', 'Ricardo', 'Daniela', 'Alejandro', 'Paola', 'Héctor', 'Fernanda']
+APELLIDOS = ['García', 'Hernández', 'López', 'Martínez', 'González', 'Pérez', 'Rodríguez',
+             'Sánchez', 'Ramírez', 'Cruz', 'Flores', 'Gómez', 'Morales', 'Vázquez', 'Reyes']
+COSTOS = [0.0, 300.0, 450.0, 600.0, 800.0, 1000.0, 1200.0, 1500.0, 1800.0, 2500.0]
+
+
+def _valores(catalogo: List[Dict[str, Any]], campo: str) -> List[Any]:
+    vistos, valores = set(), []
+    for r in catalogo:
+        valor = r.get(campo)
+        clave = json.dumps(valor, sort_keys=True, ensure_ascii=False)
+        if valor and clave not in vistos:
+            vistos.add(clave)
+            valores.append(valor)
+    return valores
+
+
+def generar_catalogo(n: int, seed: int = 0, catalogo_path: str = CATALOGO_REAL) -> List[Dict[str, Any]]:
+    """n recursos sintéticos (deterministas para una semilla)"""
+    with open(catalogo_path, 'r', encoding='utf-8') as f:
+        plantillas = json.load(f)
+    rnd = random.Random(seed)
+    ubicaciones = _valores(plantillas, 'ubicacion')
+    especializaciones = sorted({e for r in plantillas for e in r.get('especializaciones', [])})
+    disponibilidades = _valores(plantillas, 'disponibilidad')
+    metodos_pago = _valores(plantillas, 'metodos_pago')
+    grupos = _valores(plantillas, 'grupo_etario')
+
+    recursos = []
+    for i in range(n):
+        plantilla = plantillas[rnd.randrange(len(plantillas))]
+        recurso = dict(plantilla)
+        recurso['id'] = f"syn_{i:07d}"
+        if plantilla.get('tipo_recurso') == 'especialista':
+            titulo = rnd.choice(['Dra.', 'Dr.', 'Psic.', 'Mtra.', 'Mtro.'])
+            recurso['nombre'] = f"{titulo} {rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}"
+            recurso['genero_especialista'] = 'Femenino' if titulo in ('Dra.', 'Mtra.') else rnd.choice(
+                ['Masculino', 'Femenino'])
+        else:
+            recurso['nombre'] = f"{plantilla['nombre']} {i}"
+        costo = rnd.choice(COSTOS)
+        recurso['costo'] = {'promedio': costo,
+                            'descripcion': 'Gratuito' if costo == 0 else f"${costo:,.0f} MXN por sesión",
+                            'es_gratuito': costo == 0}
+        recurso['rating'] = round(rnd.uniform(3.5, 5.0), 1)
+        recurso['resenas'] = rnd.randint(0, 500)
+        recurso['especializaciones'] = rnd.sample(especializaciones, rnd.randint(2, 6))
+        recurso['ubicacion'] = copy.copy(rnd.choice(ubicaciones))
+        recurso['grupo_etario'] = rnd.choice(grupos)
+        recurso['disponibilidad'] = rnd.choice(disponibilidades)
+        recurso['tiene_sabado'] = rnd.random() < 0.3
+        recurso['metodos_pago'] = rnd.choice(metodos_pago)
+        recurso['es_emergencia'] = plantilla.get('es_emergencia', False) or rnd.random() < 0.02
+        recursos.append(recurso)
+    return recursos
+
+
+def sistema_sintetico(recursos: List[Dict[str, Any]], client: Any,
+                      openai_model: str = 'text-embedding-3-small') -> MentalHealthRetrieval:
+    """
+    MentalHealthRetrieval en memoria sobre el catálogo sintético, embebido
+    con `client` (FakeOpenAI). Solo arma lo que usan search(), search_mixto(),
+    facets() y el scoring: sin grafo de vecinos (O(n²) a 1M de recursos) ni
+    prototipos de crisis, que no son parte de los caminos medidos.
+    """
+    vectores = client.embeddings.vectores([texto_recurso(r) for r in recursos])
+    sistema = MentalHealthRetrieval.__new__(MentalHealthRetrieval)
+    sistema._init_client(openai_model, client)
+    sistema.recursos = sistema.especialistas = recursos
+    sistema.index = faiss.IndexFlatIP(vectores.shape[1])
+    sistema.index.add(np.ascontiguousarray(vectores))
+    sistema.filter_index = FilterIndex(recursos)
+    sistema.particiones = PartitionedIndex(vectores, recursos)
+    sistema.crisis_classifier = None
+    return sistema
+
+
+# Proveedores NPPES sintéticos (columnas de nppes_ingestion.COLUMNAS_NPPES)
+TAXONOMIAS_NPPES = [
+    ('Psychiatry & Neurology, Psychiatry', 'Individual'),
+    ('Psychiatry & Neurology, Child & Adolescent Psychiatry', 'Individual'),
+    ('Psychiatry & Neurology, Addiction Psychiatry', 'Individual'),
+    ('Psychologist, Clinical', 'Individual'),
+    ('Psychologist, Counseling', 'Individual'),
+    ('Social Worker, Clinical', 'Individual'),
+    ('Counselor, Mental Health', 'Individual'),
+    ('Marriage & Family Therapist', 'Individual'),
+    ('Registered Nurse, Psychiatric/Mental Health', 'Individual'),
+    ('Psychiatric Hospital', 'Organization'),
+    ('Clinic/Center, Mental Health (Including Community Mental Health Center)', 'Organization'),
+    ('Community/Behavioral Health', 'Organization'),
+]
+CIUDADES_NPPES = [('AUSTIN', 'TX'), ('HOUSTON', 'TX'), ('DALLAS', 'TX'), ('LOS ANGELES', 'CA'),
+                  ('SAN DIEGO', 'CA'), ('NEW YORK', 'NY'), ('BUFFALO', 'NY'), ('MIAMI', 'FL'),
+                  ('TAMPA', 'FL'), ('CHICAGO', 'IL'), ('SEATTLE', 'WA'), ('DENVER', 'CO')]
+CREDENCIALES_NPPES = {'Psychiatry': ['MD', 'DO'], 'Psychologist': ['PhD', 'PsyD'],
+                      'Social Worker': ['LCSW'], 'Counselor': ['LPC', 'LMHC'],
+                      'Marriage': ['LMFT'], 'Nurse': ['PMHNP', 'APRN']}
+
+
+def generar_parquet_nppes(path: str, n: int, seed: int = 0, duplicados: float = 0.05) -> str:
+    """
+    Parquet con n proveedores NPPES sintéticos (deterministas para una
+    semilla). Los individuales comparten teléfono con su consultorio; una
+    fracción `duplicados` de las organizaciones aparece con otro NPI y el
+    mismo nombre y teléfono, como los registros múltiples reales.
+    """
+    rnd = random.Random(seed)
+    consultorios = {ciudad: [f"{rnd.randint(200, 999)}555{rnd.randint(1000, 9999)}" for _ in range(40)]
+                    for ciudad, _ in CIUDADES_NPPES}
+    filas: List[Dict[str, Any]] = []
+    while len(filas) < n:
+        taxonomia, tipo = rnd.choice(TAXONOMIAS_NPPES)
+        ciudad, estado = rnd.choice(CIUDADES_NPPES)
+        npi = 1000000000 + len(filas)
+        if tipo == 'Individual':
+            nombre = f"{rnd.choice(NOMBRES).upper()} {rnd.choice(APELLIDOS).upper()}"
+            credenciales = next((c for clave, c in CREDENCIALES_NPPES.items() if clave in taxonomia), [''])
+            credencial = rnd.choice(credenciales)
+            telefono = rnd.choice(consultorios[ciudad])
+        else:
+            nombre = f"{ciudad} {rnd.choice(['BEHAVIORAL HEALTH', 'MENTAL HEALTH CENTER', 'COUNSELING SERVICES'])} {len(filas)}"
+            credencial = ''
+            telefono = f"{rnd.randint(200, 999)}{rnd.randint(1000000, 9999999)}"
+        codigo = f"{zlib.crc32(taxonomia.encode()) % 1000:03d}X00000X"
+        fila = {
+            'npi': npi, 'provider_type': tipo, 'name': nombre, 'credential': credencial,
+            'primary_taxonomy': taxonomia, 'primary_taxonomy_code': codigo,
+            'all_taxonomies': [{'code': codigo, 'desc': taxonomia, 'state': estado,
+                                'license': None, 'primary': True}],
+            'practice_location': {'address_1': f"{rnd.randint(1, 9999)} MAIN ST", 'address_2': None,
+                                  'city': ciudad, 'state': estado,
+                                  'postal_code': f"{rnd.randint(10000, 99999)}", 'country_code': 'US',
+                                  'telephone': telefono},
+            'status': 'A',
+        }
+        filas.append(fila)
+        if tipo == 'Organization' and rnd.random() < duplicados and len(filas) < n:
+            filas.append(dict(fila, npi=npi + 1))
+    pq.write_table(pa.Table.from_pylist(filas), path)
+    return path
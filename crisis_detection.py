@@ -0,0 +1,332 @@
+"""
+Detección de crisis en el texto del usuario
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Detector léxico compilado:
+- Todas las palabras clave (crisis y alto riesgo) en un solo PatternMatcher
+- Texto normalizado (acentos, ortografía, espaciado) una sola vez por request
+- Devuelve cada término encontrado con su severidad en una pasada
+- Listas de palabras clave recargables en caliente desde un JSON
+
+Clasificador semántico:
+- Matriz de embeddings prototipo por nivel, calculada una vez y versionada
+  junto al índice FAISS
+- Se evalúa con un solo producto punto contra el embedding del texto del
+  usuario, pedido en la misma llamada que el de la query de búsqueda
+- Los umbrales por nivel viajan en el pickle de prototipos: los de
+  PROTOTYPE_THRESHOLDS son el punto de partida y
+  benchmarks/eval_crisis_semantica.py los calibra con paráfrasis etiquetadas
+  para el modelo en uso y los escribe ahí
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from snapshots import guardar_pickle, leer_pickle
+from text_matching import PatternMatcher, normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+# Palabras clave de crisis y alto riesgo
+CRISIS_KEYWORDS = [
+    'suicid', 'suicidio', 'suicidarme', 'matarme', 'quitarme la vida',
+    'morir', 'muerte', 'acabar con todo', 'no quiero vivir',
+    'mejor muerto', 'quiero desaparecer', 'hacerme daño',
+    'cortarme', 'autolesion', 'pastillas para morir',
+    'plan para suicidarme', 'quiero que acabe', 'ya no puedo más'
+]
+
+HIGH_RISK_KEYWORDS = [
+    'pánico', 'panico', 'crisis', 'desesperado', 'desesperada',
+    'muy mal', 'horrible', 'insoportable', 'no aguanto',
+    'colapso', 'emergencia', 'urgente', 'ayuda inmediata'
+]
+
+# Frases prototipo para el clasificador semántico (lenguaje parafraseado
+# que no contiene las palabras clave). Cambiar la lista implica subir la versión.
+CRISIS_PROTOTYPES = {
+    'CRITICO': [
+        'ya no le encuentro sentido a seguir viviendo',
+        'quisiera dormirme y no despertar nunca',
+        'todos estarían mejor sin mí',
+        'estoy pensando en terminar con mi vida',
+        'he pensado en cómo hacerlo para dejar de existir',
+        'me quiero lastimar para dejar de sentir',
+        'ya me despedí de las personas que quiero',
+        'no veo ninguna salida y quiero que todo termine',
+    ],
+    'ALTO': [
+        'siento que me voy a volver loco',
+        'no puedo respirar y siento que me va a dar un infarto',
+        'estoy completamente desbordado y no sé qué hacer',
+        'siento que estoy perdiendo el control',
+        'llevo días sin dormir y ya no puedo con esto',
+        'tengo miedo de lo que pueda hacer',
+    ],
+}
+PROTOTYPES_VERSION = '1'
+# Umbrales de un clasificador recién construido; el cache guarda los calibrados
+PROTOTYPE_THRESHOLDS = {'CRITICO': 0.62, 'ALTO': 0.58}
+
+# Niveles de mayor a menor severidad
+NIVELES_CRISIS = ['CRITICO', 'ALTO', 'MODERADO', 'NORMAL']
+NIVELES_EMERGENCIA = {'CRITICO', 'ALTO'}
+
+
+@dataclass
+class CrisisMatch:
+    """Término de crisis encontrado en el texto"""
+    termino: str
+    nivel: str
+    posicion: int
+
+
+@dataclass
+class CrisisResult:
+    """Resultado de la detección de crisis"""
+    nivel: str
+    requiere_emergencia: bool
+    coincidencias: List[CrisisMatch] = field(default_factory=list)
+
+
+@dataclass
+class SemanticCrisisResult:
+    """Resultado del clasificador semántico"""
+    nivel: str
+    similitud: float
+    prototipo: Optional[str] = None
+
+
+def nivel_mas_grave(niveles) -> str:
+    """Nivel más severo de una colección de niveles"""
+    for nivel in NIVELES_CRISIS:
+        if nivel in niveles:
+            return nivel
+    return 'NORMAL'
+
+
+class CrisisDetector:
+    """
+    Detector de crisis por palabras clave con matching compilado
+
+    Args:
+        keywords: Diccionario {nivel: [palabras]} (default: listas del módulo)
+        keywords_path: JSON opcional con el mismo formato; si existe, se usa y
+            se recarga automáticamente cuando cambia su fecha de modificación
+        check_interval: Segundos mínimos entre revisiones del archivo
+    """
+
+    def __init__(self,
+                 keywords: Optional[Dict[str, List[str]]] = None,
+                 keywords_path: Optional[str] = None,
+                 check_interval: float = 5.0):
+        self.keywords_path = keywords_path
+        self.check_interval = check_interval
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+        self.load_keywords(keywords or {
+            'CRITICO': CRISIS_KEYWORDS,
+            'ALTO': HIGH_RISK_KEYWORDS,
+        })
+        if keywords_path and os.path.exists(keywords_path):
+            try:
+                self.reload()
+            except Exception as e:
+                # Con un archivo inválido se arranca con las listas por defecto
+                self._mtime = os.path.getmtime(keywords_path)
+                logger.error(f"Palabras clave de crisis inválidas en {keywords_path}, "
+                             f"se usan las de por defecto: {e}")
+
+    @staticmethod
+    def validar_keywords(keywords: Any) -> None:
+        """ValueError si no es {nivel: [palabras no vacías]} con niveles conocidos"""
+        if not isinstance(keywords, dict):
+            raise ValueError(f"Se esperaba un objeto {{nivel: [palabras]}}, no {type(keywords).__name__}")
+        desconocidos = set(keywords) - set(NIVELES_CRISIS)
+        if desconocidos:
+            raise ValueError(f"Niveles de crisis desconocidos: {sorted(map(str, desconocidos))}")
+        for nivel, palabras in keywords.items():
+            if not isinstance(palabras, list) or not all(isinstance(p, str) and p.strip() for p in palabras):
+                raise ValueError(f"Las palabras del nivel {nivel} deben ser una lista de textos no vacíos")
+
+    def load_keywords(self, keywords: Dict[str, List[str]]) -> None:
+        """Compila las palabras clave y reemplaza el matcher de forma atómica"""
+        self.validar_keywords(keywords)
+
+        # Niveles más graves primero: ante colisiones gana la mayor severidad
+        patterns = [(palabra, nivel)
+                    for nivel in NIVELES_CRISIS
+                    for palabra in keywords.get(nivel, [])]
+        # Se compila antes de reemplazar nada: si falla quedan las anteriores
+        matcher = PatternMatcher(patterns)
+        self.keywords = {nivel: list(keywords.get(nivel, [])) for nivel in NIVELES_CRISIS
+                         if keywords.get(nivel)}
+        self._matcher = matcher
+        logger.info(f"Detector de crisis compilado con {self._matcher.size} patrones")
+
+    def reload(self) -> bool:
+        """Recarga las palabras clave desde keywords_path. Retorna True si recargó"""
+        if not self.keywords_path:
+            return False
+        with self._lock:
+            mtime = os.path.getmtime(self.keywords_path)
+            with open(self.keywords_path, 'r', encoding='utf-8') as f:
+                keywords = json.load(f)
+            self.load_keywords(keywords)
+            self._mtime = mtime
+            self._last_check = time.monotonic()
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """Revisa (con throttling) si el archivo de palabras clave cambió"""
+        if not self.keywords_path:
+            return False
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.keywords_path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            return self.reload()
+        except Exception as e:
+            # Un archivo inválido no debe dejar al detector sin patrones ni
+            # romper detect(): se siguen usando las anteriores y no se vuelve
+            # a intentar hasta que el archivo cambie otra vez
+            self._mtime = mtime
+            logger.error(f"No se pudieron recargar palabras clave de crisis: {e}")
+            return False
+
+    def detect(self, texto: str) -> CrisisResult:
+        """
+        Detecta todos los términos de crisis en el texto
+
+        Returns:
+            CrisisResult con el nivel más grave y todas las coincidencias
+        """
+        self.reload_if_changed()
+        coincidencias = [CrisisMatch(termino=termino, nivel=nivel, posicion=pos)
+                         for termino, nivel, pos in self._matcher.find_all(normalizar_texto(texto),
+                                                                           normalizado=True)]
+        nivel = nivel_mas_grave({c.nivel for c in coincidencias})
+        return CrisisResult(
+            nivel=nivel,
+            requiere_emergencia=nivel in NIVELES_EMERGENCIA,
+            coincidencias=coincidencias
+        )
+
+
+class SemanticCrisisClassifier:
+    """
+    Clasificador de crisis por similitud con embeddings prototipo
+
+    La matriz de prototipos (n_prototipos x dimension) está normalizada L2 y
+    ordenada por nivel, así que clasificar cuesta un producto matriz-vector y
+    un máximo por segmento.
+    """
+
+    def __init__(self,
+                 embeddings: np.ndarray,
+                 prototipos: Dict[str, List[str]],
+                 thresholds: Dict[str, float],
+                 model: str,
+                 version: str = PROTOTYPES_VERSION):
+        self.embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        self.prototipos = prototipos
+        self.thresholds = thresholds
+        self.model = model
+        self.version = version
+
+        self._niveles = [nivel for nivel in NIVELES_CRISIS if prototipos.get(nivel)]
+        self._frases = [frase for nivel in self._niveles for frase in prototipos[nivel]]
+        tamanos = [len(prototipos[nivel]) for nivel in self._niveles]
+        self._inicios = np.cumsum([0] + tamanos[:-1])
+
+    @classmethod
+    def build(cls,
+              client: Any,
+              model: str,
+              prototipos: Optional[Dict[str, List[str]]] = None,
+              thresholds: Optional[Dict[str, float]] = None) -> 'SemanticCrisisClassifier':
+        """Calcula los embeddings prototipo con una sola llamada a la API"""
+        prototipos = prototipos or CRISIS_PROTOTYPES
+        frases = [frase for nivel in NIVELES_CRISIS for frase in prototipos.get(nivel, [])]
+        resp = client.embeddings.create(model=model, input=frases)
+        embeddings = np.array([d.embedding for d in resp.data], dtype='float32')
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return cls(embeddings, prototipos, thresholds or dict(PROTOTYPE_THRESHOLDS), model)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['SemanticCrisisClassifier']:
+        """Prototipos guardados; None si no existen o el archivo no se puede leer"""
+        data = leer_pickle(path)
+        try:
+            return cls(data['embeddings'], data['prototipos'], data['thresholds'],
+                       data['model'], data['version'])
+        except (KeyError, TypeError) as e:
+            if data is not None:
+                logger.error(f"Prototipos de crisis inválidos en {path}, se regeneran: {e}")
+            return None
+
+    def save(self, path: str) -> None:
+        # Escritura atómica: un corte deja los prototipos anteriores
+        guardar_pickle(path, {
+            'version': self.version,
+            'model': self.model,
+            'thresholds': self.thresholds,
+            'prototipos': self.prototipos,
+            'embeddings': self.embeddings,
+        })
+
+    def is_current(self, model: str) -> bool:
+        """
+        True si el cache corresponde a la versión, modelo y frases actuales.
+        Los umbrales no se comparan: los del cache (calibrados) mandan.
+        """
+        return (self.version == PROTOTYPES_VERSION
+                and self.model == model
+                and self.prototipos == CRISIS_PROTOTYPES)
+
+    def puntajes(self, embeddings: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Similitud máxima con los prototipos de cada nivel
+
+        Args:
+            embeddings: (m, d) normalizados L2
+
+        Returns:
+            {nivel: (m,)} para calibrar umbrales
+        """
+        similitudes = np.asarray(embeddings, dtype='float32') @ self.embeddings.T
+        maximos = np.maximum.reduceat(similitudes, self._inicios, axis=1)
+        return {nivel: maximos[:, i] for i, nivel in enumerate(self._niveles)}
+
+    def classify(self, query_embedding: np.ndarray) -> SemanticCrisisResult:
+        """
+        Clasifica un embedding de query ya normalizado
+
+        Args:
+            query_embedding: Vector (d,) o (1, d) normalizado L2
+        """
+        similitudes = self.embeddings @ query_embedding.reshape(-1)
+        maximos = np.maximum.reduceat(similitudes, self._inicios)
+        for i, nivel in enumerate(self._niveles):
+            if maximos[i] >= self.thresholds.get(nivel, 1.0):
+                idx = self._inicios[i] + int(np.argmax(
+                    similitudes[self._inicios[i]:self._inicios[i] + len(self.prototipos[nivel])]))
+                return SemanticCrisisResult(nivel=nivel, similitud=float(maximos[i]),
+                                            prototipo=self._frases[idx])
+        return SemanticCrisisResult(nivel='NORMAL', similitud=float(similitudes.max()))
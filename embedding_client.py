@@ -0,0 +1,400 @@
+"""
+Cliente de embeddings compartido por el proceso
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+MentalHealthRetrieval, MentalHealthKnowledgeRAG y RegionShardManager (y cada
+reconstrucción desde /admin/rebuild_faiss) usan por defecto el mismo
+cliente, cliente_compartido(), en vez de crear un OpenAI cada uno. Lo
+resuelven en cada uso (ClienteDelProceso): construidos en el master de
+gunicorn, cada worker usa el suyo y no la sesión heredada del master.
+
+- Un pool de conexiones HTTP keep-alive (requests/urllib3) de
+  EMBEDDING_POOL_SIZE conexiones: el handshake TLS se paga una vez por
+  conexión y no en cada request del usuario
+- Timeouts explícitos de conexión y lectura (EMBEDDING_CONNECT_TIMEOUT,
+  EMBEDDING_READ_TIMEOUT, en segundos) en vez de los 10 minutos del SDK
+- Reintentos con backoff exponencial (EMBEDDING_MAX_RETRIES por llamada)
+  limitados por un presupuesto: cada llamada suma EMBEDDING_RETRY_RATIO al
+  saldo y cada reintento gasta 1, así una caída de la API no multiplica el
+  tráfico por los reintentos de todos los hilos
+
+Habla directamente con POST {OPENAI_BASE_URL}/embeddings (vectores en
+base64, como el SDK) y expone la misma interfaz client.embeddings.create
+que el resto del código, incluidos los clientes falsos de benchmarks/.
+El modo ASGI usa crear_async(): un AsyncOpenAI con los mismos timeouts y
+sin reintentos propios, cuyos reintentos salen del mismo presupuesto.
+
+Cada llamada deja en /metrics su latencia y resultado
+(calma_embedding_llamada_segundos), los reintentos hechos y negados, las
+conexiones nuevas y las conexiones en uso del pool; stats() da lo mismo
+para /health.
+"""
+
+import asyncio
+import base64
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import (actualizar_pool_embeddings, observar_llamada_embedding,
+                     registrar_conexiones_embedding, registrar_reintento_embedding)
+
+BASE_URL_DEFAULT = 'https://api.openai.com/v1'
+
+# Status que vale la pena reintentar (como el SDK de OpenAI)
+STATUS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504}
+
+# Errores sin respuesta que vale la pena reintentar (SSLError es un ConnectionError)
+ERRORES_REINTENTABLES = (requests.Timeout, requests.ConnectionError,
+                         requests.exceptions.ChunkedEncodingError)
+
+
+class EmbeddingError(Exception):
+    """La API de embeddings falló después de los reintentos permitidos"""
+
+    def __init__(self, mensaje: str, status: Optional[int] = None):
+        super().__init__(mensaje)
+        self.status = status
+
+
+@dataclass
+class Embedding:
+    index: int
+    embedding: np.ndarray
+
+
+@dataclass
+class Uso:
+    prompt_tokens: int = 0
+    total_tokens: int = 0
+
+
+@dataclass
+class RespuestaEmbeddings:
+    data: List[Embedding]
+    model: str
+    usage: Uso
+
+
+class _Embeddings:
+    """client.embeddings"""
+
+    def __init__(self, cliente: 'EmbeddingClient'):
+        self._cliente = cliente
+
+    def create(self, model: str, input: Union[str, List[str]], **kwargs) -> RespuestaEmbeddings:
+        return self._cliente.crear(model, input, **kwargs)
+
+
+class EmbeddingClient:
+    """
+    Cliente HTTP de la Embeddings API con pool, timeouts y presupuesto de reintentos
+
+    Args:
+        api_key: API key de OpenAI
+        base_url: URL base de la API (default: OPENAI_BASE_URL o la de OpenAI)
+        pool_size: Conexiones keep-alive que se conservan abiertas
+        connect_timeout: Segundos para abrir la conexión (incluye TLS)
+        read_timeout: Segundos de espera de la respuesta
+        max_reintentos: Reintentos por llamada como máximo
+        proporcion_reintentos: Saldo de reintentos que suma cada llamada
+        saldo_max: Reintentos acumulables (también el saldo inicial)
+        backoff_base: Espera antes del primer reintento, se duplica en cada uno
+        backoff_max: Espera máxima entre intentos (también acota Retry-After)
+    """
+
+    def __init__(self,
+                 api_key: str,
+                 base_url: Optional[str] = None,
+                 pool_size: int = 32,
+                 connect_timeout: float = 3.05,
+                 read_timeout: float = 20.0,
+                 max_reintentos: int = 2,
+                 proporcion_reintentos: float = 0.2,
+                 saldo_max: float = 10.0,
+                 backoff_base: float = 0.25,
+                 backoff_max: float = 4.0):
+        self.api_key = api_key
+        self.base_url = (base_url or BASE_URL_DEFAULT).rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_reintentos = max_reintentos
+        self.proporcion_reintentos = proporcion_reintentos
+        self.saldo_max = saldo_max
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.embeddings = _Embeddings(self)
+
+        self._sesion = requests.Session()
+        # Los reintentos los decide el presupuesto, no urllib3
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._sesion.mount('http://', adaptador)
+        self._sesion.mount('https://', adaptador)
+        self._sesion.headers.update({'Authorization': f'Bearer {api_key}',
+                                     'Content-Type': 'application/json'})
+        if os.getenv('OPENAI_ORG_ID'):
+            self._sesion.headers['OpenAI-Organization'] = os.getenv('OPENAI_ORG_ID')
+        if os.getenv('OPENAI_PROJECT_ID'):
+            self._sesion.headers['OpenAI-Project'] = os.getenv('OPENAI_PROJECT_ID')
+        self._pools = adaptador.poolmanager.pools
+        self._async = None
+
+        self._lock = threading.Lock()
+        self._saldo = saldo_max
+        self._en_uso = 0
+        self._conexiones = 0
+        self.contadores = {'llamadas': 0, 'intentos': 0, 'errores': 0,
+                           'reintentos': 0, 'reintentos_negados': 0}
+        actualizar_pool_embeddings(0, pool_size)
+
+    @classmethod
+    def from_env(cls) -> 'EmbeddingClient':
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise EnvironmentError('OPENAI_API_KEY no está definido en las variables de entorno')
+        return cls(api_key,
+                   base_url=os.getenv('OPENAI_BASE_URL'),
+                   pool_size=int(os.getenv('EMBEDDING_POOL_SIZE', '32')),
+                   connect_timeout=float(os.getenv('EMBEDDING_CONNECT_TIMEOUT', '3.05')),
+                   read_timeout=float(os.getenv('EMBEDDING_READ_TIMEOUT', '20')),
+                   max_reintentos=int(os.getenv('EMBEDDING_MAX_RETRIES', '2')),
+                   proporcion_reintentos=float(os.getenv('EMBEDDING_RETRY_RATIO', '0.2')))
+
+    def crear(self, model: str, input: Union[str, List[str]], **kwargs) -> RespuestaEmbeddings:
+        """POST /embeddings con reintentos; lanza EmbeddingError si no se logra"""
+        textos = [input] if isinstance(input, str) else list(input)
+        cuerpo = {'model': model, 'input': textos, 'encoding_format': 'base64', **kwargs}
+        self._abonar_llamada()
+
+        intento = 0
+        while True:
+            datos, error, status, retry_after = self._intentar(cuerpo)
+            if datos is not None:
+                return self._respuesta(model, datos)
+            reintentable = status in STATUS_REINTENTABLES if status is not None \
+                else isinstance(error, ERRORES_REINTENTABLES)
+            if not self._reintentar(intento, reintentable):
+                break
+            intento += 1
+            time.sleep(self._espera(intento, retry_after))
+
+        self._contar('errores')
+        raise EmbeddingError(f"Embeddings fallaron tras {intento + 1} intento(s): {error}", status)
+
+    async def crear_async(self, model: str, input: Union[str, List[str]], **kwargs) -> Any:
+        """
+        Como crear() pero con AsyncOpenAI, sin ocupar un hilo (modo ASGI):
+        mismos timeouts, reintentos y presupuesto. Devuelve la respuesta del SDK.
+        """
+        textos = [input] if isinstance(input, str) else list(input)
+        self._abonar_llamada()
+
+        intento = 0
+        while True:
+            self._contar('intentos')
+            inicio = time.perf_counter()
+            status = retry_after = None
+            try:
+                resp = await self._cliente_async().embeddings.create(model=model, input=textos, **kwargs)
+                observar_llamada_embedding('ok', time.perf_counter() - inicio)
+                return resp
+            except openai.APIStatusError as e:
+                error, status, resultado = e, e.status_code, str(e.status_code)
+                retry_after = _segundos_retry_after(e.response.headers.get('Retry-After'))
+                reintentable = status in STATUS_REINTENTABLES
+            except openai.APIConnectionError as e:
+                # Incluye APITimeoutError
+                error, reintentable = e, True
+                resultado = 'timeout' if isinstance(e, openai.APITimeoutError) else 'conexion'
+            observar_llamada_embedding(resultado, time.perf_counter() - inicio)
+            if not self._reintentar(intento, reintentable):
+                break
+            intento += 1
+            await asyncio.sleep(self._espera(intento, retry_after))
+
+        self._contar('errores')
+        raise EmbeddingError(f"Embeddings fallaron tras {intento + 1} intento(s): {error}", status)
+
+    def _cliente_async(self) -> Any:
+        # Los reintentos los decide el presupuesto, no el SDK
+        if self._async is None:
+            connect_timeout, read_timeout = self.timeout
+            self._async = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                             timeout=openai.Timeout(read_timeout, connect=connect_timeout),
+                                             max_retries=0)
+        return self._async
+
+    def _abonar_llamada(self):
+        with self._lock:
+            self.contadores['llamadas'] += 1
+            self._saldo = min(self.saldo_max, self._saldo + self.proporcion_reintentos)
+
+    def _contar(self, clave: str):
+        with self._lock:
+            self.contadores[clave] += 1
+
+    def _reintentar(self, intento: int, reintentable: bool) -> bool:
+        """True si el intento fallido se reintenta (y gasta saldo)"""
+        if intento >= self.max_reintentos or not reintentable:
+            return False
+        concedido = self._gastar_reintento()
+        registrar_reintento_embedding(concedido)
+        return concedido
+
+    def _espera(self, intento: int, retry_after: Optional[float]) -> float:
+        espera = self.backoff_base * 2 ** (intento - 1) * random.uniform(0.5, 1.0)
+        return min(self.backoff_max, retry_after if retry_after is not None else espera)
+
+    def _intentar(self, cuerpo: Dict[str, Any]):
+        """(datos, error, status, retry_after) de un intento"""
+        with self._lock:
+            self._en_uso += 1
+            self.contadores['intentos'] += 1
+            actualizar_pool_embeddings(self._en_uso, self.pool_size)
+        inicio = time.perf_counter()
+        datos = error = status = retry_after = None
+        try:
+            resp = self._sesion.post(f'{self.base_url}/embeddings', json=cuerpo, timeout=self.timeout)
+            status = resp.status_code
+            if status == 200:
+                datos = resp.json()
+            else:
+                error = f"HTTP {status}: {resp.text[:200]}"
+                retry_after = _segundos_retry_after(resp.headers.get('Retry-After'))
+        except requests.RequestException as e:
+            # Sin respuesta utilizable (timeout, conexión, cuerpo cortado o inválido)
+            error, status = e, None
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._lock:
+                self._en_uso -= 1
+                actualizar_pool_embeddings(self._en_uso, self.pool_size)
+                nuevas = self._conexiones_creadas() - self._conexiones
+                self._conexiones += nuevas
+            if nuevas:
+                registrar_conexiones_embedding(nuevas)
+        observar_llamada_embedding(_resultado(datos, error, status), duracion)
+        return datos, error, status, retry_after
+
+    def _conexiones_creadas(self) -> int:
+        # Conexiones que urllib3 abrió en el pool (cada una con su handshake)
+        return sum(self._pools[clave].num_connections for clave in self._pools.keys())
+
+    def _gastar_reintento(self) -> bool:
+        with self._lock:
+            if self._saldo < 1:
+                self.contadores['reintentos_negados'] += 1
+                return False
+            self._saldo -= 1
+            self.contadores['reintentos'] += 1
+            return True
+
+    @staticmethod
+    def _respuesta(model: str, datos: Dict[str, Any]) -> RespuestaEmbeddings:
+        data = []
+        for item in sorted(datos['data'], key=lambda d: d['index']):
+            vector = item['embedding']
+            if isinstance(vector, str):
+                vector = np.frombuffer(base64.b64decode(vector), dtype='<f4')
+            else:
+                vector = np.asarray(vector, dtype='float32')
+            data.append(Embedding(index=item['index'], embedding=vector))
+        usage = datos.get('usage') or {}
+        return RespuestaEmbeddings(data=data, model=datos.get('model', model),
+                                   usage=Uso(prompt_tokens=usage.get('prompt_tokens', 0),
+                                             total_tokens=usage.get('total_tokens', 0)))
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores del cliente y uso del pool (para /health)"""
+        with self._lock:
+            return {**self.contadores,
+                    'saldo_reintentos': round(self._saldo, 2),
+                    'conexiones_abiertas': self._conexiones,
+                    'pool_en_uso': self._en_uso,
+                    'pool_size': self.pool_size}
+
+    def close(self):
+        self._sesion.close()
+
+    async def cerrar_async(self):
+        if self._async is not None:
+            await self._async.close()
+            self._async = None
+
+
+def _segundos_retry_after(valor: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(valor)) if valor is not None else None
+    except ValueError:
+        return None
+
+
+def _resultado(datos: Any, error: Any, status: Optional[int]) -> str:
+    if datos is not None:
+        return 'ok'
+    if status is not None:
+        return str(status)
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    return 'conexion' if isinstance(error, ERRORES_REINTENTABLES) else 'invalida'
+
+
+_compartidos: Dict[int, EmbeddingClient] = {}
+_lock_compartidos = threading.Lock()
+
+
+def cliente_compartido() -> EmbeddingClient:
+    """
+    Cliente del proceso actual. Se crea en el primer uso de cada proceso:
+    con gunicorn --preload los workers no deben heredar los sockets del master
+    """
+    pid = os.getpid()
+    cliente = _compartidos.get(pid)
+    if cliente is None:
+        with _lock_compartidos:
+            cliente = _compartidos.get(pid)
+            if cliente is None:
+                cliente = _compartidos[pid] = EmbeddingClient.from_env()
+    return cliente
+
+
+def cerrar_compartido():
+    """Cierra y olvida el cliente del proceso actual (el master antes del fork)"""
+    with _lock_compartidos:
+        cliente = _compartidos.pop(os.getpid(), None)
+    if cliente is not None:
+        cliente.close()
+
+
+class ClienteDelProceso:
+    """
+    Atributo client de los sistemas: el cliente inyectado o, si no hay,
+    cliente_compartido() del proceso que lo usa. Se resuelve en cada acceso
+    porque los sistemas se construyen en el master y se usan en los workers.
+    """
+
+    def __set_name__(self, owner, nombre: str):
+        self._atributo = f'_{nombre}'
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        cliente = obj.__dict__.get(self._atributo)
+        return cliente if cliente is not None else cliente_compartido()
+
+    def __set__(self, obj, cliente: Optional[Any]):
+        obj.__dict__[self._atributo] = cliente
+
+
+def stats_compartido() -> Optional[Dict[str, Any]]:
+    """stats() del cliente del proceso, o None si todavía no se creó"""
+    cliente = _compartidos.get(os.getpid())
+    return cliente.stats() if cliente is not None else None
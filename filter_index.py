@@ -0,0 +1,244 @@
+"""
+Índice de filtros columnar para el catálogo de recursos
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Representa los campos filtrables del catálogo como columnas numpy
+(códigos categóricos, matrices booleanas multi-valor y arreglos numéricos)
+para poder:
+- Evaluar los filtros suaves de QueryFilters sobre todo el catálogo en una
+  sola pasada vectorizada (máscara booleana)
+- Calcular conteos por faceta (delegación, modalidad, tipo profesional y
+  banda de precio) con np.bincount / sumas por columna
+
+Los filtros por subcadena (especializaciones, delegación) se resuelven
+sobre el vocabulario, que es chico, y combinan bitmaps de filas por valor
+(bits empaquetados) en vez de recorrer el texto de cada recurso.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+# Bandas de precio alineadas con los presupuestos de /buscar_especialista
+# (barato <= 600, medio <= 1200, caro > 1200)
+PRICE_BANDS = ['gratuito', 'bajo', 'medio', 'alto']
+PRICE_BAND_LIMITS = {'bajo': 600, 'medio': 1200}
+
+# Más valores que esto en un filtro: una pasada con tabla de códigos es más barata
+MAX_BITMAPS_POR_FILTRO = 32
+
+
+def costo_actual(costo_info: Any) -> Optional[float]:
+    """
+    Costo de referencia de un recurso, con la misma regla que los filtros:
+    cantidad_min si es > 0, si no el promedio. None si no hay dict de costo.
+    """
+    if not isinstance(costo_info, dict):
+        return None
+    costo_promedio = costo_info.get('promedio', 0)
+    costo_min = costo_info.get('cantidad_min', costo_promedio)
+    return costo_min if costo_min > 0 else costo_promedio
+
+
+def _split_modalidad(modalidad: str) -> List[str]:
+    """'Presencial / Online' -> ['Presencial', 'Online']"""
+    return [m.strip() for m in modalidad.split('/') if m.strip()]
+
+
+class _CategoricalColumn:
+    """Columna de un solo valor por recurso codificada como enteros"""
+
+    def __init__(self, values: Iterable[str]):
+        self.vocab: List[str] = []
+        lookup: Dict[str, int] = {}
+        codes = []
+        for value in values:
+            if value not in lookup:
+                lookup[value] = len(self.vocab)
+                self.vocab.append(value)
+            codes.append(lookup[value])
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self._vocab_lower = [v.lower() for v in self.vocab]
+        # Bitmap por código, creado la primera vez que un filtro lo usa: el
+        # vocabulario puede ser grande (ciudades de NPPES) y casi todo sin consultar
+        self._bitmaps: Dict[int, np.ndarray] = {}
+
+    def _bitmap(self, code: int) -> np.ndarray:
+        bitmap = self._bitmaps.get(code)
+        if bitmap is None:
+            bitmap = self._bitmaps[code] = np.packbits(self.codes == code)
+        return bitmap
+
+    def contains_any(self, needles: List[str]) -> np.ndarray:
+        """Máscara de recursos cuyo valor contiene alguna subcadena (case-insensitive)"""
+        needles = [n.lower() for n in needles]
+        matching = [code for code, value in enumerate(self._vocab_lower)
+                    if any(n in value for n in needles)]
+        if len(matching) > MAX_BITMAPS_POR_FILTRO:
+            tabla = np.zeros(len(self.vocab), dtype=bool)
+            tabla[matching] = True
+            return tabla[self.codes]
+        return _unir_bitmaps([self._bitmap(code) for code in matching], len(self.codes))
+
+    def counts(self, mask: np.ndarray) -> Dict[str, int]:
+        counts = np.bincount(self.codes[mask], minlength=len(self.vocab))
+        return _counts_to_dict(self.vocab, counts)
+
+
+class _MultiValueColumn:
+    """Columna multi-valor (listas) como matriz booleana recursos x vocabulario"""
+
+    def __init__(self, values: Iterable[List[str]]):
+        rows = list(values)
+        self.vocab: List[str] = sorted({v for row in rows for v in row})
+        lookup = {v: i for i, v in enumerate(self.vocab)}
+        self.matrix = np.zeros((len(rows), len(self.vocab)), dtype=bool)
+        for i, row in enumerate(rows):
+            for v in row:
+                self.matrix[i, lookup[v]] = True
+
+    def has_any(self, wanted: List[str]) -> np.ndarray:
+        """Máscara de recursos que tienen alguno de los valores exactos"""
+        cols = [i for i, v in enumerate(self.vocab) if v in wanted]
+        if not cols:
+            return np.zeros(self.matrix.shape[0], dtype=bool)
+        return self.matrix[:, cols].any(axis=1)
+
+    def counts(self, mask: np.ndarray) -> Dict[str, int]:
+        counts = self.matrix[mask].sum(axis=0)
+        return _counts_to_dict(self.vocab, counts)
+
+
+class _TokenBitmaps:
+    """
+    Bitmap de filas por valor de una columna multi-valor, para filtros por
+    subcadena dentro de un valor (especializaciones). Memoria:
+    vocabulario x n/8 bytes.
+    """
+
+    def __init__(self, values: Iterable[List[str]]):
+        filas: Dict[str, List[int]] = {}
+        size = 0
+        for i, row in enumerate(values):
+            size = i + 1
+            for v in row:
+                filas.setdefault(v.lower(), []).append(i)
+        self.size = size
+        self.vocab: List[str] = sorted(filas)
+        self.bitmaps = np.zeros((len(self.vocab), (size + 7) // 8), dtype=np.uint8)
+        for j, v in enumerate(self.vocab):
+            fila = np.zeros(size, dtype=bool)
+            fila[filas[v]] = True
+            self.bitmaps[j] = np.packbits(fila)
+
+    def contains_any(self, needles: List[str]) -> np.ndarray:
+        """Máscara de recursos con algún valor que contiene alguna subcadena (case-insensitive)"""
+        needles = [n.lower() for n in needles]
+        cols = [j for j, v in enumerate(self.vocab) if any(n in v for n in needles)]
+        return _unir_bitmaps([self.bitmaps[j] for j in cols], self.size)
+
+
+def _unir_bitmaps(bitmaps: List[np.ndarray], size: int) -> np.ndarray:
+    """OR de bitmaps empaquetados como máscara booleana de `size` filas"""
+    if not bitmaps:
+        return np.zeros(size, dtype=bool)
+    union = bitmaps[0] if len(bitmaps) == 1 else np.bitwise_or.reduce(bitmaps, axis=0)
+    return np.unpackbits(union, count=size).view(bool)
+
+
+def _counts_to_dict(vocab: List[str], counts: np.ndarray) -> Dict[str, int]:
+    """Conteos > 0 ordenados de mayor a menor"""
+    order = np.argsort(-counts, kind='stable')
+    return {vocab[i]: int(counts[i]) for i in order if counts[i] > 0}
+
+
+class FilterIndex:
+    """
+    Vista columnar de los recursos para filtrado y facetas vectorizadas.
+    Se construye una vez por índice (O(n)) y cada consulta cuesta
+    operaciones numpy sobre arreglos de longitud n.
+    """
+
+    def __init__(self, recursos: List[Dict[str, Any]]):
+        self.size = len(recursos)
+
+        self.delegacion = _CategoricalColumn(
+            (r.get('ubicacion') or {}).get('delegacion', '') or '' for r in recursos)
+        self.tipo_profesional = _CategoricalColumn(
+            r.get('tipo_profesional', '') or '' for r in recursos)
+        # Modalidad: el valor completo para filtros por subcadena y
+        # los componentes ('Presencial', 'Online', ...) para facetas
+        self.modalidad_raw = _CategoricalColumn(r.get('modalidad', '') or '' for r in recursos)
+        self.modalidad = _MultiValueColumn(
+            _split_modalidad(r.get('modalidad', '') or '') for r in recursos)
+        self.grupo_etario = _MultiValueColumn(r.get('grupo_etario', []) or [] for r in recursos)
+
+        costos = [costo_actual(r.get('costo', {})) for r in recursos]
+        self.costo_es_dict = np.array([c is not None for c in costos], dtype=bool)
+        self.costo = np.array([c if c is not None else 0.0 for c in costos], dtype=np.float64)
+        self.rating = np.array([r.get('rating', 0) or 0 for r in recursos], dtype=np.float64)
+        self.es_gratuito = np.array(
+            [bool(isinstance(r.get('costo'), dict) and r['costo'].get('es_gratuito', False))
+             for r in recursos], dtype=bool)
+        self.es_emergencia = np.array([bool(r.get('es_emergencia', False)) for r in recursos],
+                                      dtype=bool)
+        self.emergencia_texto = np.array(
+            ['emergencia' in (r.get('tipo_profesional', '') or '').lower()
+             or 'emergencia' in (r.get('tags_match', '') or '').lower()
+             or 'crisis' in (r.get('tags_match', '') or '').lower()
+             for r in recursos], dtype=bool)
+        self.especializaciones = _TokenBitmaps(r.get('especializaciones', []) or [] for r in recursos)
+
+        # Banda de precio precalculada como código categórico
+        bandas = np.full(self.size, PRICE_BANDS.index('alto'), dtype=np.int32)
+        bandas[self.costo <= PRICE_BAND_LIMITS['medio']] = PRICE_BANDS.index('medio')
+        bandas[self.costo <= PRICE_BAND_LIMITS['bajo']] = PRICE_BANDS.index('bajo')
+        bandas[self.es_gratuito | (self.costo_es_dict & (self.costo == 0))] = PRICE_BANDS.index('gratuito')
+        self.banda_precio = bandas
+
+    def mask(self, filters: Optional[Any] = None) -> np.ndarray:
+        """
+        Máscara booleana de recursos que pasan los filtros suaves.
+        Replica la semántica de MentalHealthRetrieval._apply_filters.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        if filters is None:
+            return mask
+
+        if filters.max_cost is not None:
+            mask &= ~self.costo_es_dict | (self.costo <= filters.max_cost)
+        if filters.min_rating is not None:
+            mask &= self.rating >= filters.min_rating
+        if filters.modalidad:
+            mask &= self.modalidad_raw.contains_any(filters.modalidad)
+        if filters.tipo_profesional:
+            mask &= self.tipo_profesional.contains_any(filters.tipo_profesional)
+        if filters.delegacion:
+            mask &= self.delegacion.contains_any([filters.delegacion])
+        if filters.especializaciones:
+            mask &= self.especializaciones.contains_any(filters.especializaciones)
+        if filters.grupo_etario:
+            mask &= self.grupo_etario.has_any(filters.grupo_etario)
+
+        # es_emergencia y es_gratuito aceptan por bandera antes de evaluar el resto
+        aceptado = np.zeros(self.size, dtype=bool)
+        pendiente = np.ones(self.size, dtype=bool)
+        if filters.es_emergencia:
+            aceptado |= self.es_emergencia
+            pendiente &= self.emergencia_texto
+        if filters.es_gratuito:
+            gratuito = self.es_gratuito & pendiente
+            aceptado |= gratuito
+            pendiente &= ~self.costo_es_dict | (self.costo <= 500)
+        return mask & (aceptado | pendiente)
+
+    def facet_counts(self, mask: np.ndarray) -> Dict[str, Dict[str, int]]:
+        """Conteos por faceta sobre los recursos seleccionados por la máscara"""
+        bandas = np.bincount(self.banda_precio[mask], minlength=len(PRICE_BANDS))
+        return {
+            'delegacion': self.delegacion.counts(mask),
+            'modalidad': self.modalidad.counts(mask),
+            'tipo_profesional': self.tipo_profesional.counts(mask),
+            'banda_precio': {banda: int(bandas[i]) for i, banda in enumerate(PRICE_BANDS)},
+        }
@@ -0,0 +1,84 @@
+"""
+Configuración de Gunicorn para producción (render.yaml)
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+    gunicorn -c gunicorn.conf.py api_rest:app
+
+Los índices se cargan una sola vez en el master, antes del fork
+(preload_app + on_starting): los workers nacen listos, comparten las
+páginas de los índices por copy-on-write y un worker reciclado no vuelve a
+cargar nada. /ready responde 200 desde el primer request de cada worker.
+
+FAISS usa OpenMP, cuyo pool de hilos no sobrevive a un fork: el master
+carga con un solo hilo y cada worker recupera el número original en
+post_fork. El resto del estado por proceso (cliente de embeddings, captura
+de tráfico, métricas) se recrea solo al detectar el cambio de pid; el
+master cierra su cliente de embeddings al terminar de cargar para no
+heredar a los workers conexiones keep-alive abiertas.
+
+Con varios workers, /metrics solo vería los contadores del worker que
+atiende el scrape. Por eso PROMETHEUS_MULTIPROC_DIR (default:
+<tmp>/calma_prometheus) se fija y se vacía aquí, antes de que preload_app
+importe metrics.py: los archivos de una corrida anterior (otros pids) se
+sumarían a los de esta. child_exit quita los gauges de cada worker que
+termina.
+
+Variables: PORT, WEB_CONCURRENCY (workers), GUNICORN_THREADS,
+GUNICORN_TIMEOUT, PROMETHEUS_MULTIPROC_DIR.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+_inicio = time.perf_counter()
+
+_metricas_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                      os.path.join(tempfile.gettempdir(), 'calma_prometheus'))
+shutil.rmtree(_metricas_dir, ignore_errors=True)
+os.makedirs(_metricas_dir)
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+preload_app = True
+
+# Hilos de OpenMP del master antes de limitarlos para el fork
+_hilos_faiss = None
+
+
+def on_starting(server):
+    # Con preload_app la app ya se importó: el tiempo hasta aquí son imports
+    global _hilos_faiss
+    import faiss
+    import api_rest
+    from embedding_client import cerrar_compartido
+    from metrics import registrar_fase_arranque
+
+    registrar_fase_arranque('imports', time.perf_counter() - _inicio)
+    _hilos_faiss = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(1)
+    api_rest.init_systems()
+    cerrar_compartido()
+
+
+def when_ready(server):
+    server.log.info(f"Master listo en {time.perf_counter() - _inicio:.2f}s, "
+                    f"{workers} workers x {threads} hilos")
+
+
+def post_fork(server, worker):
+    import faiss
+
+    if _hilos_faiss:
+        faiss.omp_set_num_threads(_hilos_faiss)
+
+
+def child_exit(server, worker):
+    # Quita los gauges del worker que terminó
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
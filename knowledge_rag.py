@@ -5,20 +5,150 @@ Responde preguntas como "¿Qué hago?" o "¿Por qué me siento así?"
 Técnica: RAG Clásico con similitud coseno
 - Top 1 suele ser suficiente para demos
 - Sin reranking complejo
+- Router por frases clave: los temas frecuentes (pánico, ansiedad, insomnio)
+  se responden sin embedding ni FAISS cuando la confianza es suficiente
+- Índice de pasajes (pasos, técnicas, listas de síntomas) con puntero al
+  artículo padre, para responder solo con los pasos relevantes
+- Proyecciones precalculadas por artículo (intro de voz, artículo para móvil
+  y su fragmento JSON, texto formateado) guardadas junto a los metadatos
 """
 
 import json
 import os
+import re
 import numpy as np
-from typing import Dict, Any, List, Optional
-from openai import OpenAI
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+from embedding_client import ClienteDelProceso
 import faiss
-import pickle
 from dotenv import load_dotenv
+from text_matching import PatternMatcher, normalizar_texto
+from metrics import etapa, fase_arranque, registrar_cache, registrar_tokens
+from snapshots import (Snapshot, SnapshotInvalido, cargar_snapshot, fuente_vigente, guardar_pickle,
+                       guardar_snapshot, huella_texto, leer_pickle, resolver_snapshot,
+                       vectores_incrementales)
+from async_embeddings import precalculado
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
+# Frases adicionales por artículo para el router (además de tema y síntomas)
+ROUTER_ALIASES = {
+    'kb_001': ['ataque de pánico', 'crisis de pánico', 'ataque de ansiedad', 'pánico'],
+    'kb_002': ['insomnio', 'no puedo dormir', 'dormir', 'sueño'],
+    'kb_003': ['ansiedad', 'ansiedad generalizada', 'grounding', 'nervios'],
+    'kb_004': ['suicidio', 'suicida', 'suicidas', 'suicidarme', 'quitarme la vida', 'no quiero vivir', 'matarme', 'hacerme daño'],
+    'kb_005': ['bipolar', 'manía', 'episodio maníaco'],
+    'kb_006': ['tdah', 'déficit de atención', 'hiperactividad', 'concentrarme'],
+    'kb_007': ['fobia social', 'ansiedad social', 'miedo a la gente'],
+    'kb_008': ['toc', 'obsesivo', 'compulsivo', 'pensamientos intrusivos'],
+    'kb_009': ['psicosis', 'alucinaciones', 'escucho voces', 'esquizofrenia'],
+}
+
+# Campos con pasos accionables, en orden de prioridad
+PASOS_KEYS = ['PASOS_INMEDIATOS_CRÍTICOS', 'pasos_inmediatos', 'pasos_inmediatos_manias']
+# Campos de listas que se indexan como un pasaje cada una
+LISTAS_PASAJE = {
+    'sintomas_clave': 'sintomas',
+    'sintomas_manias': 'sintomas',
+    'sintomas_depresion': 'sintomas',
+    'sintomas_tempranos': 'sintomas',
+    'sintomas_psicosis_clara': 'sintomas',
+    'senales_de_alerta_graves': 'senales_alerta',
+    'QUE_NO_HACER': 'que_no_hacer',
+}
+# Tipos de pasaje que se pueden leer como pasos a seguir
+TIPOS_ACCIONABLES = ('paso', 'tecnica')
+
+# Pesos por tipo de frase: alias y segmentos de tema pesan más que síntomas
+ROUTER_WEIGHTS = {'alias': 3.0, 'tema': 3.0, 'tema_token': 2.0, 'sintoma': 1.0}
+# Score del artículo top a partir del cual la confianza ya no se penaliza
+ROUTER_SCORE_SATURATION = 3.0
+
+# Versión del formato de proyecciones; subirla si cambian las plantillas
+PROJECTIONS_VERSION = '1'
+# Longitud máxima de la descripción leída por voz
+VOZ_MAX_DESCRIPCION = 150
+
+_ROUTER_STOPWORDS = {
+    'de', 'del', 'la', 'el', 'los', 'las', 'y', 'en', 'con', 'para', 'por', 'un',
+    'una', 'que', 'se', 'mi', 'me', 'al', 'lo', 'como', 'si', 'no', 'o', 'a',
+    'intervension', 'inmediata', 'inmediatas', 'inmediato', 'primeros', 'pasos',
+    'manejo', 'estrategias', 'temprana', 'emergensia', 'trastorno', 'trastornos',
+}
+# Palabras de conversación que no cuentan al medir qué parte de la pregunta
+# cubren las frases del router (normalizadas)
+_ROUTER_RELLENO = _ROUTER_STOPWORDS | {
+    'que', 'hago', 'haser', 'tengo', 'tiene', 'tienes', 'estoy', 'esta', 'siento', 'creo',
+    'quiero', 'nesesito', 'ayuda', 'ayudame', 'mucho', 'mucha', 'muy', 'ahora', 'algo',
+    'es', 'son', 'soy', 'yo', 'te', 'le', 'su', 'tu', 'ya', 'hay', 'sobre', 'cuando',
+    'porque', 'dime', 'unos', 'unas',
+}
+
+
+def titulo_pasaje(pasaje: Dict[str, Any]) -> str:
+    """Nombre corto de un paso o técnica, para leer por voz"""
+    contenido = pasaje.get('contenido')
+    if not isinstance(contenido, dict):
+        return ''
+    if pasaje.get('tipo') == 'tecnica':
+        return f"Técnica {contenido.get('nombre', '')}".strip()
+    return contenido.get('nombre', contenido.get('accion', ''))
+
+
+def _json(valor: Any) -> str:
+    return json.dumps(valor, ensure_ascii=False)
+
+
+def voz_intro(article: Dict[str, Any]) -> str:
+    """Inicio de la respuesta de voz: alerta crítica, tema y descripción breve"""
+    partes = []
+    if article.get('nivel_urgencia') == 'CRÍTICO':
+        partes.append("⚠️ ATENCIÓN: Esta es una situación crítica. ")
+        numeros = article.get('NUMEROS_EMERGENCIA', {})
+        if 'México' in numeros:
+            partes.append(f"Por favor llama inmediatamente al {numeros['México']}. ")
+    partes.append(f"Sobre {article.get('tema', 'Información')}: ")
+    if 'descripcion_clinica' in article:
+        desc = article['descripcion_clinica']
+        # Limitar longitud para voz
+        if len(desc) > VOZ_MAX_DESCRIPCION:
+            desc = desc[:VOZ_MAX_DESCRIPCION - 3] + "..."
+        partes.append(f"{desc} ")
+    return ''.join(partes)
+
+
+def voz_pasos(titulos: List[str]) -> str:
+    """Lista numerada de pasos para leer por voz"""
+    if not titulos:
+        return ''
+    return "Aquí están los pasos que puedes seguir: " + ''.join(
+        f"{i}. {titulo}. " for i, titulo in enumerate(titulos, 1))
+
+
+def proyeccion_articulo(article: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos estáticos del artículo que se envían a la app móvil"""
+    nivel_urgencia = article.get('nivel_urgencia', 'N/A')
+    articulo = {
+        'tema': article.get('tema', 'Información'),
+        'categoria': article.get('categoria', 'General'),
+        'nivel_urgencia': nivel_urgencia,
+        'descripcion': article.get('descripcion_clinica', ''),
+        'sintomas': article.get('sintomas_clave', []),
+    }
+    # Números de emergencia si es crítico
+    if nivel_urgencia == 'CRÍTICO' and 'NUMEROS_EMERGENCIA' in article:
+        articulo['numeros_emergencia'] = article['NUMEROS_EMERGENCIA']
+    return articulo
+
+
+@dataclass
+class RouteResult:
+    """Resultado del router de intención"""
+    ranking: List[Tuple[int, float]]  # (índice de artículo, score) de mayor a menor
+    confidence: float
+    frases: List[str] = field(default_factory=list)
+
 
 class MentalHealthKnowledgeRAG:
     """
@@ -26,12 +156,20 @@ class MentalHealthKnowledgeRAG:
     Usa OpenAI embeddings + FAISS para búsqueda rápida
     """
     
+    # Inyectado o el del proceso que consulta (ver embedding_client.py)
+    client = ClienteDelProceso()
+    
     def __init__(self,
                  knowledge_base_path: str = 'base_conocimiento_rag_pasos_inmediatos.json',
                  openai_model: str = 'text-embedding-3-small',
                  index_path: str = 'faiss_pasos/knowledge_index.bin',
                  metadata_path: str = 'faiss_pasos/knowledge_metadata.pkl',
-                 force_rebuild: bool = False):
+                 passages_index_path: str = 'faiss_pasos/knowledge_passages_index.bin',
+                 passages_metadata_path: str = 'faiss_pasos/knowledge_passages_metadata.pkl',
+                 projections_path: str = 'faiss_pasos/knowledge_projections.pkl',
+                 force_rebuild: bool = False,
+                 router_min_confidence: float = 0.6,
+                 client: Optional[Any] = None):
         """
         Inicializa el sistema RAG de conocimiento
         
@@ -40,54 +178,464 @@ class MentalHealthKnowledgeRAG:
             openai_model: Modelo de embeddings de OpenAI
             index_path: Ruta para guardar/cargar índice FAISS
             metadata_path: Ruta para guardar/cargar metadatos
+            passages_index_path: Ruta para guardar/cargar el índice de pasajes
+            passages_metadata_path: Ruta para guardar/cargar metadatos de pasajes
+            projections_path: Ruta para guardar/cargar las proyecciones precalculadas
             force_rebuild: Si True, regenera embeddings aunque exista cache
+                (sin él, un JSON modificado solo embebe lo que cambió)
+            router_min_confidence: Confianza mínima del router para omitir
+                la búsqueda densa (> 1 desactiva el router)
+            client: Cliente con la interfaz client.embeddings.create de OpenAI
+                (default: embedding_client.cliente_compartido())
         """
         # Cargar base de conocimiento
         with open(knowledge_base_path, 'r', encoding='utf-8') as f:
             self.knowledge_base = json.load(f)
         
-        # Configurar OpenAI
+        # Cliente de embeddings (por defecto el compartido por el proceso)
         self.openai_model = openai_model
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise EnvironmentError('OPENAI_API_KEY no está definido en las variables de entorno')
-        self.client = OpenAI(api_key=api_key)
+        self.client = client
         
-        self.index_path = index_path
-        self.metadata_path = metadata_path
+        # Archivos del snapshot según faiss_pasos/manifest.json (ver snapshots.py)
+        snapshot = resolver_snapshot(index_path, metadata_path)
+        self.index_path = snapshot.index_path
+        self.metadata_path = snapshot.metadata_path
         
         # Crear directorios si no existen
-        os.makedirs(os.path.dirname(index_path) if os.path.dirname(index_path) else '.', exist_ok=True)
-        os.makedirs(os.path.dirname(metadata_path) if os.path.dirname(metadata_path) else '.', exist_ok=True)
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        os.makedirs(os.path.dirname(self.metadata_path) or '.', exist_ok=True)
+        
+        with fase_arranque('indice_conocimiento'):
+            self._load_or_build(snapshot, knowledge_base_path, force_rebuild)
+        
+        # Índice de pasajes con punteros al artículo padre
+        pasajes = resolver_snapshot(passages_index_path, passages_metadata_path)
+        self.passages_index_path = pasajes.index_path
+        self.passages_metadata_path = pasajes.metadata_path
+        with fase_arranque('pasajes'):
+            self._load_passages(pasajes, knowledge_base_path, force_rebuild)
+        
+        # Contenido y construcciones de los que salen las proyecciones
+        self._huella_kb = {
+            'fuente': snapshot.entrada.get('fuente', {}).get('sha256'),
+            'articulos': snapshot.entrada.get('construccion'),
+            'pasajes': pasajes.entrada.get('construccion')
+        }
+        
+        # Router de intención y tablas de lookup (sin red, O(tamaño del KB))
+        self.router_min_confidence = router_min_confidence
+        with fase_arranque('router'):
+            self._build_router()
         
-        # Intentar cargar desde cache
-        if not force_rebuild and os.path.exists(index_path) and os.path.exists(metadata_path):
+        # Respuestas de voz y proyecciones para móvil, una vez por artículo
+        self.projections_path = projections_path
+        with fase_arranque('proyecciones'):
+            self._load_projections(force_rebuild)
+        
+        print(f"Sistema RAG listo con {len(self.knowledge_base)} articulos de conocimiento")
+    
+    def _load_or_build(self, snapshot: Snapshot, fuente: str, force_rebuild: bool = False):
+        """
+        Carga el índice de artículos si es válido y está al día con la base de
+        conocimiento; si no, lo genera reutilizando los artículos sin cambios
+        """
+        previo = huellas_previas = None
+        if not force_rebuild and snapshot.existe:
             print("Cargando base de conocimiento desde cache")
-            self.index = faiss.read_index(index_path)
-            with open(metadata_path, 'rb') as f:
-                cached_data = pickle.load(f)
-                self.knowledge_base = cached_data['knowledge_base']
-            print(f"Base de conocimiento cargada: {self.index.ntotal} articulos")
+            try:
+                index, metadatos = cargar_snapshot(snapshot, 'knowledge_base', self.openai_model)
+                if fuente_vigente(snapshot, fuente):
+                    self.index, self.knowledge_base = index, metadatos['knowledge_base']
+                    print(f"Base de conocimiento cargada: {self.index.ntotal} articulos")
+                    return
+                print(f"{fuente} cambió desde la construcción del snapshot, se actualiza")
+                previo = index
+                huellas_previas = [huella_texto(self._create_searchable_text(art))
+                                   for art in metadatos['knowledge_base']]
+            except SnapshotInvalido as e:
+                print(f"Snapshot inválido, se reconstruye: {e}")
+        
+        texts = [self._create_searchable_text(art) for art in self.knowledge_base]
+        embeddings, _, embebidos = vectores_incrementales(texts, self._generate_embeddings,
+                                                          previo, huellas_previas)
+        print(f"{embebidos} de {len(texts)} articulos embebidos")
+        
+        # Crear índice FAISS (vectores normalizados para cosine similarity)
+        self.index = faiss.IndexFlatIP(embeddings.shape[1])
+        self.index.add(embeddings)
+        
+        # Guardar cache
+        print(f"Guardando cache en {self.index_path}")
+        guardar_snapshot(snapshot, self.index, {'knowledge_base': self.knowledge_base},
+                         self.openai_model, fuente=fuente, parametros={'indice': 'IndexFlatIP'})
+        print("Cache guardado")
+    
+    def _load_passages(self, snapshot: Snapshot, fuente: str, force_rebuild: bool = False):
+        """Carga o genera el índice FAISS de pasajes (solo embebe pasajes nuevos o modificados)"""
+        cargado = False
+        previo = huellas_previas = None
+        if not force_rebuild and snapshot.existe:
+            print("Cargando indice de pasajes desde cache")
+            try:
+                index, metadatos = cargar_snapshot(snapshot, 'passages', self.openai_model)
+                if fuente_vigente(snapshot, fuente):
+                    self.passages_index, self.passages = index, metadatos['passages']
+                    cargado = True
+                else:
+                    print(f"{fuente} cambió desde la construcción de los pasajes, se actualizan")
+                    previo = index
+                    huellas_previas = [huella_texto(p['texto']) for p in metadatos['passages']]
+            except SnapshotInvalido as e:
+                print(f"Snapshot inválido, se reconstruye: {e}")
+        if not cargado:
+            self.passages = [passage
+                             for idx, article in enumerate(self.knowledge_base)
+                             for passage in self._create_passages(article, idx)]
+            embeddings, _, embebidos = vectores_incrementales(
+                [p['texto'] for p in self.passages], self._embed_texts, previo, huellas_previas)
+            print(f"{embebidos} de {len(self.passages)} pasajes embebidos")
+            self.passages_index = faiss.IndexFlatIP(embeddings.shape[1])
+            self.passages_index.add(embeddings)
+            
+            print(f"Guardando indice de pasajes en {self.passages_index_path}")
+            guardar_snapshot(snapshot, self.passages_index, {'passages': self.passages},
+                             self.openai_model, fuente=fuente, parametros={'indice': 'IndexFlatIP'})
+        
+        # Vectores en memoria para puntuar los pasajes de un artículo sin FAISS
+        self.passage_vectors = self.passages_index.reconstruct_n(0, self.passages_index.ntotal)
+        self.passages_by_article: Dict[int, np.ndarray] = {}
+        for i, passage in enumerate(self.passages):
+            self.passages_by_article.setdefault(passage['articulo_idx'], []).append(i)
+        self.passages_by_article = {idx: np.array(rows) for idx, rows in self.passages_by_article.items()}
+        print(f"Indice de pasajes listo: {len(self.passages)} pasajes")
+    
+    def _load_projections(self, force_rebuild: bool = False):
+        """
+        Carga o calcula las proyecciones por artículo. Se recalculan si cambia
+        la versión de las plantillas o el contenido de la base de conocimiento
+        (sha256 de la fuente y construcciones de los snapshots, ver manifest.json).
+        """
+        # Un cache ilegible (escritura interrumpida) cuenta como ausente
+        cached = None if force_rebuild else leer_pickle(self.projections_path)
+        if (isinstance(cached, dict)
+                and cached.get('version') == PROJECTIONS_VERSION
+                and cached.get('huella_kb') == self._huella_kb
+                and len(cached['articulos']) == len(self.knowledge_base)
+                and len(cached['pasajes']) == len(self.passages)):
+            self.projections = cached['articulos']
+            self.passage_projections = cached['pasajes']
+            return
+        
+        print("Calculando proyecciones de articulos")
+        self.passage_projections = [{
+            'titulo_voz': titulo_pasaje(p),
+            'contenido_json': _json(p['contenido'])
+        } for p in self.passages]
+        self.projections = [self._create_projection(article, idx)
+                            for idx, article in enumerate(self.knowledge_base)]
+        guardar_pickle(self.projections_path, {
+            'version': PROJECTIONS_VERSION,
+            'huella_kb': self._huella_kb,
+            'articulos': self.projections,
+            'pasajes': self.passage_projections
+        })
+    
+    def _create_projection(self, article: Dict[str, Any], idx: int) -> Dict[str, Any]:
+        """Partes estáticas de las respuestas de un artículo"""
+        articulo = proyeccion_articulo(article)
+        
+        # Pasos por defecto: los que se eligen sin embedding (router o CRÍTICO)
+        pasajes_default = self._passage_rows(idx)[:3]
+        return {
+            'voz_intro': voz_intro(article),
+            'pasajes_default': pasajes_default,
+            'voz_pasos_default': voz_pasos(
+                [self.passage_projections[i]['titulo_voz'] for i in pasajes_default]),
+            'articulo': articulo,
+            # Objeto JSON abierto: el endpoint agrega los campos dinámicos y '}'
+            'articulo_json': _json(articulo)[:-1],
+            'texto': {
+                True: self._format_static(article, include_sources=True),
+                False: self._format_static(article, include_sources=False)
+            }
+        }
+    
+    def _projection_for(self, article: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Proyección precalculada de un artículo del KB (None si no es del KB)"""
+        idx = self.articles_by_id.get(article.get('id'))
+        if idx is None or self.knowledge_base[idx].get('tema') != article.get('tema'):
+            registrar_cache('proyeccion_guia', False)
+            return None
+        registrar_cache('proyeccion_guia', True)
+        return self.projections[idx]
+    
+    def voice_parts(self, article: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Partes de la respuesta de voz de un resultado de ask(): intro
+        precalculada y pasos de 'pasajes_relevantes' (también precalculados
+        si son los de por defecto)
+        """
+        pasajes = article.get('pasajes_relevantes', [])
+        proyeccion = self._projection_for(article)
+        if proyeccion is None:
+            return voz_intro(article), voz_pasos([titulo_pasaje(p) for p in pasajes])
+        
+        filas = [p.get('indice') for p in pasajes]
+        if filas == proyeccion['pasajes_default']:
+            pasos = proyeccion['voz_pasos_default']
+        else:
+            pasos = voz_pasos([self.passage_projections[i]['titulo_voz'] for i in filas])
+        return proyeccion['voz_intro'], pasos
+    
+    def voice_response(self, article: Dict[str, Any]) -> str:
+        """
+        Respuesta de voz de un resultado de ask() (intro + pasos). El llamador
+        agrega las partes dinámicas restantes.
+        """
+        return ''.join(self.voice_parts(article))
+    
+    def article_projection_json(self, article: Dict[str, Any]) -> str:
+        """
+        Artículo para móvil serializado como JSON, reutilizando el fragmento
+        estático precalculado y los contenidos de pasos ya serializados
+        """
+        pasajes = article.get('pasajes_relevantes', [])
+        proyeccion = self._projection_for(article)
+        if proyeccion is None:
+            return _json(self.article_projection(article))
+        pasos = ', '.join(self.passage_projections[p['indice']]['contenido_json'] for p in pasajes)
+        return (f"{proyeccion['articulo_json']}, \"pasos\": [{pasos}], "
+                f"\"pasos_totales\": {int(article.get('pasos_totales', len(pasajes)))}, "
+                f"\"relevancia\": {_json(article.get('relevancia', 'N/A'))}, "
+                f"\"similarity_score\": {_json(float(article.get('similarity_score', 0)))}}}")
+    
+    def article_projection(self, article: Dict[str, Any]) -> Dict[str, Any]:
+        """Artículo para móvil como dict (misma forma que article_projection_json)"""
+        pasajes = article.get('pasajes_relevantes', [])
+        proyeccion = self._projection_for(article)
+        if proyeccion is not None:
+            resultado = dict(proyeccion['articulo'])
+        else:
+            resultado = proyeccion_articulo(article)
+        resultado.update({
+            'pasos': [p['contenido'] for p in pasajes],
+            'pasos_totales': article.get('pasos_totales', len(pasajes)),
+            'relevancia': article.get('relevancia', 'N/A'),
+            'similarity_score': article.get('similarity_score', 0)
+        })
+        return resultado
+    
+    def _create_passages(self, article: Dict[str, Any], idx: int) -> List[Dict[str, Any]]:
+        """
+        Divide un artículo en pasajes: descripción, cada paso, cada técnica
+        y cada lista de síntomas/señales. El texto lleva el tema como contexto.
+        """
+        tema = article.get('tema', '')
+        passages = []
+        
+        def agregar(tipo: str, campo: str, orden: int, contenido: Any, texto: str):
+            passages.append({
+                'articulo_idx': idx,
+                'articulo_id': article.get('id'),
+                'tipo': tipo,
+                'campo': campo,
+                'orden': orden,
+                'contenido': contenido,
+                'texto': f"{tema}: {texto}"
+            })
+        
+        if article.get('descripcion_clinica'):
+            agregar('descripcion', 'descripcion_clinica', 0, article['descripcion_clinica'],
+                    article['descripcion_clinica'])
+        
+        for campo in PASOS_KEYS:
+            for orden, paso in enumerate(article.get(campo, [])):
+                if isinstance(paso, dict):
+                    texto = ' '.join(str(v) if not isinstance(v, list) else ' '.join(map(str, v))
+                                     for k, v in paso.items() if k != 'paso')
+                    agregar('paso', campo, orden, paso, texto)
+        
+        for orden, tecnica in enumerate(article.get('tecnicas_grounding', [])):
+            texto = f"{tecnica.get('nombre', '')} {' '.join(tecnica.get('pasos', []))}"
+            agregar('tecnica', 'tecnicas_grounding', orden, tecnica, texto)
+        
+        for campo, tipo in LISTAS_PASAJE.items():
+            if article.get(campo):
+                agregar(tipo, campo, 0, article[campo], ' '.join(article[campo]))
+        
+        return passages
+    
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Embeddings float32 para una lista de textos"""
+        if len(texts) == 1:
+            # Pregunta de ask(): en modo ASGI ya se pidió de forma asíncrona
+            vector = precalculado(self.openai_model, texts[0])
+            if vector is not None:
+                return np.array([vector], dtype='float32')
+        with etapa('embedding'):
+            resp = self.client.embeddings.create(model=self.openai_model, input=texts)
+        registrar_tokens(self.openai_model, resp)
+        return np.array([d.embedding for d in resp.data], dtype='float32')
+    
+    def _passage_rows(self, article_idx: int, tipos: tuple = TIPOS_ACCIONABLES) -> List[int]:
+        """Índices de los pasajes de un artículo con alguno de los tipos dados"""
+        return [i for i in self.passages_by_article.get(article_idx, [])
+                if self.passages[i]['tipo'] in tipos]
+    
+    def _relevant_passages(self,
+                           article_idx: int,
+                           query_embedding: Optional[np.ndarray],
+                           top_n: int,
+                           tipos: tuple = TIPOS_ACCIONABLES) -> List[Dict[str, Any]]:
+        """
+        Selecciona los pasajes de un artículo más relevantes para la query.
+        
+        Sin embedding (respuesta del router) o en artículos CRÍTICOS se
+        respeta el orden del protocolo. Los elegidos se devuelven en el orden
+        del documento para que los pasos se lean en secuencia.
+        """
+        rows = self._passage_rows(article_idx, tipos)
+        if not rows:
+            return []
+        
+        critico = self.knowledge_base[article_idx].get('nivel_urgencia', '').upper() == 'CRÍTICO'
+        if query_embedding is None or critico:
+            elegidos = [(i, None) for i in rows[:top_n]]
         else:
-            print("Generando embeddings para base de conocimiento")
-            embeddings = self._generate_embeddings()
+            scores = self.passage_vectors[rows] @ query_embedding.reshape(-1)
+            mejores = np.argsort(-scores)[:top_n]
+            elegidos = sorted(((rows[j], float(scores[j])) for j in mejores), key=lambda x: x[0])
+        
+        resultado = []
+        for i, score in elegidos:
+            passage = self.passages[i]
+            resultado.append({
+                'indice': int(i),
+                'tipo': passage['tipo'],
+                'campo': passage['campo'],
+                'orden': passage['orden'],
+                'contenido': passage['contenido'],
+                'similarity_score': score
+            })
+        return resultado
+    
+    def search_passages(self, question: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Busca pasajes en toda la base de conocimiento
+        
+        Returns:
+            Pasajes con similitud y puntero al artículo padre (articulo_id, tema)
+        """
+        query_embedding = self._embed_texts([question])
+        faiss.normalize_L2(query_embedding)
+        similarities, indices = self.passages_index.search(query_embedding, top_k)
+        
+        results = []
+        for i, similarity in zip(indices[0], similarities[0]):
+            if i < 0:
+                continue
+            passage = self.passages[i]
+            article = self.knowledge_base[passage['articulo_idx']]
+            results.append({
+                'articulo_id': passage['articulo_id'],
+                'tema': article.get('tema'),
+                'nivel_urgencia': article.get('nivel_urgencia'),
+                'tipo': passage['tipo'],
+                'campo': passage['campo'],
+                'orden': passage['orden'],
+                'contenido': passage['contenido'],
+                'similarity_score': float(similarity)
+            })
+        return results
+    
+    def _build_router(self):
+        """
+        Construye el índice de frases normalizadas -> artículos y las tablas
+        por categoría y por nivel de urgencia
+        """
+        self.articles_by_id: Dict[str, int] = {}
+        self.by_categoria: Dict[str, List[int]] = {}
+        self.by_urgencia: Dict[str, List[int]] = {}
+        
+        # frase normalizada -> {idx_articulo: peso}
+        frases: Dict[str, Dict[int, float]] = {}
+        
+        def agregar(frase: str, idx: int, tipo: str):
+            normalizada = normalizar_texto(frase)
+            if not normalizada:
+                return
+            pesos = frases.setdefault(normalizada, {})
+            pesos[idx] = max(pesos.get(idx, 0.0), ROUTER_WEIGHTS[tipo])
+        
+        for idx, article in enumerate(self.knowledge_base):
+            self.articles_by_id[article.get('id')] = idx
+            self.by_categoria.setdefault(article.get('categoria', ''), []).append(idx)
+            self.by_urgencia.setdefault(article.get('nivel_urgencia', '').upper(), []).append(idx)
             
-            # Crear índice FAISS
-            dimension = embeddings.shape[1]
-            self.index = faiss.IndexFlatIP(dimension)
+            # Segmentos del tema: 'Ataque de Pánico - Intervención Inmediata'
+            for segmento in re.split(r'\s+-\s+|[()/]', article.get('tema', '')):
+                agregar(segmento, idx, 'tema')
+                for token in normalizar_texto(segmento).split():
+                    if len(token) >= 3 and token not in _ROUTER_STOPWORDS:
+                        agregar(token, idx, 'tema_token')
             
-            # Normalizar vectores para cosine similarity
-            faiss.normalize_L2(embeddings)
-            self.index.add(embeddings)
+            for key in ['sintomas_clave', 'sintomas_manias', 'sintomas_depresion',
+                        'sintomas_tempranos', 'sintomas_psicosis_clara']:
+                for sintoma in article.get(key, []):
+                    agregar(sintoma, idx, 'sintoma')
             
-            # Guardar cache
-            print(f"Guardando cache en {self.index_path}")
-            faiss.write_index(self.index, self.index_path)
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump({'knowledge_base': self.knowledge_base}, f)
-            print("Cache guardado")
+            for alias in ROUTER_ALIASES.get(article.get('id'), []):
+                agregar(alias, idx, 'alias')
         
-        print(f"Sistema RAG listo con {len(self.knowledge_base)} articulos de conocimiento")
+        # Frases compartidas por varios artículos reparten su peso (tipo idf)
+        self._router_frases = {
+            frase: {idx: peso / len(pesos) for idx, peso in pesos.items()}
+            for frase, pesos in frases.items()
+        }
+        self._router_matcher = PatternMatcher(((frase, frase) for frase in self._router_frases),
+                                              whole_words=True)
+    
+    def route(self, question: str) -> Optional[RouteResult]:
+        """
+        Resuelve la pregunta con el índice de frases (sin embeddings)
+        
+        La confianza combina el margen entre el primer y segundo artículo, la
+        fuerza absoluta del primero (saturada en ROUTER_SCORE_SATURATION) y la
+        cobertura: la fracción de las palabras de contenido de la pregunta que
+        caen dentro de las frases encontradas. Una sola palabra clave en una
+        pregunta que dice otras cosas ('tengo sueño todo el día y no tengo
+        ganas de nada') no alcanza para omitir la búsqueda densa.
+        
+        Returns:
+            RouteResult, o None si ninguna frase coincide
+        """
+        matches = self._router_matcher.find_all(question)
+        if not matches:
+            return None
+        
+        scores: Dict[int, float] = {}
+        frases = []
+        for _, frase, _ in matches:
+            frases.append(frase)
+            for idx, peso in self._router_frases[frase].items():
+                scores[idx] = scores.get(idx, 0.0) + peso
+        
+        ranking = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        top = ranking[0][1]
+        segundo = ranking[1][1] if len(ranking) > 1 else 0.0
+        confidence = ((top - segundo) / top) * min(1.0, top / ROUTER_SCORE_SATURATION) \
+            * self._router_coverage(question, frases)
+        
+        return RouteResult(ranking=ranking, confidence=confidence, frases=frases)
+    
+    @staticmethod
+    def _router_coverage(question: str, frases: List[str]) -> float:
+        """Fracción de las palabras de contenido de la pregunta cubiertas por las frases"""
+        contenido = [t for t in normalizar_texto(question).split() if t not in _ROUTER_RELLENO]
+        if not contenido:
+            return 1.0
+        cubiertas = {t for frase in frases for t in frase.split()}
+        return sum(t in cubiertas for t in contenido) / len(contenido)
     
     def _create_searchable_text(self, article: Dict[str, Any]) -> str:
         """
@@ -134,10 +682,8 @@ class MentalHealthKnowledgeRAG:
         
         return ' '.join([str(p) for p in parts if p])
     
-    def _generate_embeddings(self) -> np.ndarray:
-        """Genera embeddings para toda la base de conocimiento"""
-        texts = [self._create_searchable_text(art) for art in self.knowledge_base]
-        
+    def _generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Genera embeddings para textos de artículos de la base de conocimiento"""
         print(f"Procesando {len(texts)} articulos")
         resp = self.client.embeddings.create(model=self.openai_model, input=texts)
         embeddings = np.array([d.embedding for d in resp.data], dtype='float32')
@@ -145,10 +691,37 @@ class MentalHealthKnowledgeRAG:
         
         return embeddings
     
+    def requiere_embedding(self, question: str) -> bool:
+        """True si ask(question) no se resuelve con el router y va a pedir el embedding"""
+        ruta = self.route(question)
+        return ruta is None or ruta.confidence < self.router_min_confidence
+    
+    def _route_candidates(self, ruta: RouteResult, top_k: int) -> List[Tuple[int, float]]:
+        """
+        Candidatos de una ruta confiable: el ranking del router y, para
+        completar top_k como la búsqueda densa, artículos de la misma
+        categoría que el primero y después el resto de la base. Cada uno
+        lleva la confianza de la ruta escalada por su puntaje (0.0 para los
+        que el router no encontró).
+        """
+        top_idx, top_score = ruta.ranking[0]
+        candidatos = [(idx, ruta.confidence * score / top_score) for idx, score in ruta.ranking]
+        vistos = {idx for idx, _ in candidatos}
+        categoria = self.knowledge_base[top_idx].get('categoria', '')
+        for idx in self.by_categoria.get(categoria, []) + list(range(len(self.knowledge_base))):
+            if len(candidatos) >= top_k:
+                break
+            if idx not in vistos:
+                candidatos.append((idx, 0.0))
+                vistos.add(idx)
+        return candidatos[:top_k]
+    
     def ask(self, 
             question: str, 
             top_k: int = 1,
-            include_context: bool = True) -> List[Dict[str, Any]]:
+            include_context: bool = True,
+            use_router: bool = True,
+            top_passages: int = 0) -> List[Dict[str, Any]]:
         """
         Responde una pregunta buscando en la base de conocimiento
         
@@ -156,26 +729,50 @@ class MentalHealthKnowledgeRAG:
             question: Pregunta del usuario ("¿Qué hago si tengo ansiedad?")
             top_k: Número de artículos a retornar (default: 1)
             include_context: Si True, incluye contexto completo del artículo
+            use_router: Si True, intenta resolver con el router antes del embedding
+            top_passages: Si > 0, agrega a cada artículo sus N pasos/técnicas
+                más relevantes en 'pasajes_relevantes'
             
         Returns:
-            Lista de artículos relevantes con scores de similitud
+            Lista de artículos relevantes con scores de similitud (coseno, o la
+            confianza de la ruta si respondió el router: metodo_recuperacion
+            'router' y la misma confianza en 'confianza_ruta')
         """
-        # Generar embedding de la pregunta
-        resp = self.client.embeddings.create(model=self.openai_model, input=[question])
-        query_embedding = np.array(resp.data[0].embedding, dtype='float32').reshape(1, -1)
-        
-        # Normalizar para cosine similarity
-        faiss.normalize_L2(query_embedding)
-        
-        # Buscar en FAISS
-        similarities, indices = self.index.search(query_embedding, top_k)
+        ruta = self.route(question) if use_router else None
+        query_embedding = None
+        usa_router = ruta is not None and ruta.confidence >= self.router_min_confidence
+        if use_router:
+            registrar_cache('router_guia', usa_router)
+        
+        if usa_router:
+            # Ruta confiable: sin embedding ni FAISS
+            candidatos = self._route_candidates(ruta, top_k)
+            metodo = 'router'
+        else:
+            # Generar embedding de la pregunta
+            query_embedding = self._embed_texts([question])
+            
+            # Normalizar para cosine similarity
+            faiss.normalize_L2(query_embedding)
+            
+            # Buscar en FAISS
+            with etapa('faiss'):
+                similarities, indices = self.index.search(query_embedding, top_k)
+            candidatos = [(idx, sim) for idx, sim in zip(indices[0], similarities[0]) if idx >= 0]
+            metodo = 'semantico'
         
         # Construir resultados
         results = []
-        for idx, similarity in zip(indices[0], similarities[0]):
+        for idx, puntaje in candidatos:
             article = self.knowledge_base[idx].copy()
-            article['similarity_score'] = float(similarity)
-            article['relevancia'] = self._classify_relevance(similarity)
+            article['similarity_score'] = float(puntaje)
+            if usa_router:
+                # Sin embedding no hay coseno: el score es la confianza de la ruta
+                article['confianza_ruta'] = float(puntaje)
+                article['relevancia'] = self._classify_route_relevance(puntaje)
+            else:
+                article['relevancia'] = self._classify_relevance(puntaje)
+            article['metodo_recuperacion'] = metodo
             
             # Opcionalmente reducir contexto
             if not include_context:
@@ -186,9 +783,16 @@ class MentalHealthKnowledgeRAG:
                     'categoria': article.get('categoria'),
                     'nivel_urgencia': article.get('nivel_urgencia'),
                     'similarity_score': article['similarity_score'],
-                    'relevancia': article['relevancia']
+                    'confianza_ruta': article.get('confianza_ruta'),
+                    'relevancia': article['relevancia'],
+                    'metodo_recuperacion': article['metodo_recuperacion']
                 }
             
+            # Pasos/técnicas relevantes con el mismo embedding de la pregunta
+            if top_passages > 0:
+                article['pasajes_relevantes'] = self._relevant_passages(idx, query_embedding, top_passages)
+                article['pasos_totales'] = len(self._passage_rows(idx))
+            
             results.append(article)
         
         return results
@@ -204,14 +808,25 @@ class MentalHealthKnowledgeRAG:
         else:
             return "Baja"
     
+    def _classify_route_relevance(self, confianza: float) -> str:
+        """Relevancia de un resultado del router según su confianza"""
+        if confianza >= 0.85:
+            return "Muy Alta"
+        elif confianza >= self.router_min_confidence:
+            return "Alta"
+        elif confianza >= self.router_min_confidence / 2:
+            return "Media"
+        else:
+            return "Baja"
+    
     def get_emergency_response(self) -> Dict[str, Any]:
         """
         Retorna respuesta de emergencia para crisis
-        Busca artículo con nivel_urgencia CRÍTICO
+        Busca artículo con nivel_urgencia CRÍTICO (tabla precalculada)
         """
-        for article in self.knowledge_base:
-            if article.get('nivel_urgencia', '').upper() == 'CRÍTICO':
-                return article
+        criticos = self.by_urgencia.get('CRÍTICO')
+        if criticos:
+            return self.knowledge_base[criticos[0]]
         
         # Fallback genérico
         return {
@@ -247,6 +862,28 @@ class MentalHealthKnowledgeRAG:
         Returns:
             Texto formateado para mostrar al usuario
         """
+        # Cuerpo estático precalculado si el artículo es del KB
+        proyeccion = self._projection_for(article)
+        if proyeccion is not None:
+            lines = [proyeccion['texto'][bool(include_sources)]]
+        else:
+            lines = [self._format_static(article, include_sources)]
+        
+        # Score de similitud
+        if 'similarity_score' in article:
+            score = article['similarity_score']
+            relevancia = article.get('relevancia', 'N/A')
+            if article.get('metodo_recuperacion') == 'router':
+                lines.append(f"\nRelevancia: {relevancia} (confianza de ruta {score:.3f})")
+            else:
+                lines.append(f"\nRelevancia: {relevancia} ({score:.3f})")
+        
+        lines.append("\n" + "=" * 60)
+        
+        return '\n'.join(lines)
+    
+    def _format_static(self, article: Dict[str, Any], include_sources: bool = True) -> str:
+        """Parte de format_response que no depende de la consulta"""
         lines = []
         
         # Header
@@ -294,14 +931,6 @@ class MentalHealthKnowledgeRAG:
         if include_sources and 'fuentes' in article:
             lines.append(f"\nFuentes: {', '.join(article['fuentes'])}")
         
-        # Score de similitud
-        if 'similarity_score' in article:
-            score = article['similarity_score']
-            relevancia = article.get('relevancia', 'N/A')
-            lines.append(f"\nRelevancia: {relevancia} ({score:.3f})")
-        
-        lines.append("\n" + "=" * 60)
-        
         return '\n'.join(lines)
 
 
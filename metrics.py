@@ -0,0 +1,257 @@
+"""
+Métricas de latencia por etapa y contadores (Prometheus)
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Cada request guarda su endpoint en una variable de contexto; las etapas
+(parseo, detección de crisis, embedding, FAISS, filtros, scoring, rerank,
+format_for_mobile, respuesta de voz, serialización) se miden donde ocurren,
+incluso dentro de retrieval_system o knowledge_rag, y quedan etiquetadas
+con ese endpoint sin pasarlo como argumento. Fuera de un request (ingesta,
+benchmarks) la etiqueta es 'ninguno'.
+
+Las métricas se exponen en GET /metrics. Con varios workers de Gunicorn,
+PROMETHEUS_MULTIPROC_DIR (directorio vacío al arrancar) hace que /metrics
+sume los de todos los procesos; gunicorn.conf.py lo fija y lo vacía. Si la
+variable está fijada fuera de gunicorn (build de render.yaml, uvicorn,
+scripts), el directorio se crea aquí para que importar el módulo no falle.
+"""
+
+import contextvars
+import os
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+
+# prometheus_client abre <dir>/<tipo>_<pid>.db al definir cada métrica
+_multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if _multiproc_dir:
+    os.makedirs(_multiproc_dir, exist_ok=True)
+
+# Endpoint del request en curso (etiqueta de todas las métricas)
+endpoint_actual: contextvars.ContextVar[str] = contextvars.ContextVar('endpoint_actual', default='ninguno')
+
+# Solo en requests perfilados (profiler.py) o capturados (traffic_capture.py):
+# además del histograma, cada etapa se anota en esta lista del request
+etapas_request: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    'etapas_request', default=None)
+
+# Buckets en segundos: las etapas locales están en el rango de µs-ms, las
+# llamadas de embeddings y los requests completos en cientos de ms
+BUCKETS_ETAPA = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ETAPA_SEGUNDOS = Histogram(
+    'calma_etapa_segundos', 'Duración de cada etapa del request',
+    ['endpoint', 'etapa'], buckets=BUCKETS_ETAPA)
+REQUEST_SEGUNDOS = Histogram(
+    'calma_request_segundos', 'Duración total del request (sin el cuerpo en streaming)',
+    ['endpoint', 'status'], buckets=BUCKETS_ETAPA)
+CACHE_TOTAL = Counter(
+    'calma_cache_total', 'Consultas a caches y precálculos',
+    ['endpoint', 'cache', 'resultado'])
+EMBEDDING_TOKENS = Counter(
+    'calma_embedding_tokens_total', 'Tokens enviados a la API de embeddings',
+    ['endpoint', 'modelo'])
+RESPUESTAS_DEGRADADAS = Counter(
+    'calma_respuestas_degradadas_total', 'Respuestas servidas en modo degradado',
+    ['endpoint', 'motivo'])
+
+# Control de admisión (admission_control.py), por clase de prioridad
+ADMISION_COLA = Gauge(
+    'calma_admision_cola', 'Requests esperando un cupo de ejecución',
+    ['clase'], multiprocess_mode='livesum')
+ADMISION_EN_CURSO = Gauge(
+    'calma_admision_en_curso', 'Requests admitidos en ejecución',
+    ['clase'], multiprocess_mode='livesum')
+ADMISION_ESPERA = Histogram(
+    'calma_admision_espera_segundos', 'Espera en cola de los requests admitidos',
+    ['clase'], buckets=BUCKETS_ETAPA)
+ADMISION_RECHAZOS = Counter(
+    'calma_admision_rechazos_total', 'Requests descartados con 503',
+    ['clase', 'motivo'])
+
+# Cliente de embeddings compartido (embedding_client.py)
+EMBEDDING_LLAMADA_SEGUNDOS = Histogram(
+    'calma_embedding_llamada_segundos', 'Duración de cada intento HTTP a la API de embeddings',
+    ['resultado'], buckets=BUCKETS_ETAPA)
+EMBEDDING_REINTENTOS = Counter(
+    'calma_embedding_reintentos_total', 'Reintentos de embeddings hechos o negados por el presupuesto',
+    ['resultado'])
+EMBEDDING_CONEXIONES = Counter(
+    'calma_embedding_conexiones_total', 'Conexiones nuevas (con handshake) a la API de embeddings')
+EMBEDDING_POOL_EN_USO = Gauge(
+    'calma_embedding_pool_en_uso', 'Conexiones del pool de embeddings ocupadas',
+    multiprocess_mode='livesum')
+EMBEDDING_POOL_TAMANO = Gauge(
+    'calma_embedding_pool_tamano', 'Conexiones keep-alive del pool de embeddings',
+    multiprocess_mode='livesum')
+
+# Arranque: carga (o construcción) de índices y estructuras derivadas
+ARRANQUE_SEGUNDOS = Gauge(
+    'calma_arranque_segundos', 'Duración de cada fase del último arranque',
+    ['fase'], multiprocess_mode='max')
+
+# Hijos con etiquetas ya resueltas: labels() valida y toma un lock en cada
+# llamada, y las etapas se miden varias veces por request
+_hijos: Dict[Tuple[Any, ...], Any] = {}
+
+
+def _hijo(metrica, *etiquetas: str):
+    clave = (metrica, *etiquetas)
+    hijo = _hijos.get(clave)
+    if hijo is None:
+        hijo = _hijos[clave] = metrica.labels(*etiquetas)
+    return hijo
+
+
+class etapa:
+    """
+    Mide un bloque como etapa del request en curso:
+
+        with etapa('faiss'):
+            similarities, indices = index.search(q, k)
+    """
+
+    __slots__ = ('nombre', 'inicio')
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observar_etapa(self.nombre, time.perf_counter() - self.inicio)
+        return False
+
+
+# Segundos de cada fase del último arranque del proceso (para /ready)
+tiempos_arranque: Dict[str, float] = {}
+
+
+class fase_arranque:
+    """
+    Mide una fase del arranque (fuera de requests):
+
+        with fase_arranque('indice_recursos'):
+            self.index = faiss.read_index(path)
+    """
+
+    __slots__ = ('nombre', 'inicio')
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registrar_fase_arranque(self.nombre, time.perf_counter() - self.inicio)
+        return False
+
+
+def registrar_fase_arranque(nombre: str, segundos: float):
+    tiempos_arranque[nombre] = segundos
+    _hijo(ARRANQUE_SEGUNDOS, nombre).set(segundos)
+
+
+def cronometrado(nombre: str) -> Callable:
+    """Decorador: cada llamada a la función cuenta como la etapa `nombre`"""
+    def decorador(fn: Callable) -> Callable:
+        @wraps(fn)
+        def envuelta(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observar_etapa(nombre, time.perf_counter() - inicio)
+        return envuelta
+    return decorador
+
+
+def observar_etapa(nombre: str, segundos: float):
+    _hijo(ETAPA_SEGUNDOS, endpoint_actual.get(), nombre).observe(segundos)
+    registro = etapas_request.get()
+    if registro is not None:
+        registro.append((nombre, segundos))
+
+
+def tiempos_etapas(etapas: Iterable[Tuple[str, float]]) -> Dict[str, float]:
+    """Milisegundos por etapa (sumados si la etapa ocurrió varias veces)"""
+    totales: Dict[str, float] = {}
+    for nombre, segundos in etapas:
+        totales[nombre] = totales.get(nombre, 0.0) + segundos * 1000
+    return {nombre: round(ms, 3) for nombre, ms in totales.items()}
+
+
+def observar_request(endpoint: str, status: int, segundos: float):
+    _hijo(REQUEST_SEGUNDOS, endpoint, str(status)).observe(segundos)
+
+
+def registrar_cache(cache: str, acierto: bool):
+    _hijo(CACHE_TOTAL, endpoint_actual.get(), cache, 'hit' if acierto else 'miss').inc()
+
+
+def registrar_tokens(modelo: str, respuesta: Any):
+    """Suma los tokens de una respuesta de embeddings (si trae 'usage')"""
+    usage = getattr(respuesta, 'usage', None)
+    tokens = getattr(usage, 'total_tokens', None) or getattr(usage, 'prompt_tokens', None)
+    if tokens:
+        _hijo(EMBEDDING_TOKENS, endpoint_actual.get(), modelo).inc(tokens)
+
+
+def registrar_degradada(motivo: str):
+    _hijo(RESPUESTAS_DEGRADADAS, endpoint_actual.get(), motivo).inc()
+
+
+def actualizar_admision(clase: str, en_cola: int, en_curso: int):
+    _hijo(ADMISION_COLA, clase).set(en_cola)
+    _hijo(ADMISION_EN_CURSO, clase).set(en_curso)
+
+
+def observar_espera_admision(clase: str, segundos: float):
+    _hijo(ADMISION_ESPERA, clase).observe(segundos)
+
+
+def registrar_rechazo(clase: str, motivo: str):
+    _hijo(ADMISION_RECHAZOS, clase, motivo).inc()
+
+
+def observar_llamada_embedding(resultado: str, segundos: float):
+    _hijo(EMBEDDING_LLAMADA_SEGUNDOS, resultado).observe(segundos)
+
+
+def registrar_reintento_embedding(permitido: bool):
+    _hijo(EMBEDDING_REINTENTOS, 'hecho' if permitido else 'negado').inc()
+
+
+def registrar_conexiones_embedding(nuevas: int):
+    EMBEDDING_CONEXIONES.inc(nuevas)
+
+
+def actualizar_pool_embeddings(en_uso: int, tamano: int):
+    EMBEDDING_POOL_EN_USO.set(en_uso)
+    EMBEDDING_POOL_TAMANO.set(tamano)
+
+
+def map_con_contexto(executor, fn: Callable, items: Iterable) -> Iterator:
+    """
+    executor.map que conserva las variables de contexto (endpoint) en los
+    hilos del pool; cada tarea corre en su propia copia del contexto
+    """
+    futuros = [executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return (f.result() for f in futuros)
+
+
+def exposicion() -> Tuple[bytes, str]:
+    """(cuerpo, content type) para GET /metrics"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,233 @@
+"""
+Colapso de casi-duplicados al construir el índice de recursos
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Servicios públicos e instituciones aparecen varias veces con texto casi
+idéntico (misma línea, otra modalidad o registro). Antes de crear el índice:
+- Se buscan pares con similitud coseno >= umbral que además coinciden en
+  algún campo clave (nombre del servicio, teléfono o institución + delegación).
+  Se agrupa primero por valor de campo clave y solo se comparan vectores
+  dentro de cada cubeta: el costo depende del tamaño de las cubetas, no del
+  catálogo, y solo se leen los vectores de filas que comparten alguna clave
+- Un especialista con NPI (NPPES) nunca es duplicado: el NPI individual
+  identifica a una persona, y colegas del mismo consultorio comparten
+  teléfono y, con embeddings compuestos, el mismo vector
+- Los pares se agrupan con union-find; cada grupo guarda un solo vector, el
+  del representante (mejor rating y más reseñas)
+- Las demás entradas quedan en 'variantes' del representante, y su
+  modalidad se suma a la del representante para que los filtros las encuentren
+"""
+
+import re
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from text_matching import normalizar_texto
+
+UMBRAL_DUPLICADO = 0.92
+
+# Campos que se conservan de cada variante colapsada
+CAMPOS_VARIANTE = ('id', 'nombre', 'tipo_recurso', 'tipo_profesional', 'institucion',
+                   'modalidad', 'ubicacion', 'contacto', 'costo')
+
+
+def _telefono(recurso: Dict[str, Any]) -> str:
+    digitos = re.sub(r'\D', '', (recurso.get('contacto') or {}).get('telefono') or '')
+    return digitos if len(digitos) >= 7 else ''
+
+
+def _nombre_servicio(recurso: Dict[str, Any]) -> str:
+    # Dos especialistas homónimos pueden ser personas distintas
+    if recurso.get('tipo_recurso') == 'especialista':
+        return ''
+    return normalizar_texto(recurso.get('nombre') or '')
+
+
+def _institucion_delegacion(recurso: Dict[str, Any]) -> str:
+    institucion = normalizar_texto(recurso.get('institucion') or '')
+    if not institucion:
+        return ''
+    return f"{institucion}|{normalizar_texto((recurso.get('ubicacion') or {}).get('delegacion') or '')}"
+
+
+# Campos clave: además de la similitud del vector, debe coincidir al menos uno
+CLAVES_DUPLICADO: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    'nombre': _nombre_servicio,
+    'telefono': _telefono,
+    'institucion': _institucion_delegacion,
+}
+
+
+def claves_duplicado(recurso: Dict[str, Any]) -> Dict[str, str]:
+    """Valores de los campos clave del recurso ('' = no participa)"""
+    if recurso.get('npi') and recurso.get('tipo_recurso') == 'especialista':
+        return {nombre: '' for nombre in CLAVES_DUPLICADO}
+    return {nombre: f(recurso) for nombre, f in CLAVES_DUPLICADO.items()}
+
+
+class UnionFind:
+    """Conjuntos disjuntos con compresión de caminos (elementos 0..n-1 y los agregados)"""
+
+    def __init__(self, n: int):
+        self.padre: Dict[int, int] = {i: i for i in range(n)}
+
+    def agregar(self, i: int):
+        self.padre.setdefault(i, i)
+
+    def find(self, i: int) -> int:
+        raiz = i
+        while self.padre[raiz] != raiz:
+            raiz = self.padre[raiz]
+        while self.padre[i] != raiz:
+            self.padre[i], i = raiz, self.padre[i]
+        return raiz
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.padre[max(ra, rb)] = min(ra, rb)
+
+
+def agregar_cubetas(cubetas: Dict[Tuple[str, str], List[int]],
+                    recursos: Iterable[Dict[str, Any]], inicio: int = 0):
+    """Anota cada fila (desde `inicio`) en las cubetas (campo, valor) de sus claves"""
+    for fila, recurso in enumerate(recursos, start=inicio):
+        for campo, valor in claves_duplicado(recurso).items():
+            if valor:
+                cubetas.setdefault((campo, valor), []).append(fila)
+
+
+def pares_duplicados(cubetas: Dict[Tuple[str, str], List[int]],
+                     vectores: np.ndarray,
+                     umbral: float = UMBRAL_DUPLICADO,
+                     batch_size: int = 1024) -> List[List[int]]:
+    """
+    Grupos de más de un elemento entre filas que comparten alguna cubeta
+
+    Args:
+        cubetas: (campo, valor) -> filas (ver agregar_cubetas)
+        vectores: (n, d) normalizados L2 por fila; solo se leen las filas de
+            cubetas con más de una fila (sirve la vista de vectores_indice)
+        umbral: Similitud coseno mínima para considerar un par
+
+    Returns:
+        Grupos de filas (cada uno ordenado, ordenados por su primera fila)
+    """
+    uf = UnionFind(0)
+    for filas in cubetas.values():
+        if len(filas) < 2:
+            continue
+        filas = np.array(filas)
+        for fila in filas:
+            uf.agregar(int(fila))
+        for inicio in range(0, len(filas), batch_size):
+            lote = filas[inicio:inicio + batch_size]
+            sims = np.asarray(vectores[lote], dtype='float32') @ np.asarray(vectores[filas], dtype='float32').T
+            for j, i in zip(*np.nonzero(sims >= umbral)):
+                if lote[j] < filas[i]:
+                    uf.union(int(lote[j]), int(filas[i]))
+
+    grupos: Dict[int, List[int]] = {}
+    for fila in sorted(uf.padre):
+        grupos.setdefault(uf.find(fila), []).append(fila)
+    return [g for g in grupos.values() if len(g) > 1]
+
+
+def grupos_duplicados(vectores: np.ndarray,
+                      recursos: List[Dict[str, Any]],
+                      umbral: float = UMBRAL_DUPLICADO,
+                      batch_size: int = 1024) -> List[List[int]]:
+    """
+    Agrupa recursos casi duplicados
+
+    Args:
+        vectores: (n, d) normalizados L2, alineados con recursos
+        recursos: Recursos del catálogo
+        umbral: Similitud coseno mínima para considerar un par
+
+    Returns:
+        Grupos de índices (cada uno ordenado), incluidos los de un solo elemento
+    """
+    cubetas: Dict[Tuple[str, str], List[int]] = {}
+    agregar_cubetas(cubetas, recursos)
+    grupos = pares_duplicados(cubetas, vectores, umbral, batch_size)
+    agrupadas = {fila for grupo in grupos for fila in grupo}
+    grupos += [[i] for i in range(len(recursos)) if i not in agrupadas]
+    grupos.sort(key=lambda g: g[0])
+    return grupos
+
+
+def _modalidades(recursos: List[Dict[str, Any]]) -> str:
+    vistas: List[str] = []
+    for r in recursos:
+        for m in (r.get('modalidad') or '').split('/'):
+            if m.strip() and m.strip() not in vistas:
+                vistas.append(m.strip())
+    return ' / '.join(vistas)
+
+
+def representante_grupo(grupo: List[int],
+                        recursos: Mapping[int, Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+    """
+    Fila y recurso que representan a un grupo de casi-duplicados
+
+    Representante: mejor rating, más reseñas, primero en el catálogo. Es una
+    copia con la modalidad y la emergencia de todo el grupo y 'variantes'
+    (resúmenes de las otras entradas). `recursos` basta con tener las filas
+    del grupo (lista completa o dict fila -> recurso).
+    """
+    rep = max(grupo, key=lambda i: (recursos[i].get('rating') or 0,
+                                    recursos[i].get('resenas') or 0, -i))
+    miembros = [recursos[i] for i in grupo]
+    representante = dict(recursos[rep])
+    representante['modalidad'] = _modalidades(miembros)
+    representante['es_emergencia'] = any(r.get('es_emergencia') for r in miembros)
+    representante['variantes'] = [{campo: recursos[i].get(campo) for campo in CAMPOS_VARIANTE}
+                                  for i in grupo if i != rep]
+    return rep, representante
+
+
+def colapsar_duplicados(vectores: np.ndarray,
+                        recursos: List[Dict[str, Any]],
+                        umbral: Optional[float] = UMBRAL_DUPLICADO
+                        ) -> Tuple[np.ndarray, List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Deja un vector por grupo de casi-duplicados
+
+    Args:
+        vectores: (n, d) normalizados L2, alineados con recursos
+        recursos: Recursos del catálogo
+        umbral: Similitud mínima; None desactiva el colapso
+
+    Returns:
+        (vectores, recursos, estadísticas); los recursos representantes son
+        copias con 'variantes' (lista de resúmenes de las otras entradas).
+        estadísticas['filas'] da la fila original de cada recurso conservado.
+    """
+    if umbral is None or len(recursos) < 2:
+        return vectores, recursos, {'antes': len(recursos), 'despues': len(recursos), 'grupos': 0,
+                                    'filas': list(range(len(recursos)))}
+
+    grupos = grupos_duplicados(vectores, recursos, umbral)
+    grupos.sort(key=lambda g: g[0])  # conservar el orden original del catálogo
+
+    filas: List[int] = []
+    colapsados: List[Dict[str, Any]] = []
+    for grupo in grupos:
+        if len(grupo) == 1:
+            filas.append(grupo[0])
+            colapsados.append(recursos[grupo[0]])
+            continue
+        rep, representante = representante_grupo(grupo, recursos)
+        filas.append(rep)
+        colapsados.append(representante)
+
+    estadisticas = {
+        'antes': len(recursos),
+        'despues': len(colapsados),
+        'grupos': sum(1 for g in grupos if len(g) > 1),
+        'umbral': umbral,
+        'filas': filas,
+    }
+    return np.ascontiguousarray(vectores[filas]), colapsados, estadisticas
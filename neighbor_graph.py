@@ -0,0 +1,220 @@
+"""
+Grafo de vecinos (kNN) precalculado sobre los vectores del índice de recursos
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+"Más como este especialista" se resuelve con una consulta al grafo en vez
+de una llamada de embeddings más una búsqueda ANN:
+- El grafo guarda, por recurso, sus k vecinos más similares (coseno) y se
+  persiste como .npz junto al índice FAISS
+- Cada fila lleva una huella (crc32) de su vector; al cambiar el índice solo
+  se recalculan las filas nuevas o modificadas y las que apuntaban a ellas,
+  el resto solo compara sus vecinos actuales contra las filas nuevas
+"""
+
+import os
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+GRAPH_VERSION = 1
+
+# Si cambia más de esta fracción del catálogo, reconstruir desde cero es más barato
+MAX_FRACCION_INCREMENTAL = 0.3
+
+
+def ruta_grafo(index_path: str) -> str:
+    """Ruta por defecto del grafo: junto al índice FAISS"""
+    return f"{os.path.splitext(index_path)[0]}_vecinos.npz"
+
+
+def huellas(vectores: np.ndarray) -> np.ndarray:
+    """crc32 de cada fila (detecta vectores nuevos o modificados)"""
+    return np.fromiter((zlib.crc32(fila.tobytes()) for fila in vectores),
+                       dtype=np.uint32, count=len(vectores))
+
+
+def vectores_indice(index: faiss.Index) -> np.ndarray:
+    """Vectores almacenados en el índice; sin copia para índices planos"""
+    if isinstance(index, faiss.IndexFlat):
+        return faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _indice_exacto(index: Optional[faiss.Index]) -> Optional[faiss.Index]:
+    """El índice si ya es plano por producto interno (se busca en él sin copiar vectores)"""
+    if isinstance(index, faiss.IndexFlat) and index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return index
+    return None
+
+
+def _vecinos_exactos(vectores: np.ndarray, filas: np.ndarray, k: int,
+                     batch_size: int, index: Optional[faiss.Index] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k por producto interno de `filas` contra todo el catálogo, sin la propia fila
+
+    Con `index` (IndexFlatIP con los mismos vectores) se busca en él por
+    lotes; si no, se arma una copia plana de `vectores`
+    """
+    if index is None:
+        index = faiss.IndexFlatIP(vectores.shape[1])
+        index.add(np.ascontiguousarray(vectores, dtype='float32'))
+    k_busqueda = min(k + 1, len(vectores))
+
+    vecinos = np.full((len(filas), k), -1, dtype=np.int32)
+    similitudes = np.zeros((len(filas), k), dtype=np.float32)
+    for inicio in range(0, len(filas), batch_size):
+        lote = filas[inicio:inicio + batch_size]
+        sims, ids = index.search(np.ascontiguousarray(vectores[lote], dtype='float32'), k_busqueda)
+        for j, fila in enumerate(lote):
+            # La propia fila no siempre sale primero si hay vectores idénticos
+            propios = ids[j] != fila
+            n = min(k, int(propios.sum()))
+            vecinos[inicio + j, :n] = ids[j][propios][:n]
+            similitudes[inicio + j, :n] = sims[j][propios][:n]
+    return vecinos, similitudes
+
+
+class NeighborGraph:
+    """
+    k vecinos más similares de cada recurso
+
+    Atributos:
+        ids: id del recurso de cada fila (mismo orden que el índice)
+        vecinos: (n, k) filas vecinas, -1 donde hay menos de k
+        similitudes: (n, k) similitud coseno de cada vecino, descendente
+        huellas: (n,) crc32 del vector de cada fila
+    """
+
+    def __init__(self, ids: Sequence[str], vecinos: np.ndarray,
+                 similitudes: np.ndarray, huellas: np.ndarray):
+        self.ids = list(ids)
+        self.vecinos = vecinos
+        self.similitudes = similitudes
+        self.huellas = huellas
+        self.fila_por_id: Dict[str, int] = {}
+        for i, id_ in enumerate(self.ids):
+            self.fila_por_id.setdefault(id_, i)
+
+    @property
+    def k(self) -> int:
+        return self.vecinos.shape[1]
+
+    @classmethod
+    def build(cls, vectores: np.ndarray, ids: Sequence[str], k: int = 20,
+              batch_size: int = 1024, index: Optional[faiss.Index] = None) -> 'NeighborGraph':
+        """Calcula el grafo completo (búsqueda exacta, vectores normalizados L2)"""
+        filas = np.arange(len(vectores))
+        vecinos, similitudes = _vecinos_exactos(vectores, filas, k, batch_size, _indice_exacto(index))
+        return cls(ids, vecinos, similitudes, huellas(vectores))
+
+    def refresh(self, vectores: np.ndarray, ids: Sequence[str], batch_size: int = 1024,
+                index: Optional[faiss.Index] = None) -> Tuple['NeighborGraph', Dict[str, int]]:
+        """
+        Actualiza el grafo al estado actual del índice (`index`, si se da,
+        debe tener los mismos vectores; ver build)
+
+        Returns:
+            (grafo nuevo, estadísticas con filas 'sucias', 'recalculadas' y 'fusionadas')
+        """
+        ids = list(ids)
+        n, k = len(ids), self.k
+        nuevas_huellas = huellas(vectores)
+        # Ids repetidos en el catálogo se emparejan por orden de aparición
+        filas_previas: Dict[str, List[int]] = {}
+        for i, id_ in enumerate(self.ids):
+            filas_previas.setdefault(id_, []).append(i)
+        anterior = np.array([filas_previas[id_].pop(0) if filas_previas.get(id_) else -1
+                             for id_ in ids], dtype=np.int64)
+        sin_cambio = anterior >= 0
+        sin_cambio[sin_cambio] = self.huellas[anterior[sin_cambio]] == nuevas_huellas[sin_cambio]
+        sucias = np.flatnonzero(~sin_cambio)
+
+        if len(sucias) == 0 and ids == self.ids:
+            return self, {'sucias': 0, 'recalculadas': 0, 'fusionadas': 0}
+        if len(sucias) > MAX_FRACCION_INCREMENTAL * n:
+            grafo = NeighborGraph.build(vectores, ids, k, batch_size, index)
+            return grafo, {'sucias': len(sucias), 'recalculadas': n, 'fusionadas': 0}
+
+        # Fila vieja -> fila nueva solo para vectores sin cambio; los demás
+        # (borrados o modificados) invalidan a quien los tenía de vecino
+        vieja_a_nueva = np.full(len(self.ids) + 1, -1, dtype=np.int64)  # el último absorbe el -1
+        vieja_a_nueva[anterior[sin_cambio]] = np.flatnonzero(sin_cambio)
+        vecinos_mapeados = vieja_a_nueva[self.vecinos[anterior.clip(0)]]
+        validos_antes = self.vecinos[anterior.clip(0)] >= 0
+        perdio_vecino = ((vecinos_mapeados < 0) & validos_antes).any(axis=1)
+
+        recalcular = np.flatnonzero(~sin_cambio | perdio_vecino)
+        fusionar = np.flatnonzero(sin_cambio & ~perdio_vecino)
+
+        vecinos = np.full((n, k), -1, dtype=np.int32)
+        similitudes = np.zeros((n, k), dtype=np.float32)
+        if len(recalcular):
+            vecinos[recalcular], similitudes[recalcular] = _vecinos_exactos(
+                vectores, recalcular, k, batch_size, _indice_exacto(index))
+
+        # Filas limpias: sus vecinos siguen siendo los mejores entre las filas
+        # sin cambio, solo falta compararlos contra las filas sucias
+        for inicio in range(0, len(fusionar), batch_size):
+            lote = fusionar[inicio:inicio + batch_size]
+            sims_sucias = vectores[lote] @ vectores[sucias].T
+            cand_ids = np.concatenate([vecinos_mapeados[lote],
+                                       np.broadcast_to(sucias, (len(lote), len(sucias)))], axis=1)
+            cand_sims = np.concatenate([self.similitudes[anterior[lote]], sims_sucias], axis=1)
+            cand_sims[cand_ids < 0] = -np.inf
+            orden = np.argsort(-cand_sims, axis=1, kind='stable')[:, :k]
+            elegidos = np.take_along_axis(cand_ids, orden, axis=1)
+            elegidas_sims = np.take_along_axis(cand_sims, orden, axis=1)
+            vacios = ~np.isfinite(elegidas_sims)
+            elegidos[vacios] = -1
+            elegidas_sims[vacios] = 0
+            m = elegidos.shape[1]
+            vecinos[lote, :m] = elegidos
+            similitudes[lote, :m] = elegidas_sims
+
+        grafo = NeighborGraph(ids, vecinos, similitudes, nuevas_huellas)
+        return grafo, {'sucias': len(sucias), 'recalculadas': len(recalcular), 'fusionadas': len(fusionar)}
+
+    def neighbors(self, resource_id: str, top_k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """[(fila, similitud)] de los vecinos del recurso; KeyError si no existe"""
+        fila = self.fila_por_id[resource_id]
+        vecinos = self.vecinos[fila]
+        validos = vecinos >= 0
+        pares = list(zip(vecinos[validos].tolist(), self.similitudes[fila][validos].tolist()))
+        return pares[:top_k] if top_k is not None else pares
+
+    def save(self, path: str):
+        """Guarda el grafo como .npz (escritura atómica)"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, version=GRAPH_VERSION, ids=np.array(self.ids, dtype=str),
+                 vecinos=self.vecinos, similitudes=self.similitudes, huellas=self.huellas)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['NeighborGraph']:
+        """Carga el grafo; None si no existe o es de otra versión"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if int(data['version']) != GRAPH_VERSION:
+                return None
+            return cls(data['ids'].tolist(), data['vecinos'], data['similitudes'], data['huellas'])
+
+
+def load_or_refresh(path: str, index: faiss.Index, ids: Sequence[str],
+                    k: int = 20) -> Tuple[NeighborGraph, Dict[str, int]]:
+    """Carga el grafo de `path` y lo pone al día con el índice (guardando si cambió)"""
+    vectores = vectores_indice(index)
+    grafo = NeighborGraph.load(path)
+    if grafo is None or grafo.k != k:
+        grafo = NeighborGraph.build(vectores, ids, k, index=index)
+        estadisticas = {'sucias': len(ids), 'recalculadas': len(ids), 'fusionadas': 0}
+    else:
+        nuevo, estadisticas = grafo.refresh(vectores, ids, index=index)
+        if nuevo is grafo:
+            return grafo, estadisticas
+        grafo = nuevo
+    grafo.save(path)
+    return grafo, estadisticas
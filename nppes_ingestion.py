@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""
+Ingesta de proveedores NPPES al índice de recursos
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Convierte el Parquet generado por
+NPPES_content_based_recommendations/fetch_mental_health_specialists.py
+al esquema `recurso` de MentalHealthRetrieval y construye el índice FAISS
+por chunks:
+
+    Parquet (lotes, solo columnas necesarias)
+      -> nppes_a_recurso -> texto_recurso
+      -> embeddings en batches -> normalizar -> index.add
+
+En memoria solo vive un chunk de registros, textos y embeddings a la vez,
+más el índice y los ids. Cada chunk de metadatos se vuelca a un archivo
+temporal junto a metadata_path; el colapso de casi-duplicados solo compara
+filas que comparten campo clave (near_duplicates.pares_duplicados, sobre
+los vectores del índice sin copiarlos), quita las sobrantes del índice en su
+lugar y el pickle final se escribe por lotes desde el volcado.
+
+Estrategias de embedding:
+- 'compuesto' (default): miles de proveedores comparten pocas taxonomías,
+  credenciales, ciudades y estados. Esos componentes se embeben una vez por
+  valor distinto (cache persistente) y se combinan localmente. Las llamadas
+  a la API pasan de O(proveedores) a O(valores distintos). El nombre no
+  entra al vector (ninguna consulta tiene señal alineada con él): queda en
+  los metadatos, igual que la ciudad en ubicacion.delegacion para los filtros.
+- 'completo': un embedding por proveedor con su texto completo
+
+Uso:
+    python nppes_ingestion.py NPPES_content_based_recommendations/data/mental_health_specialists.parquet
+
+    # En la API:
+    MentalHealthRetrieval.from_index('faiss_nppes/nppes_index.bin',
+                                     'faiss_nppes/nppes_metadata.pkl')
+"""
+
+import argparse
+import os
+import pickle
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from embedding_client import cliente_compartido
+from near_duplicates import UMBRAL_DUPLICADO, agregar_cubetas, pares_duplicados, representante_grupo
+from neighbor_graph import load_or_refresh, ruta_grafo, vectores_indice
+from retrieval_system import generate_embeddings, texto_recurso
+from snapshots import Snapshot, guardar_pickle, guardar_snapshot, nombre_snapshot
+
+load_dotenv()
+
+# Columnas del Parquet que usa la ingesta (el resto no se lee del disco)
+COLUMNAS_NPPES = [
+    'npi', 'provider_type', 'name', 'credential', 'primary_taxonomy',
+    'primary_taxonomy_code', 'all_taxonomies', 'practice_location', 'status'
+]
+
+# Especialidad NPPES -> tipo_profesional (primera coincidencia, de lo más
+# específico a lo más general)
+TAXONOMIA_TIPO_PROFESIONAL = [
+    ('child & adolescent psychiatry', 'Psiquiatra Infanto-Juvenil'),
+    ('addiction psychiatry', 'Psiquiatra en Adicciones'),
+    ('geriatric psychiatry', 'Psiquiatra Geriátrico'),
+    ('psychiatric/mental health', 'Enfermería Psiquiátrica'),
+    ('psych/mental health', 'Enfermería Psiquiátrica'),
+    ('psychiatric hospital', 'Hospital Psiquiátrico'),
+    ('psychiatric unit', 'Hospital Psiquiátrico'),
+    ('psychiatry', 'Psiquiatra'),
+    ('neuropsycholog', 'Neuropsicólogo'),
+    ('psychoanalyst', 'Psicoanalista'),
+    ('psycholog', 'Psicólogo'),
+    ('social worker', 'Trabajador Social Clínico'),
+    ('marriage & family', 'Terapeuta Familiar'),
+    ('counselor', 'Consejero en Salud Mental'),
+    ('behavior analyst', 'Analista Conductual'),
+    ('community/behavioral health', 'Centro Comunitario de Salud Mental'),
+    ('behavioral', 'Centro de Salud Conductual'),
+    ('mental health', 'Centro de Salud Mental'),
+    ('neurology', 'Neurólogo'),
+]
+TIPO_PROFESIONAL_DEFAULT = 'Profesional de Salud Mental'
+# Grupos cuyo tipo lo define la parte después de la coma:
+# 'Psychiatry & Neurology, Neurology' -> 'neurology'
+TAXONOMIA_GRUPOS = {'psychiatry & neurology'}
+
+# Grupos etarios inferidos de la especialidad
+TAXONOMIA_GRUPO_ETARIO = [
+    ('child', ['Niños', 'Adolescentes']),
+    ('adolescent', ['Adolescentes']),
+    ('geriatric', ['Adultos mayores']),
+]
+
+# NPPES no publica precios: mismo costo por defecto que usa
+# MentalHealthRetrieval._calculate_score cuando no hay información
+COSTO_DESCONOCIDO = 1500
+
+# Peso de cada componente en el embedding compuesto (todos vienen de la
+# API, un embedding cacheado por valor distinto)
+PESOS_COMPONENTES = {
+    'taxonomia': 0.80,
+    'credencial': 0.20,
+    'estado': 0.30,
+    'ciudad': 0.40,
+}
+COMPONENTES_COMPARTIDOS = ('taxonomia', 'credencial', 'estado', 'ciudad')
+
+# Nombre completo de cada estado para el texto del componente 'estado'
+ESTADOS_US = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California',
+    'CO': 'Colorado', 'CT': 'Connecticut', 'DE': 'Delaware', 'DC': 'District of Columbia',
+    'FL': 'Florida', 'GA': 'Georgia', 'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois',
+    'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas', 'KY': 'Kentucky', 'LA': 'Louisiana',
+    'ME': 'Maine', 'MD': 'Maryland', 'MA': 'Massachusetts', 'MI': 'Michigan', 'MN': 'Minnesota',
+    'MS': 'Mississippi', 'MO': 'Missouri', 'MT': 'Montana', 'NE': 'Nebraska', 'NV': 'Nevada',
+    'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico', 'NY': 'New York',
+    'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma', 'OR': 'Oregon',
+    'PA': 'Pennsylvania', 'PR': 'Puerto Rico', 'RI': 'Rhode Island', 'SC': 'South Carolina',
+    'SD': 'South Dakota', 'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont',
+    'VA': 'Virginia', 'WA': 'Washington', 'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming',
+}
+
+
+def tipo_profesional_desde_taxonomia(taxonomia: Optional[str]) -> str:
+    """'Psychiatry & Neurology, Psychiatry' -> 'Psiquiatra'"""
+    if not taxonomia:
+        return TIPO_PROFESIONAL_DEFAULT
+    texto = taxonomia.lower()
+    partes = [p.strip() for p in texto.split(',')]
+    if partes[0] in TAXONOMIA_GRUPOS and len(partes) > 1:
+        texto = partes[-1]
+    for clave, tipo in TAXONOMIA_TIPO_PROFESIONAL:
+        if clave in texto:
+            return tipo
+    return TIPO_PROFESIONAL_DEFAULT
+
+
+def nppes_a_recurso(registro: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Convierte un registro NPPES (fila del Parquet) al esquema `recurso`.
+    Retorna None si le faltan nombre o especialidad.
+    """
+    npi = registro.get('npi')
+    nombre = registro.get('name')
+    taxonomia = registro.get('primary_taxonomy')
+    if not npi or not nombre or not taxonomia:
+        return None
+
+    es_individual = registro.get('provider_type') == 'Individual'
+    tipo_profesional = tipo_profesional_desde_taxonomia(taxonomia)
+    credencial = registro.get('credential') or ''
+    especialidades = [t['desc'] for t in registro.get('all_taxonomies') or [] if t.get('desc')]
+    if taxonomia not in especialidades:
+        especialidades.insert(0, taxonomia)
+
+    grupos = []
+    for clave, grupo in TAXONOMIA_GRUPO_ETARIO:
+        if any(clave in e.lower() for e in especialidades):
+            grupos.extend(g for g in grupo if g not in grupos)
+
+    ubi = registro.get('practice_location') or {}
+    ciudad = (ubi.get('city') or '').title()
+    estado = ubi.get('state') or ''
+
+    descripcion = f"{tipo_profesional} ({taxonomia})"
+    if credencial:
+        descripcion += f", {credencial}"
+    if ciudad or estado:
+        descripcion += f" en {', '.join(p for p in (ciudad, estado) if p)}"
+
+    return {
+        'id': f"nppes_{npi}",
+        'npi': str(npi),
+        'nombre': f"{nombre}, {credencial}" if credencial and es_individual else nombre,
+        'tipo_recurso': 'especialista' if es_individual else 'servicio',
+        'tipo_profesional': tipo_profesional,
+        'institucion': '' if es_individual else nombre,
+        'descripcion': descripcion,
+        'modalidad': 'Presencial',
+        'ubicacion': {
+            'delegacion': ciudad,
+            'colonia': '',
+            'ciudad': ciudad,
+            'estado': estado,
+            'codigo_postal': (ubi.get('postal_code') or '')[:5],
+            'direccion': ubi.get('address_1') or '',
+            'latitud': '',
+            'longitud': '',
+            'modalidad': 'Presencial'
+        },
+        'costo': {
+            'promedio': COSTO_DESCONOCIDO,
+            'descripcion': 'Costo no disponible (consultar directamente)',
+            'es_gratuito': False
+        },
+        'especializaciones': especialidades,
+        'grupo_etario': grupos,
+        'genero_especialista': None,
+        'contacto': {
+            'telefono': ubi.get('telephone'),
+            'email': None,
+            'website': None
+        },
+        'rating': 0,
+        'resenas': 0,
+        'disponibilidad': '',
+        'tiene_sabado': False,
+        'metodos_pago': [],
+        'es_emergencia': False,
+        'tags_match': ' '.join(p for p in (tipo_profesional.lower(), taxonomia.lower(),
+                                           credencial.lower(), ciudad.lower(), estado.lower(),
+                                           'nppes') if p),
+        'tipo_servicio': None if es_individual else tipo_profesional,
+        'credencial': credencial or None,
+    }
+
+
+def componentes_recurso(recurso: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Divide el texto de un recurso NPPES en los componentes que comparte
+    con otros proveedores (taxonomía, credencial, estado, ciudad)
+    """
+    ubi = recurso.get('ubicacion', {})
+    estado = ubi.get('estado', '')
+    taxonomia = ' '.join([recurso.get('tipo_profesional', ''), recurso.get('tipo_recurso', '')]
+                         + recurso.get('especializaciones', []))
+    return {
+        'taxonomia': taxonomia,
+        'credencial': recurso.get('credencial') or '',
+        'estado': f"{ESTADOS_US.get(estado, estado)} ({estado}), USA" if estado else '',
+        'ciudad': f"{ubi['ciudad']}, {ESTADOS_US.get(estado, estado)}" if ubi.get('ciudad') else '',
+    }
+
+
+class ComponentEmbeddingCache:
+    """
+    Embeddings normalizados por texto de componente, calculados una vez
+    por valor distinto y persistidos por modelo
+
+    Args:
+        client: Cliente con .embeddings.create
+        model: Modelo de embeddings
+        path: Pickle opcional donde se guarda el cache entre corridas
+        batch_size: Textos por llamada a la API
+    """
+
+    def __init__(self, client: Any, model: str, path: Optional[str] = None, batch_size: int = 100):
+        self.client = client
+        self.model = model
+        self.path = path
+        self.batch_size = batch_size
+        self.embeddings: Dict[str, np.ndarray] = {}
+        self.llamadas = 0
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('model') == model:
+                self.embeddings = data['embeddings']
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return len(next(iter(self.embeddings.values()))) if self.embeddings else None
+
+    def get_many(self, textos: List[str]) -> np.ndarray:
+        """Matriz (len(textos), d); textos vacíos -> vector cero"""
+        faltantes = sorted({t for t in textos if t and t not in self.embeddings})
+        self.misses += len(faltantes)
+        self.hits += sum(1 for t in textos if t) - len(faltantes)
+        if faltantes:
+            nuevos = generate_embeddings(self.client, self.model, faltantes,
+                                         batch_size=self.batch_size, verbose=False)
+            faiss.normalize_L2(nuevos)
+            self.llamadas += (len(faltantes) - 1) // self.batch_size + 1
+            self.embeddings.update(zip(faltantes, nuevos))
+        dimension = self.dimension
+        cero = np.zeros(dimension, dtype='float32')
+        return np.stack([self.embeddings[t] if t else cero for t in textos])
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        guardar_pickle(self.path, {'model': self.model, 'embeddings': self.embeddings})
+
+
+def embeddings_compuestos(recursos: List[Dict[str, Any]],
+                          cache: ComponentEmbeddingCache,
+                          pesos: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """
+    Embedding por recurso = suma ponderada de componentes, normalizada L2.
+    Solo los valores de componente nuevos llaman a la API.
+    """
+    pesos = pesos or PESOS_COMPONENTES
+    componentes = [componentes_recurso(r) for r in recursos]
+    total = None
+    for nombre in COMPONENTES_COMPARTIDOS:
+        parcial = pesos[nombre] * cache.get_many([c[nombre] for c in componentes])
+        total = parcial if total is None else total + parcial
+    total = np.ascontiguousarray(total, dtype='float32')
+    faiss.normalize_L2(total)
+    return total
+
+
+def iter_recursos_nppes(parquet_path: str,
+                        chunk_size: int = 2000,
+                        limit: Optional[int] = None,
+                        estados: Optional[List[str]] = None) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Lee el Parquet por lotes y produce (registros leídos, recursos válidos).
+    Con `estados` solo se conservan los recursos de esos estados (un shard por región).
+    """
+    estados = {e.upper() for e in estados} if estados else None
+    parquet_file = pq.ParquetFile(parquet_path)
+    leidos = 0
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=COLUMNAS_NPPES):
+        registros = batch.to_pylist()
+        if limit is not None:
+            registros = registros[:max(0, limit - leidos)]
+        leidos += len(registros)
+        recursos = [r for r in map(nppes_a_recurso, registros) if r is not None]
+        if estados is not None:
+            recursos = [r for r in recursos if r['ubicacion']['estado'].upper() in estados]
+        yield len(registros), recursos
+        if limit is not None and leidos >= limit:
+            return
+
+
+def _leer_volcado(path: str) -> Iterator[List[Dict[str, Any]]]:
+    """Chunks de recursos volcados por ingest_nppes, en orden"""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _lotes_colapsados(path: str, quitadas: Set[int],
+                      representantes: Dict[int, Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    """Chunks del volcado sin las filas colapsadas, con cada representante en su fila"""
+    fila = 0
+    for chunk in _leer_volcado(path):
+        lote = []
+        for recurso in chunk:
+            if fila not in quitadas:
+                lote.append(representantes.get(fila, recurso))
+            fila += 1
+        yield lote
+
+
+def ingest_nppes(parquet_path: str,
+                 index_path: str = 'faiss_nppes/nppes_index.bin',
+                 metadata_path: str = 'faiss_nppes/nppes_metadata.pkl',
+                 client: Any = None,
+                 openai_model: str = 'text-embedding-3-small',
+                 embedding_batch_size: int = 100,
+                 chunk_size: int = 2000,
+                 limit: Optional[int] = None,
+                 estrategia: str = 'compuesto',
+                 cache_path: Optional[str] = 'faiss_nppes/componentes_cache.pkl',
+                 estados: Optional[List[str]] = None,
+                 umbral_duplicados: Optional[float] = UMBRAL_DUPLICADO) -> Dict[str, Any]:
+    """
+    Construye un índice FAISS + metadatos compatibles con
+    MentalHealthRetrieval.from_index a partir del Parquet de NPPES
+
+    Args:
+        parquet_path: Parquet con el esquema de provider_parquet.PROVIDER_SCHEMA
+        index_path: Ruta del índice FAISS de salida
+        metadata_path: Ruta del pickle {'especialistas': [...]} de salida (escrito por
+            lotes; se lee con snapshots.leer_metadatos)
+        client: Cliente con .embeddings.create (default: embedding_client.cliente_compartido())
+        openai_model: Modelo de embeddings (debe coincidir con el de la API)
+        embedding_batch_size: Textos por llamada a la API de embeddings
+        chunk_size: Registros leídos, embebidos y agregados al índice por paso
+        limit: Máximo de registros a leer (para pruebas)
+        estrategia: 'compuesto' (componentes cacheados + features locales)
+            o 'completo' (un embedding por proveedor)
+        cache_path: Cache persistente de embeddings de componentes
+        estados: Códigos de estado a conservar (ej. ['TX']) para construir
+            el shard de una región (ver region_shards.py); None = todos
+        umbral_duplicados: Similitud para colapsar casi-duplicados (ver
+            near_duplicates.py); None = no colapsar
+
+    Returns:
+        Estadísticas de la ingesta
+    """
+    if client is None:
+        client = cliente_compartido()
+
+    if estrategia not in ('compuesto', 'completo'):
+        raise ValueError(f"Estrategia desconocida: {estrategia}")
+    for path in (index_path, metadata_path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    cache = ComponentEmbeddingCache(client, openai_model, cache_path, embedding_batch_size)
+    llamadas = 0
+
+    total = pq.ParquetFile(parquet_path).metadata.num_rows
+    if limit is not None:
+        total = min(total, limit)
+    print(f"Ingestando hasta {total} proveedores NPPES desde {parquet_path}")
+
+    index = None
+    ids: List[str] = []
+    cubetas: Dict[Tuple[str, str], List[int]] = {}
+    procesados = 0
+    inicio = time.time()
+    volcado = f"{metadata_path}.{os.getpid()}.volcado"
+
+    try:
+        with open(volcado, 'wb') as f:
+            for leidos, chunk in iter_recursos_nppes(parquet_path, chunk_size, limit, estados):
+                procesados += leidos
+                if chunk and estrategia == 'compuesto':
+                    embeddings = embeddings_compuestos(chunk, cache)
+                elif chunk:
+                    embeddings = generate_embeddings(client, openai_model,
+                                                     [texto_recurso(r) for r in chunk],
+                                                     batch_size=embedding_batch_size, verbose=False)
+                    llamadas += (len(chunk) - 1) // embedding_batch_size + 1
+                    faiss.normalize_L2(embeddings)
+                if chunk:
+                    if index is None:
+                        index = faiss.IndexFlatIP(embeddings.shape[1])
+                    index.add(embeddings)
+                    if umbral_duplicados is not None:
+                        agregar_cubetas(cubetas, chunk, inicio=len(ids))
+                    ids.extend(r['id'] for r in chunk)
+                    pickle.dump(chunk, f)
+
+                transcurrido = time.time() - inicio
+                tasa = procesados / transcurrido if transcurrido > 0 else 0
+                restante = (total - procesados) / tasa if tasa > 0 else 0
+                print(f"  {procesados}/{total} leidos, {len(ids)} indexados "
+                      f"({tasa:.0f} registros/s, ~{restante:.0f}s restantes)")
+
+        if index is None:
+            raise ValueError(f"No hay proveedores validos en {parquet_path}")
+        if estrategia == 'compuesto':
+            cache.save()
+            llamadas = cache.llamadas
+
+        # Organizaciones registradas con varios NPI (misma clínica, mismo
+        # teléfono): solo se comparan filas que comparten campo clave y solo
+        # se leen del volcado los recursos de esos grupos
+        antes = index.ntotal
+        grupos = pares_duplicados(cubetas, vectores_indice(index), umbral_duplicados) if cubetas else []
+        del cubetas
+        en_grupo = {fila for grupo in grupos for fila in grupo}
+        miembros: Dict[int, Dict[str, Any]] = {}
+        if en_grupo:
+            fila = 0
+            for chunk in _leer_volcado(volcado):
+                for recurso in chunk:
+                    if fila in en_grupo:
+                        miembros[fila] = recurso
+                    fila += 1
+        representantes: Dict[int, Dict[str, Any]] = {}
+        quitadas: Set[int] = set()
+        for grupo in grupos:
+            rep, representantes[rep] = representante_grupo(grupo, miembros)
+            quitadas.update(fila for fila in grupo if fila != rep)
+        del miembros
+        if quitadas:
+            # IndexFlat compacta en su lugar y conserva el orden de las demás filas
+            index.remove_ids(np.array(sorted(quitadas), dtype='int64'))
+            ids = [id_ for fila, id_ in enumerate(ids) if fila not in quitadas]
+            print(f"Casi-duplicados colapsados: {antes} -> {index.ntotal} "
+                  f"recursos ({len(grupos)} grupos)")
+
+        guardar_snapshot(Snapshot(nombre_snapshot(index_path), index_path, metadata_path), index,
+                         {}, openai_model, fuente=parquet_path,
+                         parametros={'indice': 'IndexFlatIP', 'estrategia': estrategia,
+                                     'umbral_duplicados': umbral_duplicados, 'estados': estados,
+                                     'limit': limit},
+                         lotes=('especialistas', _lotes_colapsados(volcado, quitadas, representantes)))
+    finally:
+        if os.path.exists(volcado):
+            os.remove(volcado)
+
+    # Grafo de vecinos fuera de línea, para que la API solo lo cargue; la
+    # búsqueda exacta va por lotes sobre el mismo índice, sin copiar vectores
+    _, cambios_grafo = load_or_refresh(ruta_grafo(index_path), index, ids)
+
+    estadisticas = {
+        'leidos': procesados,
+        'indexados': index.ntotal,
+        'descartados': procesados - antes,
+        'duplicados_colapsados': antes - index.ntotal,
+        'dimension': index.d,
+        'estrategia': estrategia,
+        'llamadas_embeddings': llamadas,
+        'componentes_distintos': len(cache.embeddings) if estrategia == 'compuesto' else None,
+        'vecinos_recalculados': cambios_grafo['recalculadas'],
+        'segundos': round(time.time() - inicio, 1),
+        'index_path': index_path,
+        'metadata_path': metadata_path,
+    }
+    print(f"Indice guardado en {index_path}: {index.ntotal} recursos "
+          f"({estadisticas['descartados']} descartados) en {estadisticas['segundos']}s, "
+          f"{llamadas} llamadas de embeddings ({estrategia})")
+    return estadisticas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingesta de proveedores NPPES al indice de recursos')
+    parser.add_argument('parquet_path')
+    parser.add_argument('--index-path', default='faiss_nppes/nppes_index.bin')
+    parser.add_argument('--metadata-path', default='faiss_nppes/nppes_metadata.pkl')
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--estrategia', choices=['compuesto', 'completo'], default='compuesto')
+    parser.add_argument('--umbral-duplicados', type=float, default=UMBRAL_DUPLICADO,
+                        help='Similitud para colapsar casi-duplicados (0 = no colapsar)')
+    parser.add_argument('--estados', nargs='+', default=None,
+                        help='Solo estos estados (ej. TX NM), para un shard regional')
+    args = parser.parse_args()
+
+    ingest_nppes(args.parquet_path, args.index_path, args.metadata_path,
+                 embedding_batch_size=args.batch_size, chunk_size=args.chunk_size,
+                 limit=args.limit, estrategia=args.estrategia, estados=args.estados,
+                 umbral_duplicados=args.umbral_duplicados or None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Sub-índices FAISS por tipo de recurso
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Cada partición (especialistas, servicios, herramientas digitales y,
+opcionalmente, cada tipo_profesional) tiene su propio IndexFlatIP con las
+filas del índice principal que le pertenecen, así una búsqueda acotada a un
+tipo solo recorre esa partición y las listas mixtas se arman con una cuota
+por partición en vez de sobre-pedir candidatos al índice completo.
+
+Las particiones guardan copias de los vectores: con todas activas la memoria
+de vectores se duplica (las particiones por tipo_recurso cubren el catálogo).
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+
+def es_recurso_digital(recurso: Dict[str, Any]) -> bool:
+    """Apps y herramientas digitales, sean 'especialista' o 'servicio'"""
+    modalidad = (recurso.get('modalidad') or '').lower()
+    tipo = (recurso.get('tipo_profesional') or '').lower()
+    return 'app' in modalidad.replace('/', ' ').split() or 'digital' in tipo
+
+
+PARTICIONES: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+    'especialista': lambda r: r.get('tipo_recurso') == 'especialista',
+    'servicio': lambda r: r.get('tipo_recurso') == 'servicio',
+    'digital': es_recurso_digital,
+}
+
+
+class PartitionedIndex:
+    """
+    Sub-índices sobre un subconjunto de filas del índice principal
+
+    Args:
+        vectores: (n, d) vectores del índice principal (normalizados L2)
+        recursos: Recursos alineados con los vectores
+        particiones: Nombre -> predicado de pertenencia (pueden solaparse)
+        por_tipo_profesional: Si True, agrega una partición por cada
+            tipo_profesional, llamada 'tipo_profesional:<valor>'
+    """
+
+    def __init__(self,
+                 vectores: np.ndarray,
+                 recursos: List[Dict[str, Any]],
+                 particiones: Optional[Dict[str, Callable[[Dict[str, Any]], bool]]] = None,
+                 por_tipo_profesional: bool = False):
+        particiones = dict(PARTICIONES if particiones is None else particiones)
+        if por_tipo_profesional:
+            for tipo in {r.get('tipo_profesional') for r in recursos if r.get('tipo_profesional')}:
+                particiones[f"tipo_profesional:{tipo}"] = lambda r, tipo=tipo: r.get('tipo_profesional') == tipo
+
+        self._indices: Dict[str, faiss.Index] = {}
+        self._filas: Dict[str, np.ndarray] = {}
+        for nombre, pertenece in particiones.items():
+            filas = np.array([i for i, r in enumerate(recursos) if pertenece(r)], dtype=np.int64)
+            if len(filas) == 0:
+                continue
+            index = faiss.IndexFlatIP(vectores.shape[1])
+            index.add(np.ascontiguousarray(vectores[filas], dtype='float32'))
+            self._indices[nombre] = index
+            self._filas[nombre] = filas
+
+    @property
+    def nombres(self) -> List[str]:
+        return list(self._indices)
+
+    def tamanos(self) -> Dict[str, int]:
+        return {nombre: index.ntotal for nombre, index in self._indices.items()}
+
+    def __contains__(self, nombre: str) -> bool:
+        return nombre in self._indices
+
+    def search(self, nombre: str, query_embedding: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Igual que index.search pero solo sobre la partición; los índices
+        retornados son filas del índice principal (-1 si no hay más)
+        """
+        index = self._indices[nombre]
+        similitudes, locales = index.search(query_embedding, min(k, index.ntotal))
+        globales = np.where(locales >= 0, self._filas[nombre][locales.clip(0)], -1)
+        return similitudes, globales
@@ -0,0 +1,203 @@
+"""
+Perfilado bajo demanda de requests en producción
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Un request se perfila si trae el header X-Profile con el ADMIN_TOKEN, o al
+azar con probabilidad PROFILE_SAMPLE_RATE. Mientras dura, un hilo muestrea
+la pila del hilo que atiende el request (sys._current_frames) cada
+PROFILE_INTERVAL_MS y acumula pilas colapsadas ("a;b;c 12"), el formato que
+leen flamegraph.pl, speedscope e inferno. Al cerrar la respuesta (después
+del cuerpo, también en streaming) se guardan en PROFILE_DIR:
+- <id>.folded: pilas colapsadas
+- <id>.json: endpoint, status, duración y tiempos por etapa (metrics.py)
+
+Apagado (sin ADMIN_TOKEN ni PROFILE_SAMPLE_RATE) no crea hilos ni toca las
+métricas; el costo es revisar un header. Para que sea seguro dejarlo en
+Render se limitan los perfiles simultáneos, la duración del muestreo y el
+número de archivos guardados (el disco de Render es efímero: los perfiles
+se descargan con GET /admin/profiles/<id>).
+"""
+
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import etapas_request, tiempos_etapas
+
+HEADER_PERFIL = 'X-Profile'
+
+
+def _nombre_frame(frame) -> str:
+    codigo = frame.f_code
+    modulo = frame.f_globals.get('__name__', '?')
+    return f"{modulo}:{getattr(codigo, 'co_qualname', codigo.co_name)}"
+
+
+class SamplingProfiler:
+    """
+    Muestrea la pila de un hilo a intervalo fijo desde otro hilo
+
+    Args:
+        thread_id: Hilo a muestrear (threading.get_ident() del request)
+        intervalo: Segundos entre muestras
+        max_segundos: Deja de muestrear pasado este tiempo
+    """
+
+    def __init__(self, thread_id: int, intervalo: float = 0.005, max_segundos: float = 30.0):
+        self.thread_id = thread_id
+        self.intervalo = intervalo
+        self.max_segundos = max_segundos
+        self.pilas: Counter = Counter()
+        self.muestras = 0
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, name='profiler', daemon=True)
+
+    def start(self) -> 'SamplingProfiler':
+        self._hilo.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._detener.set()
+        self._hilo.join()
+        return self.pilas
+
+    def _muestrear(self):
+        limite = time.monotonic() + self.max_segundos
+        while not self._detener.wait(self.intervalo) and time.monotonic() < limite:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            pila = []
+            while frame is not None:
+                pila.append(_nombre_frame(frame))
+                frame = frame.f_back
+            self.pilas[';'.join(reversed(pila))] += 1
+            self.muestras += 1
+
+
+class RequestProfile:
+    """Perfil en curso de un request"""
+
+    def __init__(self, profiler: SamplingProfiler):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.profiler = profiler
+        self.inicio = time.perf_counter()
+        self.etapas: List[Tuple[str, float]] = []
+
+    def tiempos_etapas(self) -> Dict[str, float]:
+        """Milisegundos por etapa (sumados si la etapa ocurrió varias veces)"""
+        return tiempos_etapas(self.etapas)
+
+    def server_timing(self) -> str:
+        """Header Server-Timing (visible en las devtools del navegador)"""
+        return ', '.join(f"{nombre};dur={ms}" for nombre, ms in self.tiempos_etapas().items())
+
+
+class RequestProfiler:
+    """
+    Decide qué requests se perfilan y guarda los resultados
+
+    Args:
+        admin_token: Token que habilita el header X-Profile (None lo deshabilita)
+        sample_rate: Fracción de requests perfilados al azar (0 = ninguno)
+        directorio: Dónde se guardan los perfiles
+        intervalo_ms: Intervalo de muestreo
+        max_simultaneos: Perfiles en curso a la vez; los demás requests no se perfilan
+        max_archivos: Perfiles guardados; se borran los más viejos
+        max_segundos: Duración máxima del muestreo por request
+    """
+
+    def __init__(self,
+                 admin_token: Optional[str] = None,
+                 sample_rate: float = 0.0,
+                 directorio: str = '/tmp/calma_profiles',
+                 intervalo_ms: float = 5.0,
+                 max_simultaneos: int = 2,
+                 max_archivos: int = 100,
+                 max_segundos: float = 30.0):
+        self.admin_token = admin_token or None
+        self.sample_rate = sample_rate
+        self.directorio = directorio
+        self.intervalo = intervalo_ms / 1000
+        self.max_archivos = max_archivos
+        self.max_segundos = max_segundos
+        self._cupos = threading.BoundedSemaphore(max_simultaneos)
+
+    @classmethod
+    def from_env(cls) -> 'RequestProfiler':
+        return cls(admin_token=os.getenv('ADMIN_TOKEN'),
+                   sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+                   directorio=os.getenv('PROFILE_DIR', '/tmp/calma_profiles'),
+                   intervalo_ms=float(os.getenv('PROFILE_INTERVAL_MS', '5')),
+                   max_simultaneos=int(os.getenv('PROFILE_MAX_CONCURRENT', '2')),
+                   max_archivos=int(os.getenv('PROFILE_MAX_FILES', '100')))
+
+    @property
+    def activo(self) -> bool:
+        return self.admin_token is not None or self.sample_rate > 0
+
+    def autorizado(self, token: Optional[str]) -> bool:
+        """True si `token` es el ADMIN_TOKEN (comparación en tiempo constante)"""
+        return (self.admin_token is not None and token is not None
+                and hmac.compare_digest(token.encode(), self.admin_token.encode()))
+
+    def iniciar(self, token: Optional[str]) -> Optional[RequestProfile]:
+        """Empieza a perfilar el request actual si corresponde; None si no"""
+        if not (self.autorizado(token) or (self.sample_rate > 0 and random.random() < self.sample_rate)):
+            return None
+        if not self._cupos.acquire(blocking=False):
+            return None
+        profiler = SamplingProfiler(threading.get_ident(), self.intervalo, self.max_segundos)
+        perfil = RequestProfile(profiler.start())
+        etapas_request.set(perfil.etapas)
+        return perfil
+
+    def terminar(self, perfil: RequestProfile, info: Dict[str, Any]) -> Optional[str]:
+        """Detiene el muestreo y guarda el perfil; retorna la ruta del .folded"""
+        etapas_request.set(None)
+        try:
+            pilas = perfil.profiler.stop()
+        finally:
+            self._cupos.release()
+
+        os.makedirs(self.directorio, exist_ok=True)
+        base = os.path.join(self.directorio, perfil.id)
+        with open(f"{base}.folded", 'w', encoding='utf-8') as f:
+            for pila, n in pilas.most_common():
+                f.write(f"{pila} {n}\n")
+        with open(f"{base}.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                'id': perfil.id,
+                **info,
+                'duracion_ms': round((time.perf_counter() - perfil.inicio) * 1000, 3),
+                'muestras': perfil.profiler.muestras,
+                'intervalo_ms': self.intervalo * 1000,
+                'etapas_ms': perfil.tiempos_etapas(),
+            }, f, ensure_ascii=False, indent=2)
+        self._podar()
+        return f"{base}.folded"
+
+    def _podar(self):
+        """Borra los perfiles más viejos por encima de max_archivos"""
+        perfiles = sorted(nombre[:-len('.json')] for nombre in os.listdir(self.directorio)
+                          if nombre.endswith('.json'))
+        for viejo in perfiles[:max(0, len(perfiles) - self.max_archivos)]:
+            for extension in ('.json', '.folded'):
+                try:
+                    os.remove(os.path.join(self.directorio, viejo + extension))
+                except FileNotFoundError:
+                    pass
+
+    def ruta(self, perfil_id: str, extension: str) -> Optional[str]:
+        """Ruta de un perfil guardado (None si no existe o el id no es válido)"""
+        if not perfil_id or os.path.basename(perfil_id) != perfil_id or perfil_id.startswith('.'):
+            return None
+        ruta = os.path.join(self.directorio, perfil_id + extension)
+        return ruta if os.path.exists(ruta) else None
@@ -1,27 +1,27 @@
 #!/usr/bin/env python3
 """
 Script para REGENERAR el índice FAISS con los datos actualizados
-Ejecutar cuando se actualiza recursos_salud_mental_cdmx.json
+Ejecutar cuando se actualiza recursos_salud_mental_cdmx.json y versionar
+después faiss_recursos/ (índice, metadatos y manifest.json), para que el
+arranque no tenga que embeber nada
+
+    python rebuild_faiss_index.py            # solo recursos nuevos o modificados
+    python rebuild_faiss_index.py --completo # volver a embeber todo
 """
 
-import os
-import shutil
+import sys
 from retrieval_system import MentalHealthRetrieval
 
-# Eliminar cache viejo
-cache_dir = 'faiss_recursos'
-if os.path.exists(cache_dir):
-    print(f"🗑️  Eliminando cache viejo: {cache_dir}")
-    shutil.rmtree(cache_dir)
-    print("✓ Cache eliminado")
-
-# Regenerar índice con force_rebuild=True
+# Sin borrar faiss_recursos/: el snapshot se reemplaza de forma atómica
+# (ver snapshots.py), así que un error a mitad de camino deja el anterior
+completo = '--completo' in sys.argv[1:]
 print("\n🔄 Regenerando índice FAISS con datos actualizados...")
-print("⏳ Esto tomará unos minutos (generando embeddings con OpenAI)...\n")
+print("⏳ Generando embeddings con OpenAI para "
+      + ("todos los recursos" if completo else "los recursos nuevos o modificados") + "...\n")
 
 retrieval_system = MentalHealthRetrieval(
     'recursos_salud_mental_cdmx.json',
-    force_rebuild=True  # Forzar regeneración
+    force_rebuild=completo
 )
 
 print("\n" + "="*70)
@@ -0,0 +1,394 @@
+"""
+Índices de recursos particionados por región
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Cada región (una ciudad como CDMX, o un estado de EE.UU. construido con
+nppes_ingestion.py) tiene su propio índice FAISS + metadatos:
+- RegionShardManager carga los shards bajo demanda y descarga el menos
+  usado recientemente al superar max_activas, así la memoria crece con las
+  regiones activas y no con todo el país
+- El router elige shards a partir de la ubicación del request (alias de la
+  región o localidades conocidas); sin ubicación reconocible usa la región
+  por defecto o consulta en paralelo las regiones de fan_out (todas las
+  configuradas si no se indica) y mezcla el top-k
+- La query se embebe una sola vez y el mismo vector se usa en todos los shards
+
+Configuración (JSON, ruta en la variable REGIONS_CONFIG):
+{
+  "default": "cdmx",
+  "fan_out": ["cdmx", "tx"],
+  "max_activas": 4,
+  "regiones": {
+    "cdmx": {
+      "json_path": "recursos_salud_mental_cdmx.json",
+      "index_path": "faiss_recursos/recursos_index.bin",
+      "metadata_path": "faiss_recursos/recursos_metadata.pkl",
+      "alias": ["cdmx", "ciudad de méxico", "mexico city"],
+      "localidades": ["Coyoacán", "Benito Juárez", "Tlalpan"]
+    },
+    "tx": {
+      "index_path": "faiss_nppes/tx_index.bin",
+      "metadata_path": "faiss_nppes/tx_metadata.pkl",
+      "alias": ["texas", "tx"]
+    }
+  }
+}
+"""
+
+import dataclasses
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+from embedding_client import ClienteDelProceso
+
+from async_embeddings import precalculado
+from crisis_detection import SemanticCrisisClassifier, SemanticCrisisResult
+from metrics import etapa, map_con_contexto, registrar_cache, registrar_degradada, registrar_tokens
+from retrieval_system import MentalHealthRetrieval, QueryFilters
+from text_matching import PatternMatcher, normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RegionConfig:
+    """Archivos y nombres de una región"""
+    nombre: str
+    index_path: str
+    metadata_path: str
+    json_path: Optional[str] = None  # Si existe, el shard se (re)construye desde el JSON
+    alias: List[str] = field(default_factory=list)  # Nombres de la región completa
+    localidades: List[str] = field(default_factory=list)  # Zonas dentro de la región
+
+
+@dataclass
+class RegionRoute:
+    """Decisión del router"""
+    regiones: List[str]
+    motivo: str  # 'explicita', 'ubicacion', 'default' o 'fan_out'
+    # Ubicación sin los alias de región ('Austin, Texas' -> 'Austin'),
+    # para seguir filtrando por delegación/ciudad dentro del shard
+    ubicacion_local: Optional[str] = None
+
+
+class RegionShardManager:
+    """
+    Shards de MentalHealthRetrieval por región con carga perezosa y LRU
+
+    Args:
+        regiones: Configuración por nombre de región
+        default: Región usada cuando el request no trae ubicación reconocible
+            (None = consultar en paralelo las regiones de fan_out)
+        fan_out: Regiones consultadas sin ubicación reconocible ni default
+            (None = todas las configuradas). Es una lista fija y no los shards
+            cargados, para que el resultado no dependa del worker ni del LRU
+        max_activas: Máximo de shards en memoria a la vez
+        openai_model: Modelo de embeddings (el mismo con que se construyeron los shards)
+        prototypes_path: Prototipos del clasificador de crisis, compartidos por todos los shards
+        fan_out_workers: Hilos para consultar varios shards en paralelo
+    """
+
+    # El del proceso que busca (ver embedding_client.py)
+    client = ClienteDelProceso()
+
+    def __init__(self,
+                 regiones: Dict[str, RegionConfig],
+                 default: Optional[str] = None,
+                 fan_out: Optional[List[str]] = None,
+                 max_activas: int = 4,
+                 openai_model: str = 'text-embedding-3-small',
+                 prototypes_path: str = 'faiss_recursos/crisis_prototypes.pkl',
+                 fan_out_workers: int = 4):
+        if default is not None and default not in regiones:
+            raise ValueError(f"Región por defecto desconocida: {default}")
+        desconocidas = [nombre for nombre in fan_out or [] if nombre not in regiones]
+        if desconocidas:
+            raise ValueError(f"Regiones de fan_out desconocidas: {desconocidas}")
+        self.regiones = regiones
+        self.default = default
+        self.fan_out = list(dict.fromkeys(fan_out)) if fan_out else list(regiones)
+        self.max_activas = max(1, max_activas)
+        self.openai_model = openai_model
+        self.prototypes_path = prototypes_path
+
+        self._shards: "OrderedDict[str, MentalHealthRetrieval]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {nombre: threading.Lock() for nombre in regiones}
+        self._executor = ThreadPoolExecutor(max_workers=fan_out_workers,
+                                            thread_name_prefix='region-shard')
+        self.stats = {'cargas': 0, 'descargas': 0, 'hits': 0}
+
+        self.crisis_classifier = SemanticCrisisClassifier.load(prototypes_path)
+
+        # Alias y localidades en un solo matcher: valor = (región, es_alias)
+        patrones = [(alias, (nombre, True)) for nombre, cfg in regiones.items() for alias in cfg.alias]
+        patrones += [(loc, (nombre, False)) for nombre, cfg in regiones.items() for loc in cfg.localidades]
+        self._matcher = PatternMatcher(patrones, whole_words=True)
+        self._alias = {normalizar_texto(alias) for cfg in regiones.values() for alias in cfg.alias}
+
+    @classmethod
+    def from_config(cls, path: str, **kwargs) -> 'RegionShardManager':
+        """Crea el manager desde el JSON de configuración (ver docstring del módulo)"""
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        regiones = {nombre: RegionConfig(nombre=nombre, **cfg)
+                    for nombre, cfg in config['regiones'].items()}
+        opciones = {k: config[k] for k in ('default', 'fan_out', 'max_activas', 'openai_model', 'prototypes_path')
+                    if k in config}
+        opciones.update(kwargs)
+        return cls(regiones, **opciones)
+
+    # ------------------------------------------------------------------ shards
+
+    def get(self, region: str) -> MentalHealthRetrieval:
+        """Shard de la región, cargándolo si hace falta (LRU)"""
+        with self._lock:
+            shard = self._shards.get(region)
+            if shard is not None:
+                self._shards.move_to_end(region)
+                self.stats['hits'] += 1
+                registrar_cache('shard_region', True)
+                return shard
+        if region not in self.regiones:
+            raise KeyError(f"Región desconocida: {region}")
+
+        # Un lock por región: dos requests a una región fría la cargan una vez
+        with self._load_locks[region]:
+            with self._lock:
+                shard = self._shards.get(region)
+                if shard is not None:
+                    self._shards.move_to_end(region)
+                    return shard
+            registrar_cache('shard_region', False)
+            shard = self._load(self.regiones[region])
+            with self._lock:
+                self._shards[region] = shard
+                self.stats['cargas'] += 1
+                while len(self._shards) > self.max_activas:
+                    descargada, _ = self._shards.popitem(last=False)
+                    self.stats['descargas'] += 1
+                    logger.info(f"Shard descargado (LRU): {descargada}")
+        return shard
+
+    def _load(self, cfg: RegionConfig) -> MentalHealthRetrieval:
+        logger.info(f"Cargando shard de región: {cfg.nombre}")
+        if cfg.json_path:
+            return MentalHealthRetrieval(cfg.json_path,
+                                         openai_model=self.openai_model,
+                                         index_path=cfg.index_path,
+                                         metadata_path=cfg.metadata_path,
+                                         prototypes_path=self.prototypes_path)
+        return MentalHealthRetrieval.from_index(cfg.index_path, cfg.metadata_path,
+                                                openai_model=self.openai_model,
+                                                prototypes_path=self.prototypes_path)
+
+    def unload(self, region: str) -> bool:
+        with self._lock:
+            if self._shards.pop(region, None) is None:
+                return False
+            self.stats['descargas'] += 1
+            return True
+
+    @property
+    def activas(self) -> List[str]:
+        with self._lock:
+            return list(self._shards)
+
+    def tamanos(self) -> Dict[str, int]:
+        """Recursos de cada shard cargado"""
+        with self._lock:
+            return {nombre: len(shard.especialistas) for nombre, shard in self._shards.items()}
+
+    # ------------------------------------------------------------------ router
+
+    def route(self, ubicacion: Optional[str] = None, region: Optional[str] = None) -> RegionRoute:
+        """
+        Elige los shards para un request
+
+        Prioridad: región explícita > alias/localidad en la ubicación >
+        región por defecto > fan-out sobre las regiones de fan_out
+        """
+        if region:
+            if region not in self.regiones:
+                raise KeyError(f"Región desconocida: {region}")
+            return RegionRoute([region], 'explicita', ubicacion or None)
+
+        if ubicacion:
+            encontradas = []
+            for _, (nombre, _es_alias), _pos in self._matcher.find_all(ubicacion):
+                if nombre not in encontradas:
+                    encontradas.append(nombre)
+            if len(encontradas) == 1:
+                return RegionRoute(encontradas, 'ubicacion', self._sin_alias(ubicacion))
+            if encontradas:
+                # Varias regiones: la ubicación no sirve como filtro dentro de un shard
+                return RegionRoute(encontradas, 'ubicacion', None)
+
+        if self.default:
+            return RegionRoute([self.default], 'default', ubicacion or None)
+        return RegionRoute(list(self.fan_out), 'fan_out', ubicacion or None)
+
+    def _sin_alias(self, ubicacion: str) -> Optional[str]:
+        """Quita de la ubicación las partes que solo nombran la región"""
+        partes = [p.strip() for p in ubicacion.split(',')]
+        locales = [p for p in partes if p and normalizar_texto(p) not in self._alias]
+        return ', '.join(locales) or None
+
+    # ---------------------------------------------------------------- búsqueda
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embedding normalizado (1, d), compartido por todos los shards"""
+        return self.embed_queries([query])
+
+    def embed_queries(self, textos: List[str]) -> np.ndarray:
+        """Embeddings (m, d) normalizados, una llamada para los no precalculados"""
+        vectores = [precalculado(self.openai_model, texto) for texto in textos]
+        faltantes = [i for i, vector in enumerate(vectores) if vector is None]
+        if faltantes:
+            with etapa('embedding'):
+                resp = self.client.embeddings.create(model=self.openai_model,
+                                                     input=[textos[i] for i in faltantes])
+            registrar_tokens(self.openai_model, resp)
+            for i, dato in zip(faltantes, resp.data):
+                vectores[i] = dato.embedding
+        embeddings = np.array(vectores, dtype='float32').reshape(len(textos), -1)
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def classify_crisis(self, query_embedding: np.ndarray) -> SemanticCrisisResult:
+        if self.crisis_classifier is None:
+            registrar_degradada('sin_clasificador_crisis')
+            return SemanticCrisisResult(nivel='NORMAL', similitud=0.0)
+        with etapa('crisis_semantica'):
+            return self.crisis_classifier.classify(query_embedding)
+
+    def _filtros_para(self, filters: Optional[QueryFilters], ubicacion: Optional[str],
+                      ruta: RegionRoute) -> Optional[QueryFilters]:
+        """Si la delegación venía de la ubicación, filtrar solo por la parte local"""
+        if filters is not None and ubicacion and filters.delegacion == ubicacion:
+            return dataclasses.replace(filters, delegacion=ruta.ubicacion_local)
+        return filters
+
+    def search(self,
+               query: str,
+               filters: Optional[QueryFilters] = None,
+               top_k: int = 5,
+               apply_reranking: bool = True,
+               query_embedding: Optional[np.ndarray] = None,
+               ubicacion: Optional[str] = None,
+               region: Optional[str] = None,
+               cuotas: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """
+        Busca en los shards elegidos por el router y mezcla el top-k.
+        Mismos argumentos que MentalHealthRetrieval.search más la ubicación
+        o región del request y, opcionalmente, cuotas por partición
+        (MentalHealthRetrieval.search_mixto); cada resultado lleva su 'region'.
+        Con cuotas, la mezcla de varios shards respeta el cupo de cada
+        partición (hasta sum(cuotas) resultados) en vez de cortar en top_k.
+        """
+        ruta = self.route(ubicacion, region)
+        filters = self._filtros_para(filters, ubicacion, ruta)
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+
+        def buscar(nombre: str) -> List[Dict[str, Any]]:
+            if cuotas:
+                resultados = self.get(nombre).search_mixto(query, cuotas, filters=filters,
+                                                           apply_reranking=apply_reranking,
+                                                           query_embedding=query_embedding)
+            else:
+                resultados = self.get(nombre).search(query, filters=filters, top_k=top_k,
+                                                     apply_reranking=apply_reranking,
+                                                     query_embedding=query_embedding)
+            for r in resultados:
+                r['region'] = nombre
+            return resultados
+
+        if len(ruta.regiones) == 1:
+            return buscar(ruta.regiones[0])
+
+        resultados = [r for parcial in map_con_contexto(self._executor, buscar, ruta.regiones) for r in parcial]
+        # Primero los que pasaron filtros duros, luego por score (como en search)
+        resultados.sort(key=lambda r: ('filter_fail_reason' in r, -r['relevance_score']))
+        if not cuotas:
+            return resultados[:top_k]
+
+        # Con cuotas, cada partición conserva su cupo sumando todas las regiones
+        restantes = {nombre: k for nombre, k in cuotas.items() if k > 0}
+        mezclados = []
+        for r in resultados:
+            if restantes.get(r.get('particion'), 0) > 0:
+                restantes[r['particion']] -= 1
+                mezclados.append(r)
+        return mezclados
+
+    def particiones(self, ubicacion: Optional[str] = None, region: Optional[str] = None) -> List[str]:
+        """Particiones de los shards que el router elige para el request (valida cuotas)"""
+        nombres: List[str] = []
+        for nombre in self.route(ubicacion, region).regiones:
+            for particion in self.get(nombre).particiones.nombres:
+                if particion not in nombres:
+                    nombres.append(particion)
+        return nombres
+
+    def similares(self,
+                  resource_id: str,
+                  top_k: int = 5,
+                  filters: Optional[QueryFilters] = None,
+                  region: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Vecinos de un recurso desde el grafo de su shard. Sin región explícita
+        se busca el id en los shards cargados y luego en la región por defecto
+        (no se cargan todas las regiones para encontrarlo).
+        """
+        if region:
+            candidatas = [region]
+        else:
+            candidatas = self.activas[::-1] + ([self.default] if self.default else [])
+        for nombre in dict.fromkeys(candidatas):
+            shard = self.get(nombre)
+            if resource_id in shard.neighbor_graph.fila_por_id:
+                resultados = shard.similares(resource_id, top_k=top_k, filters=filters)
+                for r in resultados:
+                    r['region'] = nombre
+                return resultados
+        raise KeyError(resource_id)
+
+    def facets(self,
+               query: Optional[str] = None,
+               filters: Optional[QueryFilters] = None,
+               candidate_k: int = 200,
+               min_similarity: Optional[float] = None,
+               ubicacion: Optional[str] = None,
+               region: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Conteos por faceta sumados sobre los shards elegidos por el router;
+        la query se embebe una vez aquí y el vector se pasa a cada shard
+        """
+        ruta = self.route(ubicacion, region)
+        filters = self._filtros_para(filters, ubicacion, ruta)
+        query_embedding = self.embed_query(query) if query else None
+        parciales = list(map_con_contexto(
+            self._executor,
+            lambda nombre: self.get(nombre).facets(query, filters=filters, candidate_k=candidate_k,
+                                                   min_similarity=min_similarity,
+                                                   query_embedding=query_embedding),
+            ruta.regiones))
+
+        total = {'total': 0, 'facets': {}, 'regiones': ruta.regiones}
+        for parcial in parciales:
+            total['total'] += parcial['total']
+            for faceta, conteos in parcial['facets'].items():
+                acumulado = total['facets'].setdefault(faceta, {})
+                for valor, n in conteos.items():
+                    acumulado[valor] = acumulado.get(valor, 0) + n
+        for faceta, conteos in total['facets'].items():
+            total['facets'][faceta] = dict(sorted(conteos.items(), key=lambda kv: -kv[1]))
+        return total
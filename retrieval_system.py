@@ -14,15 +14,115 @@ import time
 import numpy as np
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 import re
-from openai import OpenAI
+from embedding_client import ClienteDelProceso
 import faiss
-import pickle
 from dotenv import load_dotenv
+from filter_index import FilterIndex
+from crisis_detection import SemanticCrisisClassifier, SemanticCrisisResult
+from near_duplicates import UMBRAL_DUPLICADO, colapsar_duplicados
+from neighbor_graph import load_or_refresh, ruta_grafo, vectores_indice
+from partitioned_index import PartitionedIndex
+from metrics import etapa, fase_arranque, map_con_contexto, registrar_degradada, registrar_tokens
+from snapshots import (Snapshot, SnapshotInvalido, cargar_snapshot, fuente_vigente, guardar_snapshot,
+                       huella_texto, resolver_snapshot, vectores_incrementales)
+from async_embeddings import precalculado
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
+# Búsquedas en paralelo sobre particiones (FAISS libera el GIL)
+_particiones_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='particion')
+
+
+def texto_recurso(recurso: Dict[str, Any]) -> str:
+    """
+    Crea un texto descriptivo del recurso (especialista o servicio) para embeddings
+    Incluye toda la información relevante para búsqueda semántica
+    """
+    parts = [
+        recurso.get('nombre', ''),
+        recurso.get('tipo_profesional', ''),
+        recurso.get('modalidad', ''),
+        recurso.get('institucion', ''),
+        recurso.get('descripcion', ''),
+        recurso.get('tipo_recurso', ''),  # 'especialista' o 'servicio'
+    ]
+    
+    # Especialidades/especializaciones (muy importante)
+    if 'especializaciones' in recurso:
+        parts.append(' '.join(recurso['especializaciones']))
+    
+    # Servicios ofrecidos (para servicios públicos)
+    if 'servicios_ofrecidos' in recurso:
+        parts.append(' '.join(recurso['servicios_ofrecidos']))
+    
+    # Tipo de servicio (para servicios)
+    if 'tipo_servicio' in recurso and recurso['tipo_servicio']:
+        parts.append(recurso['tipo_servicio'])
+    
+    # Ubicación
+    if 'ubicacion' in recurso:
+        ubi = recurso['ubicacion']
+        parts.extend([
+            ubi.get('colonia', ''),
+            ubi.get('delegacion', ''),
+        ])
+    
+    # Grupos etarios
+    if 'grupo_etario' in recurso:
+        parts.append(' '.join(recurso['grupo_etario']))
+    
+    # Tags de matching
+    if 'tags_match' in recurso:
+        parts.append(recurso['tags_match'])
+    
+    # Descripción del costo para contexto
+    if 'costo' in recurso:
+        if isinstance(recurso['costo'], dict):
+            if 'descripcion' in recurso['costo']:
+                parts.append(recurso['costo']['descripcion'])
+            if recurso['costo'].get('es_gratuito'):
+                parts.append('gratuito gratis sin costo')
+    
+    # Emergencia
+    if recurso.get('es_emergencia'):
+        parts.append('emergencia crisis urgente inmediato 24/7')
+    
+    return ' '.join([p for p in parts if p])
+
+
+def generate_embeddings(client: Any,
+                        model: str,
+                        texts: List[str],
+                        batch_size: int = 50,
+                        verbose: bool = True) -> np.ndarray:
+    """
+    Genera embeddings float32 con la OpenAI Embeddings API en batches,
+    con hasta 3 intentos por batch
+    """
+    all_embeddings = []
+    total_batches = (len(texts) - 1) // batch_size + 1
+    
+    for i in range(0, len(texts), batch_size):
+        batch = texts[i:i+batch_size]
+        for attempt in range(3):
+            try:
+                resp = client.embeddings.create(model=model, input=batch)
+                all_embeddings.extend(d.embedding for d in resp.data)
+                if verbose:
+                    print(f"Batch {i//batch_size + 1}/{total_batches} completado")
+                break
+            except Exception as e:
+                if attempt == 2:
+                    print(f"Error en batch {i//batch_size + 1}: {e}")
+                    raise
+                print(f"Reintento {attempt + 1}/3")
+                time.sleep(1 + attempt)
+    
+    return np.array(all_embeddings, dtype='float32')
+
 
 @dataclass
 class QueryFilters:
@@ -51,12 +151,19 @@ class MentalHealthRetrieval:
     usando búsqueda semántica y filtros específicos
     """
     
+    # Inyectado o el del proceso que busca (ver embedding_client.py)
+    client = ClienteDelProceso()
+    
     def __init__(self,
                  json_path: str,
                  openai_model: str = 'text-embedding-3-small',
                  index_path: str = 'faiss_recursos/recursos_index.bin',
                  metadata_path: str = 'faiss_recursos/recursos_metadata.pkl',
-                 force_rebuild: bool = False):
+                 prototypes_path: str = 'faiss_recursos/crisis_prototypes.pkl',
+                 force_rebuild: bool = False,
+                 neighbors_path: Optional[str] = None,
+                 umbral_duplicados: Optional[float] = UMBRAL_DUPLICADO,
+                 client: Optional[Any] = None):
         """
         Inicializa el sistema de retrieval usando OpenAI embeddings y FAISS
         
@@ -65,7 +172,15 @@ class MentalHealthRetrieval:
             openai_model: Modelo de OpenAI embeddings (default: text-embedding-3-small)
             index_path: Ruta donde guardar/cargar índice FAISS
             metadata_path: Ruta donde guardar/cargar metadatos
+            prototypes_path: Ruta donde guardar/cargar prototipos del clasificador de crisis
             force_rebuild: Si True, reconstruye embeddings aunque exista cache
+                (sin él, un JSON modificado solo embebe los recursos que cambiaron)
+            neighbors_path: Grafo de vecinos para similares() (default: junto al índice)
+            umbral_duplicados: Similitud para colapsar casi-duplicados al construir
+                el índice (ver near_duplicates.py); None = no colapsar
+            client: Cliente con la interfaz client.embeddings.create de OpenAI
+                (default: embedding_client.cliente_compartido()); benchmarks y pruebas
+                inyectan uno falso
         """
         # Cargar datos (ahora es una base de datos unificada)
         with open(json_path, 'r', encoding='utf-8') as f:
@@ -75,134 +190,169 @@ class MentalHealthRetrieval:
         self.especialistas = self.recursos
         
         # Configurar OpenAI
-        self.openai_model = openai_model
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise EnvironmentError('OPENAI_API_KEY no está definido en las variables de entorno')
-        self.client = OpenAI(api_key=api_key)
+        self._init_client(openai_model, client)
         
-        self.index_path = index_path
-        self.metadata_path = metadata_path
+        # Archivos del snapshot según faiss_recursos/manifest.json (ver snapshots.py)
+        snapshot = resolver_snapshot(index_path, metadata_path)
+        self.index_path = snapshot.index_path
+        self.metadata_path = snapshot.metadata_path
         
         # Crear directorios si no existen
-        os.makedirs(os.path.dirname(index_path) if os.path.dirname(index_path) else '.', exist_ok=True)
-        os.makedirs(os.path.dirname(metadata_path) if os.path.dirname(metadata_path) else '.', exist_ok=True)
-        
-        # Intentar cargar desde cache
-        if not force_rebuild and os.path.exists(index_path) and os.path.exists(metadata_path):
-            print(f"Cargando indice FAISS desde {index_path}")
-            self.index = faiss.read_index(index_path)
-            with open(metadata_path, 'rb') as f:
-                cached_data = pickle.load(f)
-                self.especialistas = cached_data['especialistas']
-            print(f"Indice cargado con {self.index.ntotal} vectores")
-        else:
-            print(f"Usando OpenAI embeddings: {self.openai_model}")
-            print("Generando embeddings para especialistas")
-            embeddings = self._generate_embeddings_openai()
-            
-            # Convertir a float32 para FAISS
-            embeddings = embeddings.astype('float32')
-            
-            # Crear índice FAISS
-            dimension = embeddings.shape[1]
-            self.index = faiss.IndexFlatIP(dimension)
-            
-            # Normalizar vectores para cosine similarity
-            faiss.normalize_L2(embeddings)
-            self.index.add(embeddings)
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        os.makedirs(os.path.dirname(self.metadata_path) or '.', exist_ok=True)
+        
+        with fase_arranque('indice_recursos'):
+            self._load_or_build(snapshot, json_path, force_rebuild, umbral_duplicados)
+        
+        self._init_derived(prototypes_path, force_rebuild, neighbors_path)
+    
+    @classmethod
+    def from_index(cls,
+                   index_path: str,
+                   metadata_path: str,
+                   openai_model: str = 'text-embedding-3-small',
+                   prototypes_path: str = 'faiss_recursos/crisis_prototypes.pkl',
+                   neighbors_path: Optional[str] = None,
+                   client: Optional[Any] = None) -> 'MentalHealthRetrieval':
+        """
+        Carga un índice ya construido (por ejemplo con nppes_ingestion.py)
+        sin leer ni re-embeber un JSON de recursos
+        
+        Args:
+            index_path: Índice FAISS con vectores normalizados L2
+            metadata_path: Pickle {'especialistas': [...]} alineado con el índice
+            client: Como en __init__
+        """
+        self = cls.__new__(cls)
+        self._init_client(openai_model, client)
+        snapshot = resolver_snapshot(index_path, metadata_path)
+        self.index_path = snapshot.index_path
+        self.metadata_path = snapshot.metadata_path
+        
+        # Sin JSON fuente no hay cómo reconstruir: un snapshot inválido es un error
+        with fase_arranque('indice_recursos'):
+            self._load_snapshot(snapshot)
+        self.recursos = self.especialistas
+        
+        self._init_derived(prototypes_path, force_rebuild=False, neighbors_path=neighbors_path)
+        return self
+    
+    def _load_snapshot(self, snapshot: Snapshot) -> Optional[List[str]]:
+        """
+        Carga índice y metadatos; lanza SnapshotInvalido si no se corresponden.
+        Devuelve las huellas de texto de cada fila si el snapshot las guarda.
+        """
+        print(f"Cargando indice FAISS desde {snapshot.index_path}")
+        index, metadatos = cargar_snapshot(snapshot, 'especialistas', self.openai_model)
+        self.index, self.especialistas = index, metadatos['especialistas']
+        print(f"Indice cargado con {self.index.ntotal} vectores")
+        return metadatos.get('huellas')
+    
+    def _load_or_build(self, snapshot: Snapshot, json_path: str, force_rebuild: bool,
+                       umbral_duplicados: Optional[float]):
+        """
+        Carga el snapshot si es válido y está al día con json_path; si el JSON
+        cambió, lo actualiza embebiendo solo los recursos nuevos o modificados
+        """
+        previo = huellas_previas = None
+        if not force_rebuild and snapshot.existe:
+            try:
+                huellas_previas = self._load_snapshot(snapshot)
+                if fuente_vigente(snapshot, json_path):
+                    return
+                print(f"{json_path} cambió desde la construcción del snapshot, se actualiza")
+                previo = self.index
+                if huellas_previas is None:
+                    # Snapshots anteriores a las huellas: la del recurso guardado en cada fila
+                    huellas_previas = [huella_texto(texto_recurso(r)) for r in self.especialistas]
+            except SnapshotInvalido as e:
+                print(f"Snapshot inválido, se reconstruye: {e}")
+        
+        textos = [texto_recurso(rec) for rec in self.recursos]
+        embeddings, huellas, embebidos = vectores_incrementales(
+            textos, self._generate_embeddings_openai, previo, huellas_previas)
+        print(f"{embebidos} de {len(textos)} recursos embebidos con {self.openai_model}")
+        
+        # Un vector por grupo de casi-duplicados; las variantes van en metadatos
+        embeddings, self.especialistas, duplicados = colapsar_duplicados(
+            embeddings, self.recursos, umbral_duplicados)
+        if duplicados['grupos']:
+            print(f"Casi-duplicados colapsados: {duplicados['antes']} -> {duplicados['despues']} "
+                  f"recursos ({duplicados['grupos']} grupos)")
+        huellas = [huellas[i] for i in duplicados['filas']]
+        
+        # Crear índice FAISS (vectores normalizados: producto interno = coseno)
+        self.index = faiss.IndexFlatIP(embeddings.shape[1])
+        self.index.add(embeddings)
+        
+        # Guardar índice, metadatos y manifiesto
+        print(f"Guardando indice FAISS en {self.index_path}")
+        guardar_snapshot(snapshot, self.index,
+                         {'especialistas': self.especialistas, 'huellas': huellas},
+                         self.openai_model, fuente=json_path,
+                         parametros={'indice': 'IndexFlatIP', 'umbral_duplicados': umbral_duplicados})
+        print("Indice guardado")
+    
+    def _init_client(self, openai_model: str, client: Optional[Any] = None):
+        """Usa el cliente inyectado o el de embeddings compartido por el proceso"""
+        self.openai_model = openai_model
+        self.client = client
+    
+    def _init_derived(self, prototypes_path: str, force_rebuild: bool,
+                      neighbors_path: Optional[str] = None):
+        """Estructuras derivadas del catálogo cargado (filtros, crisis y vecinos)"""
+        with fase_arranque('filtros_recursos'):
+            # Índice columnar para filtros y facetas vectorizadas
+            self.filter_index = FilterIndex(self.especialistas)
             
-            # Guardar índice y metadatos
-            print(f"Guardando indice FAISS en {self.index_path}")
-            faiss.write_index(self.index, self.index_path)
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump({'especialistas': self.especialistas}, f)
-            print("Indice guardado")
+            # Sub-índices por tipo de recurso (ver partitioned_index.py)
+            self.particiones = PartitionedIndex(vectores_indice(self.index), self.especialistas)
+        
+        # Clasificador semántico de crisis (prototipos versionados junto al índice)
+        self.prototypes_path = prototypes_path
+        with fase_arranque('prototipos_crisis'):
+            self.crisis_classifier = self._load_crisis_classifier(force_rebuild)
+        
+        # Grafo kNN para "más como este"; solo recalcula filas nuevas o modificadas
+        self.neighbors_path = neighbors_path or ruta_grafo(self.index_path)
+        with fase_arranque('grafo_vecinos'):
+            self.neighbor_graph, cambios = load_or_refresh(
+                self.neighbors_path, self.index, [r.get('id') for r in self.especialistas])
+        if cambios['sucias']:
+            print(f"Grafo de vecinos actualizado: {cambios['recalculadas']} filas recalculadas, "
+                  f"{cambios['fusionadas']} fusionadas")
         
         print(f"Sistema listo con {len(self.especialistas)} especialistas")
     
-    def _create_specialist_text(self, recurso: Dict[str, Any]) -> str:
+    def _load_crisis_classifier(self, force_rebuild: bool = False) -> Optional[SemanticCrisisClassifier]:
         """
-        Crea un texto descriptivo del recurso (especialista o servicio) para embeddings
-        Incluye toda la información relevante para búsqueda semántica
+        Carga los prototipos de crisis desde cache o los genera.
+        Si no se pueden generar, la detección queda solo léxica.
         """
-        parts = [
-            recurso.get('nombre', ''),
-            recurso.get('tipo_profesional', ''),
-            recurso.get('modalidad', ''),
-            recurso.get('institucion', ''),
-            recurso.get('descripcion', ''),
-            recurso.get('tipo_recurso', ''),  # 'especialista' o 'servicio'
-        ]
-        
-        # Especialidades/especializaciones (muy importante)
-        if 'especializaciones' in recurso:
-            parts.append(' '.join(recurso['especializaciones']))
-        
-        # Servicios ofrecidos (para servicios públicos)
-        if 'servicios_ofrecidos' in recurso:
-            parts.append(' '.join(recurso['servicios_ofrecidos']))
-        
-        # Tipo de servicio (para servicios)
-        if 'tipo_servicio' in recurso and recurso['tipo_servicio']:
-            parts.append(recurso['tipo_servicio'])
-        
-        # Ubicación
-        if 'ubicacion' in recurso:
-            ubi = recurso['ubicacion']
-            parts.extend([
-                ubi.get('colonia', ''),
-                ubi.get('delegacion', ''),
-            ])
-        
-        # Grupos etarios
-        if 'grupo_etario' in recurso:
-            parts.append(' '.join(recurso['grupo_etario']))
-        
-        # Tags de matching
-        if 'tags_match' in recurso:
-            parts.append(recurso['tags_match'])
-        
-        # Descripción del costo para contexto
-        if 'costo' in recurso:
-            if isinstance(recurso['costo'], dict):
-                if 'descripcion' in recurso['costo']:
-                    parts.append(recurso['costo']['descripcion'])
-                if recurso['costo'].get('es_gratuito'):
-                    parts.append('gratuito gratis sin costo')
-        
-        # Emergencia
-        if recurso.get('es_emergencia'):
-            parts.append('emergencia crisis urgente inmediato 24/7')
-        
-        return ' '.join([p for p in parts if p])
-    
-    def _generate_embeddings_openai(self) -> np.ndarray:
+        classifier = None if force_rebuild else SemanticCrisisClassifier.load(self.prototypes_path)
+        if classifier is not None:
+            if classifier.is_current(self.openai_model):
+                return classifier
+            print("Prototipos de crisis desactualizados, regenerando")
+        
+        try:
+            classifier = SemanticCrisisClassifier.build(self.client, self.openai_model)
+        except Exception as e:
+            print(f"No se pudieron generar prototipos de crisis: {e}")
+            return None
+        classifier.save(self.prototypes_path)
+        print(f"Prototipos de crisis guardados en {self.prototypes_path}")
+        return classifier
+    
+    def _create_specialist_text(self, recurso: Dict[str, Any]) -> str:
+        """Texto del recurso para embeddings (ver texto_recurso)"""
+        return texto_recurso(recurso)
+    
+    def _generate_embeddings_openai(self, texts: List[str]) -> np.ndarray:
         """Genera embeddings usando la OpenAI Embeddings API en batch."""
-        texts = [self._create_specialist_text(rec) for rec in self.recursos]
-        all_embeddings = []
         batch_size = 50
-        
         print(f"Generando embeddings para {len(texts)} recursos en batches de {batch_size}")
-        
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i+batch_size]
-            for attempt in range(3):
-                try:
-                    resp = self.client.embeddings.create(model=self.openai_model, input=batch)
-                    batch_emb = [d.embedding for d in resp.data]
-                    all_embeddings.extend(batch_emb)
-                    print(f"Batch {i//batch_size + 1}/{(len(texts)-1)//batch_size + 1} completado")
-                    time.sleep(0.1)
-                    break
-                except Exception as e:
-                    if attempt == 2:
-                        print(f"Error en batch {i//batch_size + 1}: {e}")
-                        raise
-                    print(f"Reintento {attempt + 1}/3")
-                    time.sleep(1 + attempt)
-
-        return np.array(all_embeddings)
+        return generate_embeddings(self.client, self.openai_model, texts, batch_size)
     
     def _apply_filters(self, recurso: Dict[str, Any], filters: QueryFilters) -> bool:
         """
@@ -250,7 +400,7 @@ class MentalHealthRetrieval:
             specs = recurso.get('especializaciones', [])
             specs_lower = [s.lower() for s in specs]
             # Al menos una especialización debe coincidir
-            if not any(f.lower() in ' '.join(specs_lower) for f in filters.especializaciones):
+            if not any(f.lower() in spec for f in filters.especializaciones for spec in specs_lower):
                 return False
         
         # Filtro de grupo etario
@@ -385,11 +535,49 @@ class MentalHealthRetrieval:
         
         return total_score
     
+    def embed_query(self, query: str) -> np.ndarray:
+        """Genera el embedding (1, d) de la query, normalizado para cosine similarity"""
+        return self.embed_queries([query])
+    
+    def embed_queries(self, textos: List[str]) -> np.ndarray:
+        """
+        Embeddings (m, d) normalizados de varios textos del mismo request,
+        con una sola llamada a la API para los que no vengan precalculados
+        """
+        # En modo ASGI los embeddings ya se pidieron de forma asíncrona
+        vectores = [precalculado(self.openai_model, texto) for texto in textos]
+        faltantes = [i for i, vector in enumerate(vectores) if vector is None]
+        if faltantes:
+            # Incluye los reintentos del cliente de embeddings
+            with etapa('embedding'):
+                resp = self.client.embeddings.create(model=self.openai_model,
+                                                     input=[textos[i] for i in faltantes])
+            registrar_tokens(self.openai_model, resp)
+            for i, dato in zip(faltantes, resp.data):
+                vectores[i] = dato.embedding
+        embeddings = np.array(vectores, dtype='float32').reshape(len(textos), -1)
+        faiss.normalize_L2(embeddings)
+        return embeddings
+    
+    def classify_crisis(self, query_embedding: np.ndarray) -> SemanticCrisisResult:
+        """
+        Clasifica el nivel de crisis de un embedding ya calculado (el del
+        texto del usuario, ver api_rest.evaluar_crisis).
+        Sin prototipos cargados retorna NORMAL.
+        """
+        if self.crisis_classifier is None:
+            registrar_degradada('sin_clasificador_crisis')
+            return SemanticCrisisResult(nivel='NORMAL', similitud=0.0)
+        with etapa('crisis_semantica'):
+            return self.crisis_classifier.classify(query_embedding)
+    
     def search(self, 
                query: str, 
                filters: Optional[QueryFilters] = None,
                top_k: int = 5,
-               apply_reranking: bool = True) -> List[Dict[str, Any]]:
+               apply_reranking: bool = True,
+               query_embedding: Optional[np.ndarray] = None,
+               particion: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Busca los mejores especialistas según la query y filtros
         
@@ -398,6 +586,9 @@ class MentalHealthRetrieval:
             filters: Filtros opcionales
             top_k: Número de resultados a devolver
             apply_reranking: Si True, aplica reranking con filtros duros a candidatos
+            query_embedding: Embedding ya calculado con embed_query (evita otra llamada)
+            particion: Buscar solo en esa partición ('especialista', 'servicio',
+                'digital'...; ver partitioned_index.py) en vez del índice completo
             
         Returns:
             Lista de especialistas ordenados por relevancia con scores
@@ -405,67 +596,206 @@ class MentalHealthRetrieval:
         if filters is None:
             filters = QueryFilters()
         
-        # Generar embedding de la query usando OpenAI
-        resp = self.client.embeddings.create(model=self.openai_model, input=[query])
-        query_embedding = np.array(resp.data[0].embedding, dtype='float32').reshape(1, -1)
-        
-        # Normalizar para cosine similarity
-        faiss.normalize_L2(query_embedding)
+        # Generar embedding de la query usando OpenAI (si no viene precalculado)
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
         
         # Buscar en FAISS (buscar más candidatos de los necesarios para reranking)
-        k_search = min(top_k * 3, self.index.ntotal)
-        similarities, indices = self.index.search(query_embedding, k_search)
+        with etapa('faiss'):
+            if particion is not None:
+                similarities, indices = self.particiones.search(particion, query_embedding, top_k * 3)
+            else:
+                k_search = min(top_k * 3, self.index.ntotal)
+                similarities, indices = self.index.search(query_embedding, k_search)
+        
+        return self._rank(similarities[0], indices[0], filters, top_k, apply_reranking)
+    
+    def _rank(self,
+              similarities: np.ndarray,
+              indices: np.ndarray,
+              filters: QueryFilters,
+              top_k: int,
+              apply_reranking: bool) -> List[Dict[str, Any]]:
+        """Scoring híbrido y reranking con filtros duros de los candidatos de FAISS"""
+        # PASO 1: Filtrar con filtros suaves
+        with etapa('filtros_suaves'):
+            pasan = [(self.especialistas[idx], similarity_score)
+                     for idx, similarity_score in zip(indices, similarities)
+                     if idx >= 0 and self._apply_filters(self.especialistas[idx], filters)]
+        
+        # PASO 2: Calcular score híbrido de los que pasaron
+        with etapa('scoring'):
+            candidates = []
+            for specialist, similarity_score in pasan:
+                score = self._calculate_score(specialist, similarity_score, filters)
+                result = specialist.copy()
+                result['relevance_score'] = float(score)
+                result['semantic_similarity'] = float(similarity_score)
+                candidates.append(result)
+            
+            # Ordenar candidatos por score
+            candidates.sort(key=lambda x: x['relevance_score'], reverse=True)
+        
+        # PASO 3: Reranking con filtros duros (reglas estrictas)
+        if apply_reranking and len(candidates) > 0:
+            with etapa('rerank_filtros_duros'):
+                return self._rerank(candidates, filters, top_k)
         
-        similarities = similarities[0]  # Aplanar
-        indices = indices[0]
+        # Si no se aplica reranking, retornar top k directamente
+        return candidates[:top_k]
+    
+    def _rerank(self,
+                candidates: List[Dict[str, Any]],
+                filters: QueryFilters,
+                top_k: int) -> List[Dict[str, Any]]:
+        """Aplica los filtros duros al pool de candidatos ya ordenados"""
+        # Tomar top candidatos (más que top_k para tener margen)
+        rerank_pool_size = min(top_k * 3, len(candidates))
+        rerank_pool = candidates[:rerank_pool_size]
+        
+        # Aplicar filtros duros
+        passed = []
+        failed = []
+        for candidate in rerank_pool:
+            passes, reason = self._apply_hard_filters(candidate, filters)
+            if passes:
+                passed.append(candidate)
+            else:
+                candidate['filter_fail_reason'] = reason
+                failed.append(candidate)
         
-        # PASO 1: Filtrar con filtros suaves y calcular scores
-        candidates = []
-        for idx, similarity_score in zip(indices, similarities):
-            specialist = self.especialistas[idx]
+        # Si quedan suficientes que pasaron filtros duros, usar esos
+        if len(passed) >= top_k:
+            return passed[:top_k]
+        # Si no hay suficientes, complementar con los que fallaron
+        else:
+            if failed:
+                registrar_degradada('filtros_relajados')
+            return passed + failed[:top_k - len(passed)]
+    
+    def search_mixto(self,
+                     query: str,
+                     cuotas: Dict[str, int],
+                     filters: Optional[QueryFilters] = None,
+                     apply_reranking: bool = True,
+                     query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Lista mixta con cupo por partición, buscando las particiones en paralelo
+        
+        Cada partición se busca con su propia cuota (y su propio margen de
+        reranking), de modo que un tipo minoritario no depende de sobre-pedir
+        candidatos al índice completo. Un recurso presente en varias
+        particiones aparece una sola vez.
+        
+        Args:
+            query: Descripción de lo que busca el usuario
+            cuotas: Partición -> máximo de resultados, ej. {'especialista': 7, 'servicio': 3}
+            filters, apply_reranking, query_embedding: Como en search()
             
-            # Aplicar filtros suaves
-            if not self._apply_filters(specialist, filters):
-                continue
+        Returns:
+            Resultados de todas las particiones ordenados por relevancia
+            (los que fallaron filtros duros al final), cada uno con 'particion'
+        """
+        if filters is None:
+            filters = QueryFilters()
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        
+        cuotas = {nombre: k for nombre, k in cuotas.items() if k > 0 and nombre in self.particiones}
+        
+        def buscar(nombre: str) -> List[Dict[str, Any]]:
+            return self.search(query, filters=filters, top_k=cuotas[nombre],
+                               apply_reranking=apply_reranking,
+                               query_embedding=query_embedding, particion=nombre)
+        
+        resultados = []
+        vistos = set()
+        for nombre, parcial in zip(cuotas, map_con_contexto(_particiones_executor, buscar, cuotas)):
+            for resultado in parcial:
+                clave = (resultado.get('id'), resultado.get('nombre'))
+                if clave in vistos:
+                    continue
+                vistos.add(clave)
+                resultado['particion'] = nombre
+                resultados.append(resultado)
+        
+        resultados.sort(key=lambda r: ('filter_fail_reason' in r, -r['relevance_score']))
+        return resultados
+    
+    def similares(self,
+                  resource_id: str,
+                  top_k: int = 5,
+                  filters: Optional[QueryFilters] = None) -> List[Dict[str, Any]]:
+        """
+        Recursos más parecidos a uno dado, desde el grafo de vecinos
+        (sin llamadas de embeddings ni búsqueda en el índice)
+        
+        Args:
+            resource_id: id del recurso de referencia
+            top_k: Número de resultados
+            filters: Filtros suaves a aplicar sobre los vecinos
             
-            # Calcular score híbrido
-            score = self._calculate_score(specialist, similarity_score, filters)
+        Returns:
+            Vecinos con 'semantic_similarity' y 'relevance_score', como search()
             
-            # Agregar a candidatos
-            result = specialist.copy()
-            result['relevance_score'] = float(score)
-            result['semantic_similarity'] = float(similarity_score)
-            candidates.append(result)
+        Raises:
+            KeyError: Si el id no está en el índice
+        """
+        if filters is None:
+            filters = QueryFilters()
         
-        # Ordenar candidatos por score
-        candidates.sort(key=lambda x: x['relevance_score'], reverse=True)
+        resultados = []
+        for fila, similitud in self.neighbor_graph.neighbors(resource_id):
+            recurso = self.especialistas[fila]
+            if not self._apply_filters(recurso, filters):
+                continue
+            resultado = recurso.copy()
+            resultado['relevance_score'] = float(self._calculate_score(recurso, similitud, filters))
+            resultado['semantic_similarity'] = float(similitud)
+            resultados.append(resultado)
         
-        # PASO 2: Reranking con filtros duros (reglas estrictas)
-        if apply_reranking and len(candidates) > 0:
-            # Tomar top candidatos (más que top_k para tener margen)
-            rerank_pool_size = min(top_k * 3, len(candidates))
-            rerank_pool = candidates[:rerank_pool_size]
-            
-            # Aplicar filtros duros
-            passed = []
-            failed = []
-            for candidate in rerank_pool:
-                passes, reason = self._apply_hard_filters(candidate, filters)
-                if passes:
-                    passed.append(candidate)
-                else:
-                    candidate['filter_fail_reason'] = reason
-                    failed.append(candidate)
-            
-            # Si quedan suficientes que pasaron filtros duros, usar esos
-            if len(passed) >= top_k:
-                return passed[:top_k]
-            # Si no hay suficientes, complementar con los que fallaron
-            else:
-                return passed + failed[:top_k - len(passed)]
+        resultados.sort(key=lambda x: x['relevance_score'], reverse=True)
+        return resultados[:top_k]
+    
+    def facets(self,
+               query: Optional[str] = None,
+               filters: Optional[QueryFilters] = None,
+               candidate_k: int = 200,
+               min_similarity: Optional[float] = None,
+               query_embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Calcula conteos por faceta (delegación, modalidad, tipo profesional,
+        banda de precio) sobre los recursos que pasan los filtros y, si hay
+        query, que además están entre los candidatos semánticos.
         
-        # Si no se aplica reranking, retornar top k directamente
-        return candidates[:top_k]
+        Args:
+            query: Texto de búsqueda (opcional). Sin query se usa todo el catálogo
+            filters: Filtros suaves a aplicar
+            candidate_k: Número de candidatos semánticos a considerar
+            min_similarity: Similitud mínima para contar un candidato (opcional)
+            query_embedding: Embedding ya calculado de la query (evita otra llamada)
+            
+        Returns:
+            Diccionario con 'total' y 'facets'
+        """
+        mask = self.filter_index.mask(filters)
+        
+        if query:
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+            k_search = min(candidate_k, self.index.ntotal)
+            similarities, indices = self.index.search(query_embedding, k_search)
+            valid = indices[0] >= 0
+            if min_similarity is not None:
+                valid &= similarities[0] >= min_similarity
+            candidatos = np.zeros(self.filter_index.size, dtype=bool)
+            candidatos[indices[0][valid]] = True
+            mask &= candidatos
+        
+        return {
+            'total': int(mask.sum()),
+            'facets': self.filter_index.facet_counts(mask)
+        }
     
     def format_result(self, specialist: Dict[str, Any]) -> str:
         """
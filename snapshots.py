@@ -0,0 +1,371 @@
+"""
+Snapshots de índices precalculados (manifest.json)
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Cada directorio de índices (faiss_recursos/, faiss_pasos/) trae un
+manifest.json con los archivos que forman cada snapshot y con qué se
+construyeron:
+
+    {"version": 1,
+     "snapshots": {
+       "knowledge_index": {"index": "knowledge_faiss_index.bin",
+                           "metadata": "knowledge_metadata.pkl",
+                           "modelo": "text-embedding-3-small",
+                           "dimension": 1536, "registros": 9,
+                           "fuente": {"archivo": "base_conocimiento_...json",
+                                      "sha256": "...", "bytes": 51234,
+                                      "mtime_ns": 1718000000000000000},
+                           "parametros": {"indice": "IndexFlatIP"},
+                           "construido": "2024-06-10T12:00:00Z",
+                           "construccion": "9f2c4e1a7b3d"}}}
+
+El nombre de un snapshot es el de la ruta de índice configurada sin
+extensión (faiss_pasos/knowledge_index.bin -> knowledge_index); el
+manifiesto puede apuntarlo a otros archivos. Sin manifiesto, o si no lista
+el snapshot, se usan las rutas configuradas tal cual.
+
+Al cargar (cargar_snapshot) se valida que los archivos se puedan leer, que
+el índice tenga la dimensión y los registros declarados, que coincida con
+sus metadatos y que el modelo sea el configurado; si no, el sistema
+reconstruye el snapshot diciendo por qué en vez de servir un índice que no
+corresponde o abortar el arranque.
+
+Cada construcción (guardar_snapshot) escribe los archivos a temporales y
+los renombra: primero los metadatos, luego el índice y al final el
+manifiesto. Metadatos y manifiesto llevan el mismo identificador de
+construcción, así que una caída a mitad de camino deja un snapshot que no
+valida en vez de un índice con los metadatos de otro.
+
+El manifiesto guarda además el tamaño, mtime y sha256 del JSON fuente: al
+arrancar basta un stat para saber si el snapshot sigue vigente (el sha256
+solo se calcula si el stat cambió, como tras un checkout). Si no lo está, el snapshot se actualiza
+reutilizando los vectores de los registros cuyo texto no cambió
+(vectores_incrementales) y solo se embeben los nuevos o modificados.
+
+Una ingesta grande (NPPES) no tiene todos los registros en memoria: pasa a
+guardar_snapshot la lista principal por lotes y el pickle queda como una
+cabecera seguida de un pickle por lote; leer_metadatos arma la lista.
+"""
+import hashlib
+import json
+import os
+import pickle
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from neighbor_graph import vectores_indice
+
+MANIFIESTO = 'manifest.json'
+VERSION_MANIFIESTO = 1
+
+
+class SnapshotInvalido(ValueError):
+    """El snapshot en disco no corresponde a lo declarado o a lo configurado"""
+
+
+@dataclass
+class Snapshot:
+    nombre: str
+    index_path: str
+    metadata_path: str
+    # Lo declarado en el manifiesto ({} si no está listado)
+    entrada: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def existe(self) -> bool:
+        return os.path.exists(self.index_path) and os.path.exists(self.metadata_path)
+
+
+def ruta_manifiesto(index_path: str) -> str:
+    return os.path.join(os.path.dirname(index_path), MANIFIESTO)
+
+
+def nombre_snapshot(index_path: str) -> str:
+    return os.path.splitext(os.path.basename(index_path))[0]
+
+
+def leer_manifiesto(path: str) -> Dict[str, Any]:
+    """Manifiesto de un directorio (vacío si no existe o no se puede leer)"""
+    vacio = {'version': VERSION_MANIFIESTO, 'snapshots': {}}
+    if not os.path.exists(path):
+        return vacio
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifiesto = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Manifiesto ilegible en {path}, se ignora: {e}")
+        return vacio
+    if manifiesto.get('version') != VERSION_MANIFIESTO:
+        print(f"Manifiesto {path} con versión {manifiesto.get('version')}, se ignora")
+        return vacio
+    manifiesto.setdefault('snapshots', {})
+    return manifiesto
+
+
+def resolver_snapshot(index_path: str, metadata_path: str) -> Snapshot:
+    """Archivos del snapshot de index_path según el manifiesto de su directorio"""
+    nombre = nombre_snapshot(index_path)
+    entrada = leer_manifiesto(ruta_manifiesto(index_path))['snapshots'].get(nombre)
+    if not entrada:
+        return Snapshot(nombre, index_path, metadata_path)
+    directorio = os.path.dirname(index_path)
+    return Snapshot(nombre,
+                    os.path.join(directorio, entrada.get('index', os.path.basename(index_path))),
+                    os.path.join(directorio, entrada.get('metadata', os.path.basename(metadata_path))),
+                    entrada)
+
+
+def validar_snapshot(snapshot: Snapshot, index: Any, registros: int, modelo: str,
+                     construccion: Optional[str] = None):
+    """
+    Lanza SnapshotInvalido si el índice cargado no coincide con sus
+    metadatos (registros y construcción), con el manifiesto o con el modelo
+    configurado
+    """
+    if index.ntotal != registros:
+        raise SnapshotInvalido(f"{snapshot.nombre}: el índice tiene {index.ntotal} vectores "
+                               f"y los metadatos {registros} registros")
+    entrada = snapshot.entrada
+    if entrada.get('dimension') is not None and entrada['dimension'] != index.d:
+        raise SnapshotInvalido(f"{snapshot.nombre}: dimensión {index.d}, el manifiesto "
+                               f"declara {entrada['dimension']}")
+    if entrada.get('registros') is not None and entrada['registros'] != index.ntotal:
+        raise SnapshotInvalido(f"{snapshot.nombre}: {index.ntotal} vectores, el manifiesto "
+                               f"declara {entrada['registros']}")
+    if entrada.get('modelo') is not None and entrada['modelo'] != modelo:
+        raise SnapshotInvalido(f"{snapshot.nombre}: construido con {entrada['modelo']}, "
+                               f"configurado {modelo}")
+    if entrada.get('construccion') is not None and entrada['construccion'] != construccion:
+        # Escritura interrumpida: los archivos no son los que registró el manifiesto
+        raise SnapshotInvalido(f"{snapshot.nombre}: metadatos de la construcción {construccion}, "
+                               f"el manifiesto declara {entrada['construccion']}")
+
+
+def registrar_snapshot(snapshot: Snapshot, index: Any, modelo: str,
+                       construccion: Optional[str] = None,
+                       fuente: Optional[str] = None,
+                       parametros: Optional[Dict[str, Any]] = None):
+    """Anota en el manifiesto el snapshot recién construido"""
+    entrada = {
+        'index': os.path.basename(snapshot.index_path),
+        'metadata': os.path.basename(snapshot.metadata_path),
+        'modelo': modelo,
+        'dimension': index.d,
+        'registros': index.ntotal,
+        'construido': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    if construccion is not None:
+        entrada['construccion'] = construccion
+    if fuente is not None:
+        entrada['fuente'] = huella_fuente(fuente)
+    if parametros is not None:
+        entrada['parametros'] = parametros
+    snapshot.entrada = entrada
+    _guardar_entrada(snapshot)
+
+
+def _guardar_entrada(snapshot: Snapshot):
+    path = ruta_manifiesto(snapshot.index_path)
+    manifiesto = leer_manifiesto(path)
+    manifiesto['snapshots'][snapshot.nombre] = snapshot.entrada
+
+    def escribir(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+    escribir_atomico(path, escribir)
+
+
+def _temporal(path: str) -> str:
+    # Por pid: dos procesos que construyen a la vez no se pisan el temporal
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def _sincronizar(path: str):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def escribir_atomico(path: str, escribir: Callable[[str], None]):
+    """Escribe a un archivo temporal y lo renombra al terminar"""
+    tmp = _temporal(path)
+    try:
+        escribir(tmp)
+        _sincronizar(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def guardar_pickle(path: str, data: Any):
+    def escribir(tmp):
+        with open(tmp, 'wb') as f:
+            pickle.dump(data, f)
+    escribir_atomico(path, escribir)
+
+
+def leer_pickle(path: str) -> Optional[Any]:
+    """Contenido de un pickle de cache; None si no existe o no se puede leer (se recalcula)"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        # pickle.load de un archivo truncado o ajeno lanza casi cualquier cosa
+        print(f"Cache ilegible en {path}, se recalcula: {e}")
+        return None
+
+
+def leer_metadatos(path: str) -> Dict[str, Any]:
+    """Pickle de metadatos de un snapshot, incluida la lista escrita por lotes"""
+    with open(path, 'rb') as f:
+        metadatos = pickle.load(f)
+        clave = metadatos.pop('lotes', None)
+        if clave is not None:
+            registros = metadatos[clave] = []
+            for lote in iter(lambda: pickle.load(f), None):
+                registros.extend(lote)
+    return metadatos
+
+
+def cargar_snapshot(snapshot: Snapshot, clave: str, modelo: str) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Lee índice y metadatos (metadatos[clave] = un registro por vector) y los
+    valida. Un archivo truncado o ilegible también lanza SnapshotInvalido,
+    así quien carga lo reconstruye igual que un snapshot que no corresponde.
+    """
+    try:
+        index = faiss.read_index(snapshot.index_path)
+        metadatos = leer_metadatos(snapshot.metadata_path)
+        registros = len(metadatos[clave])
+    except Exception as e:
+        # faiss lanza RuntimeError; pickle, UnpicklingError, EOFError y otros
+        raise SnapshotInvalido(f"{snapshot.nombre}: no se pudo leer ({type(e).__name__}: {e})") from e
+    validar_snapshot(snapshot, index, registros, modelo, metadatos.get('construccion'))
+    return index, metadatos
+
+
+def guardar_snapshot(snapshot: Snapshot,
+                     index: Any,
+                     metadatos: Dict[str, Any],
+                     modelo: str,
+                     fuente: Optional[str] = None,
+                     parametros: Optional[Dict[str, Any]] = None,
+                     lotes: Optional[Tuple[str, Iterable[List[Any]]]] = None):
+    """
+    Escribe índice y metadatos de forma atómica y los registra en el manifiesto
+
+    Args:
+        snapshot: Destino (rutas y nombre en el manifiesto)
+        index: Índice FAISS construido
+        metadatos: Contenido del pickle de metadatos; se le agrega 'construccion'
+        modelo: Modelo de embeddings con el que se construyó
+        fuente: Archivo del que sale el snapshot (su huella va al manifiesto)
+        parametros: Parámetros de construcción que se anotan en el manifiesto
+        lotes: (clave, lotes) para escribir metadatos[clave] lote a lote sin
+            tenerlo completo en memoria; se lee con leer_metadatos
+    """
+    construccion = uuid.uuid4().hex[:12]
+    tmp_index, tmp_metadata = _temporal(snapshot.index_path), _temporal(snapshot.metadata_path)
+    try:
+        faiss.write_index(index, tmp_index)
+        with open(tmp_metadata, 'wb') as f:
+            if lotes is None:
+                pickle.dump({**metadatos, 'construccion': construccion}, f)
+            else:
+                clave, partes = lotes
+                pickle.dump({**metadatos, 'construccion': construccion, 'lotes': clave}, f)
+                for lote in partes:
+                    pickle.dump(lote, f)
+                pickle.dump(None, f)
+        _sincronizar(tmp_index)
+        _sincronizar(tmp_metadata)
+        # Metadatos antes que el índice: cualquier corte deja metadatos con una
+        # construcción distinta de la del manifiesto, que validar_snapshot rechaza
+        os.replace(tmp_metadata, snapshot.metadata_path)
+        os.replace(tmp_index, snapshot.index_path)
+    finally:
+        for tmp in (tmp_index, tmp_metadata):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    registrar_snapshot(snapshot, index, modelo, construccion, fuente, parametros)
+
+
+def huella_fuente(path: str) -> Dict[str, Any]:
+    """Tamaño, mtime y sha256 de un archivo fuente"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            sha.update(bloque)
+    stat = os.stat(path)
+    return {'archivo': path, 'sha256': sha.hexdigest(),
+            'bytes': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def fuente_vigente(snapshot: Snapshot, path: str) -> bool:
+    """
+    True si el snapshot se construyó desde el contenido actual de path.
+    Con el mismo tamaño y mtime basta el stat; si solo cambió el mtime
+    (checkout, copia) se compara el sha256. El stat nuevo no se escribe al
+    manifiesto: está versionado junto a los índices y cada checkout lo
+    dejaría modificado.
+    """
+    declarada = snapshot.entrada.get('fuente')
+    if not declarada:
+        return False
+    stat = os.stat(path)
+    if stat.st_size != declarada.get('bytes'):
+        return False
+    if stat.st_mtime_ns == declarada.get('mtime_ns'):
+        return True
+    actual = huella_fuente(path)
+    if actual['sha256'] != declarada.get('sha256'):
+        return False
+    return True
+
+
+def huella_texto(texto: str) -> str:
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16]
+
+
+def vectores_incrementales(textos: List[str],
+                           embeber: Callable[[List[str]], np.ndarray],
+                           previo: Optional[Any] = None,
+                           huellas_previas: Sequence[str] = ()
+                           ) -> Tuple[np.ndarray, List[str], int]:
+    """
+    Vectores normalizados L2 de textos, reutilizando los del índice previo
+
+    Args:
+        textos: Textos a embeber, en el orden del nuevo índice
+        embeber: Función textos -> matriz (n, d) de embeddings
+        previo: Índice del snapshot anterior (None = embeber todo)
+        huellas_previas: huella_texto del texto de cada fila de previo
+
+    Returns:
+        (vectores, huellas de textos, cantidad de textos embebidos)
+    """
+    huellas = [huella_texto(t) for t in textos]
+    filas_previas = {h: i for i, h in enumerate(huellas_previas)} if previo is not None else {}
+    faltantes = [j for j, h in enumerate(huellas) if h not in filas_previas]
+    nuevos = None
+    if faltantes:
+        nuevos = np.ascontiguousarray(embeber([textos[j] for j in faltantes]), dtype='float32')
+        faiss.normalize_L2(nuevos)
+    dimension = previo.d if previo is not None else nuevos.shape[1]
+    vectores = np.empty((len(textos), dimension), dtype='float32')
+    if previo is not None:
+        anteriores = vectores_indice(previo)
+        for j, h in enumerate(huellas):
+            if h in filas_previas:
+                vectores[j] = anteriores[filas_previas[h]]
+    if faltantes:
+        vectores[faltantes] = nuevos
+    return vectores, huellas, len(faltantes)
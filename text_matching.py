@@ -0,0 +1,118 @@
+"""
+Normalización de texto y búsqueda multi-patrón compilada
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+- normalizar_texto: minúsculas, sin acentos, sin puntuación, espacios
+  colapsados y plegado fonético básico del español (c/z -> s, letras repetidas)
+- PatternMatcher: compila miles de patrones en una sola expresión regular
+  con forma de trie (equivalente a un autómata Aho-Corasick ejecutado por el
+  motor de regex en C) y devuelve todas las coincidencias en una pasada
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Tuple, TypeVar
+
+T = TypeVar('T')
+
+# Tabla de bytes: letras y dígitos ASCII se conservan, todo lo demás -> espacio
+_TABLA_ALFANUM = bytes(c if chr(c).isalnum() and c < 128 else ord(' ') for c in range(256))
+_RE_C_SUAVE = re.compile(r'c(?=[ei])')
+_RE_REPETIDAS = re.compile(r'([a-z])\1+')
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Normaliza texto para matching robusto a acentos, ortografía y espaciado
+
+    'Suisidarme!!' -> 'suisidarme'
+    'PÁNICO   total' -> 'panico total'
+    'hacerme daño' -> 'haserme dano'
+    'muuuy mal' -> 'muy mal'
+    """
+    texto = texto.lower()
+    if texto.isascii():
+        datos = texto.encode('ascii')
+    else:
+        # NFD separa las marcas diacríticas, que se descartan al pasar a ASCII
+        datos = unicodedata.normalize('NFD', texto).encode('ascii', 'ignore')
+    texto = ' '.join(datos.translate(_TABLA_ALFANUM).decode('ascii').split())
+    # Plegado fonético: 'suicidio'/'suisidio'/'suizidio' comparten forma
+    texto = _RE_C_SUAVE.sub('s', texto).replace('z', 's')
+    # Letras repetidas: 'muuuy' -> 'muy', 'pastillas' -> 'pastilas'
+    return _RE_REPETIDAS.sub(r'\1', texto)
+
+
+def _trie_to_regex(node: Dict[str, dict]) -> str:
+    """Convierte un trie de caracteres en regex sin backtracking entre ramas"""
+    es_final = '' in node
+    ramas = []
+    for char in sorted(k for k in node if k):
+        # Los espacios son opcionales: 'quitarme la vida' ~ 'quitarmela vida'
+        char_re = ' ?' if char == ' ' else re.escape(char)
+        ramas.append(char_re + _trie_to_regex(node[char]))
+    if not ramas:
+        return ''
+    cuerpo = ramas[0] if len(ramas) == 1 else '(?:' + '|'.join(ramas) + ')'
+    if es_final:
+        # Opcional greedy: prefiere la coincidencia más larga
+        cuerpo = '(?:' + cuerpo + ')?'
+    return cuerpo
+
+
+class PatternMatcher:
+    """
+    Buscador multi-patrón sobre texto normalizado
+
+    Cada patrón se asocia a un valor arbitrario (por ejemplo, una severidad).
+    Las coincidencias se reportan en todas las posiciones de inicio, tomando
+    la más larga en cada posición, con una sola pasada del regex compilado.
+
+    Args:
+        patterns: Pares (patron, valor)
+        whole_words: Si True, los patrones solo coinciden con palabras completas
+            ('toc' no coincide dentro de 'tocar'); si False, como subcadena
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, T]], whole_words: bool = False):
+        self._values: Dict[str, Tuple[str, T]] = {}
+        trie: Dict[str, dict] = {}
+        for pattern, value in patterns:
+            normalizado = normalizar_texto(pattern)
+            if not normalizado:
+                continue
+            # Los espacios son opcionales en el regex, así que la llave no los lleva
+            self._values.setdefault(normalizado.replace(' ', ''), (pattern, value))
+            node = trie
+            for char in normalizado:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        self.size = len(self._values)
+        if self.size and whole_words:
+            self._regex = re.compile('(?<![a-z0-9])(?=(' + _trie_to_regex(trie) + ')(?![a-z0-9]))')
+        elif self.size:
+            self._regex = re.compile('(?=(' + _trie_to_regex(trie) + '))')
+        else:
+            self._regex = None
+
+    def find_all(self, texto: str, normalizado: bool = False) -> List[Tuple[str, T, int]]:
+        """
+        Retorna [(patron_original, valor, posicion)] para cada coincidencia
+
+        Args:
+            texto: Texto a analizar
+            normalizado: True si el texto ya pasó por normalizar_texto
+        """
+        if self._regex is None:
+            return []
+        if not normalizado:
+            texto = normalizar_texto(texto)
+        matches = []
+        for m in self._regex.finditer(texto):
+            encontrado = m.group(1)
+            if not encontrado:
+                continue
+            pattern, value = self._values[encontrado.replace(' ', '')]
+            matches.append((pattern, value, m.start()))
+        return matches
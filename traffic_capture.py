@@ -0,0 +1,188 @@
+"""
+Captura opcional de tráfico real para pruebas de regresión de rendimiento
+Proyecto: Aplicación Móvil de Apoyo Mental con IA
+
+Con CAPTURE_DIR definido, cada request POST de búsqueda (o una fracción
+CAPTURE_SAMPLE_RATE) se anota como una línea JSON en
+CAPTURE_DIR/trafico-<pid>.jsonl (un archivo por worker de Gunicorn, rotado
+por RotatingFileHandler a CAPTURE_MAX_BYTES con CAPTURE_BACKUPS copias):
+
+    {"ts": 1760000000.123, "endpoint": "buscar_especialista",
+     "path": "/buscar_especialista", "body": {...}, "status": 200,
+     "duracion_ms": 182.4, "etapas_ms": {"embedding": 121.0, "faiss": 0.4, ...}}
+
+Privacidad: del body solo se guardan los campos que la API entiende
+(CAMPOS_BODY y los de QueryFilters); en los textos libres (sintoma, query,
+pregunta) se reemplazan correos, URLs, teléfonos, CURP y hasta cuatro palabras
+después de "me llamo"/"mi nombre es"/"soy" (sin importar mayúsculas: las
+transcripciones de voz llegan en minúsculas), y se recortan a MAX_TEXTO
+caracteres. No se guardan IPs, headers ni respuestas.
+
+El resto de esos textos SÍ se guarda: son la descripción que la persona da
+de sus síntomas (datos de salud mental). La captura es opt-in; tratar
+CAPTURE_DIR como dato sensible (acceso restringido, borrar al terminar las
+pruebas) y no activarla donde no se permita guardar esos datos.
+
+benchmarks/replay.py vuelve a enviar una captura contra un build y compara
+latencias y top-k entre builds.
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import random
+import re
+import threading
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from metrics import tiempos_etapas
+from retrieval_system import QueryFilters
+
+# Campos de primer nivel que usan los endpoints de búsqueda
+CAMPOS_BODY = {'query', 'sintoma', 'pregunta', 'genero', 'presupuesto', 'ubicacion', 'region',
+               'offset', 'top_k', 'candidate_k', 'cuotas', 'filters', 'max_cost', 'id'}
+CAMPOS_FILTROS = {campo.name for campo in dataclasses.fields(QueryFilters)}
+CAMPOS_TEXTO = {'query', 'sintoma', 'pregunta'}
+
+MAX_TEXTO = 300
+MAX_VALOR = 80
+
+# Palabras que cortan (o descartan) el nombre después de "me llamo"/"soy"
+_NO_NOMBRE = ['y', 'e', 'o', 'pero', 'que', 'porque', 'tengo', 'estoy', 'me', 'mi', 'de', 'del',
+              'con', 'en', 'a', 'al', 'para', 'por', 'no', 'ya', 'desde', 'hace', 'muy', 'un', 'una',
+              'el', 'la', 'los', 'las', 'alguien', 'siento', 'vivo']
+
+_REDACCIONES = [
+    (re.compile(r'[\w.+-]+@[\w-]+(\.[\w-]+)+'), '[correo]'),
+    (re.compile(r'(https?://|www\.)\S+', re.IGNORECASE), '[url]'),
+    (re.compile(r'\b[A-Z]{4}\d{6}[HM][A-Z]{5}[A-Z0-9]\d\b', re.IGNORECASE), '[curp]'),
+    (re.compile(r'\+?\d[\d\s().-]{6,}\d'), '[telefono]'),
+    (re.compile(r'\b(me llamo|mi nombre es|soy)\s+(?!(?:{0})\b)\w+(?:\s+(?!(?:{0})\b)\w+){{0,3}}'
+                .format('|'.join(_NO_NOMBRE)), re.IGNORECASE),
+     r'\1 [nombre]'),
+]
+
+
+def limpiar_texto(texto: str, maximo: int = MAX_TEXTO) -> str:
+    """Texto libre sin datos de contacto ni nombres propios evidentes"""
+    for patron, reemplazo in _REDACCIONES:
+        texto = patron.sub(reemplazo, texto)
+    return texto[:maximo]
+
+
+def _limpiar_valor(valor: Any) -> Any:
+    if isinstance(valor, str):
+        return limpiar_texto(valor, MAX_VALOR)
+    if isinstance(valor, (bool, int, float)) or valor is None:
+        return valor
+    if isinstance(valor, list):
+        return [_limpiar_valor(v) for v in valor[:20]]
+    return None
+
+
+def limpiar_body(body: Any) -> Dict[str, Any]:
+    """Solo los campos conocidos del body, con los textos limpios"""
+    if not isinstance(body, dict):
+        return {}
+    limpio: Dict[str, Any] = {}
+    for campo, valor in body.items():
+        if campo not in CAMPOS_BODY:
+            continue
+        if campo in CAMPOS_TEXTO and isinstance(valor, str):
+            limpio[campo] = limpiar_texto(valor)
+        elif campo == 'filters' and isinstance(valor, dict):
+            limpio[campo] = {k: _limpiar_valor(v) for k, v in valor.items() if k in CAMPOS_FILTROS}
+        elif campo == 'cuotas' and isinstance(valor, dict):
+            limpio[campo] = {limpiar_texto(str(k), MAX_VALOR): v for k, v in valor.items()
+                             if isinstance(v, (int, float))}
+        else:
+            limpio[campo] = _limpiar_valor(valor)
+    return limpio
+
+
+class TrafficCapture:
+    """
+    Escribe la captura de tráfico del worker actual
+
+    Args:
+        directorio: Dónde se escriben los trafico-<pid>.jsonl (None deshabilita)
+        sample_rate: Fracción de requests capturados
+        max_bytes: Tamaño al que rota cada archivo
+        backups: Archivos rotados que se conservan por worker
+    """
+
+    def __init__(self,
+                 directorio: Optional[str] = None,
+                 sample_rate: float = 1.0,
+                 max_bytes: int = 10 * 1024 * 1024,
+                 backups: int = 5):
+        self.directorio = directorio or None
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._logger: Optional[logging.Logger] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'TrafficCapture':
+        return cls(directorio=os.getenv('CAPTURE_DIR'),
+                   sample_rate=float(os.getenv('CAPTURE_SAMPLE_RATE', '1')),
+                   max_bytes=int(os.getenv('CAPTURE_MAX_BYTES', str(10 * 1024 * 1024))),
+                   backups=int(os.getenv('CAPTURE_BACKUPS', '5')))
+
+    @property
+    def activo(self) -> bool:
+        return self.directorio is not None and self.sample_rate > 0
+
+    def muestrear(self, metodo: str, path: str) -> bool:
+        """True si este request se captura"""
+        return (self.activo and metodo == 'POST' and not path.startswith('/admin')
+                and random.random() < self.sample_rate)
+
+    def _salida(self) -> logging.Logger:
+        # Se abre en el primer uso de cada proceso: con --preload el módulo se
+        # importa en el master y cada worker debe escribir su propio archivo
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    os.makedirs(self.directorio, exist_ok=True)
+                    handler = RotatingFileHandler(os.path.join(self.directorio, f'trafico-{pid}.jsonl'),
+                                                  maxBytes=self.max_bytes, backupCount=self.backups,
+                                                  encoding='utf-8')
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    logger = logging.getLogger(f'{__name__}.{pid}')
+                    logger.handlers = [handler]
+                    logger.setLevel(logging.INFO)
+                    logger.propagate = False
+                    self._logger, self._pid = logger, pid
+        return self._logger
+
+    def registrar(self, ts: float, endpoint: str, path: str, body: Any, status: int,
+                  duracion: float, etapas: Iterable[Tuple[str, float]]):
+        """Anota un request (duracion en segundos; etapas como en metrics.etapas_request)"""
+        self._salida().info(json.dumps({
+            'ts': round(ts, 3),
+            'endpoint': endpoint,
+            'path': path,
+            'body': limpiar_body(body),
+            'status': status,
+            'duracion_ms': round(duracion * 1000, 3),
+            'etapas_ms': tiempos_etapas(etapas),
+        }, ensure_ascii=False))
+
+
+def leer_capturas(rutas: Iterable[str]) -> List[Dict[str, Any]]:
+    """Líneas de una o varias capturas (incluidas las rotadas), ordenadas por ts"""
+    registros = []
+    for ruta in rutas:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            for linea in f:
+                linea = linea.strip()
+                if linea:
+                    registros.append(json.loads(linea))
+    registros.sort(key=lambda r: r['ts'])
+    return registros